@@ -22,9 +22,10 @@ GitLab client used by Grove.
 from urllib.parse import urljoin
 from typing import Any, Dict, List, Optional
 
-import requests
 from django.core.exceptions import ImproperlyConfigured
 
+from instance import http_client
+
 GitLabToken: Optional[str] = None
 
 PIPELINE_RUNNING_STATUSES: List[str] = [
@@ -68,7 +69,8 @@ class GitLabClient:
         if self.trigger_token is None:
             raise ImproperlyConfigured("GitLab token is not set.")
 
-        response = requests.post(
+        response = http_client.request(
+            'POST',
             urljoin(self.base_url, f"projects/{self.project_id}/trigger/pipeline"),
             json={
                 **variables,
@@ -88,7 +90,8 @@ class GitLabClient:
             bool - False if there is no pipeline running, True otherwise.
         """
 
-        response = requests.get(
+        response = http_client.request(
+            'GET',
             urljoin(self.base_url, f"projects/{self.project_id}/pipelines"),
             params={
                 'ref': self.ref
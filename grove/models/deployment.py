@@ -105,4 +105,4 @@ class GroveDeployment(Deployment, PayloadMixin):
             'type': 'grove_deployment_update',
             'deployment_id': self.id,
             'instance_id': self.instance.id,
-        })
+        }, organization_id=self.instance.owner_id)
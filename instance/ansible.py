@@ -23,8 +23,12 @@ Ansible - Helper functions
 # Imports #####################################################################
 
 from contextlib import contextmanager
+import fcntl
+from functools import lru_cache
+import hashlib
 import logging
 import os
+import shutil
 import subprocess
 from tempfile import NamedTemporaryFile
 import yaml
@@ -47,6 +51,9 @@ ANSIBLE_CALLBACKS_DIR = os.path.join(os.path.dirname(__file__), 'ansible_callbac
 ANSIBLE_STDOUT_CALLBACK = 'prettify'
 ANSIBLE_PYTHON_PATH = getattr(settings, 'ANSIBLE_PYTHON_PATH', None) or "python"
 
+# Marker file created in cached virtualenvs once all the requirements are installed
+VENV_COMPLETE_MARKER = '.complete'
+
 # Functions ###################################################################
 
 
@@ -118,27 +125,138 @@ def string_to_file_path(string, root_dir=None):
     return f.name
 
 
-def render_sandbox_creation_command(
-        requirements_path, inventory_path, vars_path, playbook_name, remote_username, venv_path):
+@lru_cache()
+def get_python_version(python_path):
     """
-    Renders the shell command used to create the sandbox
+    Get the version string of the Python binary `python_path`.
+    """
+    # Python 2 prints its version on stderr
+    return subprocess.check_output([python_path, '--version'], stderr=subprocess.STDOUT).decode('utf-8').strip()
+
+
+def read_requirements(requirements_path):
+    """
+    Get the contents of the requirements file `requirements_path`, including the contents of the
+    requirements files it references with `-r`.
+    """
+    with open(requirements_path, 'rb') as f:
+        contents = f.read()
+    for line in contents.decode('utf-8').splitlines():
+        line = line.strip()
+        for option in ('-r ', '--requirement '):
+            if line.startswith(option):
+                nested_path = os.path.join(os.path.dirname(requirements_path), line[len(option):].strip())
+                contents += read_requirements(nested_path)
+    return contents
+
+
+def get_venv_path(requirements_path):
     """
+    Get the path of the cached virtualenv with the requirements from `requirements_path` installed.
 
-    venv_python_path = os.path.join(venv_path, 'bin/python')
-    create_venv_cmd = 'virtualenv -p {python_path} {venv_path}'.format(
+    The path depends on the contents of the requirements file, and on the version of the Python
+    binary used to run Ansible.
+    """
+    digest = hashlib.sha256()
+    digest.update(get_python_version(ANSIBLE_PYTHON_PATH).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(read_requirements(requirements_path))
+    return os.path.join(settings.ANSIBLE_VENV_CACHE_DIR, digest.hexdigest()[:20])
+
+
+def evict_venvs(keep_path):
+    """
+    Remove the least recently used virtualenvs from the cache, keeping at most
+    settings.ANSIBLE_VENV_CACHE_SIZE of them, and always keeping the one at `keep_path`.
+
+    Virtualenvs being built or used hold a lock on them, and are never removed.
+    """
+    cache_dir = settings.ANSIBLE_VENV_CACHE_DIR
+    venv_paths = [
+        os.path.join(cache_dir, name) for name in os.listdir(cache_dir)
+        if os.path.isdir(os.path.join(cache_dir, name)) and os.path.join(cache_dir, name) != keep_path
+    ]
+
+    def last_used(venv_path):
+        """ Get the time the virtualenv was last used """
+        marker_path = os.path.join(venv_path, VENV_COMPLETE_MARKER)
+        return os.path.getmtime(marker_path if os.path.exists(marker_path) else venv_path)
+
+    venv_paths.sort(key=last_used, reverse=True)
+    for venv_path in venv_paths[max(settings.ANSIBLE_VENV_CACHE_SIZE - 1, 0):]:
+        with open('{}.lock'.format(venv_path), 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            logger.info('Removing least recently used virtualenv %s', venv_path)
+            shutil.rmtree(venv_path, ignore_errors=True)
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def prepare_venv(requirements_path):
+    """
+    Get the path of the cached virtualenv for `requirements_path`, mark it as used and make room for it in the cache.
+
+    The virtualenv itself is built by the command returned by `render_sandbox_creation_command`,
+    if it doesn't exist yet.
+    """
+    venv_path = get_venv_path(requirements_path)
+    os.makedirs(settings.ANSIBLE_VENV_CACHE_DIR, exist_ok=True)
+    marker_path = os.path.join(venv_path, VENV_COMPLETE_MARKER)
+    if os.path.exists(marker_path):
+        os.utime(marker_path)
+    evict_venvs(keep_path=venv_path)
+    return venv_path
+
+
+def render_venv_creation_command(requirements_path, venv_path):
+    """
+    Renders the shell command used to create the virtualenv at `venv_path`, if it isn't complete yet
+
+    The command must run with the file descriptor 9 open on `venv_path`.lock, and a shared lock held on it,
+    so that the virtualenv can't be evicted from the cache between the check of its completeness and its use.
+    Concurrent builds of the same virtualenv are serialized by upgrading that lock to an exclusive one, which
+    is downgraded back to a shared lock afterwards. The virtualenv is only marked as complete once all the
+    requirements are installed.
+    """
+    marker_path = os.path.join(venv_path, VENV_COMPLETE_MARKER)
+
+    create_venv_cmd = 'rm -rf {venv_path} && virtualenv -p {python_path} {venv_path}'.format(
         # default to the python binary in the PATH
         python_path=ANSIBLE_PYTHON_PATH,
         venv_path=venv_path,
     )
 
     install_requirements_cmd = '{python} -u {pip} install -r {requirements_path}'.format(
-        python=venv_python_path,
+        python=os.path.join(venv_path, 'bin/python'),
         pip=os.path.join(venv_path, 'bin/pip'),
         requirements_path=requirements_path,
     )
 
+    # Converting a lock isn't atomic, so the virtualenv is checked again once the shared lock is back
+    return (
+        '([ -f {marker} ] || '
+        '(flock 9 && ([ -f {marker} ] || ({create} && {install} && touch {marker})) '
+        '&& flock --shared 9 && [ -f {marker} ]))'
+    ).format(
+        marker=marker_path,
+        create=create_venv_cmd,
+        install=install_requirements_cmd,
+    )
+
+
+def render_sandbox_creation_command(
+        requirements_path, inventory_path, vars_path, playbook_name, remote_username, venv_path):
+    """
+    Renders the shell command used to create the sandbox
+
+    The virtualenv is checked and the playbook runs with a shared lock on the virtualenv, so it can't be
+    evicted from the cache meanwhile.
+    """
+
     run_playbook_cmd = '{python} -u {ansible} -i {inventory_path} -e @{vars_path} -u {user} {playbook}'.format(
-        python=venv_python_path,
+        python=os.path.join(venv_path, 'bin/python'),
         ansible=os.path.join(venv_path, 'bin/ansible-playbook'),
         inventory_path=inventory_path,
         vars_path=vars_path,
@@ -146,7 +264,11 @@ def render_sandbox_creation_command(
         playbook=playbook_name,
     )
 
-    return ' && '.join([create_venv_cmd, install_requirements_cmd, run_playbook_cmd])
+    return '(flock --shared 9 && {create_venv} && {run_playbook}) 9>{lock}'.format(
+        create_venv=render_venv_creation_command(requirements_path, venv_path),
+        run_playbook=run_playbook_cmd,
+        lock='{}.lock'.format(venv_path),
+    )
 
 
 @contextmanager
@@ -154,14 +276,15 @@ def run_playbook(requirements_path, inventory_str, vars_str, playbook_path, play
     """
     Runs ansible-playbook in a dedicated venv
 
-    Ansible only supports Python 2 - so we have to run it as a separate command, in its own venv
+    Ansible only supports Python 2 - so we have to run it as a separate command, in its own venv.
+    The venv is cached, and shared by all the runs using the same requirements (see `get_venv_path`).
     """
 
     with create_temp_dir() as ansible_tmp_dir:
 
         vars_path = string_to_file_path(vars_str, root_dir=ansible_tmp_dir)
         inventory_path = string_to_file_path(inventory_str, root_dir=ansible_tmp_dir)
-        venv_path = os.path.join(ansible_tmp_dir, 'venv')
+        venv_path = prepare_venv(requirements_path)
 
         cmd = render_sandbox_creation_command(
             requirements_path=requirements_path,
@@ -20,6 +20,7 @@
 Filters for the API
 """
 from django.conf import settings
+from django.db.models import Q
 from rest_framework import filters
 
 from instance.models.openedx_instance import OpenEdXInstance
@@ -74,6 +75,7 @@ class InstanceFilterBackend(filters.BaseFilterBackend):
 
     Currently allowed fields:
     - deployment_type
+    - domain
     - lifecycle
     - name
     - notes
@@ -85,6 +87,8 @@ class InstanceFilterBackend(filters.BaseFilterBackend):
     def _filter_name(self, queryset, value):
         """
         Filter the InstanceRef queryset on partial name.
+
+        The case-insensitive search is backed by a trigram index.
         """
         if value:
             return queryset.filter(name__icontains=value)
@@ -96,6 +100,19 @@ class InstanceFilterBackend(filters.BaseFilterBackend):
             return queryset.filter(notes__icontains=value)
         return queryset
 
+    def _filter_domain(self, queryset, value):
+        """
+        Filter the InstanceRef queryset on partial internal or external LMS domain.
+
+        The case-insensitive search is backed by trigram indexes.
+        """
+        if value:
+            instances = OpenEdXInstance.objects.filter(
+                Q(internal_lms_domain__icontains=value) | Q(external_lms_domain__icontains=value)
+            )
+            return queryset.filter(instance_id__in=instances)
+        return queryset
+
     def _filter_status(self, queryset, value):
         """
         Filter the InstanceRef queryset on exact app server status.
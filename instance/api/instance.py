@@ -21,11 +21,12 @@ Instance API
 """
 
 # Imports #####################################################################
-from django.db.models import Prefetch
+from django.db.models import Count, Prefetch
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
+from instance.api.logs import LogStreamMixin
 from instance.api.permissions import IsSuperUser
 from instance.models.instance import InstanceReference, InstanceTag
 from instance.models.openedx_appserver import OpenEdXAppServer
@@ -38,12 +39,13 @@ from instance.serializers.instance import (
 )
 
 from .filters import IsOrganizationOwnerFilterBackendInstance, InstanceFilterBackend
+from .pagination import InstanceCursorPagination
 
 
 # Views - API #################################################################
 
 
-class InstanceViewSet(viewsets.ReadOnlyModelViewSet):
+class InstanceViewSet(LogStreamMixin, viewsets.ReadOnlyModelViewSet):
     """
     API to list and manipulate instances.
 
@@ -68,10 +70,16 @@ class InstanceViewSet(viewsets.ReadOnlyModelViewSet):
     object has its own ID which should never be used - just use its InstanceReference ID). This
     detail is managed by the API so users of the API should not generally need to be aware of
     it.
+
+    The list can be paginated with the `page_size` query parameter, in which case the instances
+    are ordered by decreasing `modified` date, and the response contains `next` and `previous`
+    cursor links. The `fields` query parameter (e.g. `?fields=id,name,domain`) limits the
+    fields returned for each instance.
     """
     queryset = InstanceReference.objects.all()
     serializer_class = InstanceReferenceDetailedSerializer
     filter_backends = (IsOrganizationOwnerFilterBackendInstance, InstanceFilterBackend)
+    pagination_class = InstanceCursorPagination
 
     def get_queryset(self):
         # Don't load all columns, because some of them have very big data
@@ -80,12 +88,17 @@ class InstanceViewSet(viewsets.ReadOnlyModelViewSet):
         queryset = self.queryset.prefetch_related(
             # Use prefetching to make the number of database queries required to
             # generate this list O(1).
-            # Note that prefetching all app servers information is still required, as the "newest" is not decideable
-            # at this point. This will cause more data than necessary to be streamed from the DB, but removing this
-            # prefetch without first selecting only the "newest" here results in O(n).
+            # Only the newest and the active app servers are loaded, and the app servers
+            # are counted by the database, rather than streaming all app servers from the DB.
+            Prefetch(
+                'instance__ref_set',
+                queryset=InstanceReference.objects.annotate(_cached_appserver_count=Count('openedxappserver_set')),
+            ),
             Prefetch(
                 'instance__ref_set__openedxappserver_set',
-                queryset=appservers_few_columns,
+                # DISTINCT ON the owner keeps the first row of each owner, i.e. the newest app server
+                queryset=appservers_few_columns.order_by('owner_id', '-created').distinct('owner_id'),
+                to_attr='_cached_newest_appservers'
             ),
             Prefetch(
                 'instance__ref_set__openedxappserver_set',
@@ -104,8 +117,20 @@ class InstanceViewSet(viewsets.ReadOnlyModelViewSet):
         if 'include_archived' not in request.query_params:
             # By default, exclude archived instances from the list:
             queryset = queryset.filter(is_archived=False)
-        serializer = InstanceReferenceBasicSerializer(queryset, many=True, context={'request': request})
-        return Response(serializer.data)
+        fields = request.query_params.get('fields')
+        if fields:
+            fields = [field.strip() for field in fields.split(',') if field.strip()]
+
+        page = self.paginate_queryset(queryset)
+        serializer = InstanceReferenceBasicSerializer(
+            queryset if page is None else page,
+            many=True,
+            fields=fields or None,
+            context={'request': request},
+        )
+        if page is None:
+            return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['get'])
     def logs(self, request, pk):
@@ -114,6 +139,12 @@ class InstanceViewSet(viewsets.ReadOnlyModelViewSet):
         """
         return Response(InstanceLogSerializer(self.get_object()).data)
 
+    def get_log_entries_queryset(self, obj):
+        """
+        Return the queryset of this Instance's log entries, for the log stream
+        """
+        return obj.instance.log_entries_queryset
+
     @action(detail=True, methods=['get'])
     def app_servers(self, request, pk):
         """
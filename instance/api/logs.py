@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Log streaming API
+"""
+
+# Imports #####################################################################
+
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+
+from instance.models.log_entry import LogEntry
+from instance.serializers.logentry import LogEntryStreamSerializer
+
+
+# Constants ###################################################################
+
+LOG_LEVELS = {level for level, unused in LogEntry.LOG_LEVEL_CHOICES}
+
+
+# Functions ###################################################################
+
+def stream_log_entries(entries, since, chunk_size):
+    """
+    Generate the NDJSON lines of the given log entries with an ID greater than `since`, oldest first.
+
+    The entries are fetched by chunks of `chunk_size`, each chunk starting after the last entry of the previous
+    one, so that only one chunk is held in memory at a time.
+
+    IDs are allocated when the entries are inserted, not when their transaction commits: an entry committed
+    after an entry with a greater ID was read is skipped by a cursor past that greater ID.
+    """
+    entries = entries.order_by('pk').only('id', 'level', 'text', 'created')
+    while True:
+        chunk = list(entries.filter(pk__gt=since)[:chunk_size])
+        if not chunk:
+            return
+        yield ''.join(json.dumps(data) + '\n' for data in LogEntryStreamSerializer(chunk, many=True).data)
+        if len(chunk) < chunk_size:
+            return
+        since = chunk[-1].pk
+
+
+# Views - API #################################################################
+
+class LogStreamMixin:
+    """
+    Viewset mixin adding an endpoint streaming the log entries of an object as newline-delimited JSON.
+
+    Each line is a log entry with its `id`, `level`, `text` and `created` date. Query parameters:
+
+    * `since`: Only return the entries with a greater ID, i.e. those logged after the last entry the
+      client has already received. Without it, the `LOG_LIMIT` most recent entries are returned.
+
+      Entries written concurrently, e.g. by the log handlers of several workers, can be committed out
+      of ID order, so an entry may become visible after an entry with a greater ID was streamed. A client
+      following the logs with the last ID it received can miss such entries; to avoid that, it can pass
+      a `since` somewhat lower than the last ID it received, and skip the IDs it already has.
+    * `level`: Comma-separated levels of the entries to return, e.g. `ERROR,CRITICAL`.
+
+    Viewsets using it implement `get_log_entries_queryset()`.
+    """
+    def get_log_entries_queryset(self, obj):
+        """
+        Return the queryset of all the log entries of the given object.
+        """
+        raise NotImplementedError
+
+    @action(detail=True, methods=['get'], url_path='logs/stream')
+    def logs_stream(self, request, pk):
+        """
+        Stream this object's log entries as newline-delimited JSON
+        """
+        entries = self.get_log_entries_queryset(self.get_object())
+
+        levels = request.query_params.get('level')
+        if levels:
+            levels = {level.strip().upper() for level in levels.split(',') if level.strip()}
+            unknown_levels = levels - LOG_LEVELS
+            if unknown_levels:
+                raise ValidationError({'level': 'Unknown log levels: {}'.format(', '.join(sorted(unknown_levels)))})
+            entries = entries.filter(level__in=levels)
+
+        since = request.query_params.get('since')
+        if since is None:
+            # Start after the entry preceding the LOG_LIMIT most recent ones, if there are more
+            preceding_entry = entries.order_by('-pk').values_list('pk', flat=True)[
+                settings.LOG_LIMIT:settings.LOG_LIMIT + 1
+            ]
+            since = preceding_entry[0] if preceding_entry else 0
+        else:
+            try:
+                since = int(since)
+            except ValueError:
+                raise ValidationError({'since': 'A log entry ID is required.'})
+
+        return StreamingHttpResponse(
+            stream_log_entries(entries, since, settings.LOG_STREAM_CHUNK_SIZE),
+            content_type='application/x-ndjson',
+        )
@@ -28,6 +28,7 @@ from rest_framework.decorators import action
 from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 
+from instance.api.logs import LogStreamMixin
 from instance.api.permissions import IsSuperUser
 from instance.models.instance import InstanceReference
 from instance.models.openedx_appserver import OpenEdXAppServer
@@ -48,7 +49,7 @@ from ..models.deployment import DeploymentType
 # Views - API #################################################################
 
 
-class OpenEdXAppServerViewSet(viewsets.ReadOnlyModelViewSet):
+class OpenEdXAppServerViewSet(LogStreamMixin, viewsets.ReadOnlyModelViewSet):
     """
     API to list and manipulate Open edX AppServers.
     """
@@ -113,6 +114,12 @@ class OpenEdXAppServerViewSet(viewsets.ReadOnlyModelViewSet):
         """
         return Response(OpenEdXAppServerLogSerializer(self.get_object()).data)
 
+    def get_log_entries_queryset(self, obj):
+        """
+        Return the queryset of this AppServer's log entries and those of its VM, for the log stream
+        """
+        return obj.log_entries_queryset
+
     @action(detail=True, methods=['post'])
     def make_active(self, request, pk):
         """
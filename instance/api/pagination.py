@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Pagination for the API
+"""
+
+# Imports #####################################################################
+
+from rest_framework.pagination import CursorPagination
+
+
+# Pagination ##################################################################
+
+class InstanceCursorPagination(CursorPagination):
+    """
+    Keyset pagination for the instance list, newest modified first.
+
+    Pagination is opt-in: it's only used when the `page_size` query parameter is given, so
+    that existing clients still receive the full list. The `next` and `previous` links keep
+    the `page_size` parameter.
+    """
+    ordering = ('-modified', '-id')
+    page_size = None
+    page_size_query_param = 'page_size'
+    max_page_size = 500
@@ -20,41 +20,167 @@
 Websocket consumers
 """
 
-import json
+# Imports #####################################################################
 
-from asgiref.sync import async_to_sync
-from channels.generic.websocket import WebsocketConsumer
+import time
 
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+
+from instance.models.deployment import Deployment
 from instance.models.instance import InstanceReference
+from instance.models.openedx_appserver import OpenEdXAppServer
+from instance.utils import EVENT_OBJECT_KEYS, WEBSOCKET_SUPERUSERS_GROUP, websocket_group_name
+from userprofile.models import UserProfile
+
+
+# Functions ###################################################################
+
+def get_user_broadcast_group(user):
+    """
+    Get the group receiving the update events `user` is allowed to see, or None if the user can't manage instances.
+    """
+    if not user.is_authenticated or not InstanceReference.can_manage(user):
+        return None
+    if user.is_superuser:
+        return WEBSOCKET_SUPERUSERS_GROUP
+    try:
+        organization_id = UserProfile.objects.get(user=user).organization_id
+    except UserProfile.DoesNotExist:
+        return None
+    if organization_id is None:
+        return None
+    return websocket_group_name('organization', organization_id)
+
+
+def can_subscribe(user, kind, pk):
+    """
+    Returns true if `user` is allowed to receive the events of the object of the given `kind` and `pk`.
+    """
+    if user.is_superuser:
+        return True
+    try:
+        organization = UserProfile.objects.get(user=user).organization
+    except UserProfile.DoesNotExist:
+        return False
+    if organization is None:
+        return False
+    querysets = {
+        'instance': InstanceReference.objects.filter(pk=pk, owner=organization),
+        'appserver': OpenEdXAppServer.objects.filter(pk=pk, owner__owner=organization),
+        'deployment': Deployment.objects.filter(pk=pk, instance__owner=organization),
+        'server': OpenEdXAppServer.objects.filter(server_id=pk, owner__owner=organization),
+    }
+    return querysets[kind].exists()
 
 
-class WebSocketListener(WebsocketConsumer):
+# Classes #####################################################################
+
+class TokenBucket:
+    """
+    Rate limiter allowing `rate` actions per second on average, and up to `burst` actions at once.
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def consume(self):
+        """
+        Returns true if an action is allowed now, and accounts for it.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class WebSocketListener(AsyncJsonWebsocketConsumer):
     """
     A websocket consumer for sending notifications.
+
+    Every client receives the update events of the instances, appservers and deployments it can see.
+    Other events, like log lines, are only sent for the objects the client subscribed to, by sending
+    messages like:
+
+        {"action": "subscribe", "appserver_id": 12}
+        {"action": "unsubscribe", "appserver_id": 12}
+
+    where the object can be given by an `instance_id`, `appserver_id`, `deployment_id` or `server_id`.
     """
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.channel_group_name = 'ws'
+        self.broadcast_group_name = None
+        self.subscriptions = set()
+        self.rate_limiter = TokenBucket(settings.WEBSOCKET_RATE_LIMIT, settings.WEBSOCKET_RATE_LIMIT_BURST)
+
+    async def connect(self):
+        self.broadcast_group_name = await database_sync_to_async(get_user_broadcast_group)(self.scope['user'])
+        if self.broadcast_group_name is None:
+            await self.close()
+            return
 
-    def connect(self):
-        user = self.scope['user']
-        if not user.is_authenticated or not InstanceReference.can_manage(user):
-            self.close()
+        await self.channel_layer.group_add(self.broadcast_group_name, self.channel_name)
+        await self.accept()
 
-        async_to_sync(self.channel_layer.group_add)(
-            self.channel_group_name,
-            self.channel_name
-        )
-        self.accept()
+    async def disconnect(self, code):
+        for group_name in [self.broadcast_group_name] + sorted(self.subscriptions):
+            if group_name is not None:
+                await self.channel_layer.group_discard(group_name, self.channel_name)
+        self.subscriptions.clear()
 
-    def disconnect(self, close_code):  # pylint: disable=arguments-differ
-        async_to_sync(self.channel_layer.group_discard)(
-            self.channel_group_name,
-            self.channel_name
-        )
+    async def receive_json(self, content, **kwargs):
+        """
+        Handles the subscription requests of the client.
+        """
+        if not self.rate_limiter.consume():
+            await self.send_subscription_message('error', content, error='Too many messages.')
+            return
+
+        if not isinstance(content, dict) or content.get('action') not in ('subscribe', 'unsubscribe'):
+            await self.send_subscription_message('error', content, error='Unknown action.')
+            return
+
+        objects = [(kind, content[key]) for key, kind in EVENT_OBJECT_KEYS if key in content]
+        if len(objects) != 1 or not isinstance(objects[0][1], int):
+            await self.send_subscription_message('error', content, error='Exactly one object ID is required.')
+            return
+
+        kind, pk = objects[0]
+        group_name = websocket_group_name(kind, pk)
+        if content['action'] == 'unsubscribe':
+            if group_name in self.subscriptions:
+                self.subscriptions.discard(group_name)
+                await self.channel_layer.group_discard(group_name, self.channel_name)
+            await self.send_subscription_message('unsubscribed', content)
+            return
+
+        if group_name not in self.subscriptions:
+            if len(self.subscriptions) >= settings.WEBSOCKET_MAX_SUBSCRIPTIONS:
+                await self.send_subscription_message('error', content, error='Too many subscriptions.')
+                return
+            if not await database_sync_to_async(can_subscribe)(self.scope['user'], kind, pk):
+                await self.send_subscription_message('error', content, error='Permission denied.')
+                return
+            self.subscriptions.add(group_name)
+            await self.channel_layer.group_add(group_name, self.channel_name)
+        await self.send_subscription_message('subscribed', content)
+
+    async def send_subscription_message(self, message_type, content, **extra):
+        """
+        Reply to a subscription request of the client.
+        """
+        message = {'type': message_type, 'request': content}
+        message.update(extra)
+        await self.send_json({'type': 'subscription', 'message': message})
 
-    def notification(self, event):
+    async def notification(self, event):
         """
-        Handles the messages of type 'notification' sent to the self.channel_group_name group.
+        Handles the messages of type 'notification' sent to the groups of this consumer.
         """
-        self.send(text_data=json.dumps(event))
+        await self.send_json(event)
@@ -22,9 +22,11 @@ Gandi DNS - Helper functions
 
 # Imports #####################################################################
 
+import functools
 import logging
 import os
 import time
+from collections import defaultdict
 
 import requests
 from django.conf import settings
@@ -101,12 +103,12 @@ class GandiV5API:
             }
         }
 
-    def _dns_operation(self, callback, log_msg, attempts=4, retry_delay=1):
+    def _dns_operation(self, callback, log_msg, zone, attempts=4, retry_delay=1):
         """
-        Encapsulate logic that is common to high-level DNS operations: grab the global lock, do the operation,
+        Encapsulate logic that is common to high-level DNS operations: grab the lock of the zone, do the operation,
         and retry the whole procedure multiple times if necessary.
         """
-        with cache.lock('gandi_set_dns_record', timeout=settings.REDIS_LOCK_TIMEOUT):
+        with cache.lock(f'gandi_dns_zone_{zone}', timeout=settings.REDIS_LOCK_TIMEOUT):
             for i in range(1, attempts + 1):
                 try:
                     logger.info('%s (attempt %d out %d)', log_msg, i, attempts)
@@ -119,6 +121,21 @@ class GandiV5API:
                     retry_delay *= 2
         return result
 
+    def _get_provider(self, zone, ttl):
+        """
+        Return an authenticated lexicon provider for the given zone, creating records with the given TTL.
+        """
+        lexicon_config = self._get_base_config()
+        lexicon_config['domain'] = zone
+        lexicon_config['action'] = 'list'
+        lexicon_config['type'] = 'A'
+        lexicon_config['ttl'] = ttl
+        config = ConfigResolver()
+        config.with_dict(dict_object=lexicon_config)
+        provider = Client(config).provider
+        provider.authenticate()
+        return provider
+
     def add_dns_record(self, record):
         """
         Add a DNS record to the domain.
@@ -177,6 +194,7 @@ class GandiV5API:
         return self._dns_operation(
             callback=list_dns_records_callback,
             log_msg=f'Getting DNS records: {domain}',
+            zone=record['domain'],
         )
 
     def set_dns_record(self, domain, **record):
@@ -199,6 +217,7 @@ class GandiV5API:
         self._dns_operation(
             callback=set_dns_record_callback,
             log_msg=f'Setting DNS record: {record}',
+            zone=record['domain'],
         )
 
     def delete_dns_record(self, record):
@@ -240,8 +259,67 @@ class GandiV5API:
         self._dns_operation(
             callback=remove_dns_record_callback,
             log_msg=f'Deleting DNS record: {record}',
+            zone=record['domain'],
         )
 
+    def update_dns_records(self, set_records=(), remove_records=()):
+        """
+        Set and remove several DNS records in one batch.
+
+        `set_records` is an iterable of `(domain, record)` pairs, where `record` is a dict of the keyword
+        arguments of `set_dns_record()`; `remove_records` is an iterable of `(domain, record)` pairs for
+        `remove_dns_record()`.
+
+        The changes are grouped by zone. The changes of each zone are applied while holding the lock of
+        the zone, reusing the same authenticated lexicon provider, and are all retried together if one
+        of them fails. All the domains are checked before making any change.
+        """
+        changes = defaultdict(lambda: ([], []))
+        for domain, record in set_records:
+            record = dict(record, ttl=record.get('ttl', 1200))
+            record['name'], zone = self._split_domain_name(domain)
+            changes[zone][0].append(record)
+        for domain, record in remove_records:
+            record = dict(record)
+            record['name'], zone = self._split_domain_name(domain)
+            changes[zone][1].append(record)
+
+        for zone, (zone_set_records, zone_remove_records) in changes.items():
+            self._dns_operation(
+                callback=functools.partial(self._apply_zone_changes, zone, zone_set_records, zone_remove_records),
+                log_msg=(
+                    f'Updating DNS records of {zone}: setting {zone_set_records}, removing {zone_remove_records}'
+                ),
+                zone=zone,
+            )
+
+    def _apply_zone_changes(self, zone, set_records, remove_records):
+        """
+        Set and remove the given DNS records of a zone, with one lexicon provider per TTL.
+        """
+        providers = {}
+
+        def get_provider(ttl):
+            """ Return the provider creating records with the given TTL """
+            if ttl not in providers:
+                providers[ttl] = self._get_provider(zone, ttl)
+            return providers[ttl]
+
+        for record in remove_records + set_records:
+            try:
+                get_provider(record.get('ttl', 1200)).delete_record(rtype=record['type'], name=record['name'])
+            except Exception as e:  # pylint: disable=broad-except
+                # See delete_dns_record()
+                if 'Record identifier could not be found' not in str(e):
+                    raise
+        for record in set_records:
+            get_provider(record['ttl']).create_record(
+                rtype=record['type'], name=record['name'], content=record['value']
+            )
+
+        for record_type in {record['type'] for record in remove_records + set_records}:
+            cache.delete(f"{zone}-{record_type}")
+
 
 try:
     api = GandiV5API(settings.GANDI_API_KEY)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Shared HTTP sessions for the requests to third-party APIs
+"""
+
+# Imports #####################################################################
+
+import threading
+from urllib.parse import urlsplit
+
+from django.conf import settings
+import requests
+from requests.adapters import HTTPAdapter
+
+from instance.utils import get_requests_retry
+
+
+# Globals #####################################################################
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+# Classes #####################################################################
+
+class HostSession(requests.Session):
+    """
+    A session for the requests to a single host, reusing keep-alive connections.
+
+    At most `max_concurrency` requests run at once; the other ones wait for one of them to complete,
+    so that the pool never opens more connections than that to the host.
+    """
+    def __init__(self, max_concurrency, retries, backoff_factor):
+        super().__init__()
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=max_concurrency,
+            max_retries=get_requests_retry(
+                total=retries,
+                connect=retries,
+                read=retries,
+                redirect=retries,
+                backoff_factor=backoff_factor,
+                raise_on_status=False,
+            ),
+        )
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, *args, **kwargs):  # pylint: disable=arguments-differ
+        """
+        Send the request once fewer than `max_concurrency` requests to the host are running.
+        """
+        with self._semaphore:
+            return super().request(method, url, *args, **kwargs)
+
+
+# Functions ###################################################################
+
+def get_session(url):
+    """
+    Returns the session shared by all the requests to the host of the given URL.
+    """
+    parsed_url = urlsplit(url)
+    host = (parsed_url.scheme, parsed_url.netloc.lower())
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = _sessions[host] = HostSession(
+                max_concurrency=settings.HTTP_CLIENT_MAX_CONCURRENCY_PER_HOST,
+                retries=settings.HTTP_CLIENT_RETRIES,
+                backoff_factor=settings.HTTP_CLIENT_RETRY_BACKOFF_FACTOR,
+            )
+        return session
+
+
+def request(method, url, **kwargs):
+    """
+    Send a request with the shared session of the URL's host. Takes the same arguments as `requests.request`.
+    """
+    return get_session(url).request(method, url, **kwargs)
+
+
+def close_sessions():
+    """
+    Close all the shared sessions and their connections.
+    """
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
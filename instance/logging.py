@@ -22,8 +22,11 @@ Instance app - Logging utils
 
 # Imports #####################################################################
 
+from collections import OrderedDict
+from datetime import datetime, timezone
 from functools import wraps
 import logging
+import threading
 import traceback
 
 from django.apps import apps
@@ -59,41 +62,184 @@ def log_exception(method):
 class DBHandler(logging.Handler):
     """
     Records log messages in database models
+
+    Log entries are buffered and written with a single `bulk_create` when `capacity` entries
+    are buffered, when a record of level `flush_level` or above is emitted, or at the latest
+    `flush_interval` seconds after they were emitted. The websocket notifications are coalesced
+    into one `object_log_lines` message per model object and per flush.
+
+    Only the entries emitted outside of a transaction are buffered: the objects they refer to
+    are already committed, so any thread can write them. The buffer is only written outside of
+    transactions too, so that a rollback can't discard the entries of other threads. Entries
+    emitted within a transaction are written right away, in that transaction, like without
+    buffering.
+
+    The buffer is also flushed when the handler is closed, which `logging.shutdown()` does when
+    the process exits, so no entry is lost when a worker stops.
+
+    With the default `capacity` of 1, every entry is written as soon as it is emitted.
     """
+    def __init__(self, capacity=1, flush_interval=1.0, flush_level=logging.CRITICAL):
+        super().__init__()
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.flush_level = flush_level
+        # (log entry, model object) pairs
+        self._buffer = []
+        # Serializes database writes, so entries are written in the order they were emitted
+        # without blocking the threads emitting new records while a flush is in progress.
+        # Reentrant, as writing the entries may itself log something.
+        self._write_lock = threading.RLock()
+        self._closed = threading.Event()
+        self._flusher = None
+
     def emit(self, record):
         """
-        Handles an emitted log entry and stores it in the database, optionally linking it to the
-        model object `obj`
+        Handles an emitted log entry and buffers it for storage in the database, optionally
+        linking it to the model object `obj`
         """
         obj = record.__dict__.get('obj', None)
 
         if obj is None or not isinstance(obj, models.Model) or obj.pk is None:
-            content_type, object_id = None, None
+            obj, content_type, object_id, appserver_id = None, None, None, None
         else:
             content_type = apps.get_model('contenttypes', 'ContentType').objects.get_for_model(obj)
             object_id = obj.pk
+            appserver_id = getattr(obj, 'log_entry_appserver_id', None)
+
+        log_entry = apps.get_model('instance', 'LogEntry')(
+            level=record.levelname,
+            text=self.format(record),
+            content_type=content_type,
+            object_id=object_id,
+            appserver_id=appserver_id,
+            # Stamped when the record is emitted, rather than when the buffer is written
+            created=datetime.fromtimestamp(record.created, timezone.utc),
+        )
+        if self.capacity > 1 and not self._in_transaction():
+            self._buffer.append((log_entry, obj))
+        else:
+            self._write([(log_entry, obj)])
+
+    def handle(self, record):
+        """
+        Buffer the record, then flush the buffer if needed
 
+        The flush happens after the handler lock is released, so other threads can keep
+        logging while the log entries are written.
+        """
+        if record.name == logger.name:
+            # The errors of this handler are logged by handlers which don't write to the database
+            return False
+        emitted = super().handle(record)
+        if emitted and self._buffer:
+            if len(self._buffer) >= self.capacity or record.levelno >= self.flush_level:
+                self.flush()
+            else:
+                self._start_flusher()
+        return emitted
+
+    def flush(self):
+        """
+        Write the buffered log entries to the database, and notify the clients about them
+
+        Nothing is written within a transaction: the background flusher writes the entries instead.
+        """
+        if self._in_transaction():
+            return
+
+        self.acquire()
         try:
-            log_entry = apps.get_model('instance', 'LogEntry').objects.create(
-                level=record.levelname, text=self.format(record), content_type=content_type, object_id=object_id
+            buffered_entries, self._buffer = self._buffer, []
+        finally:
+            self.release()
+
+        if buffered_entries:
+            self._write(buffered_entries)
+
+    def close(self):
+        """
+        Stop the background flusher, and write the remaining buffered log entries
+        """
+        self._closed.set()
+        self.flush()
+        super().close()
+
+    def _in_transaction(self):
+        """
+        Return True if the current thread's database connection is in a transaction
+        """
+        return connection.in_atomic_block
+
+    def _write(self, buffered_entries):
+        """
+        Validate and store the given (log entry, model object) pairs, then notify the clients about them
+        """
+        log_entry_model = apps.get_model('instance', 'LogEntry')
+        with self._write_lock:
+            log_entries, invalid_entries = log_entry_model.validate_new_entries(
+                [log_entry for log_entry, obj in buffered_entries]
             )
-        except ProgrammingError:
-            # This can occur if django tries to log something before migrations have created the log table.
-            # Make sure that is actually what happened:
-            assert 'instance_logentry' not in connection.introspection.table_names()
-
-        # Send notice of entries related to any resource. Skip generic log entries that occur
-        # in debug mode, like "GET /static/img/favicon/favicon-96x96.png":
-        if content_type:
-            log_event = {
-                'type': 'object_log_line',
-                'log_entry': LogEntrySerializer(log_entry).data
-            }
-            if hasattr(obj, 'event_context'):
-                log_event.update(obj.event_context)
-            # TODO: Filter out log entries for which the user doesn't have view rights
-            # TODO: More targetted events - only emit events for what the user is looking at
-            publish_data(log_event)
+            for log_entry, error in invalid_entries:
+                logger.error('Discarding invalid log entry "%s": %s', log_entry.text, '; '.join(error.messages))
+            try:
+                log_entry_model.objects.bulk_create(log_entries)
+            except ProgrammingError:
+                # This can occur if django tries to log something before migrations have created the log table.
+                # Make sure that is actually what happened:
+                assert 'instance_logentry' not in connection.introspection.table_names()
+                return
+
+            # Send notice of entries related to any resource. Skip generic log entries that occur
+            # in debug mode, like "GET /static/img/favicon/favicon-96x96.png":
+            valid_entry_ids = {id(log_entry) for log_entry in log_entries}
+            notifications = OrderedDict()
+            for log_entry, obj in buffered_entries:
+                if obj is None or id(log_entry) not in valid_entry_ids:
+                    continue
+                notification_key = (log_entry.content_type_id, log_entry.object_id)
+                if notification_key not in notifications:
+                    notifications[notification_key] = (getattr(obj, 'event_context', {}), [])
+                notifications[notification_key][1].append(log_entry)
+
+            for event_context, object_log_entries in notifications.values():
+                log_event = {
+                    'type': 'object_log_lines',
+                    'log_entries': LogEntrySerializer(object_log_entries, many=True).data,
+                }
+                log_event.update(event_context)
+                # Only the clients subscribed to the object receive its log lines
+                publish_data(log_event)
+
+    def _start_flusher(self):
+        """
+        Start the thread flushing buffered log entries every `flush_interval` seconds, if it isn't running
+
+        The handler lock is held, so that threads logging concurrently don't each start a flusher.
+        """
+        self.acquire()
+        try:
+            if self._flusher is not None and self._flusher.is_alive():
+                return
+            self._flusher = threading.Thread(target=self._run_flusher, name='DBHandler-flusher', daemon=True)
+            self._flusher.start()
+        finally:
+            self.release()
+
+    def _run_flusher(self):
+        """
+        Periodically flush the buffered log entries, until the handler is closed
+        """
+        try:
+            while not self._closed.wait(self.flush_interval):
+                try:
+                    self.flush()
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception('Unable to write the buffered log entries to the database')
+                    # Reconnect for the next flush, in case the connection was lost
+                    connection.close()
+        finally:
+            connection.close()
 
 
 class ModelLoggerAdapter(logging.LoggerAdapter):
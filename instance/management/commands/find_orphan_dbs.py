@@ -28,6 +28,7 @@ import pymongo
 
 from instance.models.database_server import MongoDBServer, MySQLServer
 from instance.models.openedx_instance import OpenEdXInstance
+from instance.mysql_pool import execute_batch
 
 LOG = logging.getLogger(__name__)
 
@@ -163,32 +164,30 @@ class Command(BaseCommand):
         for mysql_server in MySQLServer.objects.all():
             self.stderr.write(f"Looking in {mysql_server}")
             try:
-                mysql_con = mysql.connect(
-                    host=mysql_server.hostname,
-                    port=mysql_server.port,
-                    user=mysql_server.username,
-                    password=mysql_server.password,
-                )
+                with mysql_server.get_admin_cursor() as cursor:
+                    cursor.execute("show databases")
+                    eligible_db_names = {
+                        db[0] for db in cursor.fetchall()
+                        if db[0] not in exclude_dbs
+                    }
             except mysql.MySQLError:
                 traceback.print_exc(file=self.stderr)
                 self.stderr.write(
                     f"Failed to connect to {mysql_server}, trying next...")
                 continue
-            with mysql_con.cursor() as cursor:
-                cursor.execute("show databases")
-                eligible_db_names = {
-                    db[0] for db in cursor.fetchall()
-                    if db[0] not in exclude_dbs
-                }
-                orphans = self._find_mysql_orphans(eligible_db_names)
-                for db in orphans:
-                    if kwargs['rm'] and self.confirm(f"Are you sure you want to drop {db}"):
-                        cursor.execute(f"drop database `{db}`")
-                self._print_orphans(
-                    "mysql",
-                    f"{mysql_server.hostname}:{mysql_server.port}",
-                    orphans
-                )
+            orphans = self._find_mysql_orphans(eligible_db_names)
+            dropped_dbs = [
+                db for db in orphans
+                if kwargs['rm'] and self.confirm(f"Are you sure you want to drop {db}")
+            ]
+            if dropped_dbs:
+                with mysql_server.get_admin_cursor() as cursor:
+                    execute_batch(cursor, [(f"drop database `{db}`", ()) for db in dropped_dbs])
+            self._print_orphans(
+                "mysql",
+                f"{mysql_server.hostname}:{mysql_server.port}",
+                orphans
+            )
 
     def _find_mysql_orphans(self, db_names):
         """
@@ -295,12 +295,11 @@ class Command(BaseCommand):
         mysql_commands = self.options.get('preupgrade_sql_commands', [])
         if mysql_commands:
             LOG.info("Performing MySQL commands: %s %s (%s)", instance, instance.domain, instance.id)
-            cursor = instance.get_mysql_cursor_for_db('edxapp')
-            if cursor is not None:
-                for command in mysql_commands:
-                    cursor.execute(command)
-                cursor.execute('COMMIT;')
-                cursor.close()
+            with instance.get_mysql_cursor_for_db('edxapp') as cursor:
+                if cursor is not None:
+                    for command in mysql_commands:
+                        cursor.execute(command)
+                    cursor.execute('COMMIT;')
 
     # TODO simplify to reduce the number of branches
     # pylint: disable=too-many-branches, useless-suppression
@@ -21,11 +21,12 @@ Management command to clean up any OpenStack VMs that are known to be dead, but
 evidently are still running about.
 """
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
 from instance import openstack_utils
-from instance.models.server import OpenStackServer, Status
+from instance.models.server import delete_zombie_vms, find_zombie_vms
 
 
 class Command(BaseCommand):
@@ -54,6 +55,12 @@ class Command(BaseCommand):
             action="store_true",
             help="Runs without actually making any changes."
         )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.KILL_ZOMBIES_WORKERS,
+            help="Maximum number of zombies to terminate concurrently."
+        )
 
     def handle(self, *args, **options):
         """
@@ -74,68 +81,21 @@ class Command(BaseCommand):
             return None
         self.log('Found {} unterminated servers in region {}.'.format(len(nova_servers), self.region))
 
-        # Scan each server for the zombieness.
-        death_count = sum(1 for srv in nova_servers if self.not_zombie_or_die(srv))
+        # Only the servers on record as terminated are zombies.
+        zombies = find_zombie_vms(nova_servers)
+        for zombie in zombies:
+            self.log("Found zombie server {} with status {}.".format(zombie.name, zombie.status))
 
         if self.dry_run:
-            result = "Would have terminated {} zombies if this weren't a dry run.".format(death_count)
+            result = "Would have terminated {} zombies if this weren't a dry run.".format(len(zombies))
         else:
-            result = "Terminated {} zombies.".format(death_count)
+            failures = delete_zombie_vms(zombies, max_workers=options.get("workers") or 1)
+            for nova_server, error in failures:
+                self.log("WARNING: Unable to delete server {}. Error: {}.".format(nova_server.name, error))
+            result = "Terminated {} zombies.".format(len(zombies) - len(failures))
         self.log(result)
         return result
 
-    def not_zombie_or_die(self, nova_server):
-        """
-        Checks if a server is a zombie, and if it is (and only if it is!),
-        terminate it.
-        """
-        self.log("Scanning server {} with status {}...".format(nova_server.name, nova_server.status))
-
-        # Detect whether the server name matches Ocim rules.
-        server = self.find_openstack_server(nova_server.name)
-
-        # Ignore servers that don't match.
-        if not server:
-            self.log("Unknown server {}.  Ignoring.".format(nova_server.name))
-            return False
-
-        # Only terminate the server if it's already expected to be dead.
-        if server.status != Status.Terminated:
-            self.log("Server {} is {}.  Ignoring.".format(nova_server.name, server.status))
-            return False
-
-        # At this point we're ready to kill the zombie.
-        self.log("Terminating zombie server {}.".format(nova_server.name))
-        if not self.dry_run:
-            try:
-                nova_server.delete()
-            except Exception as e:  # pylint: disable=broad-except
-                self.log("WARNING: Unable to delete server. Error: {}.".format(e))
-
-        return True
-
-    def find_openstack_server(self, server_name):
-        """
-        Finds and returns the Ocim OpenStack server corresponding to the Nova server name.
-        """
-        server = None
-        server_name_components = server_name.split("-")
-        server_id = server_name_components[-1]
-        if server_id.isdigit():
-            try:
-                server = OpenStackServer.objects.get(id=server_id)
-            except OpenStackServer.DoesNotExist:
-                pass
-
-        # To be doubly sure we're dealing with the right server, match
-        # against the name prefix as well.
-        if server:
-            server_name_prefix = "-".join(server_name_components[:-1])
-            if server.name_prefix != server_name_prefix:
-                server = None
-
-        return server
-
     def log(self, message):
         """
         Shortcut to log messages with date and time
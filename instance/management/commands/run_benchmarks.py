@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance app - Provisioning hot paths benchmark management command
+"""
+
+# Imports #####################################################################
+
+import argparse
+import json
+import os.path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from instance.tests.benchmarks import BENCHMARKS, find_regressions, is_test_database, run_benchmark
+from instance.tests.fake_backends import BACKENDS
+
+
+# Functions ###################################################################
+
+def parse_latency(value):
+    """
+    Parse a latency in milliseconds, applying to all the backends, or a comma-separated list of
+    `backend=milliseconds` pairs.
+
+    Returns the latency of each backend, in seconds.
+    """
+    try:
+        if '=' not in value:
+            return {backend: float(value) / 1000 for backend in BACKENDS}
+        latency = {}
+        for item in value.split(','):
+            backend, milliseconds = item.split('=')
+            if backend.strip() not in BACKENDS:
+                raise ValueError
+            latency[backend.strip()] = float(milliseconds) / 1000
+        return latency
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'Expected milliseconds, or backend=milliseconds pairs with backends among: {}'.format(', '.join(BACKENDS))
+        )
+
+
+# Classes #####################################################################
+
+class Command(BaseCommand):
+    """
+    Management command measuring the duration, database queries and memory allocation of the provisioning
+    hot paths, and comparing them to a stored baseline.
+
+    The OpenStack, Gandi, Consul and ansible backends, as well as the provisioning of databases and storage,
+    are replaced by fakes with a configurable latency. The data is created in transactions which are rolled
+    back afterwards, in a test database created for the benchmarks unless the database already is one.
+    """
+    help = (
+        'Runs the benchmarks of the provisioning hot paths against fake backends, and reports their median '
+        'duration, query count and peak memory allocation. The results can be saved as a baseline, or compared '
+        'to one, in which case the command fails if any benchmark regressed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'benchmarks',
+            nargs='*',
+            metavar='benchmark',
+            help='Benchmarks to run, among: {}. All of them by default.'.format(', '.join(BENCHMARKS))
+        )
+        parser.add_argument(
+            '--rounds',
+            type=int,
+            default=5,
+            help='Number of measured rounds of each benchmark.'
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=1,
+            help='Number of rounds of each benchmark run before measuring.'
+        )
+        parser.add_argument(
+            '--instances',
+            type=int,
+            default=20,
+            help='Number of instances sharing the load balancer in the benchmarks.'
+        )
+        parser.add_argument(
+            '--latency',
+            type=parse_latency,
+            default={},
+            help='Latency of the fake backends in milliseconds, either for all of them, or as '
+                 'comma-separated backend=milliseconds pairs. Backends: {}.'.format(', '.join(BACKENDS))
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Path of the JSON file storing the baseline results.'
+        )
+        parser.add_argument(
+            '--save-baseline',
+            action='store_true',
+            help='Store the results as the new baseline, instead of comparing them to it.'
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help='Fraction by which a duration or memory allocation may exceed its baseline.'
+        )
+        parser.add_argument(
+            '--noinput', '--no-input',
+            action='store_false',
+            dest='interactive',
+            help='Destroy a leftover test database without asking.'
+        )
+
+    def handle(self, *args, **options):
+        baseline_path = options['baseline']
+        if options['save_baseline'] and not baseline_path:
+            raise CommandError('--save-baseline requires --baseline.')
+        unknown_benchmarks = set(options['benchmarks']) - set(BENCHMARKS)
+        if unknown_benchmarks:
+            raise CommandError('Unknown benchmarks: {}'.format(', '.join(sorted(unknown_benchmarks))))
+
+        if is_test_database():
+            results = self.run_benchmarks(options)
+        else:
+            # Never create the benchmark data next to real data, even in transactions which are rolled back
+            database_name = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=not options['interactive'], serialize=False)
+            try:
+                results = self.run_benchmarks(options)
+            finally:
+                connection.creation.destroy_test_db(database_name, verbosity=0)
+
+        if not baseline_path:
+            return
+        if options['save_baseline']:
+            baseline = {}
+            if os.path.exists(baseline_path):
+                with open(baseline_path) as baseline_file:
+                    baseline = json.load(baseline_file)
+            baseline.update(results)
+            with open(baseline_path, 'w') as baseline_file:
+                json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+            self.stdout.write('Saved the baseline to {}'.format(baseline_path))
+            return
+
+        try:
+            with open(baseline_path) as baseline_file:
+                baseline = json.load(baseline_file)
+        except (OSError, ValueError) as exc:
+            raise CommandError('Cannot read the baseline {}: {}'.format(baseline_path, exc))
+        regressions = find_regressions(results, baseline, tolerance=options['tolerance'])
+        if regressions:
+            raise CommandError('Performance regressions:\n' + '\n'.join(regressions))
+        self.stdout.write('No regression compared to the baseline {}'.format(baseline_path))
+
+    def run_benchmarks(self, options):
+        """
+        Run the benchmarks selected by the options, and report the results of each of them.
+
+        Returns the results by benchmark name.
+        """
+        results = {}
+        for name in options['benchmarks'] or BENCHMARKS:
+            result = results[name] = run_benchmark(
+                name,
+                rounds=options['rounds'],
+                warmup=options['warmup'],
+                latency=options['latency'],
+                instance_count=options['instances'],
+            )
+            self.stdout.write(
+                '{name:<40s} {time_ms:>10.1f} ms {queries:>6d} queries {memory_kib:>10.1f} KiB  {calls}'.format(
+                    name=name,
+                    calls=', '.join(
+                        '{}: {}'.format(backend, count) for backend, count in sorted(result['backend_calls'].items())
+                    ),
+                    **result
+                )
+            )
+        return results
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance app - Shared server load report management command
+"""
+
+# Imports #####################################################################
+
+from collections import OrderedDict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from instance.models.database_server import MongoDBReplicaSet, MongoDBServer, MySQLServer
+from instance.models.load_balancer import LoadBalancingServer
+from instance.models.rabbitmq_server import RabbitMQServer
+from instance.models.redis_server import RedisServer
+
+
+# Constants ###################################################################
+
+SERVER_MODELS = OrderedDict((
+    ('mysql', MySQLServer),
+    ('mongodb', MongoDBServer),
+    ('mongodb-replica-set', MongoDBReplicaSet),
+    ('rabbitmq', RabbitMQServer),
+    ('redis', RedisServer),
+    ('load-balancer', LoadBalancingServer),
+))
+
+
+# Classes #####################################################################
+
+class Command(BaseCommand):
+    """
+    Management command reporting how the instances are spread across the shared servers.
+    """
+    help = (
+        'Lists the number of instances using each shared server and its load, i.e. that number divided by the '
+        'capacity weight of the server, and reports the skew of the load of the servers accepting new clients.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'server_types',
+            nargs='*',
+            metavar='server_type',
+            help='Types of servers to report on, among: {}. All of them by default.'.format(', '.join(SERVER_MODELS))
+        )
+
+    def handle(self, *args, **options):
+        unknown_server_types = set(options['server_types']) - set(SERVER_MODELS)
+        if unknown_server_types:
+            raise CommandError('Unknown server types: {}'.format(', '.join(sorted(unknown_server_types))))
+
+        for server_type in options['server_types'] or SERVER_MODELS:
+            report = SERVER_MODELS[server_type].objects.load_report()
+            skew = report['skew']
+            self.stdout.write('{}: skew {}'.format(server_type, '{:.2f}'.format(skew) if skew else 'n/a'))
+            for row in report['servers']:
+                self.stdout.write(
+                    '  {server!s:<40s} {instance_count:>6d} instances  weight {capacity_weight:>3d}  '
+                    'load {load:>8.2f}{closed}'.format(
+                        closed='' if row['accepts_new_clients'] else '  (closed to new clients)',
+                        **row
+                    )
+                )
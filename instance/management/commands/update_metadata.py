@@ -27,10 +27,8 @@ import sys
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
-import consul
-
 from instance.models.openedx_instance import OpenEdXInstance
-from instance.models.utils import ConsulAgent
+from instance.models.utils import ConsulAgent, get_consul_client
 
 
 # Classes #####################################################################
@@ -72,10 +70,9 @@ class Command(BaseCommand):
         This method will iterate over all non-archived instances to update
         their metadata in Consul.
         """
-        instances = self.get_running_instances()
+        instances = self.get_running_instances().prefetch_related('ref_set')
         self.stdout.write('Updating {} instances\' metadata...'.format(instances.count()))
-        for instance in instances:
-            instance.update_consul_metadata()
+        OpenEdXInstance.update_consul_metadata_of_instances(instances)
         self.stdout.write(self.style.SUCCESS('Successfully updated instances\' metadata'))
 
     def clean_consul_metadata(self):
@@ -86,9 +83,10 @@ class Command(BaseCommand):
         instances_ids = self.get_archived_instances()
         agent = ConsulAgent()
         self.stdout.write('Cleaning metadata for {} archived instances...'.format(len(instances_ids)))
-        for instances_id in instances_ids:
-            prefix = settings.CONSUL_PREFIX.format(ocim=settings.OCIM_ID, instance=instances_id)
-            agent.delete(prefix, recurse=True)
+        agent.delete_trees([
+            settings.CONSUL_PREFIX.format(ocim=settings.OCIM_ID, instance=instances_id)
+            for instances_id in instances_ids
+        ])
         self.stdout.write(self.style.SUCCESS('Successfully cleaned archived instances\' metadata'))
 
     @staticmethod
@@ -109,7 +107,7 @@ class Command(BaseCommand):
 
         :return: A set of all archived OpenEdXInstances
         """
-        agent = consul.Consul()
+        agent = get_consul_client()
         archived_instances_ids = set()
         instances_prefix = '{ocim}/instances/'.format(ocim=settings.OCIM_ID)
         _, consul_instances_keys = agent.kv.get(instances_prefix, recurse=True, keys=True)
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.24 on 2026-10-17 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django_extensions.db.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('instance', '0153_increase_configuration_version_length_limit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loadbalancingserver',
+            name='deployed_configuration_hash',
+            field=models.CharField(blank=True, help_text='The SHA-256 hash of the configuration currently deployed on the load balancer. Reconfigurations which would deploy the same configuration again are skipped.', max_length=64),
+        ),
+        migrations.CreateModel(
+            name='LoadBalancerBackendConfiguration',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('backend_map', models.TextField(blank=True)),
+                ('backend_conf', models.TextField(blank=True)),
+                ('content_hash', models.CharField(blank=True, help_text='The SHA-256 hash of the backend map and configuration.', max_length=64)),
+                ('configuration_version', models.PositiveIntegerField(default=0, help_text='The configuration version of the load balancer when this configuration was generated.')),
+                ('invalidated_version', models.PositiveIntegerField(default=0, help_text='The configuration version of the load balancer when this configuration was invalidated. The configuration is outdated if it was generated for an earlier version.')),
+                ('instance_ref', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='instance.InstanceReference')),
+                ('load_balancing_server', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='backend_configurations', to='instance.LoadBalancingServer')),
+            ],
+            options={
+                'unique_together': {('load_balancing_server', 'instance_ref')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.24 on 2026-10-17 14:05
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# The expressions match the SQL generated by the `icontains` lookup on PostgreSQL,
+# i.e. UPPER("column"::text) LIKE UPPER('%value%'), so that these lookups use the indexes.
+TRIGRAM_INDEXES = (
+    ('instance_instancereference_name_trgm', 'instance_instancereference', 'name'),
+    ('instance_openedxinstance_internal_lms_domain_trgm', 'instance_openedxinstance', 'internal_lms_domain'),
+    ('instance_openedxinstance_external_lms_domain_trgm', 'instance_openedxinstance', 'external_lms_domain'),
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('instance', '0154_load_balancer_backend_configuration'),
+    ]
+
+    operations = [TrigramExtension()] + [
+        migrations.RunSQL(
+            sql='CREATE INDEX {index} ON {table} USING gin (UPPER({column}::text) gin_trgm_ops);'.format(
+                index=index, table=table, column=column,
+            ),
+            reverse_sql='DROP INDEX {index};'.format(index=index),
+        )
+        for index, table, column in TRIGRAM_INDEXES
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.24 on 2026-10-17 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('instance', '0155_instance_search_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='openedxdeployment',
+            name='_status',
+            field=models.CharField(blank=True, choices=[('healthy', 'healthy'), ('unhealthy', 'unhealthy'), ('offline', 'offline'), ('provisioning', 'provisioning'), ('preparing', 'preparing'), ('changes_pending', 'pending')], db_column='status', db_index=True, max_length=20, null=True),
+        ),
+    ]
@@ -0,0 +1,179 @@
+# Generated by Django 2.2.24 on 2026-10-17 17:40
+
+from django.db import migrations, transaction
+from django.utils import timezone
+
+# Declarative partitioning with a default partition and primary keys requires PostgreSQL 11
+MIN_PG_VERSION = 110000
+
+TABLE = 'instance_logentry'
+LEGACY_TABLE = 'instance_logentry_legacy'
+CREATED_CHECK = 'instance_logentry_created_check'
+ID_CREATED_INDEX = 'instance_logentry_id_created_uniq'
+
+# Number of monthly partitions created in advance, after the current month.
+# The `delete_old_logs` task creates the following ones.
+PARTITIONS_AHEAD = 2
+
+
+def add_months(month_start, months):
+    """
+    Returns the beginning of the month `months` months after the month beginning at `month_start`.
+    """
+    years, month_index = divmod(month_start.month - 1 + months, 12)
+    return month_start.replace(year=month_start.year + years, month=month_index + 1)
+
+
+def prepare_legacy_table(cursor, first_month_start):
+    """
+    Prepare the log entries table for being attached as a partition, without blocking the log writes.
+
+    Attaching a table as a partition scans all of its rows to check the partition bounds, and builds the
+    index of the primary key of the partitioned table, while holding an ACCESS EXCLUSIVE lock. Validating a
+    check constraint implying the bounds and building the index concurrently beforehand scans the rows outside
+    of that lock, so the attachment doesn't have to.
+
+    The check constraint rejects the log entries created after the end of the current month, so the migration
+    must complete before then.
+    """
+    cursor.execute(
+        "SELECT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = %s::regclass AND conname = %s)",
+        [TABLE, CREATED_CHECK],
+    )
+    if not cursor.fetchone()[0]:
+        # Only takes the lock briefly: the existing rows are not checked
+        cursor.execute(
+            "ALTER TABLE {table} ADD CONSTRAINT {constraint} CHECK (created < %s) NOT VALID".format(
+                table=TABLE, constraint=CREATED_CHECK,
+            ),
+            [first_month_start],
+        )
+    # Runs in its own transaction, and only takes a SHARE UPDATE EXCLUSIVE lock: reads and writes go on
+    cursor.execute("ALTER TABLE {table} VALIDATE CONSTRAINT {constraint}".format(
+        table=TABLE, constraint=CREATED_CHECK,
+    ))
+    cursor.execute("CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {table} (id, created)".format(
+        table=TABLE, index=ID_CREATED_INDEX,
+    ))
+
+
+def partition_log_entries(apps, schema_editor):
+    """
+    Turn the log entries table into a table partitioned by month of creation.
+
+    The existing table is attached as the partition of all the log entries created before next month, without
+    copying its rows, so that it is dropped by the `delete_old_logs` task once all of its entries are expired.
+
+    The migration isn't atomic: the existing rows are scanned first without blocking the log writes (see
+    `prepare_legacy_table`), then the table is swapped in a transaction which doesn't scan them.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql' or connection.pg_version < MIN_PG_VERSION:
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass)", [TABLE])
+        if cursor.fetchone()[0]:
+            return
+
+        month_start = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        first_month_start = add_months(month_start, 1)
+        prepare_legacy_table(cursor, first_month_start)
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        # Block the log writes from here on, until the new table is in place
+        cursor.execute("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE".format(TABLE))
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT indexrelid::regclass::text FROM pg_index "
+            "WHERE indrelid = %s::regclass AND NOT indisprimary AND indexrelid <> %s::regclass ORDER BY 1",
+            [TABLE, ID_CREATED_INDEX],
+        )
+        index_names = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'", [TABLE]
+        )
+        primary_key_name = cursor.fetchone()[0]
+
+        cursor.execute("ALTER TABLE {} RENAME TO {}".format(TABLE, LEGACY_TABLE))
+        cursor.execute("ALTER TABLE {} RENAME CONSTRAINT {} TO {}_pkey".format(
+            LEGACY_TABLE, primary_key_name, LEGACY_TABLE,
+        ))
+        # The index of the primary key of the partitioned table is only reused by the partition if it backs
+        # a constraint too
+        cursor.execute("ALTER TABLE {legacy_table} ADD CONSTRAINT {legacy_table}_id_created_key "
+                       "UNIQUE USING INDEX {index}".format(legacy_table=LEGACY_TABLE, index=ID_CREATED_INDEX))
+        # Free the index names for the indexes of the partitioned table
+        index_definitions = []
+        for number, index_name in enumerate(index_names):
+            cursor.execute("SELECT pg_get_indexdef(%s::regclass)", [index_name])
+            index_definitions.append(cursor.fetchone()[0])
+            cursor.execute("ALTER INDEX {} RENAME TO {}_idx{}".format(index_name, LEGACY_TABLE, number))
+
+        cursor.execute(
+            "CREATE TABLE {table} (LIKE {legacy_table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            "PARTITION BY RANGE (created)".format(table=TABLE, legacy_table=LEGACY_TABLE)
+        )
+        # The check constraint only bounds the legacy table
+        cursor.execute("ALTER TABLE {} DROP CONSTRAINT {}".format(TABLE, CREATED_CHECK))
+        cursor.execute("ALTER SEQUENCE {} OWNED BY {}.id".format(sequence, TABLE))
+        # The partition key must be part of the primary key
+        cursor.execute("ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, created)".format(
+            table=TABLE,
+        ))
+        for index_definition in index_definitions:
+            cursor.execute(index_definition.replace(
+                ' ON {} '.format(LEGACY_TABLE), ' ON {} '.format(TABLE)
+            ).replace(
+                ' ON public.{} '.format(LEGACY_TABLE), ' ON public.{} '.format(TABLE)
+            ))
+        cursor.execute(
+            "ALTER TABLE {table} ADD CONSTRAINT {table}_content_type_id_fk FOREIGN KEY (content_type_id) "
+            "REFERENCES django_content_type (id) DEFERRABLE INITIALLY DEFERRED".format(table=TABLE)
+        )
+
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM {})".format(LEGACY_TABLE))
+        if cursor.fetchone()[0]:
+            # The validated check constraint proves that the rows are within the bounds, and the indexes of
+            # the table match the ones of the partitioned table, so this doesn't scan the rows.
+            cursor.execute(
+                "ALTER TABLE {table} ATTACH PARTITION {legacy_table} FOR VALUES FROM (MINVALUE) TO (%s)".format(
+                    table=TABLE, legacy_table=LEGACY_TABLE,
+                ),
+                [first_month_start],
+            )
+            cursor.execute("ALTER TABLE {legacy_table} DROP CONSTRAINT {constraint}".format(
+                legacy_table=LEGACY_TABLE, constraint=CREATED_CHECK,
+            ))
+        else:
+            first_month_start = month_start
+            cursor.execute("DROP TABLE {}".format(LEGACY_TABLE))
+
+        cursor.execute("CREATE TABLE {table}_default PARTITION OF {table} DEFAULT".format(table=TABLE))
+        for month in range(PARTITIONS_AHEAD + 1):
+            lower_bound = add_months(first_month_start, month)
+            if lower_bound > add_months(month_start, PARTITIONS_AHEAD):
+                break
+            cursor.execute(
+                "CREATE TABLE {table}_p{month:%Y%m} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)".format(
+                    table=TABLE, month=lower_bound,
+                ),
+                [lower_bound, add_months(lower_bound, 1)],
+            )
+
+
+class Migration(migrations.Migration):
+
+    # The rows of the existing table are scanned outside of the transaction swapping the tables,
+    # see `partition_log_entries`.
+    atomic = False
+
+    dependencies = [
+        ('instance', '0156_openedxdeployment_status'),
+    ]
+
+    # The log entries can't be moved back to a single table without copying all of them
+    operations = [
+        migrations.RunPython(partition_log_entries),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 2.2.24 on 2026-10-17 18:20
+
+from django.db import migrations
+
+TABLE = 'instance_logentry'
+COLUMNS = ('content_type_id', 'object_id', 'id')
+
+
+def get_index_name(schema_editor, table):
+    """
+    Returns the name Django gives to the `index_together` index of the columns on the given table.
+    """
+    return schema_editor._create_index_name(table, COLUMNS, suffix='_idx')
+
+
+def create_cursor_index(apps, schema_editor):
+    """
+    Create the index of the log entries by object and ID without blocking the log writes.
+
+    On a table partitioned by month (see migration 0157), the index of the partitioned table is created invalid
+    on the table only, then the index of each partition is built concurrently and attached to it; the index of the
+    partitioned table becomes valid once the indexes of all its partitions are attached.
+    """
+    connection = schema_editor.connection
+    quote_name = schema_editor.quote_name
+    index_name = get_index_name(schema_editor, TABLE)
+    columns = ', '.join(quote_name(column) for column in COLUMNS)
+    if connection.vendor != 'postgresql':
+        schema_editor.execute("CREATE INDEX {} ON {} ({})".format(quote_name(index_name), quote_name(TABLE), columns))
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass)", [TABLE])
+        if not cursor.fetchone()[0]:
+            cursor.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} ({})".format(
+                quote_name(index_name), quote_name(TABLE), columns,
+            ))
+            return
+
+        # The partitions created from here on get their index along with the partitioned table
+        cursor.execute("CREATE INDEX IF NOT EXISTS {} ON ONLY {} ({})".format(
+            quote_name(index_name), quote_name(TABLE), columns,
+        ))
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = %s::regclass ORDER BY child.relname",
+            [TABLE],
+        )
+        partitions = [row[0] for row in cursor.fetchall()]
+        for partition in partitions:
+            partition_index_name = get_index_name(schema_editor, partition)
+            cursor.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} ({})".format(
+                quote_name(partition_index_name), quote_name(partition), columns,
+            ))
+            cursor.execute(
+                "SELECT EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = %s::regclass)", [partition_index_name]
+            )
+            if not cursor.fetchone()[0]:
+                cursor.execute("ALTER INDEX {} ATTACH PARTITION {}".format(
+                    quote_name(index_name), quote_name(partition_index_name),
+                ))
+
+
+def drop_cursor_index(apps, schema_editor):
+    """
+    Drop the index of the log entries by object and ID, along with the indexes of the partitions attached to it.
+    """
+    index_name = get_index_name(schema_editor, TABLE)
+    schema_editor.execute("DROP INDEX IF EXISTS {}".format(schema_editor.quote_name(index_name)))
+
+
+class Migration(migrations.Migration):
+
+    # The index is built concurrently, which can't be done in a transaction
+    atomic = False
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('instance', '0157_partition_logentry_by_month'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_cursor_index, drop_cursor_index),
+            ],
+            state_operations=[
+                migrations.AlterIndexTogether(
+                    name='logentry',
+                    index_together={('content_type', 'object_id', 'id')},
+                ),
+            ],
+        ),
+    ]
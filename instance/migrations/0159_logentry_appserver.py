@@ -0,0 +1,149 @@
+# Generated by Django 2.2.24 on 2026-10-17 19:05
+
+from django.db import migrations, models, transaction
+from django.db.models import F, OuterRef, Subquery
+import django.db.models.deletion
+
+# Number of appservers whose log entries are attributed to them in each transaction
+APPSERVER_CHUNK_SIZE = 100
+
+TABLE = 'instance_logentry'
+INDEX_COLUMNS = ('appserver_id', 'id')
+
+
+def attribute_log_entries_to_appservers(apps, schema_editor):
+    """
+    Attribute the existing log entries of the appservers and of their servers to the appservers.
+
+    The appservers are processed in chunks, each in its own transaction, so that the rows of the log entries table
+    aren't all locked and rewritten in a single transaction.
+    """
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    LogEntry = apps.get_model('instance', 'LogEntry')
+    OpenEdXAppServer = apps.get_model('instance', 'OpenEdXAppServer')
+
+    content_type_ids = dict(ContentType.objects.filter(
+        app_label='instance', model__in=('openedxappserver', 'openstackserver'),
+    ).values_list('model', 'pk'))
+    appservers = OpenEdXAppServer.objects.order_by('pk').values_list('pk', 'server_id')
+    last_pk = 0
+    while content_type_ids:
+        chunk = list(appservers.filter(pk__gt=last_pk)[:APPSERVER_CHUNK_SIZE])
+        if not chunk:
+            break
+        last_pk = chunk[-1][0]
+        with transaction.atomic(using=schema_editor.connection.alias):
+            if 'openedxappserver' in content_type_ids:
+                LogEntry.objects.filter(
+                    content_type_id=content_type_ids['openedxappserver'],
+                    object_id__in=[appserver_pk for appserver_pk, unused in chunk],
+                ).update(appserver_id=F('object_id'))
+            if 'openstackserver' in content_type_ids:
+                LogEntry.objects.filter(
+                    content_type_id=content_type_ids['openstackserver'],
+                    object_id__in=[server_id for unused, server_id in chunk],
+                ).update(appserver_id=Subquery(
+                    OpenEdXAppServer.objects.filter(server_id=OuterRef('object_id')).values('pk')[:1]
+                ))
+
+
+def get_index_name(schema_editor, table):
+    """
+    Returns the name Django gives to the `index_together` index of the appserver and ID on the given table.
+    """
+    return schema_editor._create_index_name(table, INDEX_COLUMNS, suffix='_idx')
+
+
+def create_appserver_index(apps, schema_editor):
+    """
+    Create the index of the log entries by appserver and ID without blocking the log writes.
+
+    On a table partitioned by month, the index is created on the partitioned table only, then built concurrently
+    on each partition and attached to it, like the index of migration 0158.
+    """
+    connection = schema_editor.connection
+    quote_name = schema_editor.quote_name
+    index_name = get_index_name(schema_editor, TABLE)
+    columns = ', '.join(quote_name(column) for column in INDEX_COLUMNS)
+    if connection.vendor != 'postgresql':
+        schema_editor.execute("CREATE INDEX {} ON {} ({})".format(quote_name(index_name), quote_name(TABLE), columns))
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass)", [TABLE])
+        if not cursor.fetchone()[0]:
+            cursor.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} ({})".format(
+                quote_name(index_name), quote_name(TABLE), columns,
+            ))
+            return
+
+        cursor.execute("CREATE INDEX IF NOT EXISTS {} ON ONLY {} ({})".format(
+            quote_name(index_name), quote_name(TABLE), columns,
+        ))
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = %s::regclass ORDER BY child.relname",
+            [TABLE],
+        )
+        partitions = [row[0] for row in cursor.fetchall()]
+        for partition in partitions:
+            partition_index_name = get_index_name(schema_editor, partition)
+            cursor.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} ({})".format(
+                quote_name(partition_index_name), quote_name(partition), columns,
+            ))
+            cursor.execute(
+                "SELECT EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = %s::regclass)", [partition_index_name]
+            )
+            if not cursor.fetchone()[0]:
+                cursor.execute("ALTER INDEX {} ATTACH PARTITION {}".format(
+                    quote_name(index_name), quote_name(partition_index_name),
+                ))
+
+
+def drop_appserver_index(apps, schema_editor):
+    """
+    Drop the index of the log entries by appserver and ID, along with the indexes of the partitions attached to it.
+    """
+    index_name = get_index_name(schema_editor, TABLE)
+    schema_editor.execute("DROP INDEX IF EXISTS {}".format(schema_editor.quote_name(index_name)))
+
+
+class Migration(migrations.Migration):
+
+    # The log entries are attributed to their appserver in several transactions, and the index is built
+    # concurrently
+    atomic = False
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('instance', '0158_logentry_cursor_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='logentry',
+            name='appserver',
+            field=models.ForeignKey(
+                blank=True,
+                db_constraint=False,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name='+',
+                to='instance.OpenEdXAppServer',
+            ),
+        ),
+        migrations.RunPython(attribute_log_entries_to_appservers, migrations.RunPython.noop),
+        # Created after the backfill, so that the index isn't updated for each row
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_appserver_index, drop_appserver_index),
+            ],
+            state_operations=[
+                migrations.AlterIndexTogether(
+                    name='logentry',
+                    index_together={('content_type', 'object_id', 'id'), ('appserver', 'id')},
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 2.2.24 on 2026-10-17 19:40
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('instance', '0159_logentry_appserver'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loadbalancingserver',
+            name='capacity_weight',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Relative capacity of this server: new instances are assigned to the server with the fewest instances per unit of capacity weight.', validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='mongodbreplicaset',
+            name='capacity_weight',
+            field=models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='mongodbserver',
+            name='capacity_weight',
+            field=models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='mysqlserver',
+            name='capacity_weight',
+            field=models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='rabbitmqserver',
+            name='capacity_weight',
+            field=models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='redisserver',
+            name='capacity_weight',
+            field=models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+    ]
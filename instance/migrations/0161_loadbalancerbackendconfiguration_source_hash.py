@@ -0,0 +1,18 @@
+# Generated by Django 2.2.24 on 2026-10-17 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('instance', '0160_shared_server_capacity_weight'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loadbalancerbackendconfiguration',
+            name='source_hash',
+            field=models.CharField(blank=True, help_text='The SHA-256 hash of the templates and settings this configuration was generated from.', max_length=64),
+        ),
+    ]
@@ -25,9 +25,7 @@ Instance app models - App Server
 import logging
 
 from django.conf import settings
-from django.contrib.contenttypes.models import ContentType
 from django.db import models
-from django.db.models import Q
 from django.utils import timezone
 from django_extensions.db.models import TimeStampedModel
 
@@ -207,6 +205,13 @@ class AppServer(ValidateModelMixin, TimeStampedModel):
         """
         return self.owner.instance
 
+    @property
+    def log_entry_appserver_id(self):
+        """
+        ID of the AppServer which the log entries of this AppServer are attributed to.
+        """
+        return self.pk
+
     @property
     def event_context(self):
         """
@@ -248,12 +253,21 @@ class AppServer(ValidateModelMixin, TimeStampedModel):
                     openstack_region=self.instance.openstack_region,
                 )
         super().save(**kwargs)
+        if self._meta.get_field('server').is_cached(self):
+            # The server can't look this AppServer up while creating it, nor know it was assigned to it
+            self.server.log_entry_appserver_id = self.pk
 
     def terminate_vm(self):
         """
         Ensure that the VM owned by this instance is terminated.
         """
         self.server.terminate()
+        self._update_status_after_vm_termination()
+
+    def _update_status_after_vm_termination(self):
+        """
+        Update the status of this AppServer once its VM was terminated.
+        """
         if self.status == Status.Running:
             self._status_to_terminated()
             self.terminated = timezone.now()
@@ -272,19 +286,16 @@ class AppServer(ValidateModelMixin, TimeStampedModel):
         Returns oldest entries first.
         """
         # TODO: Filter out log entries for which the user doesn't have view rights
-        appserver_type = ContentType.objects.get_for_model(self)
-        server_type = ContentType.objects.get_for_model(self.server)
-        entries = LogEntry.objects.filter(
-            (Q(content_type=appserver_type) & Q(object_id=self.pk)) |
-            (Q(content_type=server_type) & Q(object_id=self.server_id))
-        )
+        # The entries of this AppServer and of its server are attributed to this AppServer when they're stored,
+        # so they're all read with a range scan of the (appserver, id) index, in the order they were stored.
+        entries = LogEntry.objects.filter(appserver_id=self.pk)
         if level_list:
             entries = entries.filter(level__in=level_list)
         if limit:
-            # Apply the limit at the SQL/DB level while sorted by descending date, then reverse.
+            # Apply the limit at the SQL/DB level while sorted by descending ID, then reverse.
             # Otherwise, we'd have to retrieve all rows and then apply the limit using python.
-            return reversed(list(entries[:limit]))
-        return entries.order_by('created')
+            return reversed(list(entries.order_by('-pk')[:limit]))
+        return entries.order_by('pk')
 
     @property
     def log_entries_queryset(self):
@@ -21,16 +21,18 @@ Instance app models - Database Server models
 """
 
 # Imports #####################################################################
+from contextlib import contextmanager
 import logging
-import random
 from urllib.parse import urlparse
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
-from django.db import models, transaction
+from django.core.validators import MinValueValidator
+from django.db import models
 from django_extensions.db.models import TimeStampedModel
 
-from instance.models.shared_server import SharedServerManager
+from instance.models.shared_server import CAPACITY_WEIGHT_HELP_TEXT, SharedServerManager
+from instance.mysql_pool import connect_mysql, get_mysql_pool, read_all_results
 from .utils import ValidateModelMixin
 
 
@@ -127,6 +129,11 @@ class DatabaseServer(ValidateModelMixin, TimeStampedModel):
 
     # Does this database server currently accept new clients (i.e., instances)?
     accepts_new_clients = models.BooleanField(default=False)
+    capacity_weight = models.PositiveSmallIntegerField(
+        default=1,
+        validators=[MinValueValidator(1)],
+        help_text=CAPACITY_WEIGHT_HELP_TEXT,
+    )
 
     @property
     def protocol(self):
@@ -204,23 +211,46 @@ class MySQLServer(DatabaseServer):
     def default_port(self):
         return MYSQL_SERVER_DEFAULT_PORT
 
+    @contextmanager
     def get_admin_cursor(self):
         """
-        Grabs a connection cursor for the admin user on the node. This is useful if you need to perform
-        meta operations like creating and dropping a database. If you need to run a command on data inside of an
-        instance's DB, use the instance's get_mysql_cursor_for_db method instead.
+        Context manager providing a connection cursor for the admin user on the node. This is useful if you need
+        to perform meta operations like creating and dropping a database. If you need to run a command on data
+        inside of an instance's DB, use the instance's get_mysql_cursor_for_db method instead.
+
+        The connection comes from the pool of this server, and is reused by the next cursors. It autocommits each
+        statement, and accepts several statements in a single query.
         """
-        import MySQLdb as mysql
-        conn = mysql.connect(
-            host=self.hostname,
-            user=self.username,
-            passwd=self.password,
-            port=self.port,
-        )
-        return conn.cursor()
+        with get_mysql_pool(self).connection() as connection:
+            cursor = connection.cursor()
+            try:
+                yield cursor
+                # The pending results of a multiple statement query would break the next query on the connection
+                read_all_results(cursor)
+            finally:
+                cursor.close()
 
+    @contextmanager
+    def get_database_cursor(self, database):
+        """
+        Context manager providing a cursor for the admin user on the given database of the node.
+
+        The cursor has a connection of its own, which is closed afterwards: the database selected on a pooled
+        connection would be used by the next cursors of the pool. The statements run in a transaction, which
+        must be committed.
+        """
+        connection = connect_mysql(self.hostname, self.port, self.username, self.password, db=database)
+        try:
+            cursor = connection.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+        finally:
+            connection.close()
 
-class MongoDBReplicaSetManager(models.Manager):
+
+class MongoDBReplicaSetManager(SharedServerManager):
     """
     Custom manager for the DatabaseServer model.
     """
@@ -287,29 +317,15 @@ class MongoDBReplicaSetManager(models.Manager):
                 replica_set=replica_set
             )
 
-    def select_random(self):
+    def filter_accepts_new_clients(self):
         """
-        Select a replica set for a new instance.
-        The current implementation selects one of the replica sets with servers that accept new clients at random.
-        If no database server accepts new clients, DoesNotExist is raised.
+        Returns a query selector of replica sets whose primary server accepts new clients.
         """
-        self._create_default()
-
-        # The set of servers might change between retrieving the server count and retrieving the random server,
-        # so we make this atomic.
-        with transaction.atomic():
-            mongodb_servers = MongoDBServer.objects.filter(
-                replica_set__isnull=False,
-                accepts_new_clients=True,
-                primary=True
-            ).distinct().select_related('replica_set')
-            logger.error(mongodb_servers)
-            count = mongodb_servers.count()
-            if not count:
-                raise self.model.DoesNotExist(
-                    "No server from the replica sets configured accepts new clients."
-                )
-            return mongodb_servers[random.randrange(count)].replica_set
+        return self.filter(pk__in=MongoDBServer.objects.filter(
+            replica_set__isnull=False,
+            accepts_new_clients=True,
+            primary=True,
+        ).values('replica_set'))
 
 
 class MongoDBReplicaSet(TimeStampedModel):
@@ -325,6 +341,11 @@ class MongoDBReplicaSet(TimeStampedModel):
         help_text='Must match name in replicaset_name on a MongoDB server.'
     )
     description = models.CharField(max_length=250, blank=True)
+    capacity_weight = models.PositiveSmallIntegerField(
+        default=1,
+        validators=[MinValueValidator(1)],
+        help_text=CAPACITY_WEIGHT_HELP_TEXT,
+    )
     objects = MongoDBReplicaSetManager()
 
     class Meta:
@@ -123,7 +123,7 @@ class InstanceReference(TimeStampedModel):
         publish_data({
             'type': 'instance_update',
             'instance_id': self.pk,
-        })
+        }, organization_id=self.owner_id)
 
     @classmethod
     def can_manage(cls, user):
@@ -292,10 +292,18 @@ class Instance(ValidateModelMixin, models.Model):
         """
         limit = settings.LOG_LIMIT
 
-        instance_type = ContentType.objects.get_for_model(self)
-        entries = LogEntry.objects.filter(content_type=instance_type, object_id=self.pk)
         # TODO: Filter out log entries for which the user doesn't have view rights
-        return reversed(list(entries[:limit]))
+        return reversed(list(self.log_entries_queryset[:limit]))
+
+    @property
+    def log_entries_queryset(self):
+        """
+        Return the unlimited queryset of the log entries of this Instance.
+
+        Does NOT include log entries of associated AppServers or Servers (VMs)
+        """
+        instance_type = ContentType.objects.get_for_model(self)
+        return LogEntry.objects.filter(content_type=instance_type, object_id=self.pk)
 
     def archive(self, **kwargs):
         """
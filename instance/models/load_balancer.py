@@ -21,6 +21,7 @@ Definition of the Load balancing server model.
 """
 import contextlib
 import functools
+import hashlib
 import logging
 import pathlib
 import random
@@ -29,17 +30,23 @@ import textwrap
 from django.conf import settings
 from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
+from django.core.validators import MinValueValidator
 from django.db import models
+from django.template import loader
 from django_extensions.db.models import TimeStampedModel
 
 from instance import ansible
 from instance.logging import ModelLoggerAdapter
-from instance.models.shared_server import SharedServerManager
+from instance.models.shared_server import CAPACITY_WEIGHT_HELP_TEXT, SharedServerManager
 from instance.models.utils import ValidateModelMixin
 
 
 logger = logging.getLogger(__name__)
 
+# The templates and settings the backend configurations of the instances are generated from.
+BACKEND_CONFIGURATION_TEMPLATES = ('instance/haproxy/openedx.conf', 'instance/haproxy/redirect.conf')
+BACKEND_CONFIGURATION_SETTINGS = ('PRELIMINARY_PAGE_SERVER_IP', 'PRELIMINARY_PAGE_HOSTNAME')
+
 
 class LoadBalancingServerManager(SharedServerManager):
     """
@@ -89,6 +96,17 @@ class OtherReconfigurationInProgress(ReconfigurationException):
     """Exception indicating that another reconfiguration is already in progress."""
 
 
+def hash_configuration(*parts):
+    """
+    Return the SHA-256 hex digest of the given configuration strings.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
 def generate_fragment_name(length):
     """
     Helper function to set the default value of the field `fragment_name_postfix`.
@@ -113,6 +131,11 @@ class LoadBalancingServer(ValidateModelMixin, TimeStampedModel):
         default=False,
         help_text='Whether new backends can be assigned to this load-balancing server.'
     )
+    capacity_weight = models.PositiveSmallIntegerField(
+        default=1,
+        validators=[MinValueValidator(1)],
+        help_text=CAPACITY_WEIGHT_HELP_TEXT,
+    )
 
     fragment_name_postfix = models.CharField(
         max_length=8,
@@ -142,6 +165,15 @@ class LoadBalancingServer(ValidateModelMixin, TimeStampedModel):
         )
     )
 
+    deployed_configuration_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text=(
+            'The SHA-256 hash of the configuration currently deployed on the load balancer. '
+            'Reconfigurations which would deploy the same configuration again are skipped.'
+        )
+    )
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.logger = ModelLoggerAdapter(logger, {'obj': self})
@@ -185,23 +217,105 @@ class LoadBalancingServer(ValidateModelMixin, TimeStampedModel):
             )
             return "", ""
 
+        source_hash = self.get_backend_configuration_source_hash()
+        stored_configurations = {
+            backend_configuration.instance_ref_id: backend_configuration
+            for backend_configuration in self.backend_configurations.all()
+        }
         backend_map = []
         backend_conf = []
         for instance in self.get_instances():
-            triggered_by_instance = instance.ref.pk == triggering_instance_id
-            map_entries, conf_entries = instance.get_load_balancer_configuration(
-                triggered_by_instance
-            )
-            backend_map.extend(
-                " ".join([domain.lower(), backend + self.fragment_name_postfix])
-                for domain, backend in map_entries
-            )
-            backend_conf.extend(
-                "backend {}\n{}\n".format(backend + self.fragment_name_postfix, conf)
-                for backend, conf in conf_entries
-            )
+            backend_configuration = stored_configurations.pop(instance.ref.pk, None)
+            if backend_configuration is None or not backend_configuration.is_current(source_hash):
+                backend_configuration = self._generate_backend_configuration(
+                    instance, instance.ref.pk == triggering_instance_id, source_hash
+                )
+            if backend_configuration.backend_map:
+                backend_map.append(backend_configuration.backend_map)
+            if backend_configuration.backend_conf:
+                backend_conf.append(backend_configuration.backend_conf)
+
+        # The remaining configurations belong to instances which don't use this load balancer anymore
+        if stored_configurations:
+            self.backend_configurations.filter(
+                pk__in=[backend_configuration.pk for backend_configuration in stored_configurations.values()]
+            ).delete()
         return "\n".join(backend_map), "\n".join(backend_conf)
 
+    def get_backend_configuration_source_hash(self):
+        """
+        Return a hash of the templates and settings the backend configurations are generated from.
+
+        Stored backend configurations generated from different templates or settings are outdated,
+        so they are generated again after a deployment changing them.
+        """
+        return hash_configuration(
+            self.fragment_name_postfix,
+            *(loader.get_template(name).template.source for name in BACKEND_CONFIGURATION_TEMPLATES),
+            *(repr(getattr(settings, name)) for name in BACKEND_CONFIGURATION_SETTINGS)
+        )
+
+    def _generate_backend_configuration(self, instance, triggered_by_instance, source_hash):
+        """
+        Render and store the backend map and configuration of the given instance.
+
+        The configuration is stored for the current configuration version and the given source hash,
+        so it is only generated again once the instance invalidates it (see
+        `invalidate_backend_configurations`), or the templates or settings change.
+        """
+        map_entries, conf_entries = instance.get_load_balancer_configuration(triggered_by_instance)
+        backend_map = "\n".join(
+            " ".join([domain.lower(), backend + self.fragment_name_postfix])
+            for domain, backend in map_entries
+        )
+        backend_conf = "\n".join(
+            "backend {}\n{}\n".format(backend + self.fragment_name_postfix, conf)
+            for backend, conf in conf_entries
+        )
+        backend_configuration, unused = LoadBalancerBackendConfiguration.objects.update_or_create(
+            load_balancing_server=self,
+            instance_ref_id=instance.ref.pk,
+            defaults=dict(
+                backend_map=backend_map,
+                backend_conf=backend_conf,
+                content_hash=hash_configuration(backend_map, backend_conf),
+                source_hash=source_hash,
+                configuration_version=self.configuration_version,
+            ),
+        )
+        return backend_configuration
+
+    def invalidate_backend_configurations(self, instance_ref_id=None):
+        """
+        Mark the stored backend configuration of the given instance as outdated, and the load balancer as dirty.
+
+        The configurations of all the instances are invalidated if no instance is given.
+        """
+        # We need to use an F expression here.  The problem is not other processes trying to
+        # increase this counter concurrently – that wouldn't matter, since we don't care whether
+        # we increase this counter by one or by two, since both marks the LB as dirty.  However, if
+        # another process is making a completely unrelated change to the LB object we might lose
+        # the increment altogether.
+        LoadBalancingServer.objects.filter(pk=self.pk).update(
+            configuration_version=models.F("configuration_version") + 1
+        )
+        # Read the version back rather than using self.configuration_version: configurations
+        # generated for an earlier version must not be reused, even if they get stored after this.
+        configuration_version = LoadBalancingServer.objects.values_list(
+            "configuration_version", flat=True
+        ).get(pk=self.pk)
+        if instance_ref_id is None:
+            self.backend_configurations.update(invalidated_version=configuration_version)
+            LoadBalancingServer.objects.filter(pk=self.pk).update(deployed_configuration_hash="")
+        else:
+            # Create a placeholder if the configuration hasn't been stored yet, so that a
+            # reconfiguration currently in progress doesn't store an outdated configuration as current.
+            LoadBalancerBackendConfiguration.objects.update_or_create(
+                load_balancing_server=self,
+                instance_ref_id=instance_ref_id,
+                defaults=dict(invalidated_version=configuration_version),
+            )
+
     def get_ansible_vars(self, triggering_instance_id=None):
         """
         Render the configuration script to be executed on the load balancer.
@@ -260,26 +374,29 @@ class LoadBalancingServer(ValidateModelMixin, TimeStampedModel):
         this method is called because the configuration changed, the flag should be set to True (the
         default).  If this method is called because the LB was marked dirty earlier, the flag
         should be set to False.
+
+        Only the backend configuration of the triggering instance is generated again; the stored
+        configurations of the other instances are reused.  When the LB is marked dirty without a
+        triggering instance, the configurations of all instances are generated and deployed again.
         """
         if mark_dirty:
-            # We need to use an F expression here.  The problem is not other processes trying to
-            # increase this counter concurrently – that wouldn't matter, since we don't care whether
-            # we increase this counter by one or by two, since both marks the LB as dirty.  However, if
-            # another process is making a completely unrelated change to the LB object we might lose
-            # the increment altogether.
-            LoadBalancingServer.objects.filter(pk=self.pk).update(
-                configuration_version=models.F("configuration_version") + 1
-            )
+            self.invalidate_backend_configurations(triggering_instance_id)
 
         try:
             with self._configuration_lock(blocking=False):
                 # Memorize the configuration version, in case new threads change it.
                 self.refresh_from_db()
                 candidate_configuration_version = self.configuration_version
-                self.logger.info("Reconfiguring load-balancing server %s", self.domain)
-                self.run_playbook(self.get_ansible_vars(triggering_instance_id))
+                ansible_vars = self.get_ansible_vars(triggering_instance_id)
+                configuration_hash = hash_configuration(ansible_vars)
+                if configuration_hash == self.deployed_configuration_hash:
+                    self.logger.info("Configuration of load-balancing server %s is unchanged", self.domain)
+                else:
+                    self.logger.info("Reconfiguring load-balancing server %s", self.domain)
+                    self.run_playbook(ansible_vars)
                 LoadBalancingServer.objects.filter(pk=self.pk).update(
-                    deployed_configuration_version=candidate_configuration_version
+                    deployed_configuration_version=candidate_configuration_version,
+                    deployed_configuration_hash=configuration_hash,
                 )
                 self.refresh_from_db()
         except OtherReconfigurationInProgress:
@@ -295,6 +412,7 @@ class LoadBalancingServer(ValidateModelMixin, TimeStampedModel):
             self.run_playbook(
                 "FRAGMENT_NAME: {fragment_name}\nREMOVE_FRAGMENT: True".format(fragment_name=fragment_name)
             )
+            LoadBalancingServer.objects.filter(pk=self.pk).update(deployed_configuration_hash="")
 
     def delete(self, **kwargs):  # pylint: disable=arguments-differ
         """
@@ -318,3 +436,68 @@ class LoadBalancingServer(ValidateModelMixin, TimeStampedModel):
             yield lock
         finally:
             lock.release()
+
+
+class LoadBalancerBackendConfiguration(TimeStampedModel):
+    """
+    The backend map and configuration generated for an instance using a load-balancing server.
+
+    Generating the configuration of an instance takes several queries and template renderings,
+    so it is stored and only generated again after the instance invalidated it, instead of
+    generating the configurations of all instances on each reconfiguration.
+
+    The configuration of an instance is invalidated when a change to the fields it's generated from
+    is saved (see `LoadBalancedInstance.save`), when the public IP address of one of its active
+    appservers is stored, and when the instance triggers a
+    reconfiguration (e.g. after activating or deactivating appservers).  Configurations generated
+    from other templates or settings (see `BACKEND_CONFIGURATION_TEMPLATES` and
+    `BACKEND_CONFIGURATION_SETTINGS`) are outdated too.  Any other change requires a reconfiguration
+    without triggering instance, which generates all the configurations again.
+    """
+    load_balancing_server = models.ForeignKey(
+        LoadBalancingServer,
+        on_delete=models.CASCADE,
+        related_name='backend_configurations',
+    )
+    instance_ref = models.ForeignKey(
+        'InstanceReference',
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    backend_map = models.TextField(blank=True)
+    backend_conf = models.TextField(blank=True)
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text='The SHA-256 hash of the backend map and configuration.',
+    )
+    source_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text='The SHA-256 hash of the templates and settings this configuration was generated from.',
+    )
+    configuration_version = models.PositiveIntegerField(
+        default=0,
+        help_text='The configuration version of the load balancer when this configuration was generated.',
+    )
+    invalidated_version = models.PositiveIntegerField(
+        default=0,
+        help_text=(
+            'The configuration version of the load balancer when this configuration was invalidated. '
+            'The configuration is outdated if it was generated for an earlier version.'
+        ),
+    )
+
+    class Meta:
+        unique_together = ('load_balancing_server', 'instance_ref')
+
+    def __str__(self):
+        return '{} backend configuration for instance reference {}'.format(
+            self.load_balancing_server, self.instance_ref_id
+        )
+
+    def is_current(self, source_hash):
+        """
+        Return True if this configuration was generated from the given source hash after it was last invalidated.
+        """
+        return self.source_hash == source_hash and self.configuration_version >= self.invalidated_version
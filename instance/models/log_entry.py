@@ -22,13 +22,17 @@ Instance app models - LogEntry
 
 # Imports #####################################################################
 
+from collections import defaultdict
 import logging
+import re
 
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import DatabaseError, connection, models, transaction
 from django.db.models.signals import post_delete
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django_extensions.db.models import TimeStampedModel
 
 from .utils import ValidateModelMixin
@@ -38,6 +42,17 @@ from .utils import ValidateModelMixin
 logger = logging.getLogger(__name__)
 
 
+# Constants ###################################################################
+
+# Number of monthly partitions of the log entries table created in advance, after the current month
+LOG_ENTRY_PARTITIONS_AHEAD = 2
+
+# Parses the bounds of the range partitions of the log entries table, as returned by `pg_get_expr()`
+PARTITION_BOUNDS_PATTERN = re.compile(
+    r"FOR VALUES FROM \((?:'(?P<lower_bound>[^']+)'|MINVALUE)\) TO \((?:'(?P<upper_bound>[^']+)'|MAXVALUE)\)"
+)
+
+
 # Models ######################################################################
 
 
@@ -58,11 +73,24 @@ class LogEntry(ValidateModelMixin, TimeStampedModel):
     object_id = models.PositiveIntegerField(null=True, blank=True)
     content_object = GenericForeignKey('content_type', 'object_id')
     level = models.CharField(max_length=9, db_index=True, default='INFO', choices=LOG_LEVEL_CHOICES)
+    # The AppServer whose logs include this entry: the entries of an AppServer and of its VM are attributed to it,
+    # so that they're read with a single index scan. Not a constraint, so that entries outlive their AppServer.
+    appserver = models.ForeignKey(
+        'instance.OpenEdXAppServer',
+        null=True,
+        blank=True,
+        db_index=False,
+        db_constraint=False,
+        on_delete=models.DO_NOTHING,
+        related_name='+',
+    )
 
     class Meta:
         ordering = ('-created', )
         index_together = [
-            ['content_type', 'object_id'],
+            # Also serves the log streams, which read the entries of an object by increasing ID
+            ['content_type', 'object_id', 'id'],
+            ['appserver', 'id'],
         ]
         permissions = (
             ("read_log_entry", "Can read LogEntry"),
@@ -72,22 +100,72 @@ class LogEntry(ValidateModelMixin, TimeStampedModel):
     def __str__(self):
         return '{0.created:%Y-%m-%d %H:%M:%S} | {0.level:>8s} | {0.text}'.format(self)
 
-    def clean_fields(self, **kwargs):  # pylint: disable=arguments-differ
+    def clean_fields(self, exclude=None):  # pylint: disable=arguments-differ
         """
         Clean fields, including the 'object_id' field
         """
-        super().clean_fields(**kwargs)
+        super().clean_fields(exclude=exclude)
         # This check is here rather than in clean() because it must come after the built-in
         # validation of the content_type field, and we should only check object_id if
         # content_type has passed validation.
+        if exclude and 'object_id' in exclude:
+            return
+        self.clean_content_object()
+
+    def clean_content_object(self, existing_objects=None):
+        """
+        Check that 'content_type' and 'object_id' are both set or both None, and refer to an existing object
+
+        `existing_objects` is the set of the (content_type_id, object_id) pairs of the existing objects,
+        when they were already fetched. Otherwise, the object is looked up.
+        """
         if self.content_type_id or self.object_id:
             # If either of these fields are set, both should be:
             if not self.content_type_id or not self.object_id:
                 raise ValidationError('LogEntry content_type and object_id must both be set or both be None.')
             # Ensure that the object_id (primary key) is valid:
-            if not self.content_type.get_all_objects_for_this_type(pk=self.object_id).exists():
+            if existing_objects is None:
+                object_exists = self.content_type.get_all_objects_for_this_type(pk=self.object_id).exists()
+            else:
+                object_exists = (self.content_type_id, self.object_id) in existing_objects
+            if not object_exists:
                 raise ValidationError({'object_id': 'Object attached to LogEntry has bad content_type or primary key'})
 
+    @classmethod
+    def validate_new_entries(cls, log_entries):
+        """
+        Validate the given new log entries like `save()` does, before they're created with `bulk_create()`.
+
+        Rather than two queries per entry, the objects the entries refer to are looked up with one query per
+        content type. Returns the list of the valid entries, and the list of the (entry, error) pairs of the
+        invalid ones.
+        """
+        object_ids = defaultdict(set)
+        for log_entry in log_entries:
+            if log_entry.content_type_id and log_entry.object_id:
+                object_ids[log_entry.content_type_id].add(log_entry.object_id)
+        existing_objects = set()
+        for content_type_id, content_type_object_ids in object_ids.items():
+            content_type = ContentType.objects.get_for_id(content_type_id)
+            existing_objects.update(
+                (content_type_id, object_id)
+                for object_id in content_type.get_all_objects_for_this_type(
+                    pk__in=content_type_object_ids,
+                ).values_list('pk', flat=True)
+            )
+
+        valid_entries, invalid_entries = [], []
+        for log_entry in log_entries:
+            try:
+                # The content types are cached, and the objects were fetched above
+                log_entry.full_clean(exclude=['content_type', 'object_id'])
+                log_entry.clean_content_object(existing_objects)
+            except ValidationError as exc:
+                invalid_entries.append((log_entry, exc))
+            else:
+                valid_entries.append(log_entry)
+        return valid_entries, invalid_entries
+
     @staticmethod
     def on_post_delete(sender, instance, **kwargs):
         """
@@ -106,3 +184,124 @@ class LogEntry(ValidateModelMixin, TimeStampedModel):
             )
 
 post_delete.connect(LogEntry.on_post_delete)
+
+
+# Functions ###################################################################
+
+def _add_months(month_start, months):
+    """
+    Returns the beginning of the month `months` months after the month beginning at `month_start`.
+    """
+    years, month_index = divmod(month_start.month - 1 + months, 12)
+    return month_start.replace(year=month_start.year + years, month=month_index + 1)
+
+
+def is_log_entry_table_partitioned():
+    """
+    Returns True if the log entries table is partitioned by month (on PostgreSQL 11+, see migration 0157).
+    """
+    if connection.vendor != 'postgresql' or connection.pg_version < 100000:
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass)",
+            [LogEntry._meta.db_table],
+        )
+        return cursor.fetchone()[0]
+
+
+def get_log_entry_partitions():
+    """
+    Returns the (name, lower_bound, upper_bound) of the partitions of the log entries table.
+
+    The bounds are None for the default partition, and for the unbounded side of the partition holding
+    the log entries created before the table was partitioned.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) "
+            "FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = %s::regclass "
+            "ORDER BY child.relname",
+            [LogEntry._meta.db_table],
+        )
+        partitions = []
+        for name, bounds in cursor.fetchall():
+            match = PARTITION_BOUNDS_PATTERN.match(bounds)
+            lower_bound = match and match.group('lower_bound')
+            upper_bound = match and match.group('upper_bound')
+            partitions.append((
+                name,
+                parse_datetime(lower_bound) if lower_bound else None,
+                parse_datetime(upper_bound) if upper_bound else None,
+            ))
+        return partitions
+
+
+def create_log_entry_partitions(start=None, months=LOG_ENTRY_PARTITIONS_AHEAD + 1):
+    """
+    Creates the monthly partitions of the log entries table for `months` months from the month of `start`
+    (the current month by default), unless partitions already cover them.
+    """
+    if not is_log_entry_table_partitioned():
+        return
+    table = LogEntry._meta.db_table
+    month_start = (start or timezone.now()).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    partitions = get_log_entry_partitions()
+    for month in range(months):
+        lower_bound = _add_months(month_start, month)
+        upper_bound = _add_months(month_start, month + 1)
+        if any(
+                (partition_upper_bound is None or partition_upper_bound > lower_bound) and
+                (partition_lower_bound is None or partition_lower_bound < upper_bound) and
+                (partition_upper_bound or partition_lower_bound)
+                for _, partition_lower_bound, partition_upper_bound in partitions
+        ):
+            continue
+        name = '{table}_p{month:%Y%m}'.format(table=table, month=lower_bound)
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    "CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)".format(
+                        name=connection.ops.quote_name(name), table=connection.ops.quote_name(table),
+                    ),
+                    [lower_bound, upper_bound],
+                )
+        except DatabaseError:
+            # This happens when the default partition already holds log entries of that month
+            logger.exception('Could not create the log entry partition %s', name)
+        else:
+            logger.info('Created the log entry partition %s', name)
+
+
+def delete_log_entries_before(cutoff, chunk_size):
+    """
+    Deletes the log entries created before `cutoff`.
+
+    The partitions which only hold older log entries are dropped. This takes the same time whatever the
+    number of entries they hold. The remaining old log entries are deleted `chunk_size` entries at a time,
+    so that each deletion only locks a bounded number of rows.
+
+    Returns the names of the dropped partitions, and the number of log entries deleted in chunks.
+    """
+    table = connection.ops.quote_name(LogEntry._meta.db_table)
+    dropped_partitions = []
+    if is_log_entry_table_partitioned():
+        for name, _, upper_bound in get_log_entry_partitions():
+            if upper_bound is not None and upper_bound <= cutoff:
+                with connection.cursor() as cursor:
+                    cursor.execute("DROP TABLE {}".format(connection.ops.quote_name(name)))
+                dropped_partitions.append(name)
+
+    deleted_count = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM {table} WHERE created < %s AND id IN "
+                "(SELECT id FROM {table} WHERE created < %s LIMIT %s)".format(table=table),
+                [cutoff, cutoff, chunk_size],
+            )
+            deleted_count += cursor.rowcount
+        if cursor.rowcount < chunk_size:
+            return dropped_partitions, deleted_count
@@ -31,12 +31,12 @@ import logging
 from django.conf import settings
 from django.db import models
 from django.utils.crypto import get_random_string
-import MySQLdb as mysql
 from MySQLdb import Error as MySQLError
 import pymongo
 from pymongo.errors import PyMongoError
 
 from instance.models.database_server import MySQLServer, MongoDBServer, MongoDBReplicaSet
+from instance.mysql_pool import execute_batch
 
 
 # Logging #####################################################################
@@ -57,57 +57,73 @@ def database_name_escaped(func):
         """ Escape database name, then call func """
         signature = inspect.signature(func)
         bound_arguments = signature.bind(*args, **kwargs)
-        # Obtain connection from cursor passed to func.
+        # Obtain connection from the batch passed to func.
         # This allows us to simplify the signature of func (we don't have to add a "connection" parameter).
-        connection = bound_arguments.arguments["cursor"].connection
+        connection = bound_arguments.arguments["batch"].connection
         database = bound_arguments.arguments["database"]
         bound_arguments.arguments["database"] = connection.escape_string(database).decode()
         func(*bound_arguments.args, **bound_arguments.kwargs)
     return wrapper
 
 
-def _get_mysql_cursor(mysql_server):
+class MySQLStatementBatch:
     """
-    Get a database cursor.
+    MySQL statements collected to run in a single round trip, with the MySQL users they create or drop.
     """
-    try:
-        connection = mysql.connect(
-            host=mysql_server.hostname,
-            user=mysql_server.username,
-            passwd=mysql_server.password,
-            port=mysql_server.port,
+    def __init__(self, cursor, users):
+        """
+        Fetch which of the given users exist, to only create the missing ones and drop the existing ones.
+        """
+        self.cursor = cursor
+        self.connection = cursor.connection
+        self.statements = []
+        users = list(users)
+        # Newer versions of MySQL support "CREATE USER IF NOT EXISTS" and "DROP USER IF EXISTS"
+        # but at this point we can't be sure that all target hosts run one of these,
+        # so we need to use a different approach for now:
+        cursor.execute(
+            'SELECT user FROM mysql.user WHERE user IN ({})'.format(', '.join(['%s'] * len(users))), users
         )
-    except MySQLError as exc:
-        logger.exception('Cannot get MySQL cursor: %s. %s', mysql_server, exc)
-        raise
-    return connection.cursor()
+        self.existing_users = {
+            user.decode() if isinstance(user, bytes) else user for user, in cursor.fetchall()
+        }
+
+    def add(self, query, params=()):
+        """
+        Add a statement to the batch.
+        """
+        self.statements.append((query, tuple(params)))
+
+    def execute(self):
+        """
+        Run the statements of the batch.
+        """
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            execute_batch(self.cursor, self.statements)
+        self.statements = []
 
 
 @database_name_escaped
-def _create_database(cursor, database):
+def _create_database(batch, database):
     """
     Create MySQL database, if it doesn't already exist.
     """
     logger.info('Creating MySQL database: %s', database)
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore")
-        cursor.execute('CREATE DATABASE IF NOT EXISTS `{db}` DEFAULT CHARACTER SET utf8'.format(db=database))
+    batch.add('CREATE DATABASE IF NOT EXISTS `{db}` DEFAULT CHARACTER SET utf8'.format(db=database))
 
 
-def _create_user(cursor, user, password):
+def _create_user(batch, user, password):
     """
     Create MySQL user identified by password if it doesn't exist
     """
-    # Newer versions of MySQL support "CREATE USER IF NOT EXISTS"
-    # but at this point we can't be sure that all target hosts run one of these,
-    # so we need to use a different approach for now:
-    user_exists = cursor.execute("SELECT 1 FROM mysql.user WHERE user = %s", (user,))
-    if not user_exists:
+    if user not in batch.existing_users:
         logger.info('Creating mysql user: %s', user)
-        cursor.execute('CREATE USER %s IDENTIFIED BY %s', (user, password,))
+        batch.add('CREATE USER %s IDENTIFIED BY %s', (user, password,))
+        batch.existing_users.add(user)
 
 
-def _grant_privileges(cursor, database, user, privileges):
+def _grant_privileges(batch, database, user, privileges):
     """
     Grant privileges for databases to MySQL user
     """
@@ -115,46 +131,33 @@ def _grant_privileges(cursor, database, user, privileges):
         tables = "*.*"
     else:
         tables = "`{database}`.*".format(database=database)
-    cursor.execute('GRANT {privileges} ON {tables} TO %s'.format(privileges=privileges, tables=tables), (user,))
+    batch.add('GRANT {privileges} ON {tables} TO %s'.format(privileges=privileges, tables=tables), (user,))
 
 
 @database_name_escaped
-def _drop_database(cursor, database):
+def _drop_database(batch, database):
     """
     Drop MySQL database
     """
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore")
-        logger.info('Dropping mysql db: %s', database)
-        try:
-            cursor.execute('DROP DATABASE IF EXISTS `{db}`'.format(db=database))
-        except MySQLError as exc:
-            logger.exception('Cannot drop MySQL database: %s. %s', database, exc)
-            raise
+    logger.info('Dropping mysql db: %s', database)
+    batch.add('DROP DATABASE IF EXISTS `{db}`'.format(db=database))
 
 
-def _drop_user(cursor, user):
+def _drop_user(batch, user):
     """
     Drop MySQL user if it exists
     """
-    # Newer versions of MySQL support "DROP USER IF EXISTS"
-    # but at this point we can't be sure that all target hosts run one of these,
-    # so we need to use a different approach for now:
-    user_exists = cursor.execute("SELECT 1 FROM mysql.user WHERE user = %s", (user,))
-    if user_exists:
+    if user in batch.existing_users:
         logger.info('Dropping mysql user: %s.', user)
-        try:
-            cursor.execute('DROP USER %s', (user,))
-        except MySQLError as exc:
-            logger.exception('Cannot drop MySQL user: %s. %s', user, exc)
-            raise
+        batch.add('DROP USER %s', (user,))
+        batch.existing_users.discard(user)
 
 
 def select_random_mysql_server():
     """
     Helper for the field default of `mysql_server`.
     """
-    return MySQLServer.objects.select_random().pk
+    return MySQLServer.objects.select_least_loaded().pk
 
 
 def select_random_mongodb_server():
@@ -162,7 +165,7 @@ def select_random_mongodb_server():
     Helper for the field default of `mongodb_server`.
     """
     if getattr(settings, MongoDBServer.DEFAULT_SETTINGS_NAME, None):
-        return MongoDBServer.objects.select_random().pk
+        return MongoDBServer.objects.select_least_loaded().pk
     return None
 
 
@@ -172,7 +175,7 @@ def select_random_mongodb_replica_set():
     """
     if getattr(settings, MongoDBServer.DEFAULT_SETTINGS_NAME, None):
         return None
-    return MongoDBReplicaSet.objects.select_random().pk
+    return MongoDBReplicaSet.objects.select_least_loaded().pk
 
 
 # Classes #####################################################################
@@ -219,33 +222,40 @@ class MySQLInstanceMixin(models.Model):
         Create mysql user and databases
         """
         if self.mysql_server:
-            cursor = _get_mysql_cursor(self.mysql_server)
-
-            # Create migration and read_only users
-            _create_user(cursor, self.migrate_user, self._get_mysql_pass(self.migrate_user))
-            _create_user(cursor, self.read_only_user, self._get_mysql_pass(self.read_only_user))
-
-            # Create default databases and users, and grant privileges
-            for database in self.mysql_databases:
-                database_name = database["name"]
-                _create_database(cursor, database_name)
-                user = database["user"]
-                _create_user(cursor, user, self._get_mysql_pass(user))
-                privileges = database.get("priv", "ALL")
-                _grant_privileges(cursor, database_name, user, privileges)
-                _grant_privileges(cursor, database_name, self.migrate_user, "ALL")
-                _grant_privileges(cursor, database_name, self.read_only_user, "ALL")
-                additional_users = database.get("additional_users", [])
-                for additional_user in additional_users:
-                    _grant_privileges(cursor, database_name, additional_user["name"], additional_user["priv"])
-
-            # Create admin user with appropriate privileges
-            _create_user(cursor, self.admin_user, self._get_mysql_pass(self.admin_user))
-            _grant_privileges(cursor, "*", self.admin_user, "CREATE USER")
-
-            cursor.close()
+            users = {self.migrate_user, self.read_only_user, self.admin_user}
+            users.update(database["user"] for database in self.mysql_databases)
+            with self.mysql_server.get_admin_cursor() as cursor:
+                batch = MySQLStatementBatch(cursor, users)
+
+                # Create migration and read_only users
+                _create_user(batch, self.migrate_user, self._get_mysql_pass(self.migrate_user))
+                _create_user(batch, self.read_only_user, self._get_mysql_pass(self.read_only_user))
+
+                # Create default databases and users, and grant privileges
+                for database in self.mysql_databases:
+                    database_name = database["name"]
+                    _create_database(batch, database_name)
+                    user = database["user"]
+                    _create_user(batch, user, self._get_mysql_pass(user))
+                    privileges = database.get("priv", "ALL")
+                    _grant_privileges(batch, database_name, user, privileges)
+                    _grant_privileges(batch, database_name, self.migrate_user, "ALL")
+                    _grant_privileges(batch, database_name, self.read_only_user, "ALL")
+                    additional_users = database.get("additional_users", [])
+                    for additional_user in additional_users:
+                        _grant_privileges(batch, database_name, additional_user["name"], additional_user["priv"])
+
+                # Create admin user with appropriate privileges
+                _create_user(batch, self.admin_user, self._get_mysql_pass(self.admin_user))
+                _grant_privileges(batch, "*", self.admin_user, "CREATE USER")
+
+                try:
+                    batch.execute()
+                except MySQLError as exc:
+                    logger.exception('Cannot provision MySQL databases and users: %s. %s', self.mysql_server, exc)
+                    raise
             self.mysql_provisioned = True
-            self.save()
+            self.save(update_fields=['mysql_provisioned'])
 
     def deprovision_mysql(self, ignore_errors=False):
         """
@@ -254,17 +264,22 @@ class MySQLInstanceMixin(models.Model):
         self.logger.info('Deprovisioning MySQL started.')
         if self.mysql_server and self.mysql_provisioned:
             try:
-                cursor = _get_mysql_cursor(self.mysql_server)
-
-                # Drop default databases and users
-                for database in self.mysql_databases:
-                    database_name = database["name"]
-                    _drop_database(cursor, database_name)
-                    _drop_user(cursor, database["user"])
-                # Drop users with global privileges
-                for user in self.global_users:
-                    _drop_user(cursor, user)
-            except MySQLError:
+                users = set(self.global_users)
+                users.update(database["user"] for database in self.mysql_databases)
+                with self.mysql_server.get_admin_cursor() as cursor:
+                    batch = MySQLStatementBatch(cursor, users)
+
+                    # Drop default databases and users
+                    for database in self.mysql_databases:
+                        _drop_database(batch, database["name"])
+                        _drop_user(batch, database["user"])
+                    # Drop users with global privileges
+                    for user in self.global_users:
+                        _drop_user(batch, user)
+
+                    batch.execute()
+            except MySQLError as exc:
+                logger.exception('Cannot deprovision MySQL databases and users: %s. %s', self.mysql_server, exc)
                 if not ignore_errors:
                     raise
 
@@ -361,7 +376,7 @@ class MongoDBInstanceMixin(models.Model):
                 self.logger.info('Creating mongo db: %s', database)
                 mongo[database].add_user(self.mongo_user, self.mongo_pass)
             self.mongo_provisioned = True
-            self.save()
+            self.save(update_fields=['mongo_provisioned'])
 
     def deprovision_mongo(self, ignore_errors=False):
         """
@@ -40,9 +40,60 @@ class LoadBalancedInstance(models.Model):
     load_balancing_server = models.ForeignKey(LoadBalancingServer, null=True, blank=True, on_delete=models.PROTECT)
     dns_records_updated = models.DateTimeField(null=True, blank=True, default=None)
 
+    # Fields which the load balancer configuration of the instance is generated from
+    load_balancer_configuration_fields = ()
+
     class Meta:
         abstract = True
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The values of the `load_balancer_configuration_fields` stored in the database, if known
+        self._stored_load_balancer_configuration_values = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remember the values the load balancer configuration of the instance is generated from.
+        """
+        instance = super().from_db(db, field_names, values)
+        instance._stored_load_balancer_configuration_values = instance._get_load_balancer_configuration_values()
+        return instance
+
+    def _get_load_balancer_configuration_values(self):
+        """
+        Return the values of the `load_balancer_configuration_fields`, leaving out the deferred ones.
+        """
+        return {
+            field_name: self.__dict__[field_name]
+            for field_name in self.load_balancer_configuration_fields if field_name in self.__dict__
+        }
+
+    def save(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        """
+        Save this instance, and invalidate its stored load balancer configuration if it changed.
+
+        The stored configuration is only invalidated when one of the `load_balancer_configuration_fields`
+        is saved with a value which differs from the stored one. New instances don't have a stored configuration.
+        """
+        update_fields = kwargs.get('update_fields')
+        configuration_values = self._get_load_balancer_configuration_values()
+        if update_fields is not None:
+            configuration_values = {
+                field_name: value for field_name, value in configuration_values.items() if field_name in update_fields
+            }
+        stored_values = self._stored_load_balancer_configuration_values
+        configuration_changed = not self._state.adding and configuration_values and (
+            stored_values is None or any(
+                stored_values.get(field_name) != value for field_name, value in configuration_values.items()
+            )
+        )
+
+        super().save(*args, **kwargs)
+        self._stored_load_balancer_configuration_values = dict(stored_values or {}, **configuration_values)
+        if configuration_changed and self.load_balancing_server_id is not None:
+            self.load_balancing_server.invalidate_backend_configurations(self.ref.pk)
+
     def get_load_balanced_domains(self):
         """
         Return an iterable of domains that should be handled by the load balancer.
@@ -60,10 +111,11 @@ class LoadBalancedInstance(models.Model):
         Create CNAME records for the domain names of this instance pointing to the load balancer.
         """
         load_balancer_domain = self.load_balancing_server.domain.rstrip(".") + "."
-        for domain in self.get_managed_domains():
-            gandi.api.set_dns_record(domain, type="CNAME", value=load_balancer_domain)
+        gandi.api.update_dns_records(set_records=[
+            (domain, dict(type="CNAME", value=load_balancer_domain)) for domain in self.get_managed_domains()
+        ])
         self.dns_records_updated = datetime.now(timezone.utc)
-        self.save()
+        self.save(update_fields=['dns_records_updated'])
 
     def remove_dns_records(self, ignore_errors=False):
         """
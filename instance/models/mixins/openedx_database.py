@@ -19,11 +19,11 @@
 """
 Open edX instance database mixin
 """
+from contextlib import contextmanager
 import hashlib
 import hmac
 
 from django.db import models
-import MySQLdb as mysql
 import yaml
 
 from instance.models.mixins.database import MySQLInstanceMixin, MongoDBInstanceMixin
@@ -228,22 +228,20 @@ class OpenEdXDatabaseMixin(MySQLInstanceMixin, MongoDBInstanceMixin, RabbitMQIns
             # We should never use this with user input anyway, so it should be OK.
             cursor.execute(f'DROP DATABASE {db_name}')
 
+    @contextmanager
     def get_mysql_cursor_for_db(self, db_suffix):
         """
-        Get an adminstrative cursor with which to execute queries on the database
-        for the application linked to the provided db_suffix.
+        Context manager providing an adminstrative cursor with which to execute queries on the database
+        for the application linked to the provided db_suffix, or None if the instance has no MySQL server.
+
+        The queries run in a transaction, which must be committed (see `MySQLServer.get_database_cursor`).
         """
         if not self.mysql_server:
-            return None
+            yield None
+            return
         db_name = self._get_mysql_database_name(db_suffix)
-        conn = mysql.connect(
-            host=self.mysql_server.hostname,
-            user=self.mysql_server.username,
-            passwd=self.mysql_server.password,
-            port=self.mysql_server.port,
-            database=db_name,
-        )
-        return conn.cursor()
+        with self.mysql_server.get_database_cursor(db_name) as cursor:
+            yield cursor
 
     def _get_mysql_user_name(self, suffix):
         """
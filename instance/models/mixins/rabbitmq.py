@@ -28,8 +28,8 @@ import urllib.parse
 
 from django.db import IntegrityError, models
 from django.utils.crypto import get_random_string
-import requests
 
+from instance import http_client
 from instance.models.rabbitmq import RabbitMQUser
 from instance.models.rabbitmq_server import RabbitMQServer
 
@@ -65,7 +65,7 @@ def select_random_rabbitmq_server():
     """
     Helper for the field default of `rabbitmq_server`.
     """
-    return RabbitMQServer.objects.select_random().pk
+    return RabbitMQServer.objects.select_least_loaded().pk
 
 
 # Classes #####################################################################
@@ -118,7 +118,8 @@ class RabbitMQInstanceMixin(models.Model):
             data = json.dumps(data)
 
         url = '{api_url}/api/{args}'.format(api_url=self.rabbitmq_server.api_url, args=formatted_args)
-        response = getattr(requests, action)(
+        response = http_client.request(
+            action.upper(),
             url,
             auth=(self.rabbitmq_server.admin_username, self.rabbitmq_server.admin_password),
             headers={'content-type': 'application/json'},
@@ -189,7 +190,7 @@ class RabbitMQInstanceMixin(models.Model):
                     'read': '.*'
                 })
         self.rabbitmq_provisioned = True
-        self.save()
+        self.save(update_fields=['rabbitmq_provisioned'])
 
     def deprovision_rabbitmq(self, ignore_errors=False):
         """
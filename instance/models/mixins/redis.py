@@ -54,14 +54,10 @@ def select_random_redis_server():
     """
     Helper for the field default of `redis_server`.
 
-    The random server selection does not make sense in case if one RedisServer
-    is available at a time, though if multiple servers are registered it serves
-    as a very basic "load balancer".
-
-    It selects a random server that accepts new connections. If the default
+    It selects the least loaded server that accepts new connections. If the default
     Redis instance's URL is set, it also creates a Redis server based on it.
     """
-    return RedisServer.objects.select_random().pk
+    return RedisServer.objects.select_least_loaded().pk
 
 
 # Classes #####################################################################
@@ -151,7 +147,7 @@ class RedisInstanceMixin(models.Model):
         self.create_redis_acl(client)
 
         self.redis_provisioned = True
-        self.save()
+        self.save(update_fields=['redis_provisioned'])
 
     def deprovision_redis(self, ignore_errors=False):
         """
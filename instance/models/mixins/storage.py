@@ -136,7 +136,7 @@ class SwiftContainerInstanceMixin(models.Model):
                     region=self.swift_openstack_region,
                 )
             self.swift_provisioned = True
-            self.save()
+            self.save(update_fields=['swift_provisioned'])
 
     def deprovision_swift(self):
         """
@@ -296,7 +296,7 @@ class S3BucketInstanceMixin(models.Model):
         access_key = self.iam.create_access_key(UserName=self.iam_username)['AccessKey']
         self.s3_access_key = access_key['AccessKeyId']
         self.s3_secret_access_key = access_key['SecretAccessKey']
-        self.save()
+        self.save(update_fields=['s3_access_key', 's3_secret_access_key'])
 
     @property
     def s3(self):
@@ -462,6 +462,7 @@ class S3BucketInstanceMixin(models.Model):
 
         if not self.s3_bucket_name:
             self.s3_bucket_name = self.bucket_name
+            self.save(update_fields=['s3_bucket_name'])
 
         if not self.s3_access_key and not self.s3_secret_access_key:
             self.create_iam_user()
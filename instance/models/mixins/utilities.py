@@ -257,7 +257,7 @@ def _extract_most_relevant_log(entries, task_name_pattern, relevant_log_pattern)
     task_name: str = ""
     log_entry: Dict[str, Any] = dict()
 
-    for entry in entries.order_by('-created')[:settings.LOG_LIMIT]:
+    for entry in entries.order_by('-pk')[:settings.LOG_LIMIT]:
         if log_entry and task_name:
             break
 
@@ -802,4 +802,4 @@ class OpenEdXAppServer(AppServer, OpenEdXAppConfiguration, AnsibleAppServerMixin
             'type': 'openedx_appserver_update',
             'appserver_id': self.pk,
             'instance_id': self.owner.pk,
-        })
+        }, organization_id=self.owner.owner_id)
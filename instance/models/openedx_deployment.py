@@ -21,11 +21,15 @@ Instance app models - Open EdX Deployment models
 """
 
 from django.contrib.postgres.fields import JSONField
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
 from instance.models.appserver import Status
 from instance.models.deployment import Deployment
+from instance.models.openedx_appserver import OpenEdXAppServer
 from instance.models.openedx_instance import OpenEdXInstance
+from instance.signals import resource_state_changed
 from instance.utils import DjangoChoiceEnum
 
 
@@ -66,11 +70,52 @@ class OpenEdXDeployment(Deployment):
     changes = JSONField(null=True, blank=True)
     # Field which denotes if the deployment was cancelled by the user
     cancelled = models.BooleanField(default=False)
+    # Name of the current DeploymentState of the deployment, updated by `update_status()` whenever
+    # its AppServers change. Null until the state of the deployment has been computed once.
+    _status = models.CharField(
+        max_length=20,
+        choices=DeploymentState.choices(),
+        null=True,
+        blank=True,
+        db_index=True,
+        db_column='status',
+    )
 
-     # pylint: disable=too-many-return-statements
     def status(self):
         """
-        Current state of deployment.
+        Current state of deployment, see `compute_status()`.
+
+        The state is stored and kept up to date as the AppServers of the deployment change,
+        so this doesn't need any query unless the state was never computed.
+
+        :return: A DeploymentState for the deployment
+        """
+        if self._status is None:
+            return self.update_status()
+        return DeploymentState[self._status]
+
+    def update_status(self):
+        """
+        Compute the current state of the deployment, and store it.
+
+        The deployment row is locked while its state is computed: when several AppServers change
+        concurrently, the last transaction to store the state sees the changes of all the others.
+
+        :return: A DeploymentState for the deployment
+        """
+        with transaction.atomic():
+            locked_deployments = OpenEdXDeployment.objects.select_for_update().filter(pk=self.pk)
+            deployment_exists = bool(locked_deployments.values_list('pk', flat=True))
+            deployment_status = self.compute_status()
+            if deployment_exists:
+                OpenEdXDeployment.objects.filter(pk=self.pk).update(_status=deployment_status.name)
+        self._status = deployment_status.name
+        return deployment_status
+
+     # pylint: disable=too-many-return-statements
+    def compute_status(self):
+        """
+        Compute the current state of deployment from the state of its AppServers.
 
         This returns an aggregate state for the deployment, and will be one of:
 
@@ -191,3 +236,92 @@ class OpenEdXDeployment(Deployment):
         verbose_name = 'Open edX Deployment'
         ordering = ('-created',)
         get_latest_by = 'created'
+
+
+# Functions ###################################################################
+
+def update_deployment_status(deployment_id):
+    """
+    Update the stored state of the OpenEdXDeployment with the given ID, if it exists.
+    """
+    if deployment_id is None:
+        return
+    try:
+        deployment = OpenEdXDeployment.objects.get(pk=deployment_id)
+    except OpenEdXDeployment.DoesNotExist:
+        return
+    deployment.update_status()
+
+
+# Signal handlers #############################################################
+
+@receiver(resource_state_changed, sender=OpenEdXAppServer)
+def update_status_after_appserver_transition(sender, resource, **kwargs):
+    """
+    Update the state of a deployment when the state of one of its AppServers changes.
+    """
+    update_deployment_status(resource.deployment_id)
+
+
+@receiver(post_save, sender=OpenEdXAppServer)
+def update_status_after_appserver_save(sender, instance, created, update_fields, **kwargs):
+    """
+    Update the state of a deployment when an AppServer is added to it.
+
+    Saving only the state of the AppServer is handled by `update_status_after_appserver_transition`.
+    """
+    if created or update_fields is None or 'deployment' in update_fields:
+        update_deployment_status(instance.deployment_id)
+
+
+@receiver(post_delete, sender=OpenEdXAppServer)
+def update_status_after_appserver_delete(sender, instance, **kwargs):
+    """
+    Update the state of a deployment when one of its AppServers is deleted.
+    """
+    update_deployment_status(instance.deployment_id)
+
+
+@receiver(post_save, sender=OpenEdXDeployment)
+def update_status_after_deployment_creation(sender, instance, created, **kwargs):
+    """
+    Compute the state of new deployments.
+
+    The first deployment of an instance is special (see `compute_status()`), so the previous deployments
+    of the instance which were still preparing are updated too.
+    """
+    if not created:
+        return
+    instance.update_status()
+    for deployment in OpenEdXDeployment.objects.filter(
+            instance_id=instance.instance_id, _status=DeploymentState.preparing.name,
+    ).exclude(pk=instance.pk):
+        deployment.update_status()
+
+
+@receiver(post_delete, sender=OpenEdXDeployment)
+def update_status_after_deployment_delete(sender, instance, **kwargs):
+    """
+    Update the state of the other deployments of an instance when one is deleted, as the remaining one
+    may now be the first deployment of the instance.
+    """
+    for deployment in OpenEdXDeployment.objects.filter(
+            instance_id=instance.instance_id,
+            _status__in=(DeploymentState.changes_pending.name, DeploymentState.provisioning.name),
+    ):
+        deployment.update_status()
+
+
+@receiver(post_save, sender=OpenEdXInstance)
+def update_status_after_appserver_count_change(sender, instance, created, **kwargs):
+    """
+    Update the state of the deployments of an instance when its required number of AppServers changes.
+    """
+    loaded_appserver_count = getattr(instance, '_loaded_openedx_appserver_count', None)
+    instance._loaded_openedx_appserver_count = instance.openedx_appserver_count
+    if created or loaded_appserver_count == instance.openedx_appserver_count:
+        return
+    for deployment in OpenEdXDeployment.objects.filter(
+            instance__in=instance.ref_set.all(),
+    ).exclude(_status__isnull=True):
+        deployment.update_status()
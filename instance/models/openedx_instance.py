@@ -19,6 +19,8 @@
 """
 Instance app models - Open edX Instance models
 """
+import itertools
+from operator import attrgetter
 import string
 import re
 
@@ -48,10 +50,11 @@ from instance.models.mixins.openedx_storage import OpenEdXStorageMixin
 from instance.models.mixins.openedx_studio_oauth import OpenEdXStudioOauthMixin
 from instance.models.mixins.openedx_theme import OpenEdXThemeMixin
 from instance.models.mixins.secret_keys import SecretKeyInstanceMixin
-from instance.models.openedx_appserver import OpenEdXAppConfiguration
+from instance.models.openedx_appserver import OpenEdXAppConfiguration, OpenEdXAppServer
+from instance.models.server import Status as ServerStatus, terminate_servers
 from instance.models.utils import ConsulAgent, WrongStateException, get_base_playbook_name
 from instance.signals import appserver_spawned
-from instance.utils import sufficient_time_passed
+from instance.utils import run_steps, sufficient_time_passed
 from registration.models import BetaTestApplication
 
 
@@ -88,11 +91,30 @@ class OpenEdXInstance(
     successfully_provisioned = models.BooleanField(default=False)
     database_name = models.CharField(blank=False, unique=True, max_length=60)
 
+    # Fields used by `get_load_balancer_configuration()`
+    load_balancer_configuration_fields = (
+        'internal_lms_domain', 'internal_lms_preview_domain', 'internal_studio_domain', 'internal_discovery_domain',
+        'internal_ecommerce_domain', 'internal_mfe_domain', 'external_lms_domain', 'external_lms_preview_domain',
+        'external_studio_domain', 'external_discovery_domain', 'external_ecommerce_domain', 'external_mfe_domain',
+        'extra_custom_domains', 'enable_prefix_domains_redirect', 'http_auth_user', 'http_auth_pass',
+    )
+
     def __init__(self, *args, **kwargs):
         """Init."""
         self.random_prefix = kwargs.pop('random_prefix', None)
+        # The number of AppServers stored in the database, to update the state of the deployments when it changes
+        self._loaded_openedx_appserver_count = None
         super().__init__(*args, **kwargs)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remember the number of AppServers loaded from the database.
+        """
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_openedx_appserver_count = instance.__dict__.get('openedx_appserver_count')
+        return instance
+
     class Meta:
         verbose_name = 'Open edX Instance'
 
@@ -125,6 +147,30 @@ class OpenEdXInstance(
             return self.ref._cached_active_appservers
         return self.appserver_set.filter(_is_active=True)
 
+    def get_appserver_count(self):
+        """
+        Returns the number of appservers of this instance.
+        """
+        if hasattr(self.ref, '_cached_appserver_count'):
+            # Annotated by the /api/v1/instances/ endpoint query, see get_active_appservers()
+            return self.ref._cached_appserver_count
+        return self.appserver_set.count()
+
+    def get_newest_appserver(self):
+        """
+        Returns the most recently created appserver, or None if there is none.
+        """
+        if hasattr(self.ref, '_cached_newest_appservers'):
+            # Prefetched by the /api/v1/instances/ endpoint query, see get_active_appservers()
+            newest_appservers = self.ref._cached_newest_appservers
+        else:
+            # Note that appservers are ordered by '-created' by default.
+            newest_appservers = self.appserver_set.all()[:1]
+        try:
+            return newest_appservers[0]
+        except IndexError:
+            return None
+
     def get_latest_deployment(self):
         """ The latest OpenEdXDeployment associated with this instance. """
         deployment = super(OpenEdXInstance, self).get_latest_deployment()
@@ -249,17 +295,21 @@ class OpenEdXInstance(
         self.logger.info("Setting DNS records for active app servers...")
         with cache.lock('appserver_dns_record_update_{}'.format(self.ref.instance_id)):
             active_appservers = self.get_active_appservers()
+            set_records = []
             for i, appserver in enumerate(active_appservers, 1):
                 ip_addr = appserver.server.public_ip
 
                 if ip_addr:
                     domain = "vm{index}.{base_domain}".format(index=i, base_domain=self.internal_lms_domain)
-                    gandi.api.set_dns_record(domain, type="A", value=ip_addr)
+                    set_records.append((domain, dict(type="A", value=ip_addr)))
 
+            remove_records = []
             if deactivate_appserver:
                 unused_dns_index = active_appservers.count() + 1
                 domain = "vm{index}.{base_domain}".format(index=unused_dns_index, base_domain=self.internal_lms_domain)
-                gandi.api.remove_dns_record(domain, type="A")
+                remove_records.append((domain, dict(type="A")))
+
+            gandi.api.update_dns_records(set_records=set_records, remove_records=remove_records)
 
     def clean_up_appserver_dns_records(self):
         """
@@ -267,9 +317,10 @@ class OpenEdXInstance(
         """
         self.logger.info("Cleaning up DNS records for app servers...")
         with cache.lock('appserver_dns_record_update_{}'.format(self.ref.instance_id)):
-            for i, _ in enumerate(self.get_active_appservers(), 1):
-                domain = "vm{index}.{base_domain}".format(index=i, base_domain=self.internal_lms_domain)
-                gandi.api.remove_dns_record(domain, type="A")
+            gandi.api.update_dns_records(remove_records=[
+                ("vm{index}.{base_domain}".format(index=i, base_domain=self.internal_lms_domain), dict(type="A"))
+                for i, _ in enumerate(self.get_active_appservers(), 1)
+            ])
 
     @property
     def appserver_set(self):
@@ -313,42 +364,54 @@ class OpenEdXInstance(
 
             Returns the ID of the new AppServer on success or None on failure.
         """
-        if not self.load_balancing_server:
-            self.load_balancing_server = LoadBalancingServer.objects.select_random()
-            self.save()
-            self.reconfigure_load_balancer()
-
-        # We unconditionally set the DNS records here, though this would only be strictly needed
-        # when the first AppServer is spawned.  However, there is no easy way to tell whether the
-        # DNS records have already been successfully set, and it doesn't hurt to always do it.
-        self.set_dns_records()
+        if self.cache_db not in (OpenEdXDatabaseMixin.REDIS, OpenEdXDatabaseMixin.RABBIT_MQ):
+            raise NotImplementedError(f"{self.cache_db} does not provision any cache DBs")
 
-        # Provision external databases:
+        # Provision the resources used by the new AppServer. The steps are independent network round-trips,
+        # except for the DNS records which point to the load balancer, so they are run concurrently.
         # TODO: Use db row-level locking to ensure we don't get any race conditions when creating these DBs.
         # Use select_for_update(nowait=True) to lock this object's row, then do these steps, then refresh_from_db
-        self.logger.info('Provisioning MySQL database...')
-        self.provision_mysql()
-        self.logger.info('Provisioning MongoDB databases...')
-        self.provision_mongo()
+        steps = {
+            'load balancer': (self._provision_load_balancer, ()),
+            # We unconditionally set the DNS records here, though this would only be strictly needed
+            # when the first AppServer is spawned.  However, there is no easy way to tell whether the
+            # DNS records have already been successfully set, and it doesn't hurt to always do it.
+            'DNS records': (self.set_dns_records, ('load balancer',)),
+            'MySQL': (self._log_and_call('Provisioning MySQL database...', self.provision_mysql), ()),
+            'MongoDB': (self._log_and_call('Provisioning MongoDB databases...', self.provision_mongo), ()),
+        }
         if self.storage_type == self.SWIFT_STORAGE:
-            self.logger.info('Provisioning Swift container...')
-            self.provision_swift()
+            steps['storage'] = (self._log_and_call('Provisioning Swift container...', self.provision_swift), ())
         elif self.storage_type == self.S3_STORAGE:
-            self.logger.info('Provisioning S3 bucket...')
-            self.provision_s3()
-
+            steps['storage'] = (self._log_and_call('Provisioning S3 bucket...', self.provision_s3), ())
         if self.cache_db == OpenEdXDatabaseMixin.REDIS:
-            self.logger.info('Provisioning Redis user ACL...')
-            self.provision_redis()
-
-        elif self.cache_db == OpenEdXDatabaseMixin.RABBIT_MQ:
-            self.logger.info('Provisioning RabbitMQ vhost...')
-            self.provision_rabbitmq()
+            steps['cache DB'] = (self._log_and_call('Provisioning Redis user ACL...', self.provision_redis), ())
         else:
-            raise NotImplementedError(f"{self.cache_db} does not provision any cache DBs")
+            steps['cache DB'] = (self._log_and_call('Provisioning RabbitMQ vhost...', self.provision_rabbitmq), ())
+
+        run_steps(steps, max_workers=settings.SPAWN_APPSERVER_PROVISIONING_WORKERS, logger_=self.logger)
 
         return self._create_owned_appserver(deployment_id=deployment_id)
 
+    def _provision_load_balancer(self):
+        """
+        Assign a load balancer to this instance, if it doesn't have one yet.
+        """
+        if not self.load_balancing_server:
+            self.load_balancing_server = LoadBalancingServer.objects.select_least_loaded()
+            self.save(update_fields=['load_balancing_server'])
+            self.reconfigure_load_balancer()
+
+    def _log_and_call(self, message, func):
+        """
+        Return a function logging `message` to the instance log before calling `func`.
+        """
+        def log_and_call():
+            """ Log the message and call the function """
+            self.logger.info(message)
+            return func()
+        return log_and_call
+
     @log_exception
     def spawn_appserver(self,
                         mark_active_on_success=False,
@@ -462,33 +525,8 @@ class OpenEdXInstance(
         - a fallback appserver, for `days` after activating an appserver, to allow reverts
           (we keep the most recent running appserver created before the latest activation)
         """
-        latest_active_appserver = None
-        if self.get_active_appservers().exists():
-            latest_active_appserver = self.get_active_appservers().latest('last_activated')
-        fallback_appserver = None
-        rc_appserver = None
-        now = timezone.now()
-
-        for appserver in self.appserver_set.all().order_by('-created'):
-            # Skip active appservers
-            if appserver.is_active:
-                continue
-
-            # Keep a running appserver as fallback for `days` after latest activation, to allow reverts
-            if latest_active_appserver and appserver.created < latest_active_appserver.last_activated:
-                if not sufficient_time_passed(latest_active_appserver.last_activated, now, days) \
-                        and not fallback_appserver and appserver.status == AppServerStatus.Running:
-                    fallback_appserver = appserver
-                elif sufficient_time_passed(appserver.created, now, days):
-                    appserver.terminate_vm()
-
-            # Keep the most recent running appserver created after activation (or when none is activated)
-            # to allow testing of a release candidate (rc)
-            else:
-                if not rc_appserver and appserver.status == AppServerStatus.Running:
-                    rc_appserver = appserver
-                elif sufficient_time_passed(appserver.created, now, days):
-                    appserver.terminate_vm()
+        for appserver in get_obsolete_appservers(self.appserver_set.all(), timezone.now(), days):
+            appserver.terminate_vm()
 
     def archive(self, **kwargs):
         """
@@ -631,6 +669,23 @@ class OpenEdXInstance(
         version, updated = self._write_metadata_to_consul(new_configurations)
         return version, updated
 
+    @classmethod
+    def update_consul_metadata_of_instances(cls, instances):
+        """
+        Reflect the configurations of all the given instances on Consul, as `update_consul_metadata` does,
+        writing them in a few transactions instead of one request per instance.
+
+        :return: A dict of (version, changed) pairs by instance ID.
+        """
+        if not settings.CONSUL_ENABLED:
+            return {}
+
+        instances = [instance for instance in instances if not instance.ref.is_archived]
+        results = ConsulAgent().create_or_update_dicts({
+            instance.consul_prefix: instance._generate_consul_metadata() for instance in instances
+        })
+        return {instance.id: results[instance.consul_prefix] for instance in instances}
+
     def purge_consul_metadata(self):
         """
         This method is responsible for purging all instances' metadata from
@@ -649,3 +704,82 @@ class OpenEdXInstance(
         """
         in_progress_statuses = AppServerStatus.states_with(ids_only=True, is_configuration_state=True)
         return self.appserver_set.filter(_status__in=in_progress_statuses)
+
+
+# Functions ###################################################################
+
+def get_obsolete_appservers(appservers, now, days=2):
+    """
+    Return the obsolete app servers among `appservers`, all the app servers of an instance, newest first.
+
+    See `OpenEdXInstance.terminate_obsolete_appservers` for the app servers which are kept.
+    """
+    appservers = sorted(appservers, key=lambda appserver: appserver.created, reverse=True)
+    active_appservers = [appserver for appserver in appservers if appserver.is_active]
+    latest_active_appserver = None
+    if active_appservers:
+        latest_active_appserver = max(active_appservers, key=lambda appserver: appserver.last_activated)
+    fallback_appserver = None
+    rc_appserver = None
+    obsolete_appservers = []
+
+    for appserver in appservers:
+        # Skip active appservers
+        if appserver.is_active:
+            continue
+
+        # Keep a running appserver as fallback for `days` after latest activation, to allow reverts
+        if latest_active_appserver and appserver.created < latest_active_appserver.last_activated:
+            if not sufficient_time_passed(latest_active_appserver.last_activated, now, days) \
+                    and not fallback_appserver and appserver.status == AppServerStatus.Running:
+                fallback_appserver = appserver
+            elif sufficient_time_passed(appserver.created, now, days):
+                obsolete_appservers.append(appserver)
+
+        # Keep the most recent running appserver created after activation (or when none is activated)
+        # to allow testing of a release candidate (rc)
+        else:
+            if not rc_appserver and appserver.status == AppServerStatus.Running:
+                rc_appserver = appserver
+            elif sufficient_time_passed(appserver.created, now, days):
+                obsolete_appservers.append(appserver)
+    return obsolete_appservers
+
+
+def terminate_obsolete_appservers_of_all_instances(days=2, max_workers=1):
+    """
+    Terminate the obsolete app servers of all the instances, as `OpenEdXInstance.terminate_obsolete_appservers`
+    does for each instance.
+
+    The app servers of all the instances are loaded with a single query, leaving out those which were terminated
+    already, and their VMs are terminated by `terminate_servers`, up to `max_workers` at a time.
+
+    The errors of each app server are logged, without interrupting the termination of the others.
+
+    Returns the number of obsolete app servers terminated, and the number of those which couldn't be terminated.
+    """
+    appservers = OpenEdXAppServer.objects.exclude(
+        _status=AppServerStatus.Terminated.state_id,
+        server___status=ServerStatus.Terminated.state_id,
+    ).select_related('server').order_by('owner_id', '-created')
+    now = timezone.now()
+    obsolete_appservers = [
+        appserver
+        for unused, instance_appservers in itertools.groupby(appservers, key=attrgetter('owner_id'))
+        for appserver in get_obsolete_appservers(instance_appservers, now, days)
+    ]
+
+    for appserver in obsolete_appservers:
+        # The log entries of the servers are attributed to their appserver, which doesn't need to be looked up
+        appserver.server.log_entry_appserver_id = appserver.pk
+    failed_servers = terminate_servers([appserver.server for appserver in obsolete_appservers], max_workers=max_workers)
+    failed_count = len(failed_servers)
+    for appserver in obsolete_appservers:
+        if appserver.server in failed_servers:
+            continue
+        try:
+            appserver._update_status_after_vm_termination()  # pylint: disable=protected-access
+        except Exception:  # pylint: disable=broad-except
+            appserver.logger.exception('Unable to update the status of the app server after terminating its VM.')
+            failed_count += 1
+    return len(obsolete_appservers) - failed_count, failed_count
@@ -27,10 +27,11 @@ from urllib.parse import urlparse
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
+from django.core.validators import MinValueValidator
 from django.db import models
 from django_extensions.db.models import TimeStampedModel
 
-from instance.models.shared_server import SharedServerManager
+from instance.models.shared_server import CAPACITY_WEIGHT_HELP_TEXT, SharedServerManager
 from instance.models.utils import ValidateModelMixin
 
 
@@ -108,6 +109,11 @@ class RedisServer(ValidateModelMixin, TimeStampedModel):
 
     use_ssl_connections = models.BooleanField(default=True)
     accepts_new_clients = models.BooleanField(default=False)
+    capacity_weight = models.PositiveSmallIntegerField(
+        default=1,
+        validators=[MinValueValidator(1)],
+        help_text=CAPACITY_WEIGHT_HELP_TEXT,
+    )
 
     objects = RedisServerManager()
 
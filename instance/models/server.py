@@ -22,9 +22,12 @@ Instance app models - Server
 
 # Imports #####################################################################
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import logging
 import time
 
+from django.apps import apps
 from django.conf import settings
 from django.db import models
 from django.db.models import Q
@@ -37,7 +40,7 @@ from instance.logging import ModelLoggerAdapter
 from instance.models.utils import (
     ValidateModelMixin, ResourceState, ModelResourceStateDescriptor, SteadyStateException, default_setting
 )
-from instance.utils import is_port_open, to_json, publish_data
+from instance.utils import is_port_open, jittered_backoff, to_json, publish_data
 
 
 # Logging #####################################################################
@@ -207,7 +210,8 @@ class Server(ValidateModelMixin, TimeStampedModel):
         This can happen if the server is in a steady state (i.e., a state that is not expected to change)
         that does not fulfill the desired condition.
 
-        The default timeout is 1h.
+        The default timeout is 1h. The status is checked with an exponential backoff between
+        SERVER_STATUS_POLL_MIN_INTERVAL and SERVER_STATUS_POLL_MAX_INTERVAL seconds.
 
         Use as follows:
 
@@ -218,32 +222,51 @@ class Server(ValidateModelMixin, TimeStampedModel):
         # to avoid the possibility of entering an infinite loop (if timeout is negative)
         # or reaching the timeout right away (if timeout is zero)
         assert timeout > 0, "Timeout must be greater than 0 to be able to do anything useful"
-        initial_timeout = timeout
+        # The waits can end early, when other threads poll the status of their servers, so the time
+        # actually spent is measured
+        deadline = time.monotonic() + timeout
 
         self.logger.info('Waiting to reach status from which we can proceed...')
 
-        while timeout > 0:
-            self.update_status()
-            if condition():
-                self.logger.info(
-                    'Reached appropriate status ({name}). Proceeding.'.format(name=self.status.name)
-                )
-                return
-            else:
-                if steady_state_check and self.status.is_steady_state:
-                    raise SteadyStateException(
-                        "The current status ({name}) does not fulfill the desired condition "
-                        "and is not expected to change.".format(name=self.status.name)
+        delays = jittered_backoff(settings.SERVER_STATUS_POLL_MIN_INTERVAL, settings.SERVER_STATUS_POLL_MAX_INTERVAL)
+        with self._status_polling():
+            while True:
+                self.update_status()
+                if condition():
+                    self.logger.info(
+                        'Reached appropriate status ({name}). Proceeding.'.format(name=self.status.name)
                     )
-            time.sleep(1)
-            timeout -= 1
+                    return
+                else:
+                    if steady_state_check and self.status.is_steady_state:
+                        raise SteadyStateException(
+                            "The current status ({name}) does not fulfill the desired condition "
+                            "and is not expected to change.".format(name=self.status.name)
+                        )
+                remaining_time = deadline - time.monotonic()
+                if remaining_time <= 0:
+                    break
+                self._wait_for_status_update(min(next(delays), remaining_time))
 
         # If we get here, this means we've reached the timeout
         raise TimeoutError(
             "Waited {minutes:.2f} minutes to reach appropriate status, and got nowhere. "
-            "Aborting with a status of {status}.".format(minutes=initial_timeout / 60, status=self.status.name)
+            "Aborting with a status of {status}.".format(minutes=timeout / 60, status=self.status.name)
         )
 
+    @contextmanager
+    def _status_polling(self):
+        """
+        Context in which `sleep_until` polls the status of this server.
+        """
+        yield
+
+    def _wait_for_status_update(self, delay):  # pylint: disable=no-self-use
+        """
+        Wait up to `delay` seconds before checking the status of this server again.
+        """
+        time.sleep(delay)
+
     def save(self, *args, **kwargs):  # pylint: disable=arguments-differ
         """
         Save this server.
@@ -251,7 +274,7 @@ class Server(ValidateModelMixin, TimeStampedModel):
         super().save(*args, **kwargs)
         publish_data({
             'type': 'server_update',
-            'server_pk': self.pk,
+            'server_id': self.pk,
         })
 
     def update_status(self):
@@ -278,7 +301,9 @@ class OpenStackServer(Server):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.nova = openstack_utils.get_nova_client(self.openstack_region)
+        self._nova = None
+        self._status_poller = None
+        self._log_entry_appserver_id = None
 
     def __str__(self):
         if self.openstack_id:
@@ -286,6 +311,48 @@ class OpenStackServer(Server):
         else:
             return 'Pending OpenStack Server'
 
+    @property
+    def nova(self):
+        """
+        Nova client for the region of this server.
+
+        The client is only looked up on first use, and is shared with the other servers of the
+        same region (see `openstack_utils.OpenStackClientRegistry`), so instantiating servers
+        doesn't cost any request to the OpenStack API.
+        """
+        if self._nova is None:
+            self._nova = openstack_utils.get_nova_client(self.openstack_region)
+        return self._nova
+
+    @nova.setter
+    def nova(self, value):
+        """
+        Override the nova client used by this server.
+        """
+        self._nova = value
+
+    @property
+    def log_entry_appserver_id(self):
+        """
+        ID of the AppServer running on this server, which the log entries of this server are attributed to.
+
+        The AppServer sets it when it creates or is assigned this server. Servers loaded on their own
+        look their AppServer up once, on their first log entry.
+        """
+        if self._log_entry_appserver_id is None and self.pk is not None:
+            # 0 records that the server has no AppServer, so that it isn't looked up again
+            self._log_entry_appserver_id = apps.get_model('instance', 'OpenEdXAppServer').objects.filter(
+                server_id=self.pk,
+            ).values_list('pk', flat=True).first() or 0
+        return self._log_entry_appserver_id or None
+
+    @log_entry_appserver_id.setter
+    def log_entry_appserver_id(self, value):
+        """
+        Attribute the log entries of this server to the AppServer with the given ID.
+        """
+        self._log_entry_appserver_id = value
+
     @property
     def os_server(self):
         """
@@ -314,8 +381,27 @@ class OpenStackServer(Server):
                 return None
             self._public_ip = public_addr['addr']
             self.save()
+            self._invalidate_load_balancer_configuration()
         return self._public_ip
 
+    def _invalidate_load_balancer_configuration(self):
+        """
+        Invalidate the stored load balancer configuration of the instance this server is active for.
+
+        The configuration contains the public IP addresses of the active appservers of the instance.
+        """
+        instance_ref_id = apps.get_model('instance', 'OpenEdXAppServer').objects.filter(
+            server_id=self.pk,
+            _is_active=True,
+        ).values_list('owner_id', flat=True).first()
+        if instance_ref_id is None:
+            return
+        load_balancing_servers = apps.get_model('instance', 'LoadBalancingServer').objects.filter(
+            backend_configurations__instance_ref_id=instance_ref_id,
+        )
+        for load_balancing_server in load_balancing_servers:
+            load_balancing_server.invalidate_backend_configurations(instance_ref_id)
+
     @property
     def vm_created(self):
         """
@@ -330,6 +416,40 @@ class OpenStackServer(Server):
         """
         return self.status == Status.Pending
 
+    @contextmanager
+    def _status_polling(self):
+        """
+        While waiting for a status, get this server from the list shared by all the servers
+        waited for in the same region, instead of getting it from nova on each check.
+        """
+        self._status_poller = openstack_utils.get_server_status_poller(self.openstack_region)
+        try:
+            yield
+        finally:
+            self._status_poller = None
+
+    def _wait_for_status_update(self, delay):
+        """
+        Wait up to `delay` seconds, returning earlier if another thread lists the servers meanwhile.
+        """
+        if self._status_poller is None:
+            super()._wait_for_status_update(delay)
+        else:
+            self._status_poller.wait_for_update(delay)
+
+    def _get_polled_os_server(self):
+        """
+        Get the nova server, from the shared server list when the status is being polled.
+        """
+        if self._status_poller is not None and self.openstack_id:
+            os_server = self._status_poller.get_server(
+                self.nova, self.openstack_id, max_age=settings.SERVER_STATUS_POLL_MIN_INTERVAL
+            )
+            if os_server is not None:
+                return os_server
+        # Not listed (yet, or anymore): get the server itself, which raises NotFound if it doesn't exist
+        return self.os_server
+
     def _update_status_from_nova(self, os_server):
         """
         Update the status from the Nova Server object given in os_server.
@@ -356,7 +476,7 @@ class OpenStackServer(Server):
         # This is not the case if we can not interact with the server:
         if self.status not in [Status.BuildFailed, Status.Terminated, Status.Pending]:
             try:
-                os_server = self.os_server
+                os_server = self._get_polled_os_server()
             except novaclient.exceptions.NotFound:
                 # This exception is raised before the server is created, and after it has been
                 # terminated.  Because of the first "if", we can't get her in Pending state, so the
@@ -430,39 +550,70 @@ class OpenStackServer(Server):
         This ensures any daemons that need to perform cleanup tasks can do so, or that any
         shutdown scripts/tasks get executed.
         """
+        if not self._begin_termination():
+            return
+        try:
+            server_closed, exception = self._delete_vm(), None
+        except (requests.RequestException, novaclient.exceptions.ClientException) as exc:
+            server_closed, exception = False, exc
+        if self._finish_vm_deletion(server_closed, exception):
+            self._status_to_terminated()
+
+    def _begin_termination(self):
+        """
+        Prepare the termination of this server, returning whether its VM must be deleted.
+
+        Servers which are already terminated, or whose VM wasn't created, don't have a VM to delete; the latter
+        are marked as terminated right away.
+        """
         # We should delete SSH key before terminating a server.
         # Edge cases: server is still being configured or has incorrect status due to an error.
         self._delete_ssh_key()
 
         if self.status == Status.Terminated:
-            return
+            return False
 
         self.logger.info('Terminating server (status=%s)...', self.status)
         if not self.vm_created:
             self.logger.info('Note: server was not created when terminated.')
             self._status_to_terminated()
-            return
+            return False
+        return True
 
-        try:
-            os_server = self.os_server
-            server_closed = self._shutdown(os_server)
-
-            if not server_closed:
-                self.logger.warning("Server has not reached SHUTOFF state after max wait time; terminating forcefully.")
-            os_server.delete()
-        except novaclient.exceptions.NotFound:
-            self.logger.exception(
+    def _delete_vm(self):
+        """
+        Shut down the VM of this server, then delete it, returning whether it reached the SHUTOFF state first.
+
+        Only the OpenStack API is called, and its exceptions are propagated, so that this can run in
+        another thread than the one updating the server (see `terminate_servers`).
+        """
+        os_server = self.os_server
+        server_closed = self._shutdown(os_server)
+        os_server.delete()
+        return server_closed
+
+    def _finish_vm_deletion(self, server_closed, exception=None):
+        """
+        Log the outcome of `_delete_vm`, returning whether the VM was deleted or didn't exist anymore.
+
+        If the OpenStack API couldn't be reached, the server is marked as unknown instead.
+        """
+        if isinstance(exception, novaclient.exceptions.NotFound):
+            self.logger.error(
                 'Error while attempting to terminate the server "%s":'
                 + ' could not find the corresponding OpenStack server',
-                self.name
+                self.name,
+                exc_info=exception,
             )
-            self._status_to_terminated()
-        except (requests.RequestException, novaclient.exceptions.ClientException) as exc:
-            self.logger.error('Unable to reach the OpenStack API due to %s', exc)
+            return True
+        elif exception is not None:
+            self.logger.error('Unable to reach the OpenStack API due to %s', exception)
             if self.status != Status.Unknown:
                 self._status_to_unknown()
-        else:
-            self._status_to_terminated()
+            return False
+        if not server_closed:
+            self.logger.warning("Server has not reached SHUTOFF state after max wait time; terminating forcefully.")
+        return True
 
     def _shutdown(self, os_server, poll_interval=10, max_wait=None):
         """
@@ -474,12 +625,17 @@ class OpenStackServer(Server):
         # We purposely check for `None` rather than generically for falseness
         # because it allows `max_wait = 0`.
         max_wait = max_wait if max_wait is not None else settings.SHUTDOWN_TIMEOUT
+        # The waits can end early, when other threads poll the status of their servers, so the time
+        # actually spent is measured
+        deadline = time.monotonic() + max_wait
 
         os_server.stop()
-        while max_wait > 0 and os_server.status != 'SHUTOFF':
-            time.sleep(poll_interval)
-            max_wait -= poll_interval
-            os_server = self.os_server
+        while os_server.status != 'SHUTOFF':
+            remaining_time = deadline - time.monotonic()
+            if remaining_time <= 0:
+                break
+            self._wait_for_status_update(min(poll_interval, remaining_time))
+            os_server = self._get_polled_os_server()
         return os_server.status == 'SHUTOFF'
 
     def _delete_ssh_key(self) -> None:
@@ -501,3 +657,144 @@ class OpenStackServer(Server):
             )
             return
         ssh.remove_known_host_key(ip)
+
+
+# Functions ###################################################################
+
+def _delete_vm_in_thread(server):
+    """
+    Delete the VM of `server`, polling its shutdown from the server list shared by the servers of its region.
+
+    Returns whether the VM reached the SHUTOFF state before its deletion, and the OpenStack API error which
+    prevented its deletion, if any. No database query is made, so that the deletions can run in worker threads.
+    """
+    with server._status_polling():  # pylint: disable=protected-access
+        try:
+            return server._delete_vm(), None  # pylint: disable=protected-access
+        except (requests.RequestException, novaclient.exceptions.ClientException) as exc:
+            return False, exc
+
+
+def _confirm_vm_deletion(servers, timeout, poll_interval):
+    """
+    Mark the given servers, whose VMs were deleted, as terminated once their VMs aren't listed anymore.
+
+    The VMs are listed with one `servers.list()` call per region, repeated every `poll_interval` seconds for up to
+    `timeout` seconds while some VMs are still listed. Returns the servers whose VMs are still listed, and those
+    which couldn't be marked as terminated.
+    """
+    deadline = time.monotonic() + timeout
+    failed_servers = []
+    while servers:
+        listed_ids = set()
+        try:
+            for nova in {server.openstack_region: server.nova for server in servers}.values():
+                listed_ids.update(os_server.id for os_server in nova.servers.list() if os_server.status != 'DELETED')
+        except (requests.RequestException, novaclient.exceptions.ClientException) as exc:
+            logger.error('Unable to list the servers to confirm their deletion due to %s', exc)
+            return failed_servers + servers
+
+        remaining_servers = []
+        for server in servers:
+            if server.openstack_id in listed_ids:
+                remaining_servers.append(server)
+                continue
+            try:
+                server._status_to_terminated()  # pylint: disable=protected-access
+            except Exception:  # pylint: disable=broad-except
+                server.logger.exception('Unable to mark the server as terminated after the deletion of its VM.')
+                failed_servers.append(server)
+        servers = remaining_servers
+        if not servers or time.monotonic() + poll_interval > deadline:
+            break
+        time.sleep(poll_interval)
+
+    for server in servers:
+        server.logger.warning('The VM is still listed by OpenStack after its deletion; it will be terminated again.')
+    return failed_servers + servers
+
+
+def terminate_servers(servers, max_workers=1, confirm_timeout=60, poll_interval=10):
+    """
+    Terminate the given OpenStack servers, deleting up to `max_workers` VMs concurrently.
+
+    Each VM is shut down and deleted like `OpenStackServer.terminate()` does, except that the shutdowns of the
+    VMs of a region are polled from a shared server list, and that the servers are only marked as terminated
+    once a `servers.list()` sweep confirms that their VMs are gone (see `_confirm_vm_deletion`).
+
+    Returns the servers which couldn't be terminated; they keep their status, so that they can be terminated
+    again later. The errors of each server are logged, and don't prevent the termination of the other servers.
+    """
+    # pylint: disable=protected-access
+    servers_to_delete, failed_servers = [], []
+    for server in servers:
+        try:
+            if server._begin_termination():
+                servers_to_delete.append(server)
+        except Exception:  # pylint: disable=broad-except
+            server.logger.exception('Unable to begin the termination of the server.')
+            failed_servers.append(server)
+
+    if max_workers <= 1:
+        results = [_delete_vm_in_thread(server) for server in servers_to_delete]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_delete_vm_in_thread, servers_to_delete))
+
+    deleted_servers = []
+    for server, (server_closed, exception) in zip(servers_to_delete, results):
+        try:
+            vm_deleted = server._finish_vm_deletion(server_closed, exception)
+        except Exception:  # pylint: disable=broad-except
+            server.logger.exception('Unable to record the outcome of the deletion of the VM.')
+            vm_deleted = False
+        if vm_deleted:
+            deleted_servers.append(server)
+        else:
+            failed_servers.append(server)
+    return failed_servers + _confirm_vm_deletion(deleted_servers, confirm_timeout, poll_interval)
+
+
+def find_zombie_vms(nova_servers):
+    """
+    Return the VMs among `nova_servers` whose OpenStack server is on record as terminated.
+
+    The servers on record for the listed VMs are fetched with a single query. VMs which aren't on record, or which
+    are also on record for a server that isn't terminated, are left alone.
+    """
+    listed_ids = {nova_server.id for nova_server in nova_servers}
+    terminated_ids, live_ids = set(), set()
+    for openstack_id, status in OpenStackServer.objects.filter(
+            openstack_id__in=listed_ids,
+    ).values_list('openstack_id', '_status'):
+        if status == Status.Terminated.state_id:
+            terminated_ids.add(openstack_id)
+        else:
+            live_ids.add(openstack_id)
+    zombie_ids = terminated_ids - live_ids
+    return [nova_server for nova_server in nova_servers if nova_server.id in zombie_ids]
+
+
+def _delete_zombie_vm(nova_server):
+    """
+    Delete the given VM, returning the error which prevented its deletion, if any.
+    """
+    try:
+        nova_server.delete()
+    except Exception as exc:  # pylint: disable=broad-except
+        return exc
+    return None
+
+
+def delete_zombie_vms(nova_servers, max_workers=1):
+    """
+    Delete the given VMs, up to `max_workers` concurrently.
+
+    Returns the `(nova_server, error)` pairs of the VMs which couldn't be deleted.
+    """
+    if max_workers <= 1:
+        errors = [_delete_zombie_vm(nova_server) for nova_server in nova_servers]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            errors = list(executor.map(_delete_zombie_vm, nova_servers))
+    return [(nova_server, error) for nova_server, error in zip(nova_servers, errors) if error is not None]
@@ -22,10 +22,16 @@ Instance app models - Database Server models
 
 # Imports #####################################################################
 
+from functools import reduce
 import logging
+import operator
 import random
+import warnings
 
-from django.db import models, transaction
+from django.apps import apps
+from django.db import models
+from django.db.models import Count, ExpressionWrapper, F, FloatField, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce
 
 
 # Logging #####################################################################
@@ -33,6 +39,14 @@ from django.db import models, transaction
 logger = logging.getLogger(__name__)
 
 
+# Constants ###################################################################
+
+CAPACITY_WEIGHT_HELP_TEXT = (
+    'Relative capacity of this server: new instances are assigned to the server with the fewest instances per unit '
+    'of capacity weight.'
+)
+
+
 # Models ######################################################################
 
 class SharedServerManager(models.Manager):
@@ -55,21 +69,97 @@ class SharedServerManager(models.Manager):
         """
         return self.filter(accepts_new_clients=True)
 
-    def select_random(self):
+    def _instance_field_names(self):
+        """
+        Return the names of the fields referencing servers of this model on instances.
+        """
+        instance_model = apps.get_model('instance', 'OpenEdXInstance')
+        return [
+            field.name for field in instance_model._meta.get_fields()
+            if field.many_to_one and field.related_model is self.model
+        ]
+
+    def annotate_load(self, servers=None):
+        """
+        Annotate the given servers (all servers by default) with `instance_count`, the number of instances
+        which aren't archived using each of them, and `load`, that number divided by their capacity weight.
+
+        The counts are correlated subqueries, so that the load of all servers is computed in a single query.
+        """
+        if servers is None:
+            servers = self.all()
+        instances = apps.get_model('instance', 'OpenEdXInstance').objects.filter(ref_set__is_archived=False)
+        instance_counts = [
+            Coalesce(
+                Subquery(
+                    instances.filter(**{field_name: OuterRef('pk')}).order_by().values(field_name).annotate(
+                        count=Count('pk'),
+                    ).values('count'),
+                    output_field=IntegerField(),
+                ),
+                0,
+            )
+            for field_name in self._instance_field_names()
+        ]
+        return servers.annotate(
+            instance_count=reduce(operator.add, instance_counts) if instance_counts else Value(0, IntegerField()),
+        ).annotate(
+            load=ExpressionWrapper(
+                Cast('instance_count', FloatField()) / F('capacity_weight'),
+                output_field=FloatField(),
+            ),
+        )
+
+    def select_least_loaded(self):
         """
         Select a server for a new instance.
-        The current implementation selects one of the servers that accept new clients at random.
-        If no database server accepts new clients, DoesNotExist is raised.
+
+        Among the servers that accept new clients, the one with the lowest load, i.e. the fewest instances per unit
+        of capacity weight, is selected. If several servers have the lowest load, one of them is picked at random,
+        weighted by their capacity weight, so that the larger servers keep getting proportionally more instances.
+        If no server accepts new clients, DoesNotExist is raised.
         """
         self._create_default()
 
-        # The set of servers might change between retrieving the server count and retrieving the random server,
-        # so we make this atomic.
-        with transaction.atomic():
-            servers = self.filter_accepts_new_clients()
-            count = servers.count()
-            if not count:
-                raise self.model.DoesNotExist(
-                    "No configured {} accepts new clients.".format(self.__class__.__name__)
-                )
-            return servers[random.randrange(count)]
+        servers = list(self.annotate_load(self.filter_accepts_new_clients()).order_by('load', 'pk'))
+        if not servers:
+            raise self.model.DoesNotExist(
+                "No configured {} accepts new clients.".format(self.__class__.__name__)
+            )
+        least_loaded_servers = [server for server in servers if server.load == servers[0].load]
+        return random.choices(
+            least_loaded_servers,
+            weights=[server.capacity_weight for server in least_loaded_servers],
+        )[0]
+
+    def select_random(self):
+        """
+        Deprecated alias of `select_least_loaded()`.
+        """
+        warnings.warn('select_random() is deprecated, use select_least_loaded()', DeprecationWarning, stacklevel=2)
+        return self.select_least_loaded()
+
+    def load_report(self):
+        """
+        Return the load of the servers, and the skew of the load of those accepting new clients.
+
+        The skew is the ratio between the highest load and the average load of the servers accepting new clients:
+        1 means that instances are spread evenly according to the capacity weights.
+        """
+        servers = list(self.annotate_load().order_by('-load', 'pk'))
+        accepting_pks = set(self.filter_accepts_new_clients().values_list('pk', flat=True))
+        loads = [server.load for server in servers if server.pk in accepting_pks]
+        mean_load = sum(loads) / len(loads) if loads else 0
+        return {
+            'servers': [
+                {
+                    'server': server,
+                    'accepts_new_clients': server.pk in accepting_pks,
+                    'capacity_weight': server.capacity_weight,
+                    'instance_count': server.instance_count,
+                    'load': server.load,
+                }
+                for server in servers
+            ],
+            'skew': max(loads) / mean_load if mean_load else None,
+        }
@@ -20,9 +20,12 @@
 Models Utils
 """
 
+import base64
+from concurrent.futures import ThreadPoolExecutor
 import functools
 import inspect
 import json
+import os
 from weakref import WeakKeyDictionary
 
 import consul
@@ -31,6 +34,8 @@ import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from instance.signals import resource_state_changed
+
 # Exceptions ##################################################################
 
 
@@ -98,6 +103,14 @@ def get_base_playbook_name(openedx_release):
     return 'playbooks/openedx_native.yml'
 
 
+@functools.lru_cache(maxsize=None)
+def get_consul_client():
+    """
+    Returns the Consul client shared by all the `ConsulAgent` instances, so that they reuse its HTTP connections.
+    """
+    return consul.Consul()
+
+
 # Classes #####################################################################
 
 class ValidateModelMixin:
@@ -451,9 +464,14 @@ class ModelResourceStateDescriptor(ResourceStateDescriptor):
         """
         assert new_state_class in self.state_classes
         new_state = new_state_class(resource=resource, state_manager=self)
+        old_state_class = self._get_state_class_from_id(getattr(resource, self.model_field_name))
         setattr(resource, self.model_field_name, new_state_class.state_id)
         # Save changes to this one field only
         resource.save(update_fields=[self.model_field_name])
+        # Let the models which depend on this state update themselves (e.g. the status of a deployment)
+        resource_state_changed.send(
+            sender=resource.__class__, resource=resource, old_state=old_state_class, new_state=new_state_class,
+        )
         return new_state
 
 
@@ -465,8 +483,11 @@ class ConsulAgent:
     possibility to expand it for more advanced queries.
     """
 
-    def __init__(self, prefix=''):
-        self._client = consul.Consul()
+    # Maximum number of operations in a single Consul transaction
+    TXN_MAX_OPERATIONS = 64
+
+    def __init__(self, prefix='', client=None):
+        self._client = client or get_consul_client()
         self.prefix = prefix
 
     def get(self, key, index=False, **kwargs):
@@ -516,6 +537,9 @@ class ConsulAgent:
         configuration. We still need this method to make sure we increment the version number when the configuration
         value is updated.
 
+        The dictionary is written with a check-and-set on the index of the value it was read from, and
+        read again up to `num_retries` times when it was modified in between.
+
         .. note::
             Once all instances' configuration are updated we can retire
             some of the code in this class.
@@ -525,40 +549,84 @@ class ConsulAgent:
             given. To delete a key use :meth:`delete_dict_key`
 
         :param (dict) value: value to write
-        :param kwargs: consul.kv.put specific options.
+        :param kwargs: consul.kv.get specific options.
         """
-        get_data = None
-        try:
-            _, get_data = self._client.kv.get(self.prefix, **kwargs)
-        except consul.base.NotFound:
-            pass
+        for _ in range(num_retries):
+            get_data = None
+            try:
+                _, get_data = self._client.kv.get(self.prefix, **kwargs)
+            except consul.base.NotFound:
+                pass
 
-        if get_data:
-            stored = json.loads(get_data['Value'].decode('utf-8'))
-            updates = {
-                k: value[k]
-                for k in value
-                if (k in stored and value[k] != stored[k]) or k not in stored
-            }
-            payload = {
-                k: stored[k]
-                for k in stored
-                if k not in value and k != 'version'
-            }
-            updated = bool(updates)
-            payload['version'] = stored['version']
-            payload.update(value)
-        else:
-            payload = value
-            updated = True
+            stored = json.loads(get_data['Value'].decode('utf-8')) if get_data else None
+            payload, updated = self._merge_dict(stored, value)
+            if not updated:
+                return payload['version'], False
 
-        if updated:
-            payload['version'] = payload.get('version', 0) + 1
-
-            return payload['version'], self._client.kv.put(self.prefix, json.dumps(payload).encode('utf-8'))
+            modify_index = get_data.get('ModifyIndex', 0) if get_data else 0
+            if self._client.kv.put(self.prefix, json.dumps(payload).encode('utf-8'), cas=modify_index):
+                return payload['version'], True
 
         return payload['version'], False
 
+    def create_or_update_dicts(self, values, num_retries=3, max_workers=4):
+        """
+        Create or update several dictionaries, as :meth:`create_or_update_dict` does for each of them.
+
+        All the stored dictionaries are fetched with a single request, and the updated ones are written
+        with one transaction per `TXN_MAX_OPERATIONS` dictionaries, running `max_workers` transactions at once.
+        Each write is a check-and-set, so when a dictionary is modified in between, its transaction fails and
+        the dictionaries of that transaction are updated one by one instead.
+
+        :param (dict) values: the dictionaries to write, by key (appended to the agent's prefix)
+        :return: A dict of (version, updated) pairs by key, as returned by :meth:`create_or_update_dict`
+        """
+        if not values:
+            return {}
+
+        stored_entries = self._get_tree(os.path.commonprefix([self.prefix + key for key in values]))
+        results = {}
+        operations = []
+        for key, value in values.items():
+            entry = stored_entries.get(self.prefix + key)
+            stored = json.loads(entry['Value'].decode('utf-8')) if entry and entry['Value'] else None
+            payload, updated = self._merge_dict(stored, value)
+            results[key] = payload['version'], updated
+            if updated:
+                operations.append((key, {'KV': {
+                    'Verb': 'cas',
+                    'Key': self.prefix + key,
+                    'Value': base64.b64encode(json.dumps(payload).encode('utf-8')).decode('ascii'),
+                    'Index': entry['ModifyIndex'] if entry else 0,
+                }}))
+
+        batches = [
+            operations[start:start + self.TXN_MAX_OPERATIONS]
+            for start in range(0, len(operations), self.TXN_MAX_OPERATIONS)
+        ]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            committed = list(executor.map(self._run_transaction, batches))
+        for batch, batch_committed in zip(batches, committed):
+            if not batch_committed:
+                for key, _ in batch:
+                    agent = ConsulAgent(prefix=self.prefix + key, client=self._client)
+                    results[key] = agent.create_or_update_dict(values[key], num_retries=num_retries)
+        return results
+
+    def delete_trees(self, keys):
+        """
+        Will delete the given keys/prefixed-keys, and all the keys they prefix, from Consul's Key-Value store,
+        with one transaction per `TXN_MAX_OPERATIONS` keys.
+
+        :param keys: The keys we want to delete.
+        :return: True if all the transactions succeeded, False otherwise.
+        """
+        operations = [(key, {'KV': {'Verb': 'delete-tree', 'Key': self.prefix + key}}) for key in keys]
+        return all([
+            self._run_transaction(operations[start:start + self.TXN_MAX_OPERATIONS])
+            for start in range(0, len(operations), self.TXN_MAX_OPERATIONS)
+        ])
+
     def delete_dict_key(self, key, **kwargs):
         """
         Delete a given key from a stored config dictionary.
@@ -590,6 +658,42 @@ class ConsulAgent:
         """
         return self._client.kv.delete(self.prefix)
 
+    def _get_tree(self, prefix):
+        """
+        Fetch all the entries under the given prefix, by key.
+        """
+        _, entries = self._client.kv.get(prefix, recurse=True)
+        return {entry['Key']: entry for entry in entries or []}
+
+    def _run_transaction(self, operations):
+        """
+        Run the given (key, operation) pairs in a single Consul transaction.
+
+        :return: True if the transaction was committed, False if it was rolled back.
+        """
+        response = self._client.txn.put([operation for _, operation in operations])
+        return not response.get('Errors')
+
+    @staticmethod
+    def _merge_dict(stored, value):
+        """
+        Merge the `value` dictionary into the `stored` one, and increment its version if anything changed.
+
+        :return: A pair (payload, updated) with the dictionary to store and whether it changed.
+        """
+        if stored:
+            updated = any(k not in stored or value[k] != stored[k] for k in value)
+            payload = {k: stored[k] for k in stored if k not in value and k != 'version'}
+            payload['version'] = stored['version']
+            payload.update(value)
+        else:
+            payload = dict(value)
+            updated = True
+
+        if updated:
+            payload['version'] = payload.get('version', 0) + 1
+        return payload, updated
+
     @staticmethod
     def _cast_value(value):
         """
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Pooled connections to the MySQL servers
+"""
+
+# Imports #####################################################################
+
+from contextlib import contextmanager
+import functools
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+
+# Logging #####################################################################
+
+logger = logging.getLogger(__name__)
+
+
+# Constants ###################################################################
+
+# Idle connections are pinged before being reused when they have been idle for longer than this, in seconds
+HEALTH_CHECK_INTERVAL = 30
+
+# Idle connections are closed instead of being reused when they have been idle for longer than this, in seconds
+MAX_IDLE_TIME = 600
+
+
+# Globals #####################################################################
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+# Classes #####################################################################
+
+class MySQLConnectionPool:
+    """
+    A thread-safe pool of connections to a MySQL server.
+
+    At most `max_size` connections are in use at once; the other threads wait for one of them to be released.
+    A connection used by a block which raised an exception is closed instead of being reused, since it may have
+    pending results or a broken transaction.
+    """
+    def __init__(self, connect, max_size, health_check_interval=HEALTH_CHECK_INTERVAL, max_idle_time=MAX_IDLE_TIME):
+        self._connect = connect
+        self._semaphore = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        # Idle connections and the time they were released, the most recently used last
+        self._idle_connections = []
+        self.health_check_interval = health_check_interval
+        self.max_idle_time = max_idle_time
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager providing a connection of the pool.
+        """
+        with self._semaphore:
+            connection = self._acquire()
+            try:
+                yield connection
+            except BaseException:
+                _close(connection)
+                raise
+            with self._lock:
+                self._idle_connections.append((connection, time.monotonic()))
+
+    def close(self):
+        """
+        Close the idle connections of the pool.
+        """
+        with self._lock:
+            idle_connections, self._idle_connections = self._idle_connections, []
+        for connection, _ in idle_connections:
+            _close(connection)
+
+    def _acquire(self):
+        """
+        Returns the most recently used healthy idle connection, or a new connection.
+        """
+        while True:
+            with self._lock:
+                if not self._idle_connections:
+                    break
+                connection, released_at = self._idle_connections.pop()
+            idle_time = time.monotonic() - released_at
+            if idle_time > self.max_idle_time:
+                _close(connection)
+                continue
+            if idle_time > self.health_check_interval:
+                try:
+                    connection.ping()
+                except Exception:  # pylint: disable=broad-except
+                    logger.info('Discarding a broken MySQL connection')
+                    _close(connection)
+                    continue
+            return connection
+        return self._connect()
+
+
+# Functions ###################################################################
+
+def _close(connection):
+    """
+    Close the connection, ignoring the errors of already broken connections.
+    """
+    try:
+        connection.close()
+    except Exception:  # pylint: disable=broad-except
+        pass
+
+
+def connect_mysql(host, port, user, password, **kwargs):
+    """
+    Open a connection to a MySQL server, passing the extra `kwargs` to `MySQLdb.connect()`.
+    """
+    import MySQLdb as mysql
+    return mysql.connect(
+        host=host,
+        user=user,
+        passwd=password,
+        port=port,
+        **kwargs
+    )
+
+
+def _connect(host, port, user, password):
+    """
+    Open a pooled connection to a MySQL server, which autocommits and can run several statements in a single query.
+    """
+    from MySQLdb.constants import CLIENT
+    return connect_mysql(
+        host,
+        port,
+        user,
+        password,
+        autocommit=True,
+        client_flag=CLIENT.MULTI_STATEMENTS | CLIENT.MULTI_RESULTS,
+    )
+
+
+def get_mysql_pool(mysql_server):
+    """
+    Returns the connection pool of the given MySQLServer.
+    """
+    key = (mysql_server.hostname, mysql_server.port, mysql_server.username, mysql_server.password)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = MySQLConnectionPool(
+                functools.partial(_connect, *key),
+                max_size=settings.MYSQL_CONNECTION_POOL_SIZE,
+            )
+        return pool
+
+
+def close_mysql_pools():
+    """
+    Close the idle connections of all the pools.
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+def execute_batch(cursor, statements):
+    """
+    Run the given (query, params) statements in a single round trip.
+
+    The statements run in order, and the first failing one raises its error, without running the next ones.
+    Since the queries are interpolated together, a literal `%` must be doubled when any statement has params.
+    """
+    if not statements:
+        return
+    query = ';\n'.join(statement_query for statement_query, _ in statements)
+    params = [param for _, statement_params in statements for param in statement_params]
+    cursor.execute(query, params or None)
+    # The errors of the statements after the first one are raised when reaching their results
+    read_all_results(cursor)
+
+
+def read_all_results(cursor):
+    """
+    Skip the results of the statements after the first one of the last query run by the cursor.
+
+    A connection can't run another query until all the results of a multiple statement query were read.
+    """
+    while cursor.nextset() is not None:
+        pass
@@ -26,6 +26,8 @@ import logging
 import requests
 from django.conf import settings
 
+from instance import http_client
+
 # Logging #####################################################################
 
 logger = logging.getLogger(__name__)
@@ -64,7 +66,7 @@ def get_synthetics_monitor(monitor_id):
     """
     url = '{0}/monitors/{1}'.format(SYNTHETICS_API_URL, monitor_id)
     logger.info('GET %s', url)
-    r = requests.get(url, headers=_request_headers())
+    r = http_client.request('GET', url, headers=_request_headers())
     r.raise_for_status()
     return r.json()
 
@@ -76,7 +78,7 @@ def create_synthetics_monitor(uri, name=None, monitor_type='SIMPLE',
     """
     url = '{0}/monitors'.format(SYNTHETICS_API_URL)
     logger.info('POST %s', url)
-    r = requests.post(url, headers=_request_headers(), json={
+    r = http_client.request('POST', url, headers=_request_headers(), json={
         'name': uri,
         'uri': uri,
         'type': monitor_type,
@@ -99,7 +101,7 @@ def delete_synthetics_monitor(monitor_id):
     url = '{0}/monitors/{1}'.format(SYNTHETICS_API_URL, monitor_id)
     logger.info('DELETE %s', url)
     try:
-        r = requests.delete(url, headers=_request_headers())
+        r = http_client.request('DELETE', url, headers=_request_headers())
         r.raise_for_status()
     except requests.exceptions.HTTPError:
         if r.status_code == requests.codes.not_found:
@@ -114,8 +116,8 @@ def add_alert_policy(name, incident_preference='PER_POLICY'):
     """
     url = '{}.json'.format(ALERTS_POLICIES_API_URL)
     logger.info('POST %s', url)
-    r = requests.post(
-        url,
+    r = http_client.request(
+        'POST', url,
         headers=_request_headers(),
         json={"policy": {"incident_preference": incident_preference, "name": name}}
     )
@@ -129,8 +131,8 @@ def add_email_notification_channel(email_address):
     """
     url = '{}.json'.format(ALERTS_CHANNELS_API_URL)
     logger.info('POST %s', url)
-    r = requests.post(
-        url,
+    r = http_client.request(
+        'POST', url,
         headers=_request_headers(),
         json={
             'channel': {
@@ -162,8 +164,8 @@ def add_notification_channels_to_policy(policy_id, channel_ids):
     # This API call only appends to the existing notification channels and ignores the duplicates.
     headers = _request_headers()
     headers['Content-Type'] = 'application/json'
-    r = requests.put(
-        url,
+    r = http_client.request(
+        'PUT', url,
         headers=headers,
     )
     r.raise_for_status()
@@ -176,8 +178,8 @@ def add_alert_nrql_condition(policy_id, monitor_url, name):
     url = '{}/policies/{}.json'.format(ALERTS_NRQL_CONDITIONS_API_URL, policy_id)
     logger.info('POST %s', url)
     query = "SELECT count(*) FROM SyntheticCheck WHERE monitorName = '{}' AND result = 'FAILED'".format(monitor_url)
-    r = requests.post(
-        url,
+    r = http_client.request(
+        'POST', url,
         headers=_request_headers(),
         json={
             'nrql_condition': {
@@ -232,7 +234,7 @@ def delete_alert_policy(policy_id):
     url = '{}/{}.json'.format(ALERTS_POLICIES_API_URL, policy_id)
     logger.info('DELETE %s', url)
     try:
-        r = requests.delete(url, headers=_request_headers())
+        r = http_client.request('DELETE', url, headers=_request_headers())
         r.raise_for_status()
     except requests.exceptions.HTTPError:
         if r.status_code == requests.codes.not_found:
@@ -251,7 +253,7 @@ def delete_email_notification_channel(channel_id):
     url = '{}/{}.json'.format(ALERTS_CHANNELS_API_URL, channel_id)
     logger.info('DELETE %s', url)
     try:
-        r = requests.delete(url, headers=_request_headers())
+        r = http_client.request('DELETE', url, headers=_request_headers())
         r.raise_for_status()
     except requests.exceptions.HTTPError:
         if r.status_code == requests.codes.not_found:
@@ -270,7 +272,7 @@ def delete_alert_nrql_condition(condition_id):
     url = '{}/{}.json'.format(ALERTS_NRQL_CONDITIONS_API_URL, condition_id)
     logger.info('DELETE %s', url)
     try:
-        r = requests.delete(url, headers=_request_headers())
+        r = http_client.request('DELETE', url, headers=_request_headers())
         r.raise_for_status()
     except requests.exceptions.HTTPError:
         if r.status_code == requests.codes.not_found:
@@ -22,6 +22,8 @@ OpenStack - Helper functions
 
 # Imports #####################################################################
 import logging
+import threading
+import time
 from collections import namedtuple, defaultdict
 import requests
 
@@ -57,12 +59,162 @@ SecurityGroupRuleDefinition = namedtuple('SecurityGroupRuleDefinition', [
     'remote_group_id',
 ])
 
+# Client registry #############################################################
+
+
+class OpenStackClientRegistry:
+    """
+    Process-wide registry of authenticated OpenStack clients.
+
+    Building a client is cheap, but every new client has to authenticate against Keystone
+    before its first request. Clients are therefore created lazily, on the first call for a
+    given region and set of credentials, and are then shared by all threads of the process
+    (e.g. the huey thread workers), so the Keystone token is reused across calls.
+
+    keystoneauth1 clients are safe to share between threads; the registry only has to make
+    sure that a single client is created per key, and that tokens which are about to expire
+    are renewed before they are handed out again.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+
+    @staticmethod
+    def _credentials_key():
+        """
+        Return the part of the registry key identifying the credentials currently configured.
+        """
+        return (
+            settings.OPENSTACK_AUTH_URL,
+            settings.OPENSTACK_USER,
+            settings.OPENSTACK_TENANT,
+            settings.OPENSTACK_PASSWORD,
+        )
+
+    @staticmethod
+    def _refresh_expiring_token(auth):
+        """
+        Invalidate the token of the `auth` plugin if it expires within OPENSTACK_TOKEN_REFRESH_MARGIN
+        seconds, so that the next request made with the client re-authenticates.
+        """
+        auth_ref = getattr(auth, 'auth_ref', None)
+        if auth_ref is not None and auth_ref.will_expire_soon(settings.OPENSTACK_TOKEN_REFRESH_MARGIN):
+            logger.info('OpenStack token expires soon, renewing it.')
+            auth.invalidate()
+
+    def get(self, kind, region_name, factory, get_auth, *args):
+        """
+        Return the client of type `kind` for `region_name`, calling `factory(region_name, *args)`
+        to create it if it doesn't exist yet.
+
+        `get_auth` is called with the client and must return its keystoneauth1 auth plugin.
+        """
+        key = (kind, region_name, args, self._credentials_key())
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = factory(region_name, *args)
+                self._clients[key] = client
+            else:
+                self._refresh_expiring_token(get_auth(client))
+        return client
+
+    def clear(self):
+        """
+        Forget all registered clients.
+        """
+        with self._lock:
+            self._clients.clear()
+
+
+client_registry = OpenStackClientRegistry()
+
+
+# Server status polling #######################################################
+
+
+class ServerStatusPoller:
+    """
+    Fetches the status of servers on behalf of all the threads waiting for servers of a region.
+
+    Instead of each waiting thread getting its own server from nova, the first thread needing
+    fresh data lists all the servers with a single `servers.list()` call, and the threads asking
+    for data meanwhile wait for that call to complete and share its result. Threads waiting for
+    a status change are notified through a condition variable each time a new list is available.
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._servers = {}
+        self._listed_at = None
+        self._listing = False
+        self._generation = 0
+
+    def get_server(self, nova, openstack_id, max_age):
+        """
+        Get the server `openstack_id`, from a list made less than `max_age` seconds ago.
+
+        Returns None if the server isn't in the list.
+        """
+        with self._condition:
+            while self._listing:
+                self._condition.wait()
+            if self._listed_at is not None and time.monotonic() - self._listed_at <= max_age:
+                return self._servers.get(openstack_id)
+            self._listing = True
+
+        servers = None
+        try:
+            servers = {server.id: server for server in nova.servers.list()}
+        finally:
+            with self._condition:
+                if servers is not None:
+                    self._servers = servers
+                    self._listed_at = time.monotonic()
+                self._listing = False
+                self._generation += 1
+                self._condition.notify_all()
+        return servers.get(openstack_id)
+
+    def wait_for_update(self, timeout):
+        """
+        Wait until the servers are listed again, or until `timeout` seconds have passed.
+        """
+        with self._condition:
+            generation = self._generation
+            self._condition.wait_for(lambda: self._generation != generation, timeout=timeout)
+
+
+_server_status_pollers = {}
+_server_status_pollers_lock = threading.Lock()
+
+
+def get_server_status_poller(region_name):
+    """
+    Get the shared ServerStatusPoller for `region_name`.
+    """
+    with _server_status_pollers_lock:
+        if region_name not in _server_status_pollers:
+            _server_status_pollers[region_name] = ServerStatusPoller()
+        return _server_status_pollers[region_name]
+
+
 # Functions ###################################################################
 
 
 def get_openstack_connection(region_name):
     """
-    Get the OpenStack Connection object.
+    Get the shared OpenStack Connection object for `region_name`.
+
+    See `OpenStackClientRegistry` for details about how the connection is shared.
+    """
+    return client_registry.get(
+        'connection', region_name, create_openstack_connection, lambda conn: conn.session.auth,
+    )
+
+
+def create_openstack_connection(region_name):
+    """
+    Create a new OpenStack Connection object.
 
     This is the new, all-powerful Python API for OpenStack. It should be used
     instead of the service-specific APIs such as the Nova API below.
@@ -135,6 +287,17 @@ def sync_security_group_rules(security_group, rule_definitions, network):
 
 
 def get_nova_client(region_name, api_version=2):
+    """
+    Get the shared python novaclient.Client() object for `region_name`.
+
+    See `OpenStackClientRegistry` for details about how the client is shared.
+    """
+    return client_registry.get(
+        'nova', region_name, create_nova_client, lambda nova: nova.client.session.auth, api_version,
+    )
+
+
+def create_nova_client(region_name, api_version=2):
     """
     Instantiate a python novaclient.Client() object with proper credentials
     """
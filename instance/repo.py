@@ -22,12 +22,18 @@ Git repository - Helper functions
 
 # Imports #####################################################################
 
+import fcntl
+import hashlib
 import logging
+import os
+import re
+import shutil
+import time
+import uuid
 from contextlib import contextmanager
 
 import git
-
-from instance import utils
+from django.conf import settings
 
 
 # Logging #####################################################################
@@ -35,20 +41,200 @@ from instance import utils
 logger = logging.getLogger(__name__)
 
 
+# Constants ###################################################################
+
+FULL_COMMIT_HASH_RE = re.compile(r'^[0-9a-f]{40}$')
+
+# Remote-tracking references, which don't exist in the mirrors: their branches are the branches of the remote
+REMOTE_TRACKING_REF_RE = re.compile(r'^(?:refs/remotes/)?origin/(?P<branch>.+)$')
+
+# Submodule settings listed by `git config --get-regexp` from a `.gitmodules` file
+SUBMODULE_CONFIG_RE = re.compile(r'^submodule\.(?P<name>.+)\.(?P<key>path|url) (?P<value>.*)$')
+
+
 # Functions ###################################################################
 
+def get_mirror_path(repo_url):
+    """
+    Get the path of the local bare mirror of the repository `repo_url`.
+    """
+    key = hashlib.sha256(repo_url.encode('utf-8')).hexdigest()[:20]
+    return os.path.join(settings.REPO_CACHE_DIR, 'mirrors', '{}.git'.format(key))
+
+
+@contextmanager
+def lock_mirror(mirror_path):
+    """
+    Hold an exclusive lock on the mirror at `mirror_path`.
+
+    This is a file lock, so it coordinates both the threads of a process and the different processes.
+    """
+    os.makedirs(os.path.dirname(mirror_path), exist_ok=True)
+    with open('{}.lock'.format(mirror_path), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def update_mirror(repo_url, mirror_path, ref):
+    """
+    Create the mirror of `repo_url`, or fetch the new commits into it, and resolve `ref`.
+
+    The fetch is skipped when `ref` is the full hash of a commit that is already in the mirror.
+    Must be called with the mirror lock held.
+
+    Returns the mirror `Repo` object, and the hash of the commit `ref` points to.
+    """
+    if not os.path.isdir(mirror_path):
+        logger.info('Mirroring repository %s in %s...', repo_url, mirror_path)
+        # Clone next to the mirror first, so that an interrupted clone doesn't leave a broken mirror behind.
+        tmp_mirror_path = '{}.tmp'.format(mirror_path)
+        shutil.rmtree(tmp_mirror_path, ignore_errors=True)
+        git.repo.base.Repo.clone_from(repo_url, tmp_mirror_path, mirror=True)
+        os.rename(tmp_mirror_path, mirror_path)
+        return git.Repo(mirror_path), resolve_commit(git.Repo(mirror_path), ref)
+
+    mirror = git.Repo(mirror_path)
+    if not FULL_COMMIT_HASH_RE.match(ref) or resolve_commit(mirror, ref) is None:
+        logger.info('Fetching repository %s in %s...', repo_url, mirror_path)
+        mirror.git.remote('update', '--prune')
+    return mirror, resolve_commit(mirror, ref)
+
+
+def resolve_commit(repo, ref):
+    """
+    Get the hash of the commit `ref` points to in `repo`, or None if it can't be found.
+
+    Since the branches of a mirror are those of its remote, remote-tracking references like `origin/<branch>`
+    are resolved as `<branch>`.
+    """
+    try:
+        return repo.git.rev_parse('--verify', '--quiet', '{}^{{commit}}'.format(ref))
+    except git.exc.GitCommandError:
+        pass
+    match = REMOTE_TRACKING_REF_RE.match(ref)
+    if match:
+        return resolve_commit(repo, match.group('branch'))
+    return None
+
+
+def resolve_submodule_url(repo_url, url):
+    """
+    Resolve the URL of a submodule, which may be relative to the URL `repo_url` of its superproject.
+    """
+    if not url.startswith(('./', '../')):
+        return url
+    base_url = repo_url.rstrip('/')
+    while url.startswith(('./', '../')):
+        if url.startswith('../'):
+            base_url = base_url.rsplit('/', 1)[0]
+        url = url.split('/', 1)[1]
+    return '{}/{}'.format(base_url, url)
+
+
+def update_submodules(repo, repo_url):
+    """
+    Check out the submodules of the working tree of `repo`, recursively, from local mirrors of their repositories.
+
+    Like the superproject, each submodule repository is mirrored in settings.REPO_CACHE_DIR, and only fetched
+    when the commit it is checked out at isn't in its mirror yet.
+    """
+    if not os.path.exists(os.path.join(repo.working_dir, '.gitmodules')):
+        return
+    submodules = {}
+    submodules_config = repo.git.config('--file', '.gitmodules', '--get-regexp', r'^submodule\..*\.(path|url)$')
+    for line in submodules_config.splitlines():
+        match = SUBMODULE_CONFIG_RE.match(line)
+        if match:
+            submodules.setdefault(match.group('name'), {})[match.group('key')] = match.group('value')
+
+    for name, submodule in sorted(submodules.items()):
+        if 'path' not in submodule or 'url' not in submodule:
+            continue
+        tree_entry = repo.git.ls_tree('HEAD', '--', submodule['path']).split()
+        if len(tree_entry) < 3 or tree_entry[1] != 'commit':
+            continue
+        submodule_url = resolve_submodule_url(repo_url, submodule['url'])
+        mirror_path = get_mirror_path(submodule_url)
+        with lock_mirror(mirror_path):
+            update_mirror(submodule_url, mirror_path, tree_entry[2])
+        # The submodule URL is only overridden for this command, as the configuration is shared by the worktrees
+        repo.git.execute([
+            'git',
+            '-c', 'protocol.file.allow=always',
+            '-c', 'submodule.{}.url={}'.format(name, mirror_path),
+            'submodule', 'update', '--', submodule['path'],
+        ])
+        update_submodules(git.Repo(os.path.join(repo.working_dir, submodule['path'])), submodule_url)
+
+
+def remove_worktree(mirror, worktree_path):
+    """
+    Remove the worktree at `worktree_path` of `mirror`.
+
+    Must be called with the mirror lock held.
+    """
+    try:
+        mirror.git.worktree('remove', '--force', worktree_path)
+    except git.exc.GitCommandError:
+        # The worktree was already partially removed; clean up what remains.
+        shutil.rmtree(worktree_path, ignore_errors=True)
+        mirror.git.worktree('prune')
+
+
+def collect_worktree_garbage(mirror, max_age=None):
+    """
+    Remove the worktrees of `mirror` that were created more than `max_age` seconds ago
+    (default: settings.REPO_CACHE_WORKTREE_MAX_AGE), which have been abandoned by killed processes.
+
+    Must be called with the mirror lock held.
+    """
+    if max_age is None:
+        max_age = settings.REPO_CACHE_WORKTREE_MAX_AGE
+    mirror.git.worktree('prune')
+    oldest_allowed = time.time() - max_age
+    mirror_path = os.path.realpath(mirror.git_dir)
+    for line in mirror.git.worktree('list', '--porcelain').splitlines():
+        if not line.startswith('worktree '):
+            continue
+        worktree_path = line[len('worktree '):]
+        if os.path.realpath(worktree_path) == mirror_path:
+            continue
+        if os.path.getmtime(worktree_path) < oldest_allowed:
+            logger.info('Removing abandoned worktree %s', worktree_path)
+            remove_worktree(mirror, worktree_path)
+
+
 @contextmanager
 def open_repository(repo_url, ref='master'):
     """
     Get a `Git` object for a repository URL and switch it to the reference `ref`.
 
-    Note that this clones the repository locally.
+    The repository is mirrored locally in settings.REPO_CACHE_DIR, and each call only fetches the
+    new commits into that mirror. The returned object works on a separate worktree of the mirror,
+    which is removed upon context manager exit, so concurrent calls don't interfere.
     """
-    with utils.create_temp_dir() as repo_dir_path:
-        logger.info('Cloning repository %s (ref=%s) in %s...', repo_url, ref, repo_dir_path)
+    mirror_path = get_mirror_path(repo_url)
+    worktree_path = os.path.join(
+        settings.REPO_CACHE_DIR,
+        'worktrees',
+        '{}-{}'.format(os.path.splitext(os.path.basename(mirror_path))[0], uuid.uuid4().hex),
+    )
+
+    with lock_mirror(mirror_path):
+        mirror, commit = update_mirror(repo_url, mirror_path, ref)
+        if commit is None:
+            raise ValueError('Reference {} not found in repository {}'.format(ref, repo_url))
+        collect_worktree_garbage(mirror)
+        logger.info('Checking out repository %s (ref=%s, commit=%s) in %s...', repo_url, ref, commit, worktree_path)
+        mirror.git.worktree('add', '--detach', worktree_path, commit)
 
-        # We can technically clone into a branch directly, but that wouldn't work for arbitrary references.
-        repo = git.repo.base.Repo.clone_from(repo_url, repo_dir_path)
-        repo.git.checkout(ref)
-        repo.submodule_update()
+    try:
+        repo = git.Repo(worktree_path)
+        update_submodules(repo, repo_url)
         yield repo.git
+    finally:
+        with lock_mirror(mirror_path):
+            remove_worktree(mirror, worktree_path)
@@ -79,6 +79,18 @@ class InstanceReferenceBasicSerializer(InstanceReferenceMinimalSerializer):
             'appservers_full_list_url',
         )
 
+    def __init__(self, *args, fields=None, **kwargs):
+        """
+        `fields` optionally restricts the output to the given list of field names.
+        """
+        super().__init__(*args, **kwargs)
+        self.requested_fields = None
+        if fields is not None:
+            self.requested_fields = set(fields)
+            # Don't compute the fields which won't be returned
+            for field_name in set(self.fields) - self.requested_fields:
+                self.fields.pop(field_name)
+
     def serialize_details(self, instance):
         """
         Given an object that is a subclass of Instance, serialize it.
@@ -105,10 +117,13 @@ class InstanceReferenceBasicSerializer(InstanceReferenceMinimalSerializer):
         """
         output = super().to_representation(instance)
         output['instance_type'] = instance.instance_type.model
-        details = self.serialize_details(instance.instance)
-        # Merge instance details into the resulting dict, but never overwrite existing fields
-        for key, val in details.items():
-            output.setdefault(key, val)
+        if self.requested_fields is None or not self.requested_fields.issubset(output):
+            details = self.serialize_details(instance.instance)
+            # Merge instance details into the resulting dict, but never overwrite existing fields
+            for key, val in details.items():
+                output.setdefault(key, val)
+        if self.requested_fields is not None:
+            output = {key: val for key, val in output.items() if key in self.requested_fields}
         return output
 
 
@@ -34,3 +34,10 @@ class LogEntrySerializer(serializers.Serializer): #pylint: disable=abstract-meth
     level = serializers.CharField(read_only=True)
     text = serializers.CharField(read_only=True)
     created = serializers.DateTimeField(read_only=True)
+
+
+class LogEntryStreamSerializer(LogEntrySerializer): #pylint: disable=abstract-method
+    """
+    Log entries API serializer for the log streams, including the ID used as cursor
+    """
+    id = serializers.IntegerField(read_only=True)
@@ -51,7 +51,7 @@ class OpenEdXInstanceBasicSerializer(serializers.ModelSerializer):
         Add additional fields/data to the output
         """
         output = super().to_representation(instance)
-        output['appserver_count'] = instance.appserver_set.count()
+        output['appserver_count'] = instance.get_appserver_count()
         output['status_description'] = []
 
         # Store the list of active appservers, and collated status information
@@ -77,13 +77,8 @@ class OpenEdXInstanceBasicSerializer(serializers.ModelSerializer):
             output['is_healthy'] = None
             output['is_steady'] = None
 
-        try:
-            # Note that appservers are ordered by '-created' by default.
-            # We don't change or check the ordering of the .appserver_set.all() queryset here
-            # because that causes the django ORM to force a new database query to be made
-            # for each instance here, even if appserver_set was previously cached.
-            newest_appserver = instance.appserver_set.all()[0]
-        except IndexError:
+        newest_appserver = instance.get_newest_appserver()
+        if newest_appserver is None:
             output['newest_appserver'] = None
         else:
             output['newest_appserver'] = AppServerBasicSerializer(newest_appserver, context=self.context).data
@@ -30,3 +30,6 @@ import django.dispatch
 # Emitted after an appserver has been spawned
 # After all attempts have been tried, and the appserver activated if applicable
 appserver_spawned = django.dispatch.Signal(providing_args=['instance', 'appserver', 'deployment_id'])
+
+# Emitted after the state of a resource backed by a ModelResourceStateDescriptor has been changed and saved
+resource_state_changed = django.dispatch.Signal(providing_args=['resource', 'old_state', 'new_state'])
@@ -72,7 +72,31 @@ app.factory('OpenCraftAPI', function(Restangular) {
 
 app.factory('WebSocketClient', function() {
     var protocol = (window.location.protocol == 'https:') ? 'wss:' : 'ws:';
-    return new WebSocket(protocol + '//' + window.location.host + '/ws/');
+    var client = new WebSocket(protocol + '//' + window.location.host + '/ws/');
+
+    var sendWhenOpen = function(message) {
+        if (client.readyState === WebSocket.OPEN) {
+            client.send(JSON.stringify(message));
+        } else if (client.readyState === WebSocket.CONNECTING) {
+            client.addEventListener('open', function() {
+                client.send(JSON.stringify(message));
+            });
+        }
+    };
+
+    // Log lines are only sent for the objects the client subscribed to.
+    // `key` is one of 'instance_id', 'appserver_id', 'deployment_id' or 'server_id'.
+    client.subscribe = function(key, id) {
+        let message = {action: 'subscribe'};
+        message[key] = id;
+        sendWhenOpen(message);
+    };
+    client.unsubscribe = function(key, id) {
+        let message = {action: 'unsubscribe'};
+        message[key] = id;
+        sendWhenOpen(message);
+    };
+    return client;
 });
 
 // Controllers ////////////////////////////////////////////////////////////////
@@ -143,8 +167,8 @@ app.controller("Index", ['$scope', '$state', 'OpenCraftAPI', 'WebSocketClient',
 ]);
 
 
-app.controller("Details", ['$scope', '$state', '$stateParams', 'OpenCraftAPI',
-    function ($scope, $state, $stateParams, OpenCraftAPI) {
+app.controller("Details", ['$scope', '$state', '$stateParams', 'OpenCraftAPI', 'WebSocketClient',
+    function ($scope, $state, $stateParams, OpenCraftAPI, WebSocketClient) {
 
         $scope.init = function() {
             $scope.is_spawning_appserver = false;
@@ -160,6 +184,13 @@ app.controller("Details", ['$scope', '$state', '$stateParams', 'OpenCraftAPI',
             $scope.originalNotes = "";
             $scope.showNotes = false;
 
+            // Receive the log lines of this instance
+            let instanceId = parseInt($stateParams.instanceId, 10);
+            WebSocketClient.subscribe('instance_id', instanceId);
+            $scope.$on('$destroy', function() {
+                WebSocketClient.unsubscribe('instance_id', instanceId);
+            });
+
             $scope.refresh();
         };
 
@@ -293,9 +324,11 @@ app.controller("Details", ['$scope', '$state', '$stateParams', 'OpenCraftAPI',
             }
         });
 
-        $scope.$on('websocket:object_log_line', function(event, data){
+        $scope.$on('websocket:object_log_lines', function(event, data){
             if (data.instance_id == $scope.instance.id && !data.appserver_id && $scope.instanceLogs) {
-                $scope.instanceLogs.log_entries.push(data.log_entry);
+                data.log_entries.forEach(function(logEntry) {
+                    $scope.instanceLogs.log_entries.push(logEntry);
+                });
             }
         });
 
@@ -31,14 +31,26 @@ app.config(function($stateProvider) {
         });
 });
 
-app.controller("OpenEdXAppServerDetails", ['$scope', '$state', '$stateParams', 'OpenCraftAPI',
-    function ($scope, $state, $stateParams, OpenCraftAPI) {
+app.controller("OpenEdXAppServerDetails", ['$scope', '$state', '$stateParams', 'OpenCraftAPI', 'WebSocketClient',
+    function ($scope, $state, $stateParams, OpenCraftAPI, WebSocketClient) {
 
         $scope.init = function() {
             $scope.appserver = null;
             $scope.appserverLogs = null; // Logs. Once loaded, this is {log_entries: [], log_error_entries: []}
             $scope.isFetchingLogs = false; // Are we currently loading the logs?
             $scope.logsPanelOpen = false; // Is the logs panel visible?
+            $scope.subscribedServerId = null;
+
+            // Receive the log lines of this appserver, and of its VM once it's known (see refresh())
+            let appserverId = parseInt($stateParams.appserverId, 10);
+            WebSocketClient.subscribe('appserver_id', appserverId);
+            $scope.$on('$destroy', function() {
+                WebSocketClient.unsubscribe('appserver_id', appserverId);
+                if ($scope.subscribedServerId) {
+                    WebSocketClient.unsubscribe('server_id', $scope.subscribedServerId);
+                }
+            });
+
             $scope.refresh();
         };
 
@@ -51,6 +63,14 @@ app.controller("OpenEdXAppServerDetails", ['$scope', '$state', '$stateParams', '
                 $scope.is_active = appserver.is_active;
                 $scope.is_running = appserver.status === 'running';
                 $scope.vm_running = appserver.server.status === 'ready';
+                if (appserver.server.id && appserver.server.id !== $scope.subscribedServerId) {
+                    // Stop receiving the log lines of the previous VM
+                    if ($scope.subscribedServerId) {
+                        WebSocketClient.unsubscribe('server_id', $scope.subscribedServerId);
+                    }
+                    $scope.subscribedServerId = appserver.server.id;
+                    WebSocketClient.subscribe('server_id', $scope.subscribedServerId);
+                }
             }, function() {
                 $scope.notify("Unable to load the appserver details.");
             });
@@ -111,16 +131,18 @@ app.controller("OpenEdXAppServerDetails", ['$scope', '$state', '$stateParams', '
                               'alert');
             });
         };
-        $scope.$on("websocket:object_log_line", function(event, data){
+        $scope.$on("websocket:object_log_lines", function(event, data){
             if (!$scope.appserverLogs) {
                 return;
             }
 
             if (data.appserver_id == $scope.appserver.id || ($scope.appserver.server && data.server_id == $scope.appserver.server.id)) {
-                if (data.log_entry.level == 'ERROR' || data.log_entry.level == 'CRITICAL') {
-                    $scope.appserverLogs.log_error_entries.push(data.log_entry);
-                }
-                $scope.appserverLogs.log_entries.push(data.log_entry);
+                data.log_entries.forEach(function(logEntry) {
+                    if (logEntry.level == 'ERROR' || logEntry.level == 'CRITICAL') {
+                        $scope.appserverLogs.log_error_entries.push(logEntry);
+                    }
+                    $scope.appserverLogs.log_entries.push(logEntry);
+                });
                 $scope.$apply();
             }
         });
@@ -28,18 +28,18 @@ import logging
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.management import call_command, CommandError
 from django.core.mail import EmailMessage
-from django.db import connection
 from django.db.models import Q
 from django.utils import timezone
 from huey.api import crontab
 from huey.contrib.djhuey import db_periodic_task, db_task, HUEY
 
-from instance.models.log_entry import LogEntry
+from instance import openstack_utils
+from instance.models.log_entry import create_log_entry_partitions, delete_log_entries_before
 from instance.models.openedx_appserver import OpenEdXAppServer
 from instance.models.openedx_deployment import OpenEdXDeployment
-from instance.models.openedx_instance import OpenEdXInstance
+from instance.models.openedx_instance import OpenEdXInstance, terminate_obsolete_appservers_of_all_instances
+from instance.models.server import delete_zombie_vms, find_zombie_vms
 from instance.utils import sufficient_time_passed
 from userprofile.models import UserProfile
 from pr_watch import github
@@ -240,12 +240,14 @@ def terminate_obsolete_appservers_all_instances():
     """
     Terminate obsolete app servers for all instances.
     """
-    for instance in OpenEdXInstance.objects.all():
-        instance.logger.info("Terminating obsolete appservers for instance %s", instance.domain)
-        try:
-            instance.terminate_obsolete_appservers()
-        except Exception:  # pylint:disable=broad-except
-            instance.logger.exception('Error deleting the obsolete appservers for instance %s', instance.domain)
+    logger.info('Terminating the obsolete appservers of all instances')
+    terminated_count, failed_count = terminate_obsolete_appservers_of_all_instances(
+        max_workers=settings.TERMINATE_OBSOLETE_APPSERVERS_WORKERS,
+    )
+    logger.info(
+        'Terminated %d obsolete appservers; %d could not be terminated and will be retried on the next run',
+        terminated_count, failed_count,
+    )
 
 
 @db_task()
@@ -277,21 +279,18 @@ def delete_old_logs():
     """
     Delete old log entries.
 
-    For performance reasons, we execute raw SQL against the LogEntry model's table.
+    The expired monthly partitions of the log entries table are dropped, and the remaining old log entries
+    are deleted in chunks. The partitions of the upcoming months are created beforehand.
 
     This task runs every day.
     """
+    create_log_entry_partitions()
     cutoff = timezone.now() - timezone.timedelta(days=settings.LOG_DELETION_DAYS)
-    query = (
-        "DELETE FROM {table} "
-        "WHERE {table}.created < '{cutoff}'::timestamptz".format(
-            table=LogEntry._meta.db_table,
-            cutoff=cutoff.isoformat(),
-        )
+    dropped_partitions, deleted_count = delete_log_entries_before(cutoff, settings.LOG_DELETION_CHUNK_SIZE)
+    logger.info(
+        'Deleted log entries created before %s: dropped %d partitions, deleted %d entries',
+        cutoff.isoformat(), len(dropped_partitions), deleted_count,
     )
-    logger.info(query)
-    with connection.cursor() as cursor:
-        cursor.execute(query)
 
 
 if settings.CLEANUP_OLD_BETATEST_USERS:
@@ -401,57 +400,40 @@ class KillZombiesRunner:
         )
         self.send_email(subject, body)
 
-    def get_zombie_servers_count(self, stdout: str) -> int:
-        """
-        If there are servers to terminate, a `kill_zombies` dry run will warn:
-        "Would have terminated {} zombies" to stdout.
-        """
-        num_instances = 0
-        if "No servers found in region" in stdout:
-            return num_instances
-        try:
-            num_instances = int(stdout.split("Would have terminated")[1].split()[0])
-        except (IndexError, ValueError):
-            logger.info("Received unexpected input from dry run. Defaulting to zero")
-        return num_instances
-
     def run(self):
         """
         Main method for running the task
         """
         try:
-            dry_run_output, output = "", ""
-            dry_run_output = call_command(
-                "kill_zombies",
-                region=self.region,
-                dry_run=True,
-            )
-            num_of_zombies = self.get_zombie_servers_count(dry_run_output)
-            if num_of_zombies > self.threshold:
-                self.trigger_warning(num_of_zombies)
-            if num_of_zombies != 0:
-                output = call_command("kill_zombies", region=self.region)
-                logging.info(
-                    "Task `kill_zombies_periodically` ran successfully "
-                    "and terminated %s zombies", num_of_zombies
-                )
-            else:
-                logging.info(
-                    "Found zero zombies to terminate. "
-                    "Task `kill_zombies_periodically` ran successfully."
-                )
-        except CommandError:
+            nova_servers = openstack_utils.get_nova_client(self.region).servers.list()
+            zombies = find_zombie_vms(nova_servers)
+        except Exception as exc:  # pylint: disable=broad-except
             logger.error(
-                "Task `kill_zombies` command failed. Sending notification email"
+                "Task `kill_zombies` failed to list the zombies. Sending notification email"
             )
             subject = "Terminate zombie instances command failed"
             body = (
                 "Scheduled execution of `kill_zombies` command failed. "
-                "Log entries are displayed below:"
-                "%s\n%s"
-            ) % (dry_run_output, output)
+                "The error is displayed below:\n%s"
+            ) % exc
             self.send_email(subject, body)
             return False
+
+        if len(zombies) > self.threshold:
+            self.trigger_warning(len(zombies))
+        if zombies:
+            failures = delete_zombie_vms(zombies, max_workers=settings.KILL_ZOMBIES_WORKERS)
+            for nova_server, error in failures:
+                logger.warning("Unable to delete zombie server %s. Error: %s.", nova_server.name, error)
+            logging.info(
+                "Task `kill_zombies_periodically` ran successfully "
+                "and terminated %s zombies", len(zombies) - len(failures)
+            )
+        else:
+            logging.info(
+                "Found zero zombies to terminate. "
+                "Task `kill_zombies_periodically` ran successfully."
+            )
         return True
 
 
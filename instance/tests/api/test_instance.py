@@ -22,6 +22,7 @@ Views - Tests
 
 # Imports #####################################################################
 
+import json
 from unittest.mock import patch
 
 import ddt
@@ -209,6 +210,52 @@ class InstanceAPITestCase(APITestCase):
             self.assertEqual(expected_entry['text'].format(inst_id=instance.ref.pk), log_entry['text'])
             self.assertEqual(expected_entry['text'].format(inst_id=instance.ref.pk), log_entry['text'])
 
+    def test_stream_log_entries(self, mock_consul):
+        """
+        GET - Log entries stream, as newline-delimited JSON, after the `since` cursor
+        """
+        self.api_client.login(username='user3', password='pass')
+        instance = OpenEdXInstanceFactory(name="Test!")
+        instance.logger.info("info")
+        instance.logger.error("error")
+        url = '/api/v1/instance/{pk}/logs/stream/'.format(pk=instance.ref.pk)
+
+        response = self.api_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        log_entries = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([(entry['level'], entry['text']) for entry in log_entries], [
+            ('INFO', 'instance.models.instance  | instance={} (Test!) | info'.format(instance.ref.pk)),
+            ('ERROR', 'instance.models.instance  | instance={} (Test!) | error'.format(instance.ref.pk)),
+        ])
+
+        instance.logger.warning("warning")
+        response = self.api_client.get(url, {'since': log_entries[-1]['id']})
+        log_entries = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([(entry['level'], entry['text']) for entry in log_entries], [
+            ('WARNING', 'instance.models.instance  | instance={} (Test!) | warning'.format(instance.ref.pk)),
+        ])
+
+        response = self.api_client.get(url, {'since': log_entries[-1]['id']})
+        self.assertEqual(b''.join(response.streaming_content), b'')
+
+    def test_stream_log_entries_limit(self, mock_consul):
+        """
+        GET - Without cursor, the log entries stream starts with the `LOG_LIMIT` most recent entries
+        """
+        self.api_client.login(username='user3', password='pass')
+        instance = OpenEdXInstanceFactory(name="Test!")
+        for number in range(5):
+            instance.logger.info("line %d", number)
+
+        with override_settings(LOG_LIMIT=3, LOG_STREAM_CHUNK_SIZE=2):
+            response = self.api_client.get('/api/v1/instance/{pk}/logs/stream/'.format(pk=instance.ref.pk))
+            content = b''.join(response.streaming_content).decode()
+        self.assertEqual(
+            [json.loads(line)['text'][-6:] for line in content.splitlines()],
+            ['line 2', 'line 3', 'line 4'],
+        )
+
     @ddt.data(
         (None, 'Authentication credentials were not provided.'),
         ('user1', 'You do not have permission to perform this action.'),
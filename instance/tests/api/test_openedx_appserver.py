@@ -22,12 +22,16 @@ Views - Tests
 
 # Imports #####################################################################
 
+import json
+import tracemalloc
 from unittest.mock import patch
 
 import ddt
 from rest_framework import status
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
 from django.test.utils import override_settings
+from instance.models.log_entry import LogEntry
 from instance.tasks import spawn_appserver
 
 from instance.tests.api.base import APITestCase
@@ -707,6 +711,104 @@ class OpenEdXAppServerAPILogsTestCase(APITestCase):
             inst_id=instance.ref.id, as_id=app_server.pk, server_id=server.pk, server_name=server.name,
         )
 
+    @patch_url(settings.OPENSTACK_AUTH_URL)
+    def test_stream_log_entries(self, mock_consul):
+        """
+        GET - Log entries stream of the appserver and its VM, filtered by level and after the `since` cursor
+        """
+        self.api_client.login(username='user3', password='pass')
+        instance = OpenEdXInstanceFactory(name="Log Tester Instance")
+        app_server = make_test_appserver(instance)
+        server = app_server.server
+        app_server.logger.info("info")
+        app_server.logger.error("error")
+        server.logger.error("error")
+        url = '/api/v1/openedx_appserver/{pk}/logs/stream/'.format(pk=app_server.pk)
+
+        response = self.api_client.get(url, {'level': 'error,critical'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        log_entries = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.check_log_list([
+            {
+                'level': 'ERROR',
+                'text': (
+                    'instance.models.appserver | '
+                    'instance={inst_id} (Log Tester Inst),app_server={as_id} (AppServer 1) | error'
+                ),
+            },
+            {
+                'level': 'ERROR',
+                'text': 'instance.models.server    | server={server_id} ({server_name}) | error',
+            },
+        ], log_entries, inst_id=instance.ref.id, as_id=app_server.pk, server_id=server.pk, server_name=server.name)
+        self.assertLess(log_entries[0]['id'], log_entries[1]['id'])
+
+        response = self.api_client.get(url, {'since': log_entries[0]['id'], 'level': 'ERROR'})
+        self.assertEqual(
+            [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()],
+            log_entries[1:],
+        )
+
+    @ddt.data(
+        ({'since': 'last'}, 'since'),
+        ({'level': 'INFO,VERBOSE'}, 'level'),
+    )
+    @ddt.unpack
+    def test_stream_log_entries_invalid_parameters(self, params, field, mock_consul):
+        """
+        GET - The log entries stream rejects invalid cursors and levels
+        """
+        self.api_client.login(username='user3', password='pass')
+        app_server = make_test_appserver()
+        response = self.api_client.get(
+            '/api/v1/openedx_appserver/{pk}/logs/stream/'.format(pk=app_server.pk), params,
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(field, response.data)
+
+    @override_settings(LOG_STREAM_CHUNK_SIZE=1000)
+    def test_stream_log_entries_memory(self, mock_consul):
+        """
+        GET - The memory used to stream the log entries doesn't grow with the number of entries
+        """
+        self.api_client.login(username='user3', password='pass')
+        app_server = make_test_appserver()
+        appserver_type = ContentType.objects.get_for_model(app_server)
+        LogEntry.objects.bulk_create(
+            (
+                LogEntry(
+                    content_type=appserver_type,
+                    object_id=app_server.pk,
+                    appserver_id=app_server.pk,
+                    level='INFO',
+                    text='TASK [edxapp : Install the python requirements] ok: [203.0.113.10] line {}'.format(number)
+                    + ' *' * 60,
+                )
+                for number in range(100000)
+            ),
+            batch_size=10000,
+        )
+        response = self.api_client.get(
+            '/api/v1/openedx_appserver/{pk}/logs/stream/'.format(pk=app_server.pk), {'since': 0},
+        )
+
+        line_count, byte_count = 0, 0
+        tracemalloc.start()
+        try:
+            for content in response.streaming_content:
+                line_count += content.count(b'\n')
+                byte_count += len(content)
+            unused, memory_peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(line_count, app_server.log_entries_queryset.count())
+        self.assertGreater(line_count, 100000)
+        self.assertGreater(byte_count, 20 * 1024 * 1024)
+        # Only one chunk of entries is held in memory at a time
+        self.assertLess(memory_peak, byte_count / 5)
+
     @ddt.data(
         (None, 'Authentication credentials were not provided.'),
         ('user1', 'You do not have permission to perform this action.'),
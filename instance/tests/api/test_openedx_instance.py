@@ -200,7 +200,8 @@ class OpenEdXInstanceAPITestCase(APITestCase):
         self.assertEqual(len(response.data), 0)
 
         # The 7 queries are:
-        # Session, User, InstanceReference, OpenEdXInstance, InstanceReference, OpenEdxAppServer, OpenEdxAppServer
+        # Session, User, InstanceReference, OpenEdXInstance, InstanceReference (with the appserver count),
+        # OpenEdxAppServer (newest), OpenEdxAppServer (active)
         # Because user3 is superuser, his UserProfile/Organization need not be fetched to detect he's admin,
         # so in this test we save some queries compared to a non-superuser User.
         queries_per_api_call = 7
@@ -303,6 +304,65 @@ class OpenEdXInstanceAPITestCase(APITestCase):
         self.assertEqual(len(response.data), 1)
         self.assertEqual(response.data[0]['id'], instance.ref.id)
 
+    def test_instance_list_filter_on_domain(self, mock_consul):
+        """
+        GET - instance list - it should be possible to filter on internal or external LMS domain
+        """
+        instance = OpenEdXInstanceFactory(sub_domain='test.com', name='test.com')
+        instance2 = OpenEdXInstanceFactory(sub_domain='test2.com', name='test2.com')
+        instance3 = OpenEdXInstanceFactory(sub_domain='test3.com', name='test3.com',
+                                           external_lms_domain='courses.example.org')
+
+        self.api_client.login(username='user3', password='pass')
+        response = self.api_client.get('/api/v1/instance/?domain=TEST2')
+        self.assertEqual([data['id'] for data in response.data], [instance2.ref.id])
+
+        response = self.api_client.get('/api/v1/instance/?domain=courses.example')
+        self.assertEqual([data['id'] for data in response.data], [instance3.ref.id])
+
+        response = self.api_client.get('/api/v1/instance/?domain=test')
+        self.assertCountEqual(
+            [data['id'] for data in response.data],
+            [instance.ref.id, instance2.ref.id, instance3.ref.id]
+        )
+
+    def test_instance_list_pagination(self, mock_consul):
+        """
+        GET - instance list - with `page_size`, the list is paginated with cursors, newest modified first
+        """
+        instances = [OpenEdXInstanceFactory(sub_domain='page{}'.format(i)) for i in range(5)]
+        # Modify the first instance last, so that it comes first
+        instances[0].ref.save()
+        expected_ids = [instance.ref.id for instance in [instances[0]] + instances[:0:-1]]
+
+        self.api_client.login(username='user3', password='pass')
+        ids = []
+        url = '/api/v1/instance/?page_size=2'
+        while url:
+            response = self.api_client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 2)
+            ids += [data['id'] for data in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, expected_ids)
+
+        # Without page_size, the whole list is returned
+        response = self.api_client.get('/api/v1/instance/')
+        self.assertEqual(len(response.data), 5)
+
+    def test_instance_list_sparse_fields(self, mock_consul):
+        """
+        GET - instance list - the `fields` parameter restricts the returned fields
+        """
+        instance, dummy = self.add_active_appserver()
+        self.api_client.login(username='user3', password='pass')
+
+        response = self.api_client.get('/api/v1/instance/?fields=id,name')
+        self.assertEqual(response.data, [{'id': instance.ref.id, 'name': instance.name}])
+
+        response = self.api_client.get('/api/v1/instance/?fields=id,domain,appserver_count')
+        self.assertEqual(response.data, [{'id': instance.ref.id, 'domain': instance.domain, 'appserver_count': 1}])
+
     def test_instance_list_filter_on_notes(self, mock_consul):
         """
         GET - instance list - it should be possible to filter on notes
@@ -0,0 +1,503 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Benchmarks of the provisioning hot paths, run against fake external backends
+
+The benchmarks create instances, servers and log entries, which are rolled back after each benchmark.
+They only run on a test database, so that a failed rollback never leaves that data next to real one.
+"""
+
+# Imports #####################################################################
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import timedelta
+import json
+import logging
+import random
+import statistics
+import time
+import tracemalloc
+
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.backends.base.creation import TEST_DATABASE_PREFIX
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from instance.logging import DBHandler, ModelLoggerAdapter
+from instance.models.appserver import Status as AppServerStatus
+from instance.models.database_server import MongoDBServer, MySQLServer
+from instance.models.load_balancer import LoadBalancingServer
+from instance.models.openedx_appserver import OpenEdXAppServer
+from instance.models.openedx_instance import OpenEdXInstance, terminate_obsolete_appservers_of_all_instances
+from instance.models.rabbitmq_server import RabbitMQServer
+from instance.models.redis_server import RedisServer
+from instance.models.server import OpenStackServer, Status as ServerStatus
+from instance.tests.fake_backends import WEBSOCKET, FakeBackends
+from instance.utils import WEBSOCKET_SUPERUSERS_GROUP, get_event_groups, websocket_group_name
+
+
+# Constants ###################################################################
+
+# Seed of the random number generator, so that the benchmarks make the same choices on every run
+RANDOM_SEED = 20151001
+
+# Number of log lines emitted in each round of the DBHandler benchmarks
+LOG_LINES_PER_ROUND = 1000
+
+# Number of obsolete appservers of each instance in the obsolete appservers termination benchmark
+OBSOLETE_APPSERVERS_PER_INSTANCE = 2
+
+# Websocket clients of the fan-out benchmark: all of them are superusers, and some follow the logging appserver
+WEBSOCKET_CLIENTS = 200
+WEBSOCKET_SUBSCRIBERS = 5
+
+# Number of log line events sent in each round of the websocket fan-out benchmark
+WEBSOCKET_EVENTS_PER_ROUND = 200
+
+# Results which are compared to the baseline, and whether they are exact counts or measurements
+COMPARED_RESULTS = (
+    ('time_ms', False),
+    ('queries', True),
+    ('memory_kib', False),
+)
+
+
+# Globals #####################################################################
+
+BENCHMARKS = OrderedDict()
+
+
+# Fixtures ####################################################################
+
+class Fleet:
+    """
+    The instances of a benchmark, sharing a load balancer and database servers.
+    """
+    def __init__(self):
+        self.load_balancer = LoadBalancingServer.objects.create(
+            domain='benchmark-lb.example.com',
+            ssh_username='ubuntu',
+        )
+        self.servers = dict(
+            mysql_server=MySQLServer.objects.create(name='benchmark-mysql', hostname='mysql.benchmark.example.com'),
+            mongodb_server=MongoDBServer.objects.create(name='benchmark-mongo', hostname='mongo.benchmark.example.com'),
+            mongodb_replica_set=None,
+            rabbitmq_server=RabbitMQServer.objects.create(
+                name='benchmark-rabbitmq',
+                api_url='https://rabbitmq.benchmark.example.com',
+                admin_username='admin',
+                admin_password='admin',
+                instance_host='rabbitmq.benchmark.example.com',
+            ),
+            redis_server=RedisServer.objects.create(
+                name='benchmark-redis',
+                admin_username='admin',
+                admin_password='admin',
+                instance_host='redis.benchmark.example.com',
+            ),
+        )
+        self.instances = []
+
+    def create_instance(self):
+        """
+        Create an instance using the servers of the fleet.
+        """
+        number = len(self.instances) + 1
+        instance = OpenEdXInstance.objects.create(
+            sub_domain='benchmark-{}'.format(number),
+            name='Benchmark instance {}'.format(number),
+            load_balancing_server=self.load_balancer,
+            storage_type=OpenEdXInstance.S3_STORAGE,
+            s3_access_key='benchmark',
+            s3_secret_access_key='benchmark',
+            s3_bucket_name='benchmark-{}'.format(number),
+            **self.servers
+        )
+        self.instances.append(instance)
+        return instance
+
+    @staticmethod
+    def create_appserver(instance, active=True):
+        """
+        Create an appserver of the given instance, running on a VM with a public IP address.
+        """
+        appserver = instance._create_owned_appserver()  # pylint: disable=protected-access
+        OpenStackServer.objects.filter(pk=appserver.server_id).update(
+            openstack_id='benchmark-vm-{}'.format(appserver.pk),
+            _status=ServerStatus.Ready.state_id,
+        )
+        OpenEdXAppServer.objects.filter(pk=appserver.pk).update(_is_active=active)
+        return OpenEdXAppServer.objects.get(pk=appserver.pk)
+
+    @classmethod
+    def create(cls, instance_count):
+        """
+        Create a fleet of `instance_count` instances, each with an active appserver.
+        """
+        fleet = cls()
+        for unused in range(instance_count):
+            fleet.create_appserver(fleet.create_instance())
+        return fleet
+
+
+class BufferingDBHandler(DBHandler):
+    """
+    DBHandler buffering the log entries emitted within the benchmark transaction
+
+    Only the benchmarking thread writes to that transaction, which is rolled back afterwards.
+    """
+    def _in_transaction(self):
+        return False
+
+
+@contextmanager
+def inline_db_logging():
+    """
+    Make the DBHandlers of the logging configuration write each log entry as it is emitted.
+
+    This way the log entries of the benchmarks are written by the benchmarking thread, in the transaction
+    which is rolled back afterwards, rather than by the flusher threads.
+    """
+    loggers = [logging.getLogger()] + [
+        logger for logger in logging.Logger.manager.loggerDict.values() if isinstance(logger, logging.Logger)
+    ]
+    handlers = {handler for logger in loggers for handler in logger.handlers if isinstance(handler, DBHandler)}
+    capacities = {}
+    for handler in handlers:
+        handler.flush()
+        capacities[handler] = handler.capacity
+        handler.capacity = 1
+    try:
+        yield
+    finally:
+        for handler, capacity in capacities.items():
+            handler.capacity = capacity
+
+
+# Benchmarks ##################################################################
+
+def benchmark(name):
+    """
+    Register a benchmark.
+
+    The decorated function is a generator taking the `FakeBackends` and the instance count of the benchmark.
+    It prepares the data, yields the function to measure, and cleans up after the measurements.
+    """
+    def register(func):
+        """ Register the benchmark function """
+        BENCHMARKS[name] = contextmanager(func)
+        return func
+    return register
+
+
+@benchmark('spawn_appserver')
+def benchmark_spawn_appserver(backends, instance_count):  # pylint: disable=unused-argument
+    """
+    Provision the resources of a new appserver, and create it.
+
+    The provisioning steps run one after the other, since the benchmark data isn't visible to other threads.
+    """
+    fleet = Fleet.create(instance_count)
+    instance = fleet.create_instance()
+    yield instance._spawn_appserver  # pylint: disable=protected-access
+
+
+@benchmark('make_active')
+def benchmark_make_active(backends, instance_count):  # pylint: disable=unused-argument
+    """
+    Activate an appserver, reconfiguring the load balancer shared with the other instances of the fleet.
+    """
+    fleet = Fleet.create(instance_count)
+    appserver = fleet.create_appserver(fleet.create_instance(), active=False)
+    yield appserver.make_active
+
+
+@benchmark('load_balancer_reconfigure')
+def benchmark_load_balancer_reconfigure(backends, instance_count):  # pylint: disable=unused-argument
+    """
+    Regenerate and deploy the configuration of all the instances of a load balancer.
+    """
+    fleet = Fleet.create(instance_count)
+    yield fleet.load_balancer.reconfigure
+
+
+def log_appserver_lines(capacity):
+    """
+    Prepare the emission of the log lines of an appserver, stored by a DBHandler with the given buffer capacity.
+    """
+    fleet = Fleet.create(1)
+    appserver = fleet.instances[0].appserver_set.get()
+
+    handler = BufferingDBHandler(capacity=capacity, flush_interval=3600)
+    formatter_config = settings.LOGGING['formatters']['db']
+    handler.setFormatter(logging.Formatter(formatter_config['format'], style=formatter_config['style']))
+    benchmark_logger = logging.getLogger('instance.benchmark')
+    benchmark_logger.propagate = False
+    benchmark_logger.setLevel(logging.INFO)
+    benchmark_logger.addHandler(handler)
+    adapter = ModelLoggerAdapter(benchmark_logger, {'obj': appserver})
+
+    def emit_log_lines():
+        """ Log the lines, and store the buffered ones """
+        for line_num in range(LOG_LINES_PER_ROUND):
+            adapter.info('TASK [common : Install system packages] ok: [203.0.113.10] (item=%d)', line_num)
+        handler.flush()
+
+    try:
+        yield emit_log_lines
+    finally:
+        benchmark_logger.removeHandler(handler)
+        handler.close()
+
+
+@benchmark('load_balancer_reconfigure_incremental')
+def benchmark_load_balancer_reconfigure_incremental(backends, instance_count):  # pylint: disable=unused-argument
+    """
+    Regenerate the configuration of one instance of a load balancer, reusing the stored configurations of the
+    other instances of the fleet.
+    """
+    fleet = Fleet.create(instance_count)
+    triggering_instance_id = fleet.instances[0].ref.pk
+
+    def reconfigure():
+        """ Reconfigure the load balancer on behalf of the first instance """
+        fleet.load_balancer.reconfigure(triggering_instance_id=triggering_instance_id)
+    yield reconfigure
+
+
+@benchmark('db_log_handler')
+def benchmark_db_log_handler(backends, instance_count):  # pylint: disable=unused-argument
+    """
+    Emit and store the log lines of an appserver, with the configured buffering.
+    """
+    yield from log_appserver_lines(settings.LOGGING_DB_BUFFER_CAPACITY)
+
+
+@benchmark('db_log_handler_unbuffered')
+def benchmark_db_log_handler_unbuffered(backends, instance_count):  # pylint: disable=unused-argument
+    """
+    Emit and store the log lines of an appserver, one at a time.
+    """
+    yield from log_appserver_lines(1)
+
+
+@benchmark('terminate_obsolete_appservers')
+def benchmark_terminate_obsolete_appservers(backends, instance_count):
+    """
+    Terminate the obsolete appservers of all the instances of the fleet, each having two of them.
+
+    Before each round, the obsolete appservers and their VMs are running again.
+    """
+    fleet = Fleet.create(instance_count)
+    obsolete_appservers = [
+        fleet.create_appserver(instance, active=False)
+        for instance in fleet.instances
+        for unused in range(OBSOLETE_APPSERVERS_PER_INSTANCE)
+    ]
+    # The newest obsolete appserver of each instance would be kept as a release candidate if it was newer
+    OpenEdXAppServer.objects.filter(pk__in=[appserver.pk for appserver in obsolete_appservers]).update(
+        created=timezone.now() - timedelta(days=10),
+    )
+    OpenEdXAppServer.objects.filter(owner__in=[instance.ref for instance in fleet.instances]).update(
+        _status=AppServerStatus.Running.state_id, last_activated=timezone.now() - timedelta(days=5),
+    )
+
+    def terminate_obsolete_appservers():
+        """ Make the obsolete appservers run again, and terminate them """
+        backends.nova.servers.reset()
+        OpenEdXAppServer.objects.filter(pk__in=[appserver.pk for appserver in obsolete_appservers]).update(
+            _status=AppServerStatus.Running.state_id,
+        )
+        OpenStackServer.objects.filter(pk__in=[appserver.server_id for appserver in obsolete_appservers]).update(
+            _status=ServerStatus.Ready.state_id,
+        )
+        terminated_count, failed_count = terminate_obsolete_appservers_of_all_instances(
+            max_workers=settings.TERMINATE_OBSOLETE_APPSERVERS_WORKERS,
+        )
+        assert (terminated_count, failed_count) == (len(obsolete_appservers), 0), (terminated_count, failed_count)
+    yield terminate_obsolete_appservers
+
+
+@benchmark('create_configuration_settings')
+def benchmark_create_configuration_settings(backends, instance_count):  # pylint: disable=unused-argument
+    """
+    Render the ansible configuration of an appserver.
+    """
+    fleet = Fleet.create(1)
+    yield fleet.instances[0].appserver_set.get().create_configuration_settings
+
+
+@benchmark('instance_list_api')
+def benchmark_instance_list_api(backends, instance_count):  # pylint: disable=unused-argument
+    """
+    List the instances of the fleet through the API, as a superuser.
+    """
+    Fleet.create(instance_count)
+    client = APIClient()
+    client.force_authenticate(User.objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark'))
+
+    def list_instances():
+        """ Request the instance list """
+        response = client.get('/api/v1/instance/')
+        assert response.status_code == 200, response.status_code
+    yield list_instances
+
+
+@benchmark('websocket_fanout')
+def benchmark_websocket_fanout(backends, instance_count):  # pylint: disable=unused-argument
+    """
+    Send the log lines of an appserver to the websocket clients following it, among many connected clients.
+
+    The clients are simulated with the channels of an in-memory channel layer. The messages they receive
+    are counted as websocket notifications.
+    """
+    event = {
+        'type': 'object_log_lines',
+        'instance_id': 1,
+        'appserver_id': 1,
+        'log_entries': [{'level': 'INFO', 'text': 'TASK [common : Install system packages] ' + '*' * 40}],
+    }
+    end_of_round = {'type': 'benchmark.end'}
+
+    async def fan_out():
+        """ Connect the clients, send the events to their groups, and receive them """
+        channel_layer = InMemoryChannelLayer(capacity=WEBSOCKET_EVENTS_PER_ROUND + 1)
+        client_channels = [await channel_layer.new_channel() for unused in range(WEBSOCKET_CLIENTS)]
+        appserver_group = websocket_group_name('appserver', event['appserver_id'])
+        for index, channel in enumerate(client_channels):
+            await channel_layer.group_add(WEBSOCKET_SUPERUSERS_GROUP, channel)
+            if index < WEBSOCKET_SUBSCRIBERS:
+                await channel_layer.group_add(appserver_group, channel)
+
+        for unused in range(WEBSOCKET_EVENTS_PER_ROUND):
+            for group in get_event_groups(event):
+                await channel_layer.group_send(group, {'type': 'notification', 'message': event})
+
+        for channel in client_channels:
+            await channel_layer.send(channel, end_of_round)
+            while True:
+                message = await channel_layer.receive(channel)
+                if message == end_of_round:
+                    break
+                # Like the consumers do before sending the message to the client
+                json.dumps(message)
+                backends.wait(WEBSOCKET)
+        await channel_layer.flush()
+    yield async_to_sync(fan_out)
+
+
+# Functions ###################################################################
+
+def is_test_database():
+    """
+    Return whether the database is a test database, which can be thrown away.
+    """
+    settings_dict = connection.settings_dict
+    return (
+        settings_dict['NAME'] == settings_dict['TEST']['NAME'] or
+        settings_dict['NAME'].startswith(TEST_DATABASE_PREFIX)
+    )
+
+
+def run_benchmark(name, rounds=5, warmup=1, latency=None, instance_count=20):
+    """
+    Run the benchmark with the given name, against fake backends with the given latency.
+
+    The data is created in a transaction which is rolled back afterwards, and a RuntimeError is raised
+    unless the database is a test database. After `warmup` unmeasured rounds, the benchmark is timed over
+    `rounds` rounds, then run once more to count its database queries, its calls to the backends, and its
+    peak memory allocation.
+
+    Returns a dict with the median duration of a round in milliseconds, and the counts and peak
+    memory allocation in KiB of a round.
+    """
+    if not is_test_database():
+        raise RuntimeError(
+            'The benchmarks only run on a test database, not on {}'.format(connection.settings_dict['NAME'])
+        )
+
+    random.seed(RANDOM_SEED)
+    with transaction.atomic(), \
+            override_settings(
+                CONSUL_ENABLED=True,
+                DISABLE_LOAD_BALANCER_CONFIGURATION=False,
+                NEWRELIC_ADMIN_USER_API_KEY=None,
+                SPAWN_APPSERVER_PROVISIONING_WORKERS=1,
+            ), \
+            inline_db_logging(), \
+            FakeBackends(latency) as backends, \
+            BENCHMARKS[name](backends, instance_count) as run:
+        for unused in range(warmup):
+            run()
+
+        durations = []
+        for unused in range(rounds):
+            start = time.perf_counter()
+            run()
+            durations.append(time.perf_counter() - start)
+
+        backends.calls.clear()
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                run()
+            unused, memory_peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        backend_calls = dict(backends.calls)
+
+        transaction.set_rollback(True)
+
+    return {
+        'time_ms': round(statistics.median(durations) * 1000, 3),
+        'queries': len(queries),
+        'memory_kib': round(memory_peak / 1024, 1),
+        'backend_calls': backend_calls,
+    }
+
+
+def find_regressions(results, baseline, tolerance=0.2):
+    """
+    Compare the benchmark results to the baseline results, by benchmark name.
+
+    Durations and memory allocations regress when they exceed their baseline by more than `tolerance`,
+    as a fraction of the baseline; query counts regress as soon as they exceed their baseline.
+    Benchmarks missing from the baseline are ignored.
+
+    Returns a list of messages describing the regressions.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for key, exact in COMPARED_RESULTS:
+            expected = baseline[name][key]
+            limit = expected if exact else expected * (1 + tolerance)
+            if result[key] > limit:
+                regressions.append('{name}: {key} {value} exceeds the baseline {expected}'.format(
+                    name=name, key=key, value=result[key], expected=expected,
+                ))
+    return regressions
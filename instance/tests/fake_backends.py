@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Fakes of the external backends called while provisioning, answering after a configurable latency
+"""
+
+# Imports #####################################################################
+
+from collections import Counter
+from contextlib import ExitStack
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import novaclient
+
+from instance.models.load_balancer import LoadBalancingServer
+from instance.models.mixins.ansible import AnsibleAppServerMixin
+from instance.models.openedx_instance import OpenEdXInstance
+
+
+# Constants ###################################################################
+
+# Fake external backends, which can each be given a latency
+BACKENDS = ('openstack', 'gandi', 'consul', 'ansible', 'services')
+
+# Websocket notifications, counted like the calls to the backends but never delayed
+WEBSOCKET = 'websocket'
+
+
+# Classes #####################################################################
+
+class FakeNovaServers:
+    """
+    Fake `servers` endpoint of the nova API, returning running servers with a public IP address,
+    which can be stopped and deleted.
+    """
+    def __init__(self, backends):
+        self._backends = backends
+        self._lock = threading.Lock()
+        self._servers = {}
+
+    def _get_server(self, openstack_id):
+        """
+        Return the server with the given ID, creating it on first use unless it was deleted.
+        """
+        with self._lock:
+            if openstack_id not in self._servers:
+                ip_address = '203.0.113.{}'.format(sum(map(ord, str(openstack_id))) % 250 + 1)
+                self._servers[openstack_id] = SimpleNamespace(
+                    id=openstack_id,
+                    status='ACTIVE',
+                    addresses={'Ext-Net': [{'addr': ip_address, 'version': 4}]},
+                    stop=lambda: self._set_status(openstack_id, 'SHUTOFF'),
+                    delete=lambda: self._set_status(openstack_id, 'DELETED'),
+                )
+            server = self._servers[openstack_id]
+        if server.status == 'DELETED':
+            raise novaclient.exceptions.NotFound(404)
+        return server
+
+    def _set_status(self, openstack_id, status):
+        """
+        Stop or delete the server with the given ID.
+        """
+        self._backends.wait('openstack')
+        self._servers[openstack_id].status = status
+
+    def get(self, openstack_id):
+        """
+        Return the server with the given ID.
+        """
+        self._backends.wait('openstack')
+        return self._get_server(openstack_id)
+
+    def list(self):
+        """
+        Return the servers which weren't deleted.
+        """
+        self._backends.wait('openstack')
+        with self._lock:
+            return [server for server in self._servers.values() if server.status != 'DELETED']
+
+    def reset(self):
+        """
+        Forget the servers, so that the deleted ones are running again.
+        """
+        with self._lock:
+            self._servers.clear()
+
+
+class FakeGandiAPI:
+    """
+    Fake Gandi API client, accepting all DNS record changes.
+    """
+    def __init__(self, backends):
+        self._backends = backends
+
+    def set_dns_record(self, domain, **record):  # pylint: disable=unused-argument
+        """
+        Set a DNS record.
+        """
+        self._backends.wait('gandi')
+
+    def remove_dns_record(self, domain, **record):  # pylint: disable=unused-argument
+        """
+        Remove a DNS record.
+        """
+        self._backends.wait('gandi')
+
+    def update_dns_records(self, set_records=(), remove_records=()):  # pylint: disable=unused-argument
+        """
+        Set and remove DNS records in one request.
+        """
+        self._backends.wait('gandi')
+
+    def filter_dns_records(self, domain, **record):  # pylint: disable=unused-argument
+        """
+        List the DNS records of a domain.
+        """
+        self._backends.wait('gandi')
+        return []
+
+
+class FakeConsulKV:
+    """
+    Fake Consul key-value store, implementing the calls `ConsulAgent` makes outside of transactions.
+    """
+    def __init__(self, backends):
+        self._backends = backends
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._index = 0
+
+    def get(self, key, recurse=False, **kwargs):  # pylint: disable=unused-argument
+        """
+        Return the entry at the given key, or the entries it prefixes.
+        """
+        self._backends.wait('consul')
+        with self._lock:
+            if recurse:
+                entries = [dict(entry) for entry_key, entry in sorted(self._entries.items())
+                           if entry_key.startswith(key)]
+                return self._index, entries or None
+            entry = self._entries.get(key)
+            return self._index, dict(entry) if entry else None
+
+    def put(self, key, value, cas=None, **kwargs):  # pylint: disable=unused-argument
+        """
+        Store the value at the given key, if it wasn't modified since the `cas` index.
+        """
+        self._backends.wait('consul')
+        with self._lock:
+            entry = self._entries.get(key)
+            if cas is not None and cas != (entry['ModifyIndex'] if entry else 0):
+                return False
+            self._index += 1
+            self._entries[key] = {
+                'Key': key,
+                'Value': value.encode('utf-8') if isinstance(value, str) else value,
+                'CreateIndex': entry['CreateIndex'] if entry else self._index,
+                'ModifyIndex': self._index,
+            }
+            return True
+
+    def delete(self, key, recurse=False, **kwargs):  # pylint: disable=unused-argument
+        """
+        Delete the entry at the given key, or the entries it prefixes.
+        """
+        self._backends.wait('consul')
+        with self._lock:
+            self._index += 1
+            for entry_key in [k for k in self._entries if k == key or (recurse and k.startswith(key))]:
+                del self._entries[entry_key]
+            return True
+
+
+class FakeBackends:
+    """
+    Context manager replacing the OpenStack, Gandi, Consul and ansible backends, and the provisioning of
+    the databases and storage of the instances, with fakes answering after the configured latency.
+
+    `latency` maps the names of the `BACKENDS` to the time each call to them takes, in seconds.
+    The calls to each backend are counted in `calls`, as well as the websocket notifications, under `WEBSOCKET`.
+    """
+    def __init__(self, latency=None):
+        self.latency = {backend: 0 for backend in BACKENDS}
+        self.latency.update(latency or {})
+        self.calls = Counter()
+        self.nova = None
+        self._calls_lock = threading.Lock()
+        self._exit_stack = None
+
+    def wait(self, backend):
+        """
+        Simulate a call to the given backend.
+        """
+        with self._calls_lock:
+            self.calls[backend] += 1
+        if self.latency.get(backend):
+            time.sleep(self.latency[backend])
+
+    def __enter__(self):
+        nova = self.nova = SimpleNamespace(servers=FakeNovaServers(self))
+        consul_client = SimpleNamespace(kv=FakeConsulKV(self))
+
+        def create_server(*args, **kwargs):  # pylint: disable=unused-argument
+            """ Create a VM """
+            self.wait('openstack')
+            return SimpleNamespace(id='benchmark-{}'.format(self.calls['openstack']))
+
+        def run_playbook(*args, **kwargs):  # pylint: disable=unused-argument
+            """ Run a playbook on an appserver """
+            self.wait('ansible')
+            return [], 0
+
+        def provision(*args, **kwargs):  # pylint: disable=unused-argument
+            """ Provision a database or storage """
+            self.wait('services')
+
+        patchers = [
+            patch('instance.models.server.openstack_utils.get_nova_client', return_value=nova),
+            patch('instance.models.server.openstack_utils.create_server', side_effect=create_server),
+            patch('instance.models.server.ssh.remove_known_host_key'),
+            patch('instance.gandi.api', FakeGandiAPI(self)),
+            patch('instance.models.utils.get_consul_client', return_value=consul_client),
+            patch.object(AnsibleAppServerMixin, '_run_playbook', run_playbook),
+            patch.object(LoadBalancingServer, 'run_playbook', lambda *args: self.wait('ansible')),
+        ]
+        for method_name in ('provision_mysql', 'provision_mongo', 'provision_s3', 'provision_swift',
+                            'provision_rabbitmq', 'provision_redis'):
+            patchers.append(patch.object(OpenEdXInstance, method_name, provision))
+        for module in ('instance.models.instance', 'instance.models.openedx_appserver', 'instance.models.server',
+                       'instance.logging'):
+            patchers.append(patch(module + '.publish_data', side_effect=lambda *args, **kwargs: self.wait(WEBSOCKET)))
+
+        self._exit_stack = ExitStack()
+        try:
+            for patcher in patchers:
+                self._exit_stack.enter_context(patcher)
+        except BaseException:
+            self._exit_stack.close()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._exit_stack.__exit__(*exc_info)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Fake implementation of the Consul Key-Value store HTTP API.
+"""
+
+import base64
+import json
+import re
+import threading
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import responses
+
+
+class FakeConsulServer:
+    """
+    In-process fake of the Consul KV and transaction HTTP API, serving requests intercepted by `responses`.
+
+    Only the endpoints used by `ConsulAgent` are implemented. Use as follows:
+
+        with responses.RequestsMock() as rsps:
+            server = FakeConsulServer()
+            server.register(rsps)
+    """
+    def __init__(self, base_uri='http://127.0.0.1:8500'):
+        self.base_uri = base_uri
+        # Entries of the KV store by key: {'Value': bytes, 'CreateIndex': int, 'ModifyIndex': int}
+        self.entries = {}
+        self.index = 1
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def register(self, rsps):
+        """
+        Register the fake API with the given `responses.RequestsMock`.
+        """
+        url_pattern = re.compile(re.escape(self.base_uri) + r'/v1/(kv|txn)(/.*)?(\?.*)?$')
+        for method in (responses.GET, responses.PUT, responses.DELETE):
+            rsps.add_callback(method, url_pattern, callback=self.handle_request, content_type='application/json')
+
+    def get_value(self, key):
+        """
+        Return the decoded JSON value stored at the given key.
+        """
+        return json.loads(self.entries[key]['Value'].decode('utf-8'))
+
+    def set_value(self, key, value):
+        """
+        Store the given value, JSON-encoded, at the given key.
+        """
+        with self._lock:
+            self._set(key, json.dumps(value).encode('utf-8'))
+
+    def handle_request(self, request):
+        """
+        Handle a request made to the API, returning a (status, headers, body) tuple.
+        """
+        url = urlsplit(request.url)
+        path = url.path[len(urlsplit(self.base_uri).path):]
+        params = parse_qs(url.query, keep_blank_values=True)
+        body = request.body.encode('utf-8') if isinstance(request.body, str) else (request.body or b'')
+        with self._lock:
+            self.requests.append((request.method, path))
+            if path == '/v1/txn' and request.method == 'PUT':
+                return self._handle_txn(json.loads(body.decode('utf-8')))
+            key = unquote(path[len('/v1/kv/'):])
+            if request.method == 'GET':
+                return self._handle_get(key, 'recurse' in params)
+            if request.method == 'PUT':
+                cas = int(params['cas'][0]) if 'cas' in params else None
+                return 200, {}, json.dumps(self._put(key, body, cas))
+            self._delete(key, 'recurse' in params)
+            return 200, {}, json.dumps(True)
+
+    def _handle_get(self, key, recurse):
+        """
+        Return the entry at the given key, or all the entries it prefixes.
+        """
+        headers = {'X-Consul-Index': str(self.index)}
+        keys = sorted(k for k in self.entries if k.startswith(key)) if recurse else [key] if key in self.entries else []
+        if not keys:
+            return 404, headers, ''
+        return 200, headers, json.dumps([self._entry(k) for k in keys])
+
+    def _handle_txn(self, operations):
+        """
+        Run the given operations atomically, rolling all of them back when one fails.
+        """
+        entries, index = dict(self.entries), self.index
+        results = []
+        for op_index, operation in enumerate(operations):
+            verb, key = operation['KV']['Verb'], operation['KV']['Key']
+            value = base64.b64decode(operation['KV'].get('Value') or '')
+            if verb == 'set':
+                self._put(key, value)
+            elif verb == 'cas' and not self._put(key, value, operation['KV']['Index']):
+                self.entries, self.index = entries, index
+                error = 'failed to set key "{}", index is stale'.format(key)
+                return 409, {}, json.dumps({'Results': None, 'Errors': [{'OpIndex': op_index, 'What': error}]})
+            elif verb in ('delete', 'delete-tree'):
+                self._delete(key, verb == 'delete-tree')
+            if verb in ('set', 'cas'):
+                entry = self._entry(key)
+                del entry['Value']
+                results.append({'KV': entry})
+        return 200, {}, json.dumps({'Results': results, 'Errors': None})
+
+    def _entry(self, key):
+        """
+        Return the entry at the given key as the API returns it.
+        """
+        entry = self.entries[key]
+        return {
+            'Key': key,
+            'Value': base64.b64encode(entry['Value']).decode('ascii') if entry['Value'] else None,
+            'Flags': 0,
+            'CreateIndex': entry['CreateIndex'],
+            'ModifyIndex': entry['ModifyIndex'],
+        }
+
+    def _put(self, key, value, cas=None):
+        """
+        Store the value at the given key, if it wasn't modified since the `cas` index.
+        """
+        if cas is not None and cas != self.entries.get(key, {}).get('ModifyIndex', 0):
+            return False
+        self._set(key, value)
+        return True
+
+    def _set(self, key, value):
+        """
+        Store the value at the given key.
+        """
+        self.index += 1
+        create_index = self.entries[key]['CreateIndex'] if key in self.entries else self.index
+        self.entries[key] = {'Value': value, 'CreateIndex': create_index, 'ModifyIndex': self.index}
+
+    def _delete(self, key, recurse):
+        """
+        Delete the entry at the given key, or all the entries it prefixes.
+        """
+        self.index += 1
+        for k in [k for k in self.entries if k == key or (recurse and k.startswith(key))]:
+            del self.entries[k]
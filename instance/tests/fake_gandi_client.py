@@ -17,9 +17,16 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 """
-Fake implementation of the XML RPC client for the Gandi API.
+Fake implementations of the Gandi API client, and of the Gandi LiveDNS API.
 """
 
+import json
+import re
+from urllib.parse import urlsplit
+
+import responses
+
+
 class FakeGandiV5APIClient:
     """
     Fake implementation of the Gandi V5 API client.
@@ -69,8 +76,98 @@ class FakeGandiV5APIClient:
                 item for item in self._domains[registered_domain] if item['name'] != subdomain
             ]
 
+    def update_dns_records(self, set_records=(), remove_records=()):
+        """
+        Set and remove the given DNS records.
+        """
+        for domain, record in remove_records:
+            self.remove_dns_record(domain, **record)
+        for domain, record in set_records:
+            self.set_dns_record(domain, **record)
+
     def list_records(self, domain):
         """
         List the DNS records for the given registered domain.
         """
         return self._domains[domain]
+
+
+class FakeGandiLiveDNSServer:
+    """
+    In-process fake of the Gandi LiveDNS v5 REST API, serving requests intercepted by `responses`.
+
+    Only the endpoints used by lexicon to manage the records of a zone are implemented.
+    Use as follows:
+
+        with responses.RequestsMock() as rsps:
+            server = FakeGandiLiveDNSServer(['example.com'])
+            server.register(rsps)
+    """
+    def __init__(self, zones, api_base='https://dns.api.gandi.net/api/v5'):
+        self.api_base = api_base
+        # Record sets of each zone, indexed by (name, type)
+        self.zones = {zone: {} for zone in zones}
+        self.requests = []
+        self.fail_requests = 0
+
+    def register(self, rsps):
+        """
+        Register the fake API with the given `responses.RequestsMock`.
+        """
+        url_pattern = re.compile(re.escape(self.api_base) + r'/domains/.*')
+        for method in (responses.GET, responses.POST, responses.PUT, responses.DELETE):
+            rsps.add_callback(method, url_pattern, callback=self.handle_request, content_type='application/json')
+
+    def get_records(self, zone, rtype):
+        """
+        Return the values of the records of the given type in the zone, indexed by name.
+        """
+        return {
+            name: rrset['rrset_values']
+            for (name, rrset_type), rrset in self.zones[zone].items()
+            if rrset_type == rtype
+        }
+
+    def handle_request(self, request):
+        """
+        Handle a request made to the API, returning a (status, headers, body) tuple.
+        """
+        path = urlsplit(request.url).path[len(urlsplit(self.api_base).path):]
+        self.requests.append((request.method, path))
+        if self.fail_requests:
+            self.fail_requests -= 1
+            return 500, {}, json.dumps({'message': 'Internal server error'})
+
+        zone, unused, rest = path[len('/domains/'):].partition('/records')
+        if zone not in self.zones:
+            return 404, {}, json.dumps({'message': 'Domain not found'})
+        rrsets = self.zones[zone]
+        name, unused, rtype = rest.lstrip('/').partition('/')
+
+        if request.method == 'GET':
+            if not unused and not rest:
+                return 200, {}, json.dumps({'fqdn': zone})
+            matching = [rrset for (rrset_name, rrset_type), rrset in sorted(rrsets.items())
+                        if name in ('', rrset_name) and rtype in ('', rrset_type)]
+            if rtype:
+                if not matching:
+                    return 404, {}, json.dumps({'message': 'Record not found'})
+                return 200, {}, json.dumps(matching[0])
+            return 200, {}, json.dumps(matching)
+
+        if not rtype:
+            return 405, {}, json.dumps({'message': 'Not implemented in the fake API'})
+        if request.method == 'DELETE':
+            if rrsets.pop((name, rtype), None) is None:
+                return 404, {}, json.dumps({'message': 'Record not found'})
+            return 204, {}, ''
+        data = json.loads(request.body)
+        if request.method == 'POST' and (name, rtype) in rrsets:
+            return 409, {}, json.dumps({'message': 'Record already exists'})
+        rrsets[(name, rtype)] = {
+            'rrset_name': name,
+            'rrset_type': rtype,
+            'rrset_ttl': data.get('rrset_ttl', rrsets.get((name, rtype), {}).get('rrset_ttl', 10800)),
+            'rrset_values': data['rrset_values'],
+        }
+        return 201, {}, json.dumps({'message': 'DNS Record Created'})
@@ -205,28 +205,28 @@ describe('Instance app', function () {
             it("update the instance's log entries", function() {
                 const logEntry = {created: new Date().toISOString(), level: "INFO", text: "A long time ago"};
                 $scope.webSocketMessageHandler(getBroadcastMessage({
-                    type: "object_log_line",
+                    type: "object_log_lines",
                     instance_id: instanceDetail.id,
-                    log_entry: logEntry,
+                    log_entries: [logEntry],
                 }));
                 expect($scope.refresh).not.toHaveBeenCalled();
                 expect($scope.instanceLogs.log_entries.push).toHaveBeenCalledWith(logEntry);
             });
             it("do not update the instance's log entries for other instance logs", function() {
                 $scope.webSocketMessageHandler(getBroadcastMessage({
-                    type: "object_log_line",
+                    type: "object_log_lines",
                     instance_id: 400,
-                    log_entry: {created: new Date(), level: "INFO", text: "Irrelevant log line"},
+                    log_entries: [{created: new Date(), level: "INFO", text: "Irrelevant log line"}],
                 }));
                 expect($scope.refresh).not.toHaveBeenCalled();
                 expect($scope.instanceLogs.log_entries.push).not.toHaveBeenCalled();
             });
             it("do not update the instance's log entries for AppServer logs", function() {
                 $scope.webSocketMessageHandler(getBroadcastMessage({
-                    type: "object_log_line",
+                    type: "object_log_lines",
                     instance_id: instanceDetail.id,
                     appserver_id: 15,
-                    log_entry: {created: new Date(), level: "INFO", text: "Irrelevant log line"},
+                    log_entries: [{created: new Date(), level: "INFO", text: "Irrelevant log line"}],
                 }));
                 expect($scope.refresh).not.toHaveBeenCalled();
                 expect($scope.instanceLogs.log_entries.push).not.toHaveBeenCalled();
@@ -442,9 +442,9 @@ describe('Instance app', function () {
             it("update the AppServer's log entries for new AppServer logs", function() {
                 const logEntry = {created: new Date().toISOString(), level: "INFO", text: "A long time ago"};
                 $scope.webSocketMessageHandler(getBroadcastMessage({
-                    type: "object_log_line",
+                    type: "object_log_lines",
                     appserver_id: appServerDetail.id,
-                    log_entry: logEntry,
+                    log_entries: [logEntry],
                 }));
                 expect($scope.refresh).not.toHaveBeenCalled();
                 expect($scope.appserverLogs.log_entries.push).toHaveBeenCalledWith(logEntry);
@@ -453,9 +453,9 @@ describe('Instance app', function () {
             it("update the AppServer's log entries for new AppServer error logs", function() {
                 const logEntry = {created: new Date().toISOString(), level: "ERROR", text: "Something went wrong"};
                 $scope.webSocketMessageHandler(getBroadcastMessage({
-                    type: "object_log_line",
+                    type: "object_log_lines",
                     appserver_id: appServerDetail.id,
-                    log_entry: logEntry,
+                    log_entries: [logEntry],
                 }));
                 expect($scope.refresh).not.toHaveBeenCalled();
                 expect($scope.appserverLogs.log_entries.push).toHaveBeenCalledWith(logEntry);
@@ -463,9 +463,9 @@ describe('Instance app', function () {
             });
             it("do not update the AppServer's log entries for other AppServer logs", function() {
                 $scope.webSocketMessageHandler(getBroadcastMessage({
-                    type: "object_log_line",
+                    type: "object_log_lines",
                     appserver_id: 404,
-                    log_entry: {created: new Date().toISOString(), level: "INFO", text: "Irrelevant log line"},
+                    log_entries: [{created: new Date().toISOString(), level: "INFO", text: "Irrelevant log line"}],
                 }));
                 expect($scope.refresh).not.toHaveBeenCalled();
                 expect($scope.appserverLogs.log_entries.push).not.toHaveBeenCalled();
@@ -474,9 +474,9 @@ describe('Instance app', function () {
             it("update the AppServer's log entries for new VM error logs", function() {
                 const logEntry = {created: new Date().toISOString(), level: "ERROR", text: "Something went wrong on the server"};
                 $scope.webSocketMessageHandler(getBroadcastMessage({
-                    type: "object_log_line",
+                    type: "object_log_lines",
                     server_id: appServerDetail.server.id,
-                    log_entry: logEntry,
+                    log_entries: [logEntry],
                 }));
                 expect($scope.refresh).not.toHaveBeenCalled();
                 expect($scope.appserverLogs.log_entries.push).toHaveBeenCalledWith(logEntry);
@@ -484,9 +484,9 @@ describe('Instance app', function () {
             });
             it("do not update the AppServer's log entries for other VM logs", function() {
                 $scope.webSocketMessageHandler(getBroadcastMessage({
-                    type: "object_log_line",
+                    type: "object_log_lines",
                     server_id: 404,
-                    log_entry: {created: new Date().toISOString(), level: "INFO", text: "Irrelevant log line"},
+                    log_entries: [{created: new Date().toISOString(), level: "INFO", text: "Irrelevant log line"}],
                 }));
                 expect($scope.refresh).not.toHaveBeenCalled();
                 expect($scope.appserverLogs.log_entries.push).not.toHaveBeenCalled();
@@ -21,32 +21,142 @@ Tests for the 'kill_zombies' management command.
 """
 # Imports #####################################################################
 
-from unittest.mock import patch, call
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
 from django.core import mail
-from django.core.management import CommandError
+from django.core.management import call_command
 from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+
+from instance.models.server import Status, find_zombie_vms
 from instance.tasks import KillZombiesRunner
+from instance.tests.models.factories.server import OpenStackServerFactory
 
 # Tests #######################################################################
 
 # pylint: disable=bad-continuation
 
 
+def make_nova_server(openstack_id, delete_error=None):
+    """
+    Return a fake nova server with the given ID, whose deletion fails with `delete_error` if given
+    """
+    return SimpleNamespace(
+        id=openstack_id,
+        name='vm-{}'.format(openstack_id),
+        status='ACTIVE',
+        delete=Mock(side_effect=delete_error),
+    )
+
+
+class ZombieServersMixin:
+    """
+    Mixin creating servers on record for some of the VMs of a fake nova listing.
+    """
+    def setUp(self):
+        super().setUp()
+        OpenStackServerFactory(openstack_id='zombie', status=Status.Terminated)
+        OpenStackServerFactory(openstack_id='failing-zombie', status=Status.Terminated)
+        OpenStackServerFactory(openstack_id='live', status=Status.Ready)
+        # A VM on record for both a terminated and a live server isn't a zombie
+        OpenStackServerFactory(openstack_id='reused', status=Status.Terminated)
+        OpenStackServerFactory(openstack_id='reused', status=Status.Ready)
+        # Terminated servers whose VM isn't listed anymore are ignored
+        OpenStackServerFactory(openstack_id='deleted', status=Status.Terminated)
+
+        self.nova_servers = [make_nova_server('unknown-{}'.format(i)) for i in range(1000)] + [
+            make_nova_server('zombie'),
+            make_nova_server('failing-zombie', delete_error=Exception('Server is locked')),
+            make_nova_server('live'),
+            make_nova_server('reused'),
+        ]
+        patcher = patch('instance.openstack_utils.get_nova_client')
+        self.addCleanup(patcher.stop)
+        self.mock_get_nova_client = patcher.start()
+        self.mock_get_nova_client.return_value.servers.list.return_value = self.nova_servers
+
+    def assert_deleted(self, *openstack_ids):
+        """
+        Assert that only the VMs with the given IDs were deleted
+        """
+        self.assertEqual(
+            [nova_server.id for nova_server in self.nova_servers if nova_server.delete.called],
+            list(openstack_ids),
+        )
+
+
+class FindZombieVMsTestCase(ZombieServersMixin, TestCase):
+    """
+    Test cases for `find_zombie_vms`.
+    """
+    def test_find_zombie_vms(self):
+        """
+        The zombies of a thousand-server listing are found with a single query.
+        """
+        with self.assertNumQueries(1):
+            zombies = find_zombie_vms(self.nova_servers)
+        self.assertEqual([zombie.id for zombie in zombies], ['zombie', 'failing-zombie'])
+
+    def test_no_servers(self):
+        """
+        No query is made when no VMs are listed.
+        """
+        with self.assertNumQueries(0):
+            self.assertEqual(find_zombie_vms([]), [])
+
+
+class KillZombiesCommandTestCase(ZombieServersMixin, TestCase):
+    """
+    Test cases for the `kill_zombies` management command.
+    """
+    def test_dry_run(self):
+        """
+        The zombies are reported, but not deleted.
+        """
+        out = StringIO()
+        call_command('kill_zombies', region='some-region', dry_run=True, stdout=out)
+        self.mock_get_nova_client.assert_called_once_with('some-region')
+        self.assertIn('Found zombie server vm-zombie with status ACTIVE.', out.getvalue())
+        self.assertIn("Would have terminated 2 zombies if this weren't a dry run.", out.getvalue())
+        self.assert_deleted()
+
+    def test_kill_zombies(self):
+        """
+        The zombies are deleted concurrently, and the ones which can't be deleted are reported.
+        """
+        out = StringIO()
+        call_command('kill_zombies', region='some-region', workers=2, stdout=out)
+        self.assertIn('WARNING: Unable to delete server vm-failing-zombie. Error: Server is locked.', out.getvalue())
+        self.assertIn('Terminated 1 zombies.', out.getvalue())
+        self.assert_deleted('zombie', 'failing-zombie')
+
+    def test_no_servers(self):
+        """
+        Nothing is done when no VMs are listed.
+        """
+        self.mock_get_nova_client.return_value.servers.list.return_value = []
+        out = StringIO()
+        call_command('kill_zombies', region='some-region', stdout=out)
+        self.assertIn('No servers found in region some-region.', out.getvalue())
+
+
 @override_settings(
     KILL_ZOMBIES_ENABLED=True,
+    KILL_ZOMBIES_WORKERS=2,
     ADMINS=(
         ("admin1", "admin1@localhost"),
         ("admin2", "admin2@localhost"),
     ),
     OPENSTACK_REGION="some-region"
 )
-class KillZombiesPeriodicallyTestCase(TestCase):
+class KillZombiesPeriodicallyTestCase(ZombieServersMixin, TestCase):
     """
     Test cases for the `kill_zombies_task` periodic task.
     """
     @override_settings(KILL_ZOMBIES_ENABLED=False)
-    @patch("instance.tasks.call_command")
-    def test_toggle_task_false(self, mock_command):
+    @patch("instance.tasks.find_zombie_vms")
+    def test_toggle_task_false(self, mock_find_zombie_vms):
         """
         Tests that the task can't be run if disabled
         through env variables
@@ -54,86 +164,49 @@ class KillZombiesPeriodicallyTestCase(TestCase):
         with self.assertRaises(ImportError):
             from instance.tasks import kill_zombies_task
             kill_zombies_task()
-        self.assertFalse(mock_command.called)
-
-    @patch("instance.tasks.call_command")
-    def test_set_env_variables(self, mock_command):
-        """
-        Tests that the task passes env variables to
-        the kill_zombies command call
-        """
-        test_runner = KillZombiesRunner()
-        test_runner.run()
-        first_call = call.mock_command("kill_zombies", region="some-region", dry_run=True)
-        self.assertEqual(mock_command.mock_calls[0], first_call)
-        mock_command.assert_called_with("kill_zombies", region="some-region")
+        self.assertFalse(mock_find_zombie_vms.called)
 
     @patch.object(KillZombiesRunner, "trigger_warning")
-    def test_get_zombie_servers_count(self, mock_trigger):
+    def test_kill_zombies(self, mock_trigger_warning):
         """
-        Tests that KillZombiesRunner.get_zombie_servers_count
-        works as expected
+        Tests that the zombies of the configured region are
+        found with a single listing and deleted
         """
         test_runner = KillZombiesRunner()
-        no_instances = """
-        2021-02-26 14:16:12 | Starting kill_zombies
-        2021-02-26 14:16:12 | No servers found in region some-region.
-        """
-        some_instances = """
-        2021-02-26 14:16:12 | Starting kill_zombies
-        2021-02-26 14:16:12 | Found 32 unterminated servers in region some-region.
-        2021-02-26 14:16:12 | Would have terminated 32 zombies if this weren't a dry run.
-        """
-        bad_output = "qwerty"
-        self.assertEqual(test_runner.get_zombie_servers_count(no_instances), 0)
-        self.assertEqual(test_runner.get_zombie_servers_count(some_instances), 32)
-        self.assertEqual(test_runner.get_zombie_servers_count(bad_output), 0)
-        self.assertEqual(test_runner.get_zombie_servers_count(""), 0)
-
-    @override_settings(KILL_ZOMBIES_WARNING_THRESHOLD=3)
-    @patch.object(KillZombiesRunner, "get_zombie_servers_count", return_value=4)
+        self.assertTrue(test_runner.run())
+        self.mock_get_nova_client.assert_called_once_with("some-region")
+        self.mock_get_nova_client.return_value.servers.list.assert_called_once_with()
+        self.assert_deleted('zombie', 'failing-zombie')
+        self.assertFalse(mock_trigger_warning.called)
+        self.assertEqual(len(mail.outbox), 0)
+
+    @override_settings(KILL_ZOMBIES_WARNING_THRESHOLD=1)
     @patch.object(KillZombiesRunner, "trigger_warning")
-    @patch("instance.tasks.call_command")
-    def test_trigger_warning_if_over_threshold(
-        self,
-        mock_get_zombie_servers_count,
-        mock_trigger_warning,
-        mock_command
-    ):
+    def test_trigger_warning_if_over_threshold(self, mock_trigger_warning):
         """
         Tests that trigger_warning is called when the number
         of zombies to delete is over the threshold
         """
         test_runner = KillZombiesRunner()
         test_runner.run()
-        self.assertTrue(mock_get_zombie_servers_count.called)
-        self.assertTrue(mock_trigger_warning.called)
+        mock_trigger_warning.assert_called_once_with(2)
+        self.assert_deleted('zombie', 'failing-zombie')
 
-    @patch.object(KillZombiesRunner, "get_zombie_servers_count", return_value=0)
-    @patch("instance.tasks.call_command")
-    def test_do_nothing_if_zero(
-        self,
-        mock_get_zombie_servers_count,
-        mock_command
-    ):
+    def test_do_nothing_if_zero(self):
         """
-        Tests that only a dry_run is executed when
-        the number of zombies to terminate is zero.
+        Tests that nothing is deleted when there are
+        no zombies to terminate.
         """
+        self.nova_servers[-4:] = []
         test_runner = KillZombiesRunner()
-        test_runner.run()
-        mock_get_zombie_servers_count.assert_called_with(
-            "kill_zombies",
-            region="some-region",
-            dry_run=True
-        )
+        self.assertTrue(test_runner.run())
+        self.assert_deleted()
 
     @override_settings(
         DEFAULT_FROM_EMAIL="from@site.com",
         ADMINS=(("admin3", "admin3@localhost"), ("admin4", "admin4@localhost"))
     )
-    @patch("instance.tasks.call_command")
-    def test_send_warning_email(self, mock_command):
+    def test_send_warning_email(self):
         """
         Tests that trigger_warning sends an email when called
         """
@@ -151,26 +224,20 @@ class KillZombiesPeriodicallyTestCase(TestCase):
         DEFAULT_FROM_EMAIL="from@site.com",
         ADMINS=(("admin3", "admin3@localhost"),)
     )
-    @patch.object(KillZombiesRunner, "get_zombie_servers_count", return_value=4)
-    @patch.object(KillZombiesRunner, "trigger_warning")
-    @patch("instance.tasks.call_command")
-    def test_send_email_on_failure(
-        self,
-        mock_get_zombie_servers_count,
-        mock_trigger_warning,
-        mock_command
-    ):
-        """
-        When call_command fails, it raises a CommandError.
-        Tests that an email is sent when CommandError is raised
-        """
-        mock_command.side_effect = CommandError()
+    def test_send_email_on_failure(self):
+        """
+        Tests that an email is sent when the servers
+        can't be listed, and that nothing is deleted
+        """
+        self.mock_get_nova_client.return_value.servers.list.side_effect = Exception("Service Unavailable")
         test_runner = KillZombiesRunner()
-        test_runner.run()
+        self.assertFalse(test_runner.run())
         self.assertEqual(len(mail.outbox), 1)
         self.assertIn(
             "Scheduled execution of `kill_zombies` command failed",
             mail.outbox[0].body
         )
+        self.assertIn("Service Unavailable", mail.outbox[0].body)
         self.assertEqual(mail.outbox[0].from_email, "from@site.com")
         self.assertEqual(mail.outbox[0].to, ["admin3@localhost"])
+        self.assert_deleted()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance - Elasticsearch hit statistics playbook script unit tests
+"""
+# Imports #####################################################################
+
+from datetime import date
+import importlib.util
+import os
+
+from django.conf import settings
+from django.test import TestCase
+
+from instance.tests.base import get_fixture
+
+
+# Functions ###################################################################
+
+def load_query_elasticsearch():
+    """
+    Import the script run by the collect_elasticsearch_data playbook
+    """
+    path = os.path.join(settings.SITE_ROOT, 'playbooks/collect_instance_statistics/query_elasticsearch.py')
+    spec = importlib.util.spec_from_file_location('query_elasticsearch', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+query_elasticsearch = load_query_elasticsearch()
+
+
+class RecordedElasticsearchClient:
+    """
+    Elasticsearch client replaying recorded search responses, and recording the search requests
+    """
+    def __init__(self, *fixture_filenames):
+        self.responses = [get_fixture(fixture_filename) for fixture_filename in fixture_filenames]
+        self.requests = []
+
+    def search(self, index, body, **params):
+        """
+        Return the next recorded response
+        """
+        self.requests.append({'index': index, 'body': body, 'params': params})
+        return self.responses[len(self.requests) - 1]
+
+
+# Tests #######################################################################
+
+class QueryElasticsearchTestCase(TestCase):
+    """
+    Test cases for the hit statistics collected from Elasticsearch
+    """
+    def test_host_matches_prefix(self):
+        """
+        Hosts are matched like `match_phrase` queries on the host field match them
+        """
+        self.assertTrue(query_elasticsearch.host_matches_prefix('edxapp-foo-1', 'edxapp-foo'))
+        self.assertTrue(query_elasticsearch.host_matches_prefix('EDXAPP-FOO-1', 'edxapp-foo'))
+        self.assertFalse(query_elasticsearch.host_matches_prefix('edxapp-foobar-1', 'edxapp-foo'))
+        self.assertFalse(query_elasticsearch.host_matches_prefix('edxapp-foo-1', ''))
+
+    def test_build_query(self):
+        """
+        All the days of the report window and all the name prefixes are aggregated by one query
+        """
+        query = query_elasticsearch.build_query(
+            ['edxapp-foo', 'edxapp-bar'], date(2020, 1, 1), date(2020, 1, 31), page_size=100,
+        )
+        self.assertEqual(query['size'], 0)
+        self.assertEqual(query['aggs']['hits']['composite']['size'], 100)
+        self.assertNotIn('after', query['aggs']['hits']['composite'])
+        date_range, = [query_filter['range'] for query_filter in query['query']['bool']['filter']
+                       if 'range' in query_filter]
+        self.assertEqual(date_range['@timestamp']['gte'], '2020-01-01')
+        self.assertEqual(date_range['@timestamp']['lt'], '2020-02-01')
+
+        query = query_elasticsearch.build_query(
+            ['edxapp-foo'], date(2020, 1, 1), date(2020, 1, 31), after_key={'host': 'edxapp-foo-1', 'ip': '10.0.0.1'},
+        )
+        self.assertEqual(query['aggs']['hits']['composite']['after'], {'host': 'edxapp-foo-1', 'ip': '10.0.0.1'})
+
+    def test_collect_hit_statistics(self):
+        """
+        The pages of the composite aggregation are fetched until the last one, and the hits are counted
+        for each name prefix
+        """
+        client = RecordedElasticsearchClient(
+            'elasticsearch/hits_page_1.json',
+            'elasticsearch/hits_page_2.json',
+            'elasticsearch/hits_page_3.json',
+        )
+        statistics = query_elasticsearch.collect_hit_statistics(
+            client, ['edxapp-foo', 'edxapp-bar', 'edxapp-baz'], date(2020, 1, 1), date(2020, 1, 31),
+        )
+        self.assertEqual(statistics, {
+            'edxapp-foo': {'unique_hits': 3, 'total_hits': 920},
+            'edxapp-bar': {'unique_hits': 1, 'total_hits': 200},
+            'edxapp-baz': {'unique_hits': 0, 'total_hits': 0},
+        })
+
+        self.assertEqual(len(client.requests), 3)
+        self.assertNotIn('after', client.requests[0]['body']['aggs']['hits']['composite'])
+        self.assertEqual(client.requests[1]['body']['aggs']['hits']['composite']['after'],
+                         {'host': 'edxapp-foo-1', 'ip': '10.0.0.2'})
+        self.assertEqual(client.requests[2]['body']['aggs']['hits']['composite']['after'],
+                         {'host': 'edxapp-foobar-1', 'ip': '10.0.0.5'})
+        for request in client.requests:
+            self.assertEqual(request['index'], 'filebeat-*')
+            self.assertTrue(request['params']['ignore_unavailable'])
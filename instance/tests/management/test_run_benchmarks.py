@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance app - Provisioning hot paths benchmark management command - Tests
+"""
+
+# Imports #####################################################################
+
+import argparse
+import json
+import os.path
+import tempfile
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from instance.management.commands.run_benchmarks import parse_latency
+from instance.tests.benchmarks import find_regressions, run_benchmark
+from instance.models.instance import InstanceReference
+from instance.models.load_balancer import LoadBalancingServer
+
+
+# Tests #######################################################################
+
+class RunBenchmarksTestCase(TestCase):
+    """
+    Test cases for the `run_benchmarks` management command.
+    """
+    def test_benchmarks(self):
+        """
+        The command reports the results of each benchmark, and leaves no data behind.
+        """
+        out = StringIO()
+        call_command(
+            'run_benchmarks', 'spawn_appserver', 'make_active', 'instance_list_api',
+            instances=2, rounds=1, warmup=0, stdout=out,
+        )
+
+        output_lines = out.getvalue().splitlines()
+        self.assertEqual(len(output_lines), 3)
+        for output_line, name in zip(output_lines, ('spawn_appserver', 'make_active', 'instance_list_api')):
+            self.assertRegex(output_line, r'^{} +[\d.]+ ms +\d+ queries +[\d.]+ KiB'.format(name))
+        self.assertIn('services: 4', output_lines[0])
+        self.assertIn('ansible: 1', output_lines[1])
+        self.assertFalse(LoadBalancingServer.objects.filter(domain='benchmark-lb.example.com').exists())
+        self.assertFalse(InstanceReference.objects.exists())
+
+    def test_terminate_obsolete_appservers(self):
+        """
+        The termination of the obsolete appservers of the fleet is measured against the fake nova API.
+        """
+        out = StringIO()
+        call_command(
+            'run_benchmarks', 'terminate_obsolete_appservers', instances=2, rounds=1, warmup=0, stdout=out,
+        )
+        # Each of the 4 obsolete VMs is fetched, stopped and deleted, then a single list confirms their deletion
+        self.assertIn('openstack: 13', out.getvalue())
+        self.assertFalse(InstanceReference.objects.exists())
+
+    def test_folded_benchmarks(self):
+        """
+        The DBHandler, incremental load balancer reconfiguration and websocket fan-out benchmarks count
+        the notifications and playbook runs they cause.
+        """
+        out = StringIO()
+        call_command(
+            'run_benchmarks', 'db_log_handler', 'db_log_handler_unbuffered', 'load_balancer_reconfigure_incremental',
+            'websocket_fanout', instances=2, rounds=1, warmup=0, stdout=out,
+        )
+
+        output_lines = out.getvalue().splitlines()
+        self.assertEqual(len(output_lines), 4)
+        # Log entries are notified once per batch of the buffer capacity, or one by one without buffering
+        self.assertIn('websocket: {}'.format(1000 // settings.LOGGING_DB_BUFFER_CAPACITY), output_lines[0])
+        self.assertIn('websocket: 1000', output_lines[1])
+        # The configuration of the triggering instance didn't change since the warmup, so it isn't deployed
+        self.assertNotIn('ansible', output_lines[2])
+        # Only the subscribers of the appserver receive its log lines
+        self.assertIn('websocket: 1000', output_lines[3])
+        self.assertFalse(InstanceReference.objects.exists())
+
+    def test_test_database_only(self):
+        """
+        The benchmarks refuse to run on a database which isn't a test database, so the command runs them
+        in a test database created for them.
+        """
+        with patch('instance.tests.benchmarks.is_test_database', return_value=False):
+            with self.assertRaisesRegex(RuntimeError, 'only run on a test database'):
+                run_benchmark('create_configuration_settings', rounds=1, warmup=0, instance_count=1)
+
+        with patch('instance.management.commands.run_benchmarks.is_test_database', return_value=False), \
+                patch('instance.management.commands.run_benchmarks.run_benchmark', return_value={
+                    'time_ms': 1, 'queries': 1, 'memory_kib': 1, 'backend_calls': {},
+                }), \
+                patch.object(connection.creation, 'create_test_db') as mock_create_test_db, \
+                patch.object(connection.creation, 'destroy_test_db') as mock_destroy_test_db:
+            call_command('run_benchmarks', 'create_configuration_settings', interactive=False, stdout=StringIO())
+        mock_create_test_db.assert_called_once_with(verbosity=0, autoclobber=True, serialize=False)
+        mock_destroy_test_db.assert_called_once_with(connection.settings_dict['NAME'], verbosity=0)
+
+    def test_baseline(self):
+        """
+        The results can be saved as a baseline, and the command fails when they regress compared to it.
+        """
+        baseline_path = os.path.join(tempfile.mkdtemp(), 'baseline.json')
+        call_command(
+            'run_benchmarks', 'create_configuration_settings',
+            instances=1, rounds=1, warmup=0, baseline=baseline_path, save_baseline=True, stdout=StringIO(),
+        )
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)
+        self.assertEqual(list(baseline), ['create_configuration_settings'])
+
+        out = StringIO()
+        call_command(
+            'run_benchmarks', 'create_configuration_settings',
+            instances=1, rounds=1, warmup=0, baseline=baseline_path, tolerance=1000, stdout=out,
+        )
+        self.assertIn('No regression', out.getvalue())
+
+        baseline['create_configuration_settings']['queries'] -= 1
+        with open(baseline_path, 'w') as baseline_file:
+            json.dump(baseline, baseline_file)
+        with self.assertRaisesRegex(CommandError, r'create_configuration_settings: queries \d+ exceeds the baseline'):
+            call_command(
+                'run_benchmarks', 'create_configuration_settings',
+                instances=1, rounds=1, warmup=0, baseline=baseline_path, tolerance=1000, stdout=StringIO(),
+            )
+
+    def test_unknown_benchmark(self):
+        """
+        Unknown benchmark names are rejected.
+        """
+        with self.assertRaisesRegex(CommandError, 'Unknown benchmarks: spawn'):
+            call_command('run_benchmarks', 'spawn', stdout=StringIO())
+
+    def test_find_regressions(self):
+        """
+        Durations and memory allocations may exceed the baseline within the tolerance, query counts may not.
+        """
+        baseline = {'a': {'time_ms': 100, 'queries': 10, 'memory_kib': 1000}}
+        self.assertEqual(find_regressions({'a': {'time_ms': 110, 'queries': 10, 'memory_kib': 1100}}, baseline), [])
+        self.assertEqual(find_regressions({'b': {'time_ms': 900, 'queries': 90, 'memory_kib': 9000}}, baseline), [])
+        self.assertEqual(find_regressions({'a': {'time_ms': 130, 'queries': 11, 'memory_kib': 1300}}, baseline), [
+            'a: time_ms 130 exceeds the baseline 100',
+            'a: queries 11 exceeds the baseline 10',
+            'a: memory_kib 1300 exceeds the baseline 1000',
+        ])
+
+    def test_parse_latency(self):
+        """
+        The latency is given in milliseconds, for all the backends or for some of them.
+        """
+        self.assertEqual(parse_latency('50'), {
+            'openstack': 0.05, 'gandi': 0.05, 'consul': 0.05, 'ansible': 0.05, 'services': 0.05,
+        })
+        self.assertEqual(parse_latency('openstack=200, consul=10'), {'openstack': 0.2, 'consul': 0.01})
+        with self.assertRaises(argparse.ArgumentTypeError):
+            parse_latency('nova=200')
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance app - Shared server load report management command - Tests
+"""
+
+# Imports #####################################################################
+
+from unittest.mock import patch
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+
+from instance.tests.models.factories.database_server import MySQLServerFactory
+from instance.tests.models.factories.openedx_instance import OpenEdXInstanceFactory
+
+
+# Tests #######################################################################
+
+@override_settings(DEFAULT_INSTANCE_MYSQL_URL=None)
+@patch(
+    'instance.tests.models.factories.openedx_instance.OpenEdXInstance._write_metadata_to_consul',
+    return_value=(1, True)
+)
+class SharedServerLoadTestCase(TestCase):
+    """
+    Test cases for the `shared_server_load` management command.
+    """
+    def test_report(self, mock_consul):
+        """
+        The command lists the load of each server, and the skew of the servers accepting new clients.
+        """
+        busy_server = MySQLServerFactory(name='busy', accepts_new_clients=True)
+        MySQLServerFactory(name='idle', accepts_new_clients=True, capacity_weight=2)
+        MySQLServerFactory(name='closed', accepts_new_clients=False)
+        for unused in range(3):
+            OpenEdXInstanceFactory(mysql_server=busy_server)
+
+        out = StringIO()
+        call_command('shared_server_load', 'mysql', stdout=out)
+
+        output_lines = out.getvalue().splitlines()
+        self.assertEqual(output_lines[0], 'mysql: skew 2.00')
+        self.assertRegex(output_lines[1], r'^  busy +3 instances  weight +1  load +3\.00$')
+        self.assertRegex(output_lines[2], r'^  (idle|closed) ')
+        self.assertIn('(closed to new clients)', out.getvalue())
+
+    def test_unknown_server_type(self, mock_consul):
+        """
+        Unknown server types are rejected.
+        """
+        with self.assertRaisesRegex(CommandError, 'Unknown server types: postgres'):
+            call_command('shared_server_load', 'postgres', stdout=StringIO())
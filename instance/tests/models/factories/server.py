@@ -78,6 +78,14 @@ class OSServerMockManager:
             self._os_server_dict[openstack_id] = MagicMock(addresses={"Ext-Net": [{"addr": "1.1.1.1", "version": 4}]})
         return self._os_server_dict[openstack_id]
 
+    def list_os_servers(self):
+        """
+        Returns the mock `os_server` of all the `openstack_id` known so far
+        """
+        for openstack_id, os_server in self._os_server_dict.items():
+            os_server.id = openstack_id
+        return list(self._os_server_dict.values())
+
     def set_os_server_attributes(self, openstack_id, **attributes):
         """
         Set the attributes on the mock `os_server` returned for this `openstack_id`
@@ -22,6 +22,7 @@ DatabaseServer models - tests
 
 # Imports #####################################################################
 
+from unittest.mock import patch
 from urllib.parse import urlparse
 
 import ddt
@@ -35,6 +36,7 @@ from instance.models.database_server import (
 from instance.models.log_entry import LogEntry
 from instance.tests.base import TestCase
 from instance.tests.models.factories.database_server import MySQLServerFactory, MongoDBServerFactory
+from instance.tests.models.factories.openedx_instance import OpenEdXInstanceFactory
 
 
 # Classes #####################################################################
@@ -130,6 +132,36 @@ class MySQLServerTest(TestCase):
         custom_mysql_server = MySQLServerFactory(port=1234)
         self.assertEqual(custom_mysql_server.port, 1234)
 
+    @patch('instance.models.database_server.get_mysql_pool')
+    def test_get_admin_cursor_reads_all_results(self, mock_get_mysql_pool):
+        """
+        The pending results of the queries are read before the pooled connection is reused.
+        """
+        connection = mock_get_mysql_pool.return_value.connection.return_value.__enter__.return_value
+        connection.cursor.return_value.nextset.side_effect = [1, None]
+        with self.mysql_server.get_admin_cursor() as cursor:
+            cursor.execute('SELECT 1; SELECT 2')
+        self.assertEqual(cursor.nextset.call_count, 2)
+        cursor.close.assert_called_once_with()
+
+    @patch('instance.models.database_server.get_mysql_pool')
+    @patch('instance.models.database_server.connect_mysql')
+    def test_get_database_cursor(self, mock_connect_mysql, mock_get_mysql_pool):
+        """
+        The cursor on a database has a connection of its own, which is closed afterwards.
+        """
+        with self.mysql_server.get_database_cursor('test_database') as cursor:
+            self.assertIs(cursor, mock_connect_mysql.return_value.cursor.return_value)
+        mock_connect_mysql.assert_called_once_with(
+            self.mysql_server.hostname,
+            self.mysql_server.port,
+            self.mysql_server.username,
+            self.mysql_server.password,
+            db='test_database',
+        )
+        mock_connect_mysql.return_value.close.assert_called_once_with()
+        mock_get_mysql_pool.assert_not_called()
+
 
 @ddt.ddt
 class MongoDBServerTest(TestCase):
@@ -326,6 +358,66 @@ class DatabaseServerManagerTest(TestCase):
 
         self._assert_default_settings(mysql_server, mongodb_server)
 
+    @override_settings(DEFAULT_INSTANCE_MYSQL_URL=None)
+    @patch(
+        'instance.tests.models.factories.openedx_instance.OpenEdXInstance._write_metadata_to_consul',
+        return_value=(1, True)
+    )
+    def test_select_least_loaded_by_capacity(self, mock_consul):
+        """
+        Test that `select_least_loaded` selects, in a single query, the server accepting new clients with the
+        fewest instances which aren't archived per unit of capacity weight.
+        """
+        small_server = MySQLServerFactory(accepts_new_clients=True)
+        large_server = MySQLServerFactory(accepts_new_clients=True, capacity_weight=3)
+        MySQLServerFactory(accepts_new_clients=False)
+        small_instances = [OpenEdXInstanceFactory(mysql_server=small_server) for unused in range(2)]
+        for unused in range(5):
+            OpenEdXInstanceFactory(mysql_server=large_server)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(MySQLServer.objects.select_least_loaded(), large_server)
+
+        small_instances[0].ref.is_archived = True
+        small_instances[0].ref.save()
+        self.assertEqual(MySQLServer.objects.select_least_loaded(), small_server)
+
+        report = MySQLServer.objects.load_report()
+        self.assertEqual(
+            [(row['server'], row['instance_count'], row['load']) for row in report['servers']],
+            [(large_server, 5, 5 / 3), (small_server, 1, 1), (report['servers'][2]['server'], 0, 0)],
+        )
+        self.assertFalse(report['servers'][2]['accepts_new_clients'])
+        self.assertAlmostEqual(report['skew'], (5 / 3) / ((5 / 3 + 1) / 2))
+
+    @override_settings(DEFAULT_INSTANCE_MYSQL_URL=None)
+    @patch('instance.models.shared_server.random.choices', side_effect=lambda population, weights: population[-1:])
+    def test_select_least_loaded_ties(self, mock_choices):
+        """
+        Test that `select_least_loaded` picks among the servers with the lowest load, weighted by their capacity.
+        """
+        small_server = MySQLServerFactory(accepts_new_clients=True)
+        large_server = MySQLServerFactory(accepts_new_clients=True, capacity_weight=3)
+        self.assertEqual(MySQLServer.objects.select_least_loaded(), large_server)
+        mock_choices.assert_called_once_with([small_server, large_server], weights=[1, 3])
+
+    def test_select_random_deprecated(self):
+        """
+        Test that `select_random` is a deprecated alias of `select_least_loaded`.
+        """
+        with self.assertWarns(DeprecationWarning):
+            mysql_server = MySQLServer.objects.select_random()
+        self.assertEqual(mysql_server, MySQLServer.objects.select_least_loaded())
+
+    @override_settings(DEFAULT_INSTANCE_MYSQL_URL=None)
+    def test_select_least_loaded_no_server(self):
+        """
+        Test that `select_least_loaded` raises DoesNotExist when no server accepts new clients.
+        """
+        MySQLServerFactory(accepts_new_clients=False)
+        with self.assertRaises(MySQLServer.DoesNotExist):
+            MySQLServer.objects.select_least_loaded()
+
     def test__create_default(self):
         """
         Test that `_create_default` uses default settings to create MySQL and MongoDB servers.
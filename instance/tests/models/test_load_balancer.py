@@ -19,15 +19,24 @@
 """
 LoadBalancingServer model - tests
 """
+import itertools
 import re
 from unittest.mock import Mock, patch
 
+from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ImproperlyConfigured
 from django.test import override_settings
+from django.utils import timezone
 
+from instance.models.instance import InstanceReference
 from instance.models.load_balancer import LoadBalancingServer, ReconfigurationFailed
+from instance.models.openedx_instance import OpenEdXInstance
 from instance.tests.base import TestCase
 from instance.tests.models.factories.load_balancer import LoadBalancingServerFactory
+from instance.tests.models.factories.openedx_instance import OpenEdXInstanceFactory
+
+
+INSTANCE_IDS = itertools.count(1)
 
 
 def mock_instances():
@@ -39,6 +48,10 @@ def mock_instances():
         Create a mock instance meant for load balancer testing.
         """
         instance = Mock()
+        instance.ref = InstanceReference.objects.create(
+            instance_type=ContentType.objects.get_for_model(OpenEdXInstance),
+            instance_id=next(INSTANCE_IDS),
+        )
         map_entries = [(domain, backend_name) for domain in domains]
         conf_entries = [(backend_name, "    server test-server {}:80".format(ip_address))]
         instance.get_load_balancer_configuration.return_value = map_entries, conf_entries
@@ -69,7 +82,7 @@ class LoadBalancingServerTest(TestCase):
     def setUp(self):
         self.load_balancer = LoadBalancingServerFactory()
 
-    @patch('instance.models.load_balancer.LoadBalancingServer.get_instances', return_value=mock_instances())
+    @patch('instance.models.load_balancer.LoadBalancingServer.get_instances', side_effect=mock_instances)
     @override_settings(DISABLE_LOAD_BALANCER_CONFIGURATION=False)
     def test_get_configuration(self, mock_get_instances):
         """
@@ -92,7 +105,7 @@ class LoadBalancingServerTest(TestCase):
 
     @patch("instance.ansible.poll_streams")
     @patch("instance.ansible.run_playbook")
-    @patch('instance.models.load_balancer.LoadBalancingServer.get_instances', return_value=mock_instances())
+    @patch('instance.models.load_balancer.LoadBalancingServer.get_instances', side_effect=mock_instances)
     def test_reconfigure(self, mock_get_instances, mock_run_playbook, mock_poll_streams):
         """
         Test that the reconfigure() method triggers a playbook run.
@@ -107,7 +120,7 @@ class LoadBalancingServerTest(TestCase):
 
     @patch("instance.ansible.poll_streams")
     @patch("instance.ansible.run_playbook")
-    @patch('instance.models.load_balancer.LoadBalancingServer.get_instances', return_value=mock_instances())
+    @patch('instance.models.load_balancer.LoadBalancingServer.get_instances', side_effect=mock_instances)
     @override_settings(DISABLE_LOAD_BALANCER_CONFIGURATION=False)
     def test_reconfigure_fails(self, mock_get_instances, mock_run_playbook, mock_poll_streams):
         """
@@ -121,7 +134,7 @@ class LoadBalancingServerTest(TestCase):
 
     @patch("instance.ansible.poll_streams")
     @patch("instance.ansible.run_playbook")
-    @patch('instance.models.load_balancer.LoadBalancingServer.get_instances', return_value=mock_instances())
+    @patch('instance.models.load_balancer.LoadBalancingServer.get_instances', side_effect=mock_instances)
     @override_settings(DISABLE_LOAD_BALANCER_CONFIGURATION=False)
     def test_deconfigure(self, mock_get_instances, mock_run_playbook, mock_poll_streams):
         """
@@ -132,6 +145,157 @@ class LoadBalancingServerTest(TestCase):
         self.assertEqual(mock_run_playbook.call_count, 1)
 
 
+@override_settings(DISABLE_LOAD_BALANCER_CONFIGURATION=False)
+@patch('instance.models.load_balancer.LoadBalancingServer.run_playbook')
+class LoadBalancerBackendConfigurationTest(TestCase):
+    """
+    Test cases for the backend configurations stored for the instances of a load balancer.
+    """
+
+    def setUp(self):
+        self.load_balancer = LoadBalancingServerFactory()
+        self.instances = mock_instances()
+        patcher = patch(
+            'instance.models.load_balancer.LoadBalancingServer.get_instances',
+            side_effect=lambda: iter(self.instances),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_render_counts(self):
+        """
+        Return the number of times the configuration of each instance was rendered.
+        """
+        return [instance.get_load_balancer_configuration.call_count for instance in self.instances]
+
+    def test_get_configuration_stored(self, mock_run_playbook):
+        """
+        The configuration of each instance is only rendered once, and then reused.
+        """
+        configuration = self.load_balancer.get_configuration()
+        self.assertEqual(self.load_balancer.get_configuration(), configuration)
+        self.assertEqual(self.get_render_counts(), [1, 1])
+        self.assertEqual(self.load_balancer.backend_configurations.count(), 2)
+
+    def test_reconfigure_triggering_instance(self, mock_run_playbook):
+        """
+        Only the configuration of the instance triggering a reconfiguration is rendered again.
+        """
+        self.load_balancer.reconfigure()
+        self.assertEqual(mock_run_playbook.call_count, 1)
+
+        self.instances[0].get_load_balancer_configuration.return_value = (
+            [("test1.lb.opencraft.hosting", "first-backend")],
+            [("first-backend", "    server test-server 9.9.9.9:80")],
+        )
+        self.load_balancer.reconfigure(triggering_instance_id=self.instances[0].ref.pk)
+        self.assertEqual(self.get_render_counts(), [2, 1])
+        self.assertEqual(mock_run_playbook.call_count, 2)
+        self.assertIn("9.9.9.9", mock_run_playbook.call_args[0][0])
+        self.assertIn("5.6.7.8", mock_run_playbook.call_args[0][0])
+        self.assertEqual(self.load_balancer.deployed_configuration_version, 3)
+
+    def test_reconfigure_unchanged(self, mock_run_playbook):
+        """
+        The playbook isn't run again if the configuration didn't change.
+        """
+        self.load_balancer.reconfigure()
+        self.load_balancer.reconfigure(triggering_instance_id=self.instances[1].ref.pk)
+        self.assertEqual(self.get_render_counts(), [1, 2])
+        self.assertEqual(mock_run_playbook.call_count, 1)
+        self.assertEqual(self.load_balancer.deployed_configuration_version, 3)
+
+    def test_reconfigure_all(self, mock_run_playbook):
+        """
+        Reconfiguring without triggering instance renders and deploys all the configurations again.
+        """
+        self.load_balancer.reconfigure()
+        self.load_balancer.reconfigure()
+        self.assertEqual(self.get_render_counts(), [2, 2])
+        self.assertEqual(mock_run_playbook.call_count, 2)
+
+    def test_removed_instance(self, mock_run_playbook):
+        """
+        The configuration of instances which don't use the load balancer anymore is deleted.
+        """
+        self.load_balancer.get_configuration()
+        self.instances.pop()
+        backend_map, unused = self.load_balancer.get_configuration()
+        self.assertNotIn("test3.lb.opencraft.hosting", backend_map)
+        self.assertEqual(
+            list(self.load_balancer.backend_configurations.values_list("instance_ref_id", flat=True)),
+            [self.instances[0].ref.pk],
+        )
+
+    def test_invalidated_during_generation(self, mock_run_playbook):
+        """
+        A configuration generated before being invalidated is rendered again.
+        """
+        # The instance configuration changes while the load balancer is being reconfigured
+        # with the previous configuration version.
+        LoadBalancingServer.objects.filter(pk=self.load_balancer.pk).update(configuration_version=2)
+        self.load_balancer.invalidate_backend_configurations(self.instances[0].ref.pk)
+        self.load_balancer.get_configuration()
+        self.load_balancer.refresh_from_db()
+        self.load_balancer.get_configuration()
+        self.assertEqual(self.get_render_counts(), [2, 1])
+
+    def test_settings_changed(self, mock_run_playbook):
+        """
+        The configurations generated from different settings are rendered again.
+        """
+        self.load_balancer.get_configuration()
+        with override_settings(PRELIMINARY_PAGE_HOSTNAME='preliminary.example.com'):
+            self.load_balancer.get_configuration()
+        self.assertEqual(self.get_render_counts(), [2, 2])
+
+    @patch('instance.models.load_balancer.loader.get_template')
+    def test_template_changed(self, mock_get_template, mock_run_playbook):
+        """
+        The configurations generated from different templates are rendered again.
+        """
+        mock_get_template.return_value.template.source = 'backend template'
+        self.load_balancer.get_configuration()
+        self.load_balancer.get_configuration()
+        mock_get_template.return_value.template.source = 'changed backend template'
+        self.load_balancer.get_configuration()
+        self.assertEqual(self.get_render_counts(), [2, 2])
+
+    def test_instance_saved(self, mock_run_playbook):
+        """
+        Saving a change to the fields the configuration of an instance is generated from invalidates it.
+        """
+        instance = OpenEdXInstanceFactory(load_balancing_server=self.load_balancer)
+        self.instances[0].ref = instance.ref
+        self.load_balancer.refresh_from_db()
+        self.load_balancer.get_configuration()
+        self.load_balancer.get_configuration()
+        self.assertEqual(self.get_render_counts(), [1, 1])
+        instance.external_lms_domain = 'courses.example.org'
+        instance.save()
+        self.load_balancer.refresh_from_db()
+        self.load_balancer.get_configuration()
+        self.assertEqual(self.get_render_counts(), [2, 1])
+
+    def test_instance_saved_unchanged(self, mock_run_playbook):
+        """
+        Saving an instance without changing the fields its configuration is generated from doesn't invalidate it.
+        """
+        instance = OpenEdXInstanceFactory(load_balancing_server=self.load_balancer)
+        instance = OpenEdXInstance.objects.get(pk=instance.pk)
+        with patch.object(LoadBalancingServer, 'invalidate_backend_configurations') as mock_invalidate:
+            instance.dns_records_updated = timezone.now()
+            instance.save(update_fields=['dns_records_updated'])
+            instance.save()
+            instance.external_lms_domain = 'courses.example.org'
+            instance.save(update_fields=['mysql_provisioned'])
+            mock_invalidate.assert_not_called()
+            instance.save(update_fields=['external_lms_domain'])
+            mock_invalidate.assert_called_once_with(instance.ref.pk)
+            instance.save()
+            mock_invalidate.assert_called_once_with(instance.ref.pk)
+
+
 class LoadBalancingServerManager(TestCase):
     """
     Tests for LoadBalancingServerManager.
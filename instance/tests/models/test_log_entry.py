@@ -22,6 +22,8 @@ Logger models & mixins - Tests
 
 # Imports #####################################################################
 
+import logging
+import threading
 from unittest.mock import patch
 
 from django.contrib.contenttypes.models import ContentType
@@ -29,7 +31,9 @@ from django.core.exceptions import ValidationError
 from django.test import override_settings
 from freezegun import freeze_time
 
+from instance.logging import DBHandler
 from instance.models.log_entry import LogEntry
+from instance.models.server import OpenStackServer
 from instance.tests.base import TestCase
 from instance.tests.models.factories.openedx_appserver import make_test_appserver
 from instance.tests.models.factories.openedx_instance import OpenEdXInstanceFactory
@@ -137,7 +141,7 @@ class LoggingTestCase(TestCase):
             self.instance.logger.info('Text the client should see')
 
         mock_publish_data.assert_called_with({
-            'log_entry': {
+            'log_entries': [{
                 'created': '2019-10-07T00:41:00Z',
                 'level': 'INFO',
                 'text': (
@@ -145,8 +149,8 @@ class LoggingTestCase(TestCase):
                         self.instance.ref.pk
                     )
                 ),
-            },
-            'type': 'object_log_line',
+            }],
+            'type': 'object_log_lines',
             'instance_id': self.instance.ref.pk,
             'instance_type': 'OpenEdXInstance',
         })
@@ -155,7 +159,7 @@ class LoggingTestCase(TestCase):
             self.instance.logger.info('Text the client should see, with unicode «ταБЬℓσ»')
 
         mock_publish_data.assert_called_with({
-            'log_entry': {
+            'log_entries': [{
                 'created': '2019-10-07T00:41:00Z',
                 'level': 'INFO',
                 'text': (
@@ -164,8 +168,8 @@ class LoggingTestCase(TestCase):
                 ).format(
                     self.instance.ref.pk
                 )
-            },
-            'type': 'object_log_line',
+            }],
+            'type': 'object_log_lines',
             'instance_id': self.instance.ref.pk,
             'instance_type': 'OpenEdXInstance',
         })
@@ -204,16 +208,175 @@ class LoggingTestCase(TestCase):
         """
         Check that logging to the LogEntry table doesn't do more queries than necessary.
 
-        The expected queries upon inserting a log entry are:
-        1. SELECT (1) AS "a" FROM "django_content_type" WHERE "django_content_type"."id" = {content_type_id} LIMIT 1
-        2. SELECT (1) AS "a" FROM "instance_openstackserver" WHERE "instance_openstackserver"."id" = {object_id} LIMIT 1
-        3. INSERT INTO "instance_logentry" (...)
+        The content type is cached, and the appserver of the server was set when the appserver was created,
+        so the expected queries are:
+        1. SELECT "instance_openstackserver"."id" FROM "instance_openstackserver" WHERE "id" IN ({object_id})
+        2. INSERT INTO "instance_logentry" (...)
 
-        The first two are used to validate the foreign keys. 1. is added by django, and 2. is
-        added by us since the object_id foreign key constraint is not enforced by the database.
+        The first one validates the object_id, since its foreign key constraint is not enforced by the database.
         """
-        with self.assertNumQueries(3):
+        ContentType.objects.get_for_model(self.server)
+        with self.assertNumQueries(2):
             self.server.logger.info('some log message')
+        self.assertEqual(LogEntry.objects.order_by('-pk').first().appserver_id, self.app_server.pk)
+
+    def test_log_entry_appserver_id_lookup(self, mock_consul):
+        """
+        A server loaded on its own looks its appserver up only once, even when it has none.
+        """
+        server = OpenStackServer.objects.get(pk=self.server.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(server.log_entry_appserver_id, self.app_server.pk)
+            self.assertEqual(server.log_entry_appserver_id, self.app_server.pk)
+
+        server = OpenStackServerFactory()
+        with self.assertNumQueries(1):
+            self.assertIsNone(server.log_entry_appserver_id)
+            self.assertIsNone(server.log_entry_appserver_id)
+
+    def test_log_entries_appserver(self, mock_consul):
+        """
+        The log entries of an appserver and of its server are attributed to the appserver, and are
+        retrieved with a single query on that attribution.
+        """
+        self.instance.logger.info('Line #1, on instance')
+        self.app_server.logger.info('Line #2, on appserver')
+        self.server.logger.info('Line #3, on server')
+
+        self.assertEqual(
+            list(LogEntry.objects.filter(appserver_id=self.app_server.pk).values_list('text', flat=True)),
+            [self.appserver_prefix + 'Line #2, on appserver', self.server_prefix + 'Line #3, on server'],
+        )
+        self.assertIsNone(LogEntry.objects.get(text=self.instance_prefix + 'Line #1, on instance').appserver_id)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.app_server.log_entries), 2)
+
+    @patch('instance.logging.publish_data')
+    def test_log_buffered(self, mock_publish_data, mock_consul):
+        """
+        Check that a buffered DBHandler writes its entries in batches, with one notification per object and batch.
+        """
+        handler = DBHandler(capacity=3, flush_interval=3600)
+        self.addCleanup(handler.close)
+        initial_count = LogEntry.objects.count()
+        # The test case runs in a transaction, within which entries aren't buffered
+        patcher = patch.object(handler, '_in_transaction', return_value=False)
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+        def log(obj, msg, level=logging.INFO):
+            """ Send a log record about `obj` to the handler """
+            record = logging.LogRecord('test', level, __file__, 0, msg, None, None)
+            record.obj = obj
+            handler.handle(record)
+
+        log(self.server, 'Line #1, on server')
+        log(self.instance, 'Line #2, on instance')
+        self.assertEqual(LogEntry.objects.count(), initial_count)
+        mock_publish_data.assert_not_called()
+
+        # The server and the instance are looked up to validate the entries, then the entries are inserted
+        with self.assertNumQueries(3):
+            log(self.server, 'Line #3, on server')
+        self.assertEqual(LogEntry.objects.count(), initial_count + 3)
+        self.assertEqual(
+            [(call_args[0][0]['type'], [entry['text'] for entry in call_args[0][0]['log_entries']])
+             for call_args in mock_publish_data.call_args_list],
+            [
+                ('object_log_lines', ['Line #1, on server', 'Line #3, on server']),
+                ('object_log_lines', ['Line #2, on instance']),
+            ]
+        )
+
+        # Records at or above the flush level are written right away
+        log(self.server, 'Line #4, on server')
+        self.assertEqual(LogEntry.objects.count(), initial_count + 3)
+        log(self.server, 'Line #5, critical', level=logging.CRITICAL)
+        self.assertEqual(LogEntry.objects.count(), initial_count + 5)
+
+        # Closing the handler writes the remaining entries
+        log(self.instance, 'Line #6, on instance')
+        handler.close()
+        self.assertEqual(LogEntry.objects.count(), initial_count + 6)
+        self.assertEqual(mock_publish_data.call_count, 4)
+
+    def test_log_buffered_in_transaction(self, mock_consul):
+        """
+        Check that a buffered DBHandler writes the entries emitted within a transaction right away, in that
+        transaction, and doesn't write the buffered entries of other threads within it.
+        """
+        handler = DBHandler(capacity=3, flush_interval=3600)
+        self.addCleanup(handler.close)
+        initial_count = LogEntry.objects.count()
+
+        def log(obj, msg, level=logging.INFO):
+            """ Send a log record about `obj` to the handler """
+            record = logging.LogRecord('test', level, __file__, 0, msg, None, None)
+            record.obj = obj
+            handler.handle(record)
+
+        with patch.object(handler, '_in_transaction', return_value=False):
+            log(self.server, 'Line #1, buffered outside of a transaction')
+        log(self.server, 'Line #2, within a transaction')
+        self.assertEqual(
+            LogEntry.objects.order_by('-pk').values_list('text', flat=True).first(),
+            'Line #2, within a transaction',
+        )
+        self.assertEqual(LogEntry.objects.count(), initial_count + 1)
+        handler.flush()
+        self.assertEqual(LogEntry.objects.count(), initial_count + 1)
+
+    def test_log_buffered_created(self, mock_consul):
+        """
+        Check that buffered log entries are dated when they're emitted, and that invalid entries are discarded.
+        """
+        handler = DBHandler(capacity=3, flush_interval=3600)
+        self.addCleanup(handler.close)
+        patcher = patch.object(handler, '_in_transaction', return_value=False)
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+        deleted_server = OpenStackServerFactory()
+        for obj, msg, timestamp in (
+                (self.server, 'Line #1, on server', '2019-10-07 00:41:00'),
+                (deleted_server, 'Line #2, on deleted server', '2019-10-07 00:41:01'),
+        ):
+            with freeze_time(timestamp):
+                record = logging.LogRecord('test', logging.INFO, __file__, 0, msg, None, None)
+                record.obj = obj
+                handler.handle(record)
+        deleted_server.delete()
+
+        with freeze_time('2019-10-07 00:42:00'), self.assertLogs('instance.logging', level='ERROR') as logs:
+            handler.flush()
+        self.assertEqual(
+            LogEntry.objects.get(text='Line #1, on server').created.strftime('%Y-%m-%d %H:%M:%S'),
+            '2019-10-07 00:41:00',
+        )
+        self.assertFalse(LogEntry.objects.filter(text='Line #2, on deleted server').exists())
+        self.assertIn('Discarding invalid log entry "Line #2, on deleted server"', logs.output[0])
+
+    def test_log_buffered_single_flusher(self, mock_consul):
+        """
+        Check that threads buffering log entries concurrently start a single background flusher.
+        """
+        handler = DBHandler(capacity=3, flush_interval=3600)
+        self.addCleanup(handler.close)
+        initial_flushers = {thread for thread in threading.enumerate() if thread.name == 'DBHandler-flusher'}
+        barrier = threading.Barrier(8)
+
+        def start_flusher():
+            """ Start the flusher at the same time as the other threads """
+            barrier.wait()
+            handler._start_flusher()  # pylint: disable=protected-access
+
+        threads = [threading.Thread(target=start_flusher) for unused in range(barrier.parties)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        flushers = {thread for thread in threading.enumerate() if thread.name == 'DBHandler-flusher'}
+        self.assertEqual(len(flushers - initial_flushers), 1)
 
     def test_log_delete_num_queries(self, mock_consul):
         """
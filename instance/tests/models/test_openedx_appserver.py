@@ -289,7 +289,10 @@ class OpenEdXAppServerTestCase(TestCase):
         Test launching an appserver in a non-default region.
         """
         instance = OpenEdXInstanceFactory(openstack_region="elsewhere")
-        make_test_appserver(instance)
+        appserver = make_test_appserver(instance)
+        # The nova client is only looked up when it is used
+        mock_get_nova_client.assert_not_called()
+        self.assertEqual(appserver.server.nova, mock_get_nova_client.return_value)
         mock_get_nova_client.assert_called_once_with("elsewhere")
 
     @data(
@@ -22,7 +22,7 @@ OpenEdXInstance Database Mixins - Tests
 
 # Imports #####################################################################
 
-from unittest.mock import Mock, patch
+from unittest.mock import patch
 import urllib
 
 from MySQLdb import Error as MySQLError, connect as mysql_connect
@@ -413,26 +413,30 @@ class MySQLInstanceTestCase(TestCase):
         self.instance.save()
         self.check_mysql_vars_not_set(self.instance)
 
-    @patch('instance.models.mixins.database._get_mysql_cursor', return_value=Mock())
+    @patch('instance.models.database_server.MySQLServer.get_admin_cursor')
+    @patch('instance.models.mixins.database.MySQLStatementBatch')
     @patch('instance.models.mixins.database._drop_database')
     @patch('instance.models.mixins.database._drop_user')
-    def test_deprovision_mysql(self, mock_drop_user, mock_drop_database, mock_get_cursor, mock_consul):
+    def test_deprovision_mysql(self, mock_drop_user, mock_drop_database, mock_batch, mock_get_cursor, mock_consul):
         """
         Test deprovision_mysql does correct calls.
         """
         self.instance = OpenEdXInstanceFactory()
         self.instance.mysql_provisioned = True
         self.instance.deprovision_mysql()
+        batch = mock_batch.return_value
         for database in self.instance.mysql_databases:
-            mock_drop_database.assert_any_call(mock_get_cursor(), database["name"])
-            mock_drop_user.assert_any_call(mock_get_cursor(), database["user"])
+            mock_drop_database.assert_any_call(batch, database["name"])
+            mock_drop_user.assert_any_call(batch, database["user"])
         for user in self.instance.global_users:
-            mock_drop_user.assert_any_call(mock_get_cursor(), user)
+            mock_drop_user.assert_any_call(batch, user)
+        batch.execute.assert_called_once_with()
 
-    @patch('instance.models.mixins.database._get_mysql_cursor', return_value=Mock())
+    @patch('instance.models.database_server.MySQLServer.get_admin_cursor')
+    @patch('instance.models.mixins.database.MySQLStatementBatch')
     @patch('instance.models.mixins.database._drop_database', side_effect=MySQLError())
     @patch('instance.models.mixins.database._drop_user')
-    def test_ignore_errors_deprovision_mysql(self, mock_drop_user, mock_drop_database, mock_get_cursor, mock_consul):
+    def test_ignore_errors_deprovision_mysql(self, mock_drop_user, mock_drop_database, *mocks):
         """
         Test mysql is set as deprovision when ignoring errors.
         """
@@ -441,6 +445,41 @@ class MySQLInstanceTestCase(TestCase):
         self.instance.deprovision_mysql(ignore_errors=True)
         self.assertFalse(self.instance.mysql_provisioned)
 
+    @patch('instance.models.database_server.MySQLServer.get_admin_cursor')
+    def test_provision_mysql_single_batch(self, mock_get_cursor, mock_consul):
+        """
+        Test provision_mysql runs all its statements in a single query, after checking which users exist.
+        """
+        cursor = mock_get_cursor.return_value.__enter__.return_value
+        cursor.connection.escape_string.side_effect = lambda value: value.encode()
+        cursor.nextset.return_value = None
+        self.instance = OpenEdXInstanceFactory()
+        cursor.fetchall.return_value = [(self.instance.read_only_user,)]
+
+        self.instance.provision_mysql()
+
+        self.assertEqual(cursor.execute.call_count, 2)
+        query, params = cursor.execute.call_args[0]
+        statements = query.split(';\n')
+        self.assertEqual(query.count('%s'), len(params))
+        remaining_params = list(params)
+        created_users = []
+        for statement in statements:
+            statement_params = [remaining_params.pop(0) for _ in range(statement.count('%s'))]
+            if statement.startswith('CREATE USER'):
+                created_users.append(statement_params[0])
+        # The existing read-only user isn't created again
+        users = {database["user"] for database in self.instance.mysql_databases}
+        users.update((self.instance.migrate_user, self.instance.admin_user))
+        self.assertEqual(sorted(created_users), sorted(users))
+        for database in self.instance.mysql_databases:
+            self.assertIn(
+                'CREATE DATABASE IF NOT EXISTS `{}` DEFAULT CHARACTER SET utf8'.format(database["name"]), statements
+            )
+        self.assertEqual(statements[-1], 'GRANT CREATE USER ON *.* TO %s')
+        self.assertTrue(self.instance.mysql_provisioned)
+        self.instance = None
+
 
 @ddt.ddt
 @patch(
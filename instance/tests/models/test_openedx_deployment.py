@@ -19,11 +19,17 @@
 """
 OpenEdXDeployment model - Tests
 """
+from threading import Barrier, Thread
+import time
+from unittest.mock import patch
+
 from ddt import ddt, unpack, data
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
 
 from instance.models.appserver import Status as AppServerStatus
-from instance.models.openedx_deployment import DeploymentState
+from instance.models.openedx_appserver import OpenEdXAppServer
+from instance.models.openedx_deployment import DeploymentState, OpenEdXDeployment
 from instance.tests.models.factories.openedx_appserver import make_test_appserver, make_test_deployment
 from instance.tests.models.factories.openedx_instance import OpenEdXInstanceFactory
 
@@ -88,3 +94,125 @@ class TestOpenEdXDeployment(TestCase):
         deployment.instance.instance.openedx_appserver_count = appserver_count
         deployment.instance.instance.save()
         self.assertEqual(deployment.status(), status)
+
+    @unpack
+    @data(*STATUS_SCENARIOS)
+    def test_stored_status(self, server_statuses, appserver_count, status, additional_deployment=False):
+        """
+        The stored state of the deployment is kept up to date as its AppServers change, and doesn't need
+        any query to be read.
+        """
+        instance = OpenEdXInstanceFactory()
+        if additional_deployment:
+            deployment = make_test_deployment(instance)
+            make_test_appserver(deployment=deployment, instance=instance)
+        deployment = make_test_deployment(instance, appserver_states=server_statuses)
+        deployment.instance.instance.openedx_appserver_count = appserver_count
+        deployment.instance.instance.save()
+
+        deployment = OpenEdXDeployment.objects.get(pk=deployment.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(deployment.status(), status)
+        self.assertEqual(deployment.compute_status(), status)
+
+    def test_status_after_transitions(self):
+        """
+        The stored state follows the transitions of the AppServers of the deployment.
+        """
+        instance = OpenEdXInstanceFactory()
+        make_test_deployment(instance)
+        deployment = make_test_deployment(instance, appserver_states=[AppServerStatus.ConfiguringServer])
+        appserver = deployment.openedxappserver_set.get()
+        self.assertEqual(OpenEdXDeployment.objects.get(pk=deployment.pk).status(), DeploymentState.provisioning)
+
+        appserver._status_to_running()
+        self.assertEqual(OpenEdXDeployment.objects.get(pk=deployment.pk).status(), DeploymentState.healthy)
+
+        appserver._status_to_terminated()
+        self.assertEqual(OpenEdXDeployment.objects.get(pk=deployment.pk).status(), DeploymentState.offline)
+
+        appserver.delete()
+        self.assertEqual(OpenEdXDeployment.objects.get(pk=deployment.pk).status(), DeploymentState.changes_pending)
+
+    def test_status_after_new_deployment(self):
+        """
+        The first deployment of an instance is not preparing anymore once there is another deployment.
+        """
+        instance = OpenEdXInstanceFactory()
+        first_deployment = make_test_deployment(instance, appserver_states=[AppServerStatus.ConfiguringServer])
+        self.assertEqual(OpenEdXDeployment.objects.get(pk=first_deployment.pk).status(), DeploymentState.preparing)
+
+        second_deployment = make_test_deployment(instance, appserver_states=[])
+        self.assertEqual(
+            OpenEdXDeployment.objects.get(pk=first_deployment.pk).status(), DeploymentState.provisioning,
+        )
+
+        second_deployment.delete()
+        self.assertEqual(OpenEdXDeployment.objects.get(pk=first_deployment.pk).status(), DeploymentState.preparing)
+
+    def test_status_not_computed(self):
+        """
+        The state of deployments created before it was stored is computed when it's first needed.
+        """
+        deployment = make_test_deployment(appserver_states=[AppServerStatus.Running])
+        OpenEdXDeployment.objects.filter(pk=deployment.pk).update(_status=None)
+
+        deployment = OpenEdXDeployment.objects.get(pk=deployment.pk)
+        self.assertEqual(deployment.status(), DeploymentState.healthy)
+        self.assertEqual(OpenEdXDeployment.objects.get(pk=deployment.pk)._status, DeploymentState.healthy.name)
+
+
+class TestOpenEdXDeploymentConcurrency(TransactionTestCase):
+    """
+    Tests for the stored state of deployments when their AppServers change concurrently
+    """
+    def test_concurrent_transitions(self):
+        """
+        When the AppServers of a deployment change state at the same time, the stored state of the deployment
+        reflects all the changes.
+        """
+        appserver_count = 4
+        instance = OpenEdXInstanceFactory(openedx_appserver_count=appserver_count)
+        make_test_deployment(instance)
+        deployment = make_test_deployment(
+            instance, appserver_states=[AppServerStatus.ConfiguringServer] * appserver_count,
+        )
+        self.assertEqual(OpenEdXDeployment.objects.get(pk=deployment.pk).status(), DeploymentState.provisioning)
+
+        # Computing the state is slowed down, so that the transactions would overlap without locking
+        compute_status = OpenEdXDeployment.compute_status
+
+        def slow_compute_status(deployment):
+            """
+            Compute the state of the deployment, then wait.
+            """
+            deployment_status = compute_status(deployment)
+            time.sleep(0.2)
+            return deployment_status
+
+        barrier = Barrier(appserver_count)
+
+        def transition_to_running(appserver_id):
+            """
+            Move an AppServer to the Running state, at the same time as the others.
+            """
+            try:
+                appserver = OpenEdXAppServer.objects.get(pk=appserver_id)
+                barrier.wait()
+                appserver._status_to_running()
+            finally:
+                connection.close()
+
+        with patch.object(OpenEdXDeployment, 'compute_status', slow_compute_status):
+            threads = [
+                Thread(target=transition_to_running, args=(appserver_id,))
+                for appserver_id in deployment.openedxappserver_set.values_list('pk', flat=True)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        deployment = OpenEdXDeployment.objects.get(pk=deployment.pk)
+        self.assertEqual(deployment.compute_status(), DeploymentState.healthy)
+        self.assertEqual(deployment.status(), DeploymentState.healthy)
@@ -23,6 +23,7 @@ OpenEdXInstance model - Tests
 # Imports #####################################################################
 import json
 import re
+import threading
 from datetime import datetime, timedelta
 from unittest.mock import patch, Mock, PropertyMock
 
@@ -30,8 +31,10 @@ import ddt
 from django.core import mail as django_mail
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.db.models import F
-from django.test import override_settings
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 import consul
@@ -48,7 +51,9 @@ from instance.models.mixins.utilities import SensitiveDataFilter
 from instance.models.load_balancer import LoadBalancingServer
 from instance.models.openedx_appserver import OpenEdXAppServer
 from instance.models.openedx_deployment import OpenEdXDeployment
-from instance.models.openedx_instance import OpenEdXInstance, OpenEdXAppConfiguration
+from instance.models.openedx_instance import (
+    OpenEdXInstance, OpenEdXAppConfiguration, terminate_obsolete_appservers_of_all_instances
+)
 from instance.models.rabbitmq_server import RabbitMQServer
 from instance.models.redis_server import RedisServer
 from instance.models.server import OpenStackServer, Server, Status as ServerStatus
@@ -61,7 +66,7 @@ from instance.tests.models.factories import (
     RabbitMQServerFactory
 )
 from instance.tests.models.factories.RedisServerFactory import RedisServerFactory
-from instance.tests.utils import patch_services, skip_unless_consul_running
+from instance.tests.utils import patch_gandi, patch_services, skip_unless_consul_running
 from registration.models import BetaTestApplication
 from registration.approval import ApplicationNotReady
 from userprofile.models import UserProfile
@@ -1337,6 +1342,76 @@ class OpenEdXInstanceTestCase(TestCase):
             (rc_appserver_failed, AppServerStatus.ConfigurationFailed, ServerStatus.Terminated),
         ])
 
+    @patch_services
+    def test_terminate_obsolete_appservers_of_all_instances(self, mock_services, mock_consul):
+        """
+        Test that `terminate_obsolete_appservers_of_all_instances` terminates the same app servers as
+        `terminate_obsolete_appservers` does for each instance, loading the app servers with a single query.
+        """
+        reference_date = timezone.now()
+        instances = [OpenEdXInstanceFactory() for unused in range(3)]
+        appservers = {}
+        for instance in instances:
+            with freeze_time(reference_date - timedelta(days=5)):
+                appservers[instance, 'oldest'] = self._create_running_appserver(instance)
+                appservers[instance, 'oldest_failed'] = self._create_failed_appserver(instance)
+            with freeze_time(reference_date - timedelta(days=3)):
+                appservers[instance, 'active'] = self._create_running_appserver(instance)
+                appservers[instance, 'active'].make_active()
+            with freeze_time(reference_date - timedelta(days=1)):
+                appservers[instance, 'rc'] = self._create_running_appserver(instance)
+
+        with freeze_time(reference_date), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(terminate_obsolete_appservers_of_all_instances(days=2), (6, 0))
+        appserver_queries = [query for query in queries if query['sql'].startswith('SELECT')
+                             and 'FROM "instance_openedxappserver"' in query['sql']]
+        self.assertEqual(len(appserver_queries), 1)
+
+        for instance in instances:
+            self._assert_status([
+                (appservers[instance, 'oldest'], AppServerStatus.Terminated, ServerStatus.Terminated),
+                (appservers[instance, 'oldest_failed'], AppServerStatus.ConfigurationFailed, ServerStatus.Terminated),
+                (appservers[instance, 'active'], AppServerStatus.Running, ServerStatus.Pending),
+                (appservers[instance, 'rc'], AppServerStatus.Running, ServerStatus.Pending),
+            ])
+
+    @patch_services
+    def test_terminate_obsolete_appservers_of_all_instances_errors(self, mock_services, mock_consul):
+        """
+        Test that an error while updating the status of an obsolete app server is logged, and doesn't prevent
+        the termination of the other app servers.
+        """
+        reference_date = timezone.now()
+        instances = [OpenEdXInstanceFactory() for unused in range(2)]
+        for instance in instances:
+            with freeze_time(reference_date - timedelta(days=5)):
+                self._create_running_appserver(instance)
+            with freeze_time(reference_date - timedelta(days=3)):
+                self._create_running_appserver(instance).make_active()
+
+        update_status = OpenEdXAppServer._update_status_after_vm_termination
+        updated_appservers = []
+
+        def update_status_after_vm_termination(appserver):
+            """ Fail to update the status of the first app server """
+            updated_appservers.append(appserver)
+            if len(updated_appservers) == 1:
+                raise WrongStateException('Concurrent change')
+            update_status(appserver)
+
+        with freeze_time(reference_date), \
+                patch.object(OpenEdXAppServer, '_update_status_after_vm_termination', autospec=True,
+                             side_effect=update_status_after_vm_termination):
+            self.assertEqual(terminate_obsolete_appservers_of_all_instances(days=2), (1, 1))
+
+        self.assertEqual(len(updated_appservers), 2)
+        failed_appserver, terminated_appserver = [
+            OpenEdXAppServer.objects.get(pk=appserver.pk) for appserver in updated_appservers
+        ]
+        self.assertEqual(failed_appserver.status, AppServerStatus.Running)
+        self.assertEqual(failed_appserver.server.status, ServerStatus.Terminated)
+        self.assertEqual(terminated_appserver.status, AppServerStatus.Terminated)
+
     def test_shut_down_reminder(self, mock_consul):
         """
         Test that if developers run the shut_down() method on the console, they see a warning
@@ -1723,3 +1798,51 @@ class OpenEDXInstanceRedisTestCase(TestCase):
 
         instance = OpenEdXInstanceFactory()
         assert instance.redis_server == server
+
+
+@override_settings(SPAWN_APPSERVER_PROVISIONING_WORKERS=4)
+@patch(
+    'instance.tests.models.factories.openedx_instance.OpenEdXInstance._write_metadata_to_consul',
+    return_value=(1, True)
+)
+class OpenEdXInstanceConcurrentProvisioningTestCase(TransactionTestCase):
+    """
+    Tests for provisioning the resources of new AppServers in several threads
+    """
+    @patch_gandi
+    @patch('instance.models.openedx_instance.OpenEdXInstance._create_owned_appserver')
+    @patch('instance.models.load_balancer.LoadBalancingServer.run_playbook')
+    @patch('instance.models.mixins.openedx_database.MySQLInstanceMixin.provision_mysql')
+    @patch('instance.models.mixins.redis.RedisInstanceMixin._redis_client')
+    @patch('instance.models.mixins.database.pymongo.MongoClient')
+    @patch(
+        'instance.models.mixins.database.MongoDBInstanceMixin._get_main_database_url',
+        return_value='mongodb://mongo.example.com',
+    )
+    def test_spawn_appserver_steps_save_their_fields(self, *mocks):
+        """
+        The provisioning steps only save the fields they changed, so that they don't overwrite
+        the fields saved by the steps running concurrently with stale values.
+        """
+        instance = OpenEdXInstanceFactory(storage_type=OpenEdXInstance.FILE_STORAGE, cache_db=OpenEdXInstance.REDIS)
+        worker_saves = []
+        save = OpenEdXInstance.save
+
+        def record_save(instance, **kwargs):
+            """
+            Record the fields saved in the worker threads, then save the instance.
+            """
+            if threading.current_thread() is not threading.main_thread():
+                worker_saves.append(kwargs.get('update_fields'))
+            save(instance, **kwargs)
+
+        with patch.object(OpenEdXInstance, 'save', record_save):
+            instance._spawn_appserver()
+
+        self.assertTrue(worker_saves)
+        self.assertNotIn(None, worker_saves)
+        instance = OpenEdXInstance.objects.get(pk=instance.pk)
+        self.assertTrue(instance.mongo_provisioned)
+        self.assertTrue(instance.redis_provisioned)
+        self.assertIsNotNone(instance.load_balancing_server)
+        self.assertIsNotNone(instance.dns_records_updated)
@@ -22,6 +22,7 @@ OpenStackServer model - Tests
 
 # Imports #####################################################################
 
+import time
 from unittest.mock import Mock, call, patch
 
 from ddt import ddt, data, unpack
@@ -31,9 +32,12 @@ import novaclient
 import requests
 import responses
 
-from instance.models.server import OpenStackServer, Status as ServerStatus
+from instance.models.server import OpenStackServer, Status as ServerStatus, terminate_servers
 from instance.models.utils import SteadyStateException, WrongStateException
 from instance.tests.base import AnyStringMatching, TestCase
+from instance.tests.models.factories.load_balancer import LoadBalancingServerFactory
+from instance.tests.models.factories.openedx_appserver import make_test_appserver
+from instance.tests.models.factories.openedx_instance import OpenEdXInstanceFactory
 from instance.tests.models.factories.server import (
     OpenStackServerFactory,
     BootingOpenStackServerFactory,
@@ -42,6 +46,7 @@ from instance.tests.models.factories.server import (
     ReadyOpenStackServerFactory,
 )
 from instance.tests.utils import patch_publish_data
+from instance.utils import get_event_groups
 
 
 # Tests #######################################################################
@@ -143,8 +148,8 @@ class OpenStackServerTestCase(TestCase):
     )
     @patch_publish_data
     @patch('instance.models.server.OpenStackServer.update_status')
-    @patch('instance.models.server.time.sleep')
-    def test_sleep_until_condition_already_fulfilled(self, condition, mock_sleep, mock_update_status):
+    @patch('instance.models.server.OpenStackServer._wait_for_status_update')
+    def test_sleep_until_condition_already_fulfilled(self, condition, mock_wait, mock_update_status):
         """
         Check if sleep_until behaves correctly if condition to wait for
         is already fulfilled.
@@ -164,7 +169,7 @@ class OpenStackServerTestCase(TestCase):
         # if server can not reach desired status because transition logic is broken:
         server.sleep_until(lambda: getattr(server.status, condition), timeout=5)
         self.assertEqual(server.status, ServerStatus.Ready)
-        self.assertEqual(mock_sleep.call_count, 0)
+        self.assertEqual(mock_wait.call_count, 0)
 
     @data(
         {
@@ -185,8 +190,8 @@ class OpenStackServerTestCase(TestCase):
     )
     @patch_publish_data
     @patch('instance.models.server.OpenStackServer.update_status')
-    @patch('instance.models.server.time.sleep')
-    def test_sleep_until_state_changes(self, condition, mock_sleep, mock_update_status):
+    @patch('instance.models.server.OpenStackServer._wait_for_status_update')
+    def test_sleep_until_state_changes(self, condition, mock_wait, mock_update_status):
         """
         Check if sleep_until behaves correctly if condition to wait for
         is unfulfilled initially.
@@ -210,7 +215,7 @@ class OpenStackServerTestCase(TestCase):
         # if server can not reach desired status because transition logic is broken:
         server.sleep_until(lambda: getattr(server.status, condition['name']), timeout=5)
         self.assertEqual(server.status, condition['expected_status'])
-        self.assertEqual(mock_sleep.call_count, condition['required_transitions'] - 1)
+        self.assertEqual(mock_wait.call_count, condition['required_transitions'] - 1)
 
     @patch('instance.models.server.OpenStackServer.update_status')
     @patch('instance.models.server.Status.Building.is_steady_state')
@@ -238,8 +243,8 @@ class OpenStackServerTestCase(TestCase):
 
     @patch_publish_data
     @patch('instance.models.server.OpenStackServer.update_status')
-    @patch('instance.models.server.time.sleep')
-    def test_sleep_until_timeout(self, mock_sleep, mock_update_status):
+    @patch('instance.models.server.OpenStackServer._wait_for_status_update')
+    def test_sleep_until_timeout(self, mock_wait, mock_update_status):
         """
         Check if sleep_until behaves correctly if condition to wait for
         is unfulfilled when timeout is reached.
@@ -251,10 +256,55 @@ class OpenStackServerTestCase(TestCase):
             server._status_to_building()
         mock_update_status.side_effect = update_status
 
+        # The timeout is measured in real time
+        mock_wait.side_effect = time.sleep
+
         with self.assertRaises(TimeoutError) as timeout_error:
-            server.sleep_until(lambda: server.status.accepts_ssh_commands, timeout=1)
-            self.assertEqual(mock_sleep.call_count, 1)
-            self.assertIn("Waited 0.01", timeout_error.exception)
+            server.sleep_until(lambda: server.status.accepts_ssh_commands, timeout=0.6)
+        self.assertGreaterEqual(mock_wait.call_count, 1)
+        self.assertIn("Waited 0.01", str(timeout_error.exception))
+
+    @override_settings(SERVER_STATUS_POLL_MIN_INTERVAL=10, SERVER_STATUS_POLL_MAX_INTERVAL=10)
+    @patch_publish_data
+    @patch('instance.models.server.OpenStackServer.update_status')
+    @patch('instance.models.server.OpenStackServer._wait_for_status_update')
+    def test_sleep_until_woken_early(self, mock_wait, mock_update_status):
+        """
+        Check that the waits which end early, because other threads polled the status of their servers,
+        don't count as the full poll interval towards the timeout.
+        """
+        server = OpenStackServerFactory()
+        status_updates = []
+
+        def update_status():
+            """ Reach the ready status after 5 updates """
+            status_updates.append(None)
+            if len(status_updates) == 5:
+                server._status_to_building()
+                server._status_to_booting()
+                server._status_to_ready()
+        mock_update_status.side_effect = update_status
+
+        # Each wait would use up the whole timeout if it were counted as a full poll interval
+        server.sleep_until(lambda: server.status.accepts_ssh_commands, timeout=10)
+        self.assertEqual(server.status, ServerStatus.Ready)
+        self.assertEqual(mock_wait.call_count, 4)
+
+    @patch('instance.models.server.OpenStackServer._get_polled_os_server')
+    @patch('instance.models.server.OpenStackServer._wait_for_status_update')
+    def test_shutdown_woken_early(self, mock_wait, mock_get_polled_os_server):
+        """
+        Check that the waits for a shutdown which end early, because other threads polled the status of their
+        servers, don't count as the full poll interval towards the maximum wait.
+        """
+        server = ReadyOpenStackServerFactory()
+        os_server = Mock(status='ACTIVE')
+        mock_get_polled_os_server.side_effect = [Mock(status='ACTIVE')] * 4 + [Mock(status='SHUTOFF')]
+
+        # Each wait would use up the whole maximum wait if it were counted as a full poll interval
+        self.assertTrue(server._shutdown(os_server, poll_interval=10, max_wait=10))  # pylint: disable=protected-access
+        os_server.stop.assert_called_once_with()
+        self.assertEqual(mock_wait.call_count, 5)
 
     def test_sleep_until_invalid_timeout(self):
         """
@@ -454,6 +504,77 @@ class OpenStackServerTestCase(TestCase):
         )
         remove_known_host_key.assert_called_once()
 
+    @override_settings(SHUTDOWN_TIMEOUT=0)
+    @data(1, 3)
+    @patch('instance.ssh.remove_known_host_key')
+    def test_terminate_servers(self, max_workers, remove_known_host_key):
+        """
+        Terminate several servers, confirming the deletion of their VMs with a single server list
+        """
+        servers = [ReadyOpenStackServerFactory(_public_ip='127.0.0.1') for unused in range(4)]
+        deleted_server, not_found_server, listed_server, failing_server = servers
+        os_servers = {server.openstack_id: Mock(id=server.openstack_id, status='SHUTOFF') for server in servers}
+        os_servers[not_found_server.openstack_id].delete.side_effect = novaclient.exceptions.NotFound('not-found')
+        os_servers[failing_server.openstack_id].delete.side_effect = novaclient.exceptions.ClientException('Error')
+        nova = Mock()
+        nova.servers.get.side_effect = os_servers.get
+        nova.servers.list.return_value = [os_servers[listed_server.openstack_id]]
+        for server in servers:
+            server.nova = nova
+
+        failed_servers = terminate_servers(servers, max_workers=max_workers, confirm_timeout=0)
+
+        self.assertEqual(failed_servers, [failing_server, listed_server])
+        self.assertEqual(deleted_server.status, ServerStatus.Terminated)
+        self.assertEqual(not_found_server.status, ServerStatus.Terminated)
+        self.assertEqual(listed_server.status, ServerStatus.Ready)
+        self.assertEqual(failing_server.status, ServerStatus.Unknown)
+        for os_server in os_servers.values():
+            os_server.stop.assert_called_once_with()
+            os_server.delete.assert_called_once_with()
+        nova.servers.list.assert_called_once_with()
+        self.assertEqual(remove_known_host_key.call_count, 4)
+
+    @override_settings(SHUTDOWN_TIMEOUT=0)
+    @patch('instance.ssh.remove_known_host_key')
+    def test_terminate_servers_errors(self, remove_known_host_key):
+        """
+        An error while terminating a server is logged, and doesn't prevent the termination of the other servers
+        """
+        servers = [ReadyOpenStackServerFactory(_public_ip='127.0.0.1') for unused in range(3)]
+        ssh_failing_server, status_failing_server, deleted_server = servers
+        remove_known_host_key.side_effect = [RuntimeError('ssh-keygen failed'), None, None]
+        nova = Mock()
+        nova.servers.get.side_effect = lambda openstack_id: Mock(id=openstack_id, status='SHUTOFF')
+        nova.servers.list.return_value = []
+        for server in servers:
+            server.nova = nova
+        status_failing_server._status_to_terminated = Mock(side_effect=WrongStateException('Concurrent change'))
+
+        with patch.object(ssh_failing_server, 'logger') as ssh_failing_logger, \
+                patch.object(status_failing_server, 'logger') as status_failing_logger:
+            failed_servers = terminate_servers(servers, confirm_timeout=0)
+
+        self.assertEqual(failed_servers, [ssh_failing_server, status_failing_server])
+        self.assertEqual(ssh_failing_server.status, ServerStatus.Ready)
+        self.assertEqual(deleted_server.status, ServerStatus.Terminated)
+        ssh_failing_logger.exception.assert_called_once_with('Unable to begin the termination of the server.')
+        status_failing_logger.exception.assert_called_once_with(
+            'Unable to mark the server as terminated after the deletion of its VM.'
+        )
+
+    @patch('instance.models.server.publish_data')
+    def test_save_publishes_update(self, mock_publish_data):
+        """
+        Saving a server publishes an update event to the clients subscribed to the server
+        """
+        server = OpenStackServerFactory()
+        mock_publish_data.reset_mock()
+        server.save()
+        data = {'type': 'server_update', 'server_id': server.pk}
+        mock_publish_data.assert_called_once_with(data)
+        self.assertEqual(get_event_groups(data), ['ws_server_{}'.format(server.pk)])
+
     def test_public_ip_new_server(self):
         """
         A new server doesn't have a public IP
@@ -475,6 +596,22 @@ class OpenStackServerTestCase(TestCase):
         server = BuildingOpenStackServerFactory(os_server_fixture='openstack/api_server_2_active.json')
         self.assertEqual(server.public_ip, '192.168.100.200')
 
+    def test_public_ip_invalidates_load_balancer_configuration(self):
+        """
+        Storing the public IP of an active appserver invalidates the load balancer configuration of its instance
+        """
+        server = BuildingOpenStackServerFactory(os_server_fixture='openstack/api_server_2_active.json')
+        load_balancer = LoadBalancingServerFactory()
+        instance = OpenEdXInstanceFactory(load_balancing_server=load_balancer)
+        make_test_appserver(instance, server=server, is_active=True)
+        backend_configuration = load_balancer.backend_configurations.get()
+        backend_configuration.configuration_version = backend_configuration.invalidated_version
+        backend_configuration.save()
+
+        self.assertEqual(server.public_ip, '192.168.100.200')
+        backend_configuration.refresh_from_db()
+        self.assertGreater(backend_configuration.invalidated_version, backend_configuration.configuration_version)
+
 
 @ddt
 class OpenStackServerStatusTestCase(TestCase):
@@ -27,6 +27,7 @@ from unittest.mock import Mock, patch
 
 import ddt
 from django.db import models
+import responses
 
 import consul
 
@@ -37,9 +38,11 @@ from instance.models.utils import (
     ModelResourceStateDescriptor,
     WrongStateException,
     ConsulAgent,
+    get_consul_client,
 )
 
 # Tests #######################################################################
+from instance.tests.fake_consul import FakeConsulServer
 from instance.tests.utils import skip_unless_consul_running
 
 
@@ -923,6 +926,112 @@ class ConsulAgentTest(TestCase):
         self.client.kv.delete('', recurse=True)
 
 
+class ConsulAgentFakeServerTest(TestCase):
+    """
+    Tests for the ConsulAgent requests, against a fake Consul HTTP API.
+    """
+    def setUp(self):
+        self.client = consul.Consul()
+        self.server = FakeConsulServer(base_uri=self.client.http.base_uri)
+        rsps = responses.RequestsMock()
+        rsps.start()
+        self.addCleanup(rsps.stop)
+        self.addCleanup(rsps.reset)
+        self.server.register(rsps)
+        self.agent = ConsulAgent(prefix='ocim/instances/', client=self.client)
+
+    def test_shared_client(self):
+        """
+        Agents share the same Consul client by default.
+        """
+        self.assertIs(ConsulAgent()._client, get_consul_client())
+        self.assertIs(ConsulAgent(prefix='other/')._client, ConsulAgent()._client)
+        self.assertIs(self.agent._client, self.client)
+
+    def test_create_or_update_dict_check_and_set(self):
+        """
+        A dictionary modified after it was read is read again before being written.
+        """
+        self.server.set_value('ocim/instances/1', {'name': 'old', 'domain': 'old.example.com', 'version': 3})
+        agent = ConsulAgent(prefix='ocim/instances/1', client=self.client)
+        original_put = self.client.kv.put
+
+        def put_after_concurrent_update(*args, **kwargs):
+            """ Modify the dictionary before the first write. """
+            if put.call_count == 1:
+                self.server.set_value('ocim/instances/1', {'name': 'old', 'domain': 'new.example.com', 'version': 4})
+            return original_put(*args, **kwargs)
+
+        with patch.object(self.client.kv, 'put', side_effect=put_after_concurrent_update) as put:
+            self.assertEqual(agent.create_or_update_dict({'name': 'new'}), (5, True))
+
+        self.assertEqual(put.call_count, 2)
+        self.assertEqual(
+            self.server.get_value('ocim/instances/1'),
+            {'name': 'new', 'domain': 'new.example.com', 'version': 5},
+        )
+
+    def test_create_or_update_dicts(self):
+        """
+        The dictionaries are fetched with one request, and written with one transaction per 64 of them.
+        """
+        self.server.set_value('ocim/instances/1', {'name': 'old', 'domain': 'one.example.com', 'version': 3})
+        values = {str(instance_id): {'name': 'instance {}'.format(instance_id)} for instance_id in range(1, 151)}
+
+        results = self.agent.create_or_update_dicts(values)
+
+        self.assertEqual(results['1'], (4, True))
+        self.assertEqual(results['150'], (1, True))
+        self.assertEqual(
+            self.server.get_value('ocim/instances/1'),
+            {'name': 'instance 1', 'domain': 'one.example.com', 'version': 4},
+        )
+        self.assertEqual(self.server.get_value('ocim/instances/150'), {'name': 'instance 150', 'version': 1})
+        self.assertEqual(sorted(self.server.requests), [('GET', '/v1/kv/ocim/instances/')] + [('PUT', '/v1/txn')] * 3)
+
+        # Only the modified dictionaries are written again
+        self.server.requests = []
+        values['2'] = {'name': 'renamed'}
+        results = self.agent.create_or_update_dicts(values)
+        self.assertEqual(results['1'], (4, False))
+        self.assertEqual(results['2'], (2, True))
+        self.assertEqual(sorted(self.server.requests), [('GET', '/v1/kv/ocim/instances/'), ('PUT', '/v1/txn')])
+
+    def test_create_or_update_dicts_conflict(self):
+        """
+        When a dictionary is modified after it was read, the dictionaries of its transaction are updated one by one.
+        """
+        self.server.set_value('ocim/instances/1', {'name': 'old', 'version': 3})
+        original_run_transaction = self.agent._run_transaction
+
+        def run_after_concurrent_update(operations):
+            """ Modify a dictionary before running the transaction. """
+            self.server.set_value('ocim/instances/1', {'name': 'old', 'domain': 'one.example.com', 'version': 7})
+            return original_run_transaction(operations)
+
+        with patch.object(self.agent, '_run_transaction', side_effect=run_after_concurrent_update):
+            results = self.agent.create_or_update_dicts({'1': {'name': 'new'}, '2': {'name': 'two'}})
+
+        self.assertEqual(results, {'1': (8, True), '2': (1, True)})
+        self.assertEqual(
+            self.server.get_value('ocim/instances/1'),
+            {'name': 'new', 'domain': 'one.example.com', 'version': 8},
+        )
+        self.assertEqual(self.server.get_value('ocim/instances/2'), {'name': 'two', 'version': 1})
+
+    def test_delete_trees(self):
+        """
+        The given keys and the keys they prefix are deleted in one transaction.
+        """
+        for key in ('ocim/instances/1', 'ocim/instances/1/legacy', 'ocim/instances/2', 'ocim/instances/3'):
+            self.server.set_value(key, {'version': 1})
+
+        self.assertTrue(self.agent.delete_trees(['1', '2']))
+
+        self.assertEqual(list(self.server.entries), ['ocim/instances/3'])
+        self.assertEqual(self.server.requests, [('PUT', '/v1/txn')])
+
+
 @ddt.ddt
 class PlaybookNameSelectorTestCase(TestCase):
     """
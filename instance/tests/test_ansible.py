@@ -23,9 +23,15 @@ Ansible - Tests
 # Imports #####################################################################
 
 import os.path
-from unittest import mock
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock, skipUnless
 from unittest.mock import patch
 
+from django.test import override_settings
 import yaml
 
 from instance import ansible, utils
@@ -106,6 +112,7 @@ class AnsibleTestCase(TestCase):
 
         with patch('instance.ansible.render_sandbox_creation_command', return_value="ANSIBLE CMD") as mock_render, \
                 patch('instance.ansible.create_temp_dir') as mock_create_temp, \
+                patch('instance.ansible.prepare_venv', return_value='/tmp/venvs/0123456789') as mock_prepare_venv, \
                 patch('instance.ansible.string_to_file_path', return_value='/tmp/string/file'), \
                 patch('subprocess.Popen', return_value=popen_result) as mock_popen:
 
@@ -128,8 +135,9 @@ class AnsibleTestCase(TestCase):
                 requirements_path='/tmp/requirements.txt',
                 playbook_name='playbook_name',
                 remote_username='root',
-                venv_path='/tmp/tempdir/venv'
+                venv_path='/tmp/venvs/0123456789'
             )
+            mock_prepare_venv.assert_called_once_with('/tmp/requirements.txt')
 
             mock_popen.assert_called_once_with(
                 "ANSIBLE CMD", bufsize=1, stdout=-1, stderr=-1, cwd='/play/book', shell=True, env=mock.ANY
@@ -155,10 +163,13 @@ class AnsibleTestCase(TestCase):
             venv_path='/tmp/venv'
         )
         expected = (
-            f"virtualenv -p {ansible.ANSIBLE_PYTHON_PATH} /tmp/venv && "
+            '(flock --shared 9 && '
+            '([ -f /tmp/venv/.complete ] || (flock 9 && ([ -f /tmp/venv/.complete ] || ('
+            f"rm -rf /tmp/venv && virtualenv -p {ansible.ANSIBLE_PYTHON_PATH} /tmp/venv && "
             '/tmp/venv/bin/python -u /tmp/venv/bin/pip install -r /requirements/path.txt && '
+            'touch /tmp/venv/.complete)) && flock --shared 9 && [ -f /tmp/venv/.complete ])) && '
             '/tmp/venv/bin/python -u /tmp/venv/bin/ansible-playbook -i /tmp/inventory/path '
-            '-e @/tmp/vars/path -u root playbook_name'
+            '-e @/tmp/vars/path -u root playbook_name) 9>/tmp/venv.lock'
         )
 
         self.assertEqual(expected, run_playbook_command)
@@ -204,3 +215,123 @@ class AnsibleTestCase(TestCase):
                 self.assertEqual("TEST ąęłźżó", f.read())
         finally:
             os.remove(file_path)
+
+
+class VenvCacheTestCase(TestCase):
+    """
+    Test cases for the cache of virtualenvs used to run ansible
+    """
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        settings_override = override_settings(ANSIBLE_VENV_CACHE_DIR=self.cache_dir, ANSIBLE_VENV_CACHE_SIZE=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.requirements_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.requirements_dir)
+
+    def write_requirements(self, name, contents):
+        """
+        Write a requirements file, and return its path.
+        """
+        path = os.path.join(self.requirements_dir, name)
+        with open(path, 'w') as f:
+            f.write(contents)
+        return path
+
+    def make_venv(self, name, last_used):
+        """
+        Create a fake complete virtualenv in the cache, last used at the timestamp `last_used`.
+        """
+        venv_path = os.path.join(self.cache_dir, name)
+        marker_path = os.path.join(venv_path, ansible.VENV_COMPLETE_MARKER)
+        os.makedirs(venv_path)
+        open(marker_path, 'w').close()
+        os.utime(marker_path, (last_used, last_used))
+        return venv_path
+
+    def test_venv_path_depends_on_requirements(self):
+        """
+        The virtualenv is shared for identical requirements, including the ones of nested requirements files
+        """
+        base_path = self.write_requirements('base.txt', 'ansible==2.8.17\n')
+        path1 = self.write_requirements('requirements1.txt', '-r base.txt\n')
+        path2 = self.write_requirements('requirements2.txt', '-r base.txt\n')
+
+        venv_path = ansible.get_venv_path(path1)
+        self.assertEqual(os.path.dirname(venv_path), self.cache_dir)
+        self.assertEqual(ansible.get_venv_path(path2), venv_path)
+
+        self.write_requirements('base.txt', 'ansible==2.9.0\n')
+        self.assertNotEqual(ansible.get_venv_path(path1), venv_path)
+        self.assertNotEqual(ansible.get_venv_path(base_path), venv_path)
+
+    def test_venv_path_depends_on_python_version(self):
+        """
+        Different Python versions get different virtualenvs
+        """
+        path = self.write_requirements('requirements.txt', 'ansible==2.8.17\n')
+        with patch('instance.ansible.get_python_version', return_value='Python 3.5.2'):
+            venv_path = ansible.get_venv_path(path)
+        with patch('instance.ansible.get_python_version', return_value='Python 3.8.10'):
+            self.assertNotEqual(ansible.get_venv_path(path), venv_path)
+
+    def test_evict_least_recently_used(self):
+        """
+        The least recently used virtualenvs are removed, unless they are in use
+        """
+        now = time.time()
+        oldest = self.make_venv('oldest', now - 300)
+        in_use = self.make_venv('in_use', now - 200)
+        recent = self.make_venv('recent', now - 100)
+        current = os.path.join(self.cache_dir, 'current')
+
+        with open('{}.lock'.format(in_use), 'w') as lock_file:
+            ansible.fcntl.flock(lock_file, ansible.fcntl.LOCK_SH)
+            ansible.evict_venvs(keep_path=current)
+
+        self.assertFalse(os.path.exists(oldest))
+        self.assertTrue(os.path.exists(in_use))
+        self.assertTrue(os.path.exists(recent))
+
+    def test_prepare_venv_marks_used(self):
+        """
+        Preparing a cached virtualenv marks it as the most recently used one
+        """
+        path = self.write_requirements('requirements.txt', 'ansible==2.8.17\n')
+        venv_path = self.make_venv(os.path.basename(ansible.get_venv_path(path)), time.time() - 300)
+        other = self.make_venv('other', time.time() - 100)
+        newest = self.make_venv('newest', time.time() - 50)
+
+        self.assertEqual(ansible.prepare_venv(path), venv_path)
+        self.assertTrue(os.path.exists(venv_path))
+        self.assertTrue(os.path.exists(newest))
+        self.assertFalse(os.path.exists(other))
+
+    @skipUnless(shutil.which('virtualenv') and shutil.which('flock'), 'virtualenv and flock are required')
+    def test_build_venv_once(self):
+        """
+        Concurrent runs build the virtualenv once, from a local wheelhouse
+        """
+        wheelhouse = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, wheelhouse)
+        path = self.write_requirements('requirements.txt', '--no-index\n--find-links {}\n'.format(wheelhouse))
+        venv_path = ansible.prepare_venv(path)
+        build_cmd = '(flock --shared 9 && {} && echo built) 9>{}.lock'.format(
+            ansible.render_venv_creation_command(path, venv_path), venv_path,
+        )
+        build_cmd = build_cmd.replace('touch', 'echo building && touch')
+
+        def build(_):
+            """ Run the build command, and return its output """
+            return subprocess.check_output(build_cmd, shell=True).decode('utf-8')
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            outputs = list(executor.map(build, range(4)))
+
+        self.assertEqual(sum(output.count('building') for output in outputs), 1)
+        self.assertTrue(all(output.strip().endswith('built') for output in outputs))
+        self.assertTrue(os.path.exists(os.path.join(venv_path, ansible.VENV_COMPLETE_MARKER)))
+        self.assertTrue(os.path.exists(os.path.join(venv_path, 'bin/python')))
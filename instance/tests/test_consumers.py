@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Websocket consumers - Tests
+"""
+
+# Imports #####################################################################
+
+import asyncio
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.test import SimpleTestCase, override_settings
+
+from instance.consumers import TokenBucket, WebSocketListener, can_subscribe, get_user_broadcast_group
+from instance.tests.base import WithUserTestCase
+from instance.tests.models.factories.openedx_appserver import make_test_appserver
+from instance.tests.models.factories.openedx_instance import OpenEdXInstanceFactory
+from instance.utils import publish_data
+
+
+# Tests #######################################################################
+
+@patch(
+    'instance.tests.models.factories.openedx_instance.OpenEdXInstance._write_metadata_to_consul',
+    return_value=(1, True)
+)
+class WebSocketPermissionsTestCase(WithUserTestCase):
+    """
+    Test cases for the permission checks of the websocket consumer.
+    """
+    def test_broadcast_group(self, mock_consul):
+        """
+        Superusers receive the updates of all instances, instance managers those of their organization.
+        """
+        self.assertIsNone(get_user_broadcast_group(AnonymousUser()))
+        self.assertIsNone(get_user_broadcast_group(self.user1))
+        self.assertEqual(get_user_broadcast_group(self.user3), 'ws_superusers')
+        self.assertEqual(get_user_broadcast_group(self.user4), 'ws_organization_{}'.format(self.organization2.pk))
+        self.assertIsNone(get_user_broadcast_group(self.user5))
+
+    def test_can_subscribe(self, mock_consul):
+        """
+        Users can only subscribe to the objects of their organization, unless they are superusers.
+        """
+        appserver = make_test_appserver(organization=self.organization2)
+        other_appserver = make_test_appserver()
+        for kind, pk, other_pk in (
+                ('instance', appserver.owner.pk, other_appserver.owner.pk),
+                ('appserver', appserver.pk, other_appserver.pk),
+                ('server', appserver.server.pk, other_appserver.server.pk),
+        ):
+            self.assertTrue(can_subscribe(self.user4, kind, pk))
+            self.assertFalse(can_subscribe(self.user4, kind, other_pk))
+            self.assertTrue(can_subscribe(self.user3, kind, other_pk))
+            self.assertFalse(can_subscribe(self.user5, kind, pk))
+
+
+class TokenBucketTestCase(SimpleTestCase):
+    """
+    Test cases for TokenBucket.
+    """
+    @patch('instance.consumers.time.monotonic')
+    def test_rate_limit(self, mock_monotonic):
+        """
+        Up to `burst` actions are allowed at once, then `rate` actions per second.
+        """
+        mock_monotonic.return_value = 100
+        bucket = TokenBucket(rate=2, burst=3)
+        self.assertEqual([bucket.consume() for dummy in range(4)], [True, True, True, False])
+        mock_monotonic.return_value = 100.5
+        self.assertEqual([bucket.consume() for dummy in range(2)], [True, False])
+        mock_monotonic.return_value = 110
+        self.assertEqual([bucket.consume() for dummy in range(4)], [True, True, True, False])
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    WEBSOCKET_RATE_LIMIT=1,
+    WEBSOCKET_RATE_LIMIT_BURST=6,
+    WEBSOCKET_MAX_SUBSCRIPTIONS=2,
+)
+@patch('instance.consumers.can_subscribe', return_value=True)
+@patch('instance.consumers.get_user_broadcast_group', return_value='ws_superusers')
+class WebSocketListenerTestCase(SimpleTestCase):
+    """
+    Test cases for the websocket consumer.
+
+    The permission checks are tested in WebSocketPermissionsTestCase.
+    """
+    @staticmethod
+    async def connect():
+        """
+        Connect a websocket client.
+        """
+        communicator = WebsocketCommunicator(WebSocketListener, '/ws/')
+        communicator.scope['user'] = AnonymousUser()
+        connected, dummy = await communicator.connect()
+        return connected, communicator
+
+    def test_connect_denied(self, mock_get_user_broadcast_group, mock_can_subscribe):
+        """
+        Users who can't manage instances can't connect.
+        """
+        mock_get_user_broadcast_group.return_value = None
+
+        async def run():
+            connected, dummy = await self.connect()
+            self.assertFalse(connected)
+
+        async_to_sync(run)()
+
+    def test_updates_are_broadcast(self, mock_get_user_broadcast_group, mock_can_subscribe):
+        """
+        Update events are sent to every client allowed to see them, log lines only to the subscribed clients.
+        """
+        async def run():
+            connected, client = await self.connect()
+            self.assertTrue(connected)
+            connected, subscriber = await self.connect()
+            self.assertTrue(connected)
+
+            await subscriber.send_json_to({'action': 'subscribe', 'appserver_id': 12})
+            self.assertEqual(await subscriber.receive_json_from(), {
+                'type': 'subscription',
+                'message': {'type': 'subscribed', 'request': {'action': 'subscribe', 'appserver_id': 12}},
+            })
+            mock_can_subscribe.assert_called_once_with(subscriber.scope['user'], 'appserver', 12)
+
+            channel_layer = get_channel_layer()
+            update = {'type': 'openedx_appserver_update', 'appserver_id': 12, 'instance_id': 3}
+            await channel_layer.group_send('ws_superusers', {'type': 'notification', 'message': update})
+            log_lines = {'type': 'object_log_lines', 'appserver_id': 12, 'instance_id': 3, 'log_entries': []}
+            await channel_layer.group_send('ws_appserver_12', {'type': 'notification', 'message': log_lines})
+
+            self.assertEqual(await client.receive_json_from(), {'type': 'notification', 'message': update})
+            self.assertTrue(await client.receive_nothing())
+            self.assertEqual(await subscriber.receive_json_from(), {'type': 'notification', 'message': update})
+            self.assertEqual(await subscriber.receive_json_from(), {'type': 'notification', 'message': log_lines})
+
+            await subscriber.send_json_to({'action': 'unsubscribe', 'appserver_id': 12})
+            self.assertEqual((await subscriber.receive_json_from())['message']['type'], 'unsubscribed')
+            await channel_layer.group_send('ws_appserver_12', {'type': 'notification', 'message': log_lines})
+            self.assertTrue(await subscriber.receive_nothing())
+
+            await client.disconnect()
+            await subscriber.disconnect()
+
+        async_to_sync(run)()
+
+    def test_invalid_requests(self, mock_get_user_broadcast_group, mock_can_subscribe):
+        """
+        Invalid, denied and excessive subscription requests get an error.
+        """
+        mock_can_subscribe.side_effect = lambda user, kind, pk: pk != 666
+
+        async def request_error(client, content):
+            await client.send_json_to(content)
+            message = (await client.receive_json_from())['message']
+            self.assertEqual(message['type'], 'error')
+            return message['error']
+
+        async def run():
+            dummy, client = await self.connect()
+            self.assertEqual(await request_error(client, {'action': 'publish'}), 'Unknown action.')
+            self.assertEqual(
+                await request_error(client, {'action': 'subscribe', 'instance_id': 1, 'appserver_id': 2}),
+                'Exactly one object ID is required.'
+            )
+            self.assertEqual(
+                await request_error(client, {'action': 'subscribe', 'instance_id': 666}),
+                'Permission denied.'
+            )
+            for pk in (1, 2):
+                await client.send_json_to({'action': 'subscribe', 'instance_id': pk})
+                self.assertEqual((await client.receive_json_from())['message']['type'], 'subscribed')
+            self.assertEqual(
+                await request_error(client, {'action': 'subscribe', 'instance_id': 3}),
+                'Too many subscriptions.'
+            )
+            # The burst of 6 messages is exhausted
+            self.assertEqual(
+                await request_error(client, {'action': 'unsubscribe', 'instance_id': 1}),
+                'Too many messages.'
+            )
+            await client.disconnect()
+
+        async_to_sync(run)()
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class PublishDataTestCase(SimpleTestCase):
+    """
+    Test cases for publish_data().
+    """
+    def test_routing(self):
+        """
+        Update events go to the superusers and the organization, log lines to the most specific object.
+        """
+        channel_layer = get_channel_layer()
+        groups = ('ws_superusers', 'ws_organization_4', 'ws_organization_5', 'ws_instance_3', 'ws_appserver_12')
+        channels = {}
+        for group in groups:
+            channels[group] = async_to_sync(channel_layer.new_channel)()
+            async_to_sync(channel_layer.group_add)(group, channels[group])
+
+        update = {'type': 'instance_update', 'instance_id': 3}
+        publish_data(update, organization_id=4)
+        log_lines = {'type': 'object_log_lines', 'instance_id': 3, 'appserver_id': 12, 'log_entries': []}
+        publish_data(log_lines)
+
+        for group, expected_message in (
+                ('ws_superusers', update),
+                ('ws_organization_4', update),
+                ('ws_appserver_12', log_lines),
+        ):
+            self.assertEqual(
+                async_to_sync(channel_layer.receive)(channels[group]),
+                {'type': 'notification', 'message': expected_message}
+            )
+
+        async def receive_nothing(channel):
+            try:
+                await asyncio.wait_for(channel_layer.receive(channel), timeout=0.1)
+            except asyncio.TimeoutError:
+                return True
+            return False
+
+        for group in groups:
+            self.assertTrue(async_to_sync(receive_nothing)(channels[group]))
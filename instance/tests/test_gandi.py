@@ -25,10 +25,12 @@ Gandi - Tests
 from unittest.mock import call, MagicMock, patch
 
 from django.conf import settings
+import responses
 
 from instance import gandi
 from instance.gandi import GandiV5API
 from instance.tests.base import TestCase
+from instance.tests.fake_gandi_client import FakeGandiLiveDNSServer
 
 
 # Tests #######################################################################
@@ -220,3 +222,88 @@ class GandiV5TestCase(TestCase):
         self.api.remove_dns_record('sub.domain.test.com', type='A', value='1.2.3.4')
 
         mocked_cache.delete.assert_called_once_with('test.com-A')
+
+
+class GandiV5BatchTestCase(TestCase):
+    """
+    Test cases for batched DNS record changes, against a fake LiveDNS API.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.api = gandi.GandiV5API(api_key='api-key')
+        self.api._domain_cache = ['test.com', 'example.com']
+        self.server = FakeGandiLiveDNSServer(['test.com', 'example.com'])
+        self.server.zones['test.com'][('vm2.instance', 'A')] = {
+            'rrset_name': 'vm2.instance', 'rrset_type': 'A', 'rrset_ttl': 1200, 'rrset_values': ['5.6.7.8'],
+        }
+        rsps = responses.RequestsMock(assert_all_requests_are_fired=False)
+        rsps.start()
+        self.addCleanup(rsps.stop)
+        self.addCleanup(rsps.reset)
+        self.server.register(rsps)
+
+    def test_update_dns_records(self):
+        """
+        Records of several zones are set and removed, authenticating once per zone.
+        """
+        self.api.update_dns_records(
+            set_records=[
+                ('vm1.instance.test.com', dict(type='A', value='1.2.3.4')),
+                ('instance.example.com', dict(type='CNAME', value='lb.test.com.', ttl=300)),
+            ],
+            remove_records=[('vm2.instance.test.com', dict(type='A'))],
+        )
+        self.assertEqual(self.server.get_records('test.com', 'A'), {'vm1.instance': ['1.2.3.4']})
+        self.assertEqual(self.server.get_records('example.com', 'CNAME'), {'instance': ['lb.test.com.']})
+        self.assertEqual(self.server.zones['test.com'][('vm1.instance', 'A')]['rrset_ttl'], 1200)
+        self.assertEqual(self.server.zones['example.com'][('instance', 'CNAME')]['rrset_ttl'], 300)
+        self.assertEqual(self.server.requests.count(('GET', '/domains/test.com')), 1)
+        self.assertEqual(self.server.requests.count(('GET', '/domains/example.com')), 1)
+
+    def test_update_dns_records_replaces_existing(self):
+        """
+        Setting an existing record replaces its value.
+        """
+        self.api.update_dns_records(set_records=[('vm2.instance.test.com', dict(type='A', value='1.2.3.4'))])
+        self.assertEqual(self.server.get_records('test.com', 'A'), {'vm2.instance': ['1.2.3.4']})
+
+    @patch('instance.gandi.cache')
+    def test_update_dns_records_zone_locks(self, mocked_cache):
+        """
+        The changes of each zone are made while holding the lock of the zone only.
+        """
+        self.api.update_dns_records(set_records=[
+            ('vm1.instance.test.com', dict(type='A', value='1.2.3.4')),
+            ('vm3.instance.test.com', dict(type='A', value='1.2.3.5')),
+            ('instance.example.com', dict(type='CNAME', value='lb.test.com.')),
+        ])
+        self.assertCountEqual(mocked_cache.lock.call_args_list, [
+            call('gandi_dns_zone_test.com', timeout=settings.REDIS_LOCK_TIMEOUT),
+            call('gandi_dns_zone_example.com', timeout=settings.REDIS_LOCK_TIMEOUT),
+        ])
+        mocked_cache.delete.assert_has_calls([call('test.com-A'), call('example.com-CNAME')], any_order=True)
+
+    @patch('time.sleep')
+    def test_update_dns_records_retry(self, mocked_sleep):
+        """
+        When a request fails, all the changes of the zone are retried.
+        """
+        self.server.fail_requests = 2
+        self.api.update_dns_records(
+            set_records=[('vm1.instance.test.com', dict(type='A', value='1.2.3.4'))],
+            remove_records=[('vm2.instance.test.com', dict(type='A'))],
+        )
+        self.assertEqual(self.server.get_records('test.com', 'A'), {'vm1.instance': ['1.2.3.4']})
+        self.assertEqual(mocked_sleep.call_count, 2)
+
+    def test_update_dns_records_unknown_domain(self):
+        """
+        No change is made if one of the domains doesn't belong to a zone of the account.
+        """
+        with self.assertRaises(ValueError):
+            self.api.update_dns_records(set_records=[
+                ('vm1.instance.test.com', dict(type='A', value='1.2.3.4')),
+                ('instance.unknown.com', dict(type='A', value='1.2.3.4')),
+            ])
+        self.assertEqual(self.server.requests, [])
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Shared HTTP sessions - Tests
+"""
+
+# Imports #####################################################################
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import threading
+import time
+
+from django.test import override_settings
+import requests
+
+from instance import http_client
+from instance.tests.base import TestCase
+
+
+# Stub server #################################################################
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answers every request with a JSON body, after the server's delay, or with the server's queued statuses.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """
+        Answer the request.
+        """
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+            server.running_requests += 1
+            server.max_running_requests = max(server.max_running_requests, server.running_requests)
+            status = server.statuses.pop(0) if server.statuses else 200
+        time.sleep(server.delay)
+        with server.lock:
+            server.running_requests -= 1
+        body = b'{}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_PUT = do_GET
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """
+        Don't log the requests.
+        """
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """
+    Local HTTP server counting the connections opened to it, and the requests running at once.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.lock = threading.Lock()
+        self.connection_count = 0
+        self.request_count = 0
+        self.running_requests = 0
+        self.max_running_requests = 0
+        self.statuses = []
+        self.delay = 0
+
+    @property
+    def url(self):
+        """
+        The base URL of the server.
+        """
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connection_count += 1
+        super().process_request(request, client_address)
+
+
+# Tests #######################################################################
+
+@override_settings(HTTP_CLIENT_MAX_CONCURRENCY_PER_HOST=2, HTTP_CLIENT_RETRIES=2)
+class HTTPClientTestCase(TestCase):
+    """
+    Test cases for the shared HTTP sessions.
+    """
+    def setUp(self):
+        super().setUp()
+        self.server = StubServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        http_client.close_sessions()
+        self.addCleanup(http_client.close_sessions)
+
+    def test_connections_reused(self):
+        """
+        Consecutive requests to the same host reuse the same connection.
+        """
+        for path in ('vhosts/a', 'users/a', 'users/b', 'permissions/a/a', 'permissions/a/b', 'overview'):
+            response = http_client.request('PUT', '{}/api/{}'.format(self.server.url, path))
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.server.request_count, 6)
+        self.assertEqual(self.server.connection_count, 1)
+
+        # Without the shared session, each request opens a new connection
+        for _ in range(3):
+            requests.get(self.server.url)
+        self.assertEqual(self.server.connection_count, 4)
+
+    def test_sessions_per_host(self):
+        """
+        Requests to the same host share a session, and requests to other hosts don't.
+        """
+        session = http_client.get_session('https://api.newrelic.com/v2/alerts_policies.json')
+        self.assertIs(http_client.get_session('https://API.newrelic.com/v2/alerts_channels.json'), session)
+        self.assertIsNot(http_client.get_session('https://synthetics.newrelic.com/synthetics/api/v3'), session)
+        self.assertIsNot(http_client.get_session('http://api.newrelic.com/v2'), session)
+
+    def test_concurrency_limit(self):
+        """
+        At most `HTTP_CLIENT_MAX_CONCURRENCY_PER_HOST` requests to a host run at once.
+        """
+        self.server.delay = 0.1
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            responses = list(executor.map(
+                lambda index: http_client.request('GET', '{}/{}'.format(self.server.url, index)), range(8)
+            ))
+        self.assertEqual([response.status_code for response in responses], [200] * 8)
+        self.assertEqual(self.server.max_running_requests, 2)
+        self.assertLessEqual(self.server.connection_count, 2)
+
+    def test_retry(self):
+        """
+        Idempotent requests are retried on 5xx responses, and the last response is returned once
+        the retries are exhausted.
+        """
+        self.server.statuses = [503]
+        self.assertEqual(http_client.request('GET', self.server.url).status_code, 200)
+        self.assertEqual(self.server.request_count, 2)
+
+        self.server.statuses = [503, 502, 500]
+        self.assertEqual(http_client.request('GET', self.server.url).status_code, 500)
+        self.assertEqual(self.server.request_count, 5)
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+MySQL connection pool - Tests
+"""
+
+# Imports #####################################################################
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+from unittest.mock import Mock, patch
+
+from django.test import override_settings
+
+from instance import mysql_pool
+from instance.mysql_pool import MySQLConnectionPool, execute_batch, get_mysql_pool
+from instance.tests.base import TestCase
+
+
+# Fakes #######################################################################
+
+class FakeConnection:
+    """
+    A fake MySQL connection, which can be made unhealthy.
+    """
+    def __init__(self):
+        self.healthy = True
+        self.closed = False
+
+    def ping(self):
+        """
+        Check the connection.
+        """
+        if not self.healthy:
+            raise OSError('MySQL server has gone away')
+
+    def close(self):
+        """
+        Close the connection.
+        """
+        self.closed = True
+
+
+class FakeConnector:
+    """
+    Opens fake connections, counting them and how many are in use at once.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = []
+        self.in_use = 0
+        self.max_in_use = 0
+
+    def __call__(self):
+        connection = FakeConnection()
+        with self.lock:
+            self.connections.append(connection)
+        return connection
+
+    def use(self, pool, duration=0):
+        """
+        Use a connection of the pool for the given duration.
+        """
+        with pool.connection() as connection:
+            with self.lock:
+                self.in_use += 1
+                self.max_in_use = max(self.max_in_use, self.in_use)
+            time.sleep(duration)
+            with self.lock:
+                self.in_use -= 1
+            return connection
+
+
+# Tests #######################################################################
+
+class MySQLConnectionPoolTestCase(TestCase):
+    """
+    Test cases for the MySQL connection pool.
+    """
+    def setUp(self):
+        super().setUp()
+        self.connector = FakeConnector()
+        self.pool = MySQLConnectionPool(self.connector, max_size=2, health_check_interval=30, max_idle_time=600)
+
+    def test_connection_reused(self):
+        """
+        Released connections are reused.
+        """
+        connection = self.connector.use(self.pool)
+        self.assertIs(self.connector.use(self.pool), connection)
+        self.assertEqual(len(self.connector.connections), 1)
+
+    def test_connection_discarded_after_error(self):
+        """
+        Connections used by a block which raised an exception are closed.
+        """
+        with self.assertRaises(ValueError):
+            with self.pool.connection() as connection:
+                raise ValueError('Failed')
+        self.assertTrue(connection.closed)
+        self.assertIsNot(self.connector.use(self.pool), connection)
+
+    @patch('instance.mysql_pool.time.monotonic')
+    def test_health_check(self, mock_monotonic):
+        """
+        Connections idle for a while are checked before being reused, and closed if they are broken or
+        have been idle for too long.
+        """
+        mock_monotonic.return_value = 1000
+        connection = self.connector.use(self.pool)
+
+        # Recently used: reused without check, even if it's broken
+        connection.healthy = False
+        mock_monotonic.return_value = 1010
+        self.assertIs(self.connector.use(self.pool), connection)
+
+        # Idle for a while: checked, and replaced since it's broken
+        mock_monotonic.return_value = 1050
+        new_connection = self.connector.use(self.pool)
+        self.assertIsNot(new_connection, connection)
+        self.assertTrue(connection.closed)
+
+        # Idle for a while and healthy: reused
+        mock_monotonic.return_value = 1100
+        self.assertIs(self.connector.use(self.pool), new_connection)
+
+        # Idle for too long: replaced
+        mock_monotonic.return_value = 2000
+        self.assertIsNot(self.connector.use(self.pool), new_connection)
+        self.assertTrue(new_connection.closed)
+        self.assertEqual(len(self.connector.connections), 3)
+
+    def test_max_size(self):
+        """
+        At most `max_size` connections are used at once, by any number of threads.
+        """
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _: self.connector.use(self.pool, duration=0.05), range(16)))
+        self.assertEqual(self.connector.max_in_use, 2)
+        self.assertEqual(len(self.connector.connections), 2)
+
+    def test_close(self):
+        """
+        Closing the pool closes its idle connections.
+        """
+        connection = self.connector.use(self.pool)
+        self.pool.close()
+        self.assertTrue(connection.closed)
+        self.assertIsNot(self.connector.use(self.pool), connection)
+
+    @override_settings(MYSQL_CONNECTION_POOL_SIZE=3)
+    def test_get_mysql_pool(self):
+        """
+        Servers with the same address and credentials share a pool.
+        """
+        self.addCleanup(mysql_pool.close_mysql_pools)
+        server = Mock(hostname='mysql.example.com', port=3306, username='admin', password='secret')
+        same_server = Mock(hostname='mysql.example.com', port=3306, username='admin', password='secret')
+        pool = get_mysql_pool(server)
+        self.assertIs(get_mysql_pool(same_server), pool)
+        server.password = 'changed'
+        self.assertIsNot(get_mysql_pool(server), pool)
+
+    def test_execute_batch(self):
+        """
+        The statements are sent as a single query, and all their results are read.
+        """
+        cursor = Mock()
+        cursor.nextset.side_effect = [1, 1, None]
+        execute_batch(cursor, [
+            ('CREATE DATABASE IF NOT EXISTS `db`', ()),
+            ('CREATE USER %s IDENTIFIED BY %s', ('user', 'password')),
+            ('GRANT ALL ON `db`.* TO %s', ('user',)),
+        ])
+        cursor.execute.assert_called_once_with(
+            'CREATE DATABASE IF NOT EXISTS `db`;\n'
+            'CREATE USER %s IDENTIFIED BY %s;\n'
+            'GRANT ALL ON `db`.* TO %s',
+            ['user', 'password', 'user'],
+        )
+        self.assertEqual(cursor.nextset.call_count, 3)
+
+        cursor.reset_mock()
+        execute_batch(cursor, [])
+        cursor.execute.assert_not_called()
@@ -23,11 +23,15 @@ OpenStack Utilities - Tests
 # Imports #####################################################################
 
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
 from unittest import mock
 from unittest.mock import Mock, call, patch, MagicMock
 
 import ddt
 from django.conf import settings
+from django.test import override_settings
 from openstack.network.v2.security_group import SecurityGroup
 from openstack.network.v2.security_group_rule import SecurityGroupRule
 from swiftclient.service import SwiftError
@@ -88,6 +92,8 @@ class OpenStackTestCase(TestCase):
         super().setUp()
 
         self.nova = Mock()
+        openstack_utils.client_registry.clear()
+        self.addCleanup(openstack_utils.client_registry.clear)
 
     def test_get_openstack_connection(self):
         """
@@ -100,6 +106,50 @@ class OpenStackTestCase(TestCase):
         # TODO: In future we could use 'mimic' to fake the OpenStack API for testing.
         # Then, here we could test 'conn.authorize()'
 
+    def test_get_openstack_connection_shared(self):
+        """
+        Connections are shared for a given region, and created separately for other regions
+        """
+        conn = openstack_utils.get_openstack_connection("some_region")
+        self.assertIs(openstack_utils.get_openstack_connection("some_region"), conn)
+        self.assertIsNot(openstack_utils.get_openstack_connection("other_region"), conn)
+
+    @patch('instance.openstack_utils.create_nova_client')
+    def test_get_nova_client_shared(self, mock_create_nova_client):
+        """
+        A single nova client is created per region and credentials, even when requested by several threads
+        """
+        mock_create_nova_client.side_effect = lambda region_name, api_version: Mock(region_name=region_name)
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            clients = list(executor.map(openstack_utils.get_nova_client, ['some_region'] * 50))
+        self.assertEqual(len({id(client) for client in clients}), 1)
+        self.assertEqual(mock_create_nova_client.mock_calls, [call('some_region', 2)])
+
+        other_region_client = openstack_utils.get_nova_client('other_region')
+        self.assertEqual(other_region_client.region_name, 'other_region')
+        with override_settings(OPENSTACK_PASSWORD='new-password'):
+            self.assertIsNot(openstack_utils.get_nova_client('some_region'), clients[0])
+        self.assertEqual(mock_create_nova_client.call_count, 3)
+
+    @ddt.data(
+        (True, 1),
+        (False, 0),
+    )
+    @ddt.unpack
+    @patch('instance.openstack_utils.create_nova_client')
+    def test_get_nova_client_refresh_token(self, expires_soon, expected_invalidate_calls, mock_create_nova_client):
+        """
+        Tokens about to expire are invalidated before a shared client is handed out again
+        """
+        nova = openstack_utils.get_nova_client('some_region')
+        auth = nova.client.session.auth
+        auth.auth_ref.will_expire_soon.return_value = expires_soon
+
+        self.assertIs(openstack_utils.get_nova_client('some_region'), nova)
+        auth.auth_ref.will_expire_soon.assert_called_once_with(settings.OPENSTACK_TOKEN_REFRESH_MARGIN)
+        self.assertEqual(auth.invalidate.call_count, expected_invalidate_calls)
+        self.assertEqual(mock_create_nova_client.call_count, 1)
+
     RULE1_DICT = {
         "direction": "egress", "ether_type": "IPv6", "protocol": None,
         "port_range_min": None, "port_range_max": None,
@@ -311,6 +361,101 @@ class OpenStackTestCase(TestCase):
         self.assertEqual(mock_retry_sleep.call_count, 10)
 
 
+class ServerStatusPollerTestCase(TestCase):
+    """
+    Test cases for ServerStatusPoller
+    """
+    def setUp(self):
+        super().setUp()
+        self.poller = openstack_utils.ServerStatusPoller()
+        self.nova = Mock()
+        self.nova.servers.list.return_value = [Mock(id='server1'), Mock(id='server2')]
+
+    def test_get_server_shared_list(self):
+        """
+        Threads asking for servers while the servers are being listed share the same list
+        """
+        def slow_list():
+            """ Give the other threads the time to ask for their server """
+            time.sleep(0.2)
+            return [Mock(id='server{}'.format(num)) for num in range(10)]
+        self.nova.servers.list.side_effect = slow_list
+
+        openstack_ids = ['server{}'.format(num % 10) for num in range(30)]
+        with ThreadPoolExecutor(max_workers=30) as executor:
+            servers = list(executor.map(
+                lambda openstack_id: self.poller.get_server(self.nova, openstack_id, max_age=60),
+                openstack_ids
+            ))
+        self.assertEqual([server.id for server in servers], openstack_ids)
+        self.assertEqual(self.nova.servers.list.call_count, 1)
+
+    @patch('instance.openstack_utils.time.monotonic')
+    def test_get_server_max_age(self, mock_monotonic):
+        """
+        The servers are only listed again once the previous list is older than max_age
+        """
+        mock_monotonic.return_value = 100
+        self.assertEqual(self.poller.get_server(self.nova, 'server1', max_age=5).id, 'server1')
+        mock_monotonic.return_value = 105
+        self.assertEqual(self.poller.get_server(self.nova, 'server2', max_age=5).id, 'server2')
+        self.assertEqual(self.nova.servers.list.call_count, 1)
+        mock_monotonic.return_value = 106
+        self.assertEqual(self.poller.get_server(self.nova, 'server2', max_age=5).id, 'server2')
+        self.assertEqual(self.nova.servers.list.call_count, 2)
+
+    def test_get_server_not_listed(self):
+        """
+        None is returned for servers which aren't listed
+        """
+        self.assertIsNone(self.poller.get_server(self.nova, 'server3', max_age=5))
+
+    def test_get_server_list_error(self):
+        """
+        When listing the servers fails, the error is raised and the next call lists the servers again
+        """
+        self.nova.servers.list.side_effect = [keystoneauth1.exceptions.ConnectFailure, [Mock(id='server1')]]
+        with self.assertRaises(keystoneauth1.exceptions.ConnectFailure):
+            self.poller.get_server(self.nova, 'server1', max_age=5)
+        self.assertEqual(self.poller.get_server(self.nova, 'server1', max_age=5).id, 'server1')
+
+    def test_wait_for_update(self):
+        """
+        Waiting threads are woken up as soon as the servers are listed
+        """
+        waiting = threading.Event()
+
+        def wait():
+            """ Wait for an update, much longer than this test is expected to take """
+            waiting.set()
+            start = time.monotonic()
+            self.poller.wait_for_update(60)
+            return time.monotonic() - start
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(wait)
+            waiting.wait()
+            time.sleep(0.1)
+            self.poller.get_server(self.nova, 'server1', max_age=5)
+            self.assertLess(future.result(timeout=10), 10)
+
+    def test_wait_for_update_timeout(self):
+        """
+        Waiting returns after the timeout when the servers aren't listed meanwhile
+        """
+        start = time.monotonic()
+        self.poller.wait_for_update(0.1)
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+    def test_get_server_status_poller(self):
+        """
+        A poller is shared by all the servers of a region
+        """
+        poller = openstack_utils.get_server_status_poller('some_region')
+        self.assertIs(openstack_utils.get_server_status_poller('some_region'), poller)
+        self.assertIsNot(openstack_utils.get_server_status_poller('other_region'), poller)
+
+
 @ddt.ddt
 class SwiftTestCase(TestCase):
     """Tests for various swift functions."""
@@ -23,7 +23,14 @@ Git repository - Tests
 # Imports #####################################################################
 
 import os.path
-from unittest.mock import call, patch
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import git
+from django.test import override_settings
 
 from instance import repo
 from instance.tests.base import TestCase
@@ -35,16 +42,144 @@ class RepoTestCase(TestCase):
     """
     Test cases for Git repository helper functions
     """
-    @patch('git.Git')
-    @patch('git.repo.base.Repo.clone_from')
-    def test_open_repository(self, mock_clone_from, mock_git_class):
-        """
-        Get a repo object on a temporary directory
-        """
-        tmp_dir_path = None
-        with repo.open_repository('http://example.com/repo.git', ref='test-branch') as mock_repo:
-            tmp_dir_path = mock_clone_from.mock_calls[0][1][1]
-            mock_clone_from.assert_called_once_with('http://example.com/repo.git', tmp_dir_path)
-            self.assertTrue(os.path.isdir(tmp_dir_path))
-            self.assertEqual(mock_repo.mock_calls, [call.checkout('test-branch')])
-        self.assertFalse(os.path.isdir(tmp_dir_path))
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        settings_override = override_settings(REPO_CACHE_DIR=self.cache_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        # Local repository to mirror, so the tests don't need network access
+        self.origin_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.origin_dir)
+        self.origin = git.Repo.init(self.origin_dir)
+        self.origin.git.checkout('-b', 'test-branch')
+        self.origin_url = 'file://{}'.format(self.origin_dir)
+        self.first_commit = self.commit_file('VERSION', 'v1')
+
+    def commit_file(self, name, content):
+        """
+        Commit a file to the origin repository, and return the commit hash.
+        """
+        with open(os.path.join(self.origin_dir, name), 'w') as f:
+            f.write(content)
+        self.origin.index.add([name])
+        actor = git.Actor('Test', 'test@example.com')
+        return self.origin.index.commit('Update {}'.format(name), author=actor, committer=actor).hexsha
+
+    def read_file(self, name, ref='test-branch'):
+        """
+        Read a file from a checkout of the origin repository at `ref`.
+        """
+        with repo.open_repository(self.origin_url, ref=ref) as checkout:
+            with open(os.path.join(checkout.working_dir, name)) as f:
+                return f.read()
+
+    def test_open_repository(self):
+        """
+        Get a repo object on a worktree of the local mirror, which is removed afterwards
+        """
+        with repo.open_repository(self.origin_url, ref='test-branch') as checkout:
+            working_dir = checkout.working_dir
+            self.assertTrue(working_dir.startswith(os.path.join(self.cache_dir, 'worktrees')))
+            self.assertEqual(checkout.rev_parse('HEAD'), self.first_commit)
+        self.assertFalse(os.path.isdir(working_dir))
+        self.assertTrue(os.path.isdir(repo.get_mirror_path(self.origin_url)))
+
+    @patch('git.repo.base.Repo.clone_from', wraps=git.repo.base.Repo.clone_from)
+    def test_open_repository_fetches_incrementally(self, mock_clone_from):
+        """
+        The repository is only cloned once, and new commits are fetched into the mirror
+        """
+        self.assertEqual(self.read_file('VERSION'), 'v1')
+        self.commit_file('VERSION', 'v2')
+        self.assertEqual(self.read_file('VERSION'), 'v2')
+        self.assertEqual(self.read_file('VERSION', ref=self.first_commit), 'v1')
+        self.assertEqual(mock_clone_from.call_count, 1)
+
+    def test_open_repository_unknown_ref(self):
+        """
+        An error is raised for references that don't exist
+        """
+        with self.assertRaises(ValueError):
+            with repo.open_repository(self.origin_url, ref='unknown-branch'):
+                pass
+
+    def test_open_repository_remote_tracking_ref(self):
+        """
+        Remote-tracking references are resolved as the branches of the mirror
+        """
+        self.assertEqual(self.read_file('VERSION', ref='origin/test-branch'), 'v1')
+        self.assertEqual(self.read_file('VERSION', ref='refs/remotes/origin/test-branch'), 'v1')
+        with self.assertRaisesRegex(ValueError, 'Reference origin/unknown-branch not found'):
+            self.read_file('VERSION', ref='origin/unknown-branch')
+
+    @patch('git.repo.base.Repo.clone_from', wraps=git.repo.base.Repo.clone_from)
+    def test_open_repository_submodules(self, mock_clone_from):
+        """
+        Submodules are checked out from local mirrors, which are only cloned once
+        """
+        submodule_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, submodule_dir)
+        submodule = git.Repo.init(submodule_dir)
+        with open(os.path.join(submodule_dir, 'README'), 'w') as f:
+            f.write('submodule')
+        submodule.index.add(['README'])
+        actor = git.Actor('Test', 'test@example.com')
+        submodule.index.commit('Add README', author=actor, committer=actor)
+        self.origin.git.execute([
+            'git', '-c', 'protocol.file.allow=always', 'submodule', 'add', 'file://{}'.format(submodule_dir), 'sub',
+        ])
+        self.origin.index.commit('Add submodule', author=actor, committer=actor)
+
+        self.assertEqual(self.read_file('sub/README'), 'submodule')
+        self.assertEqual(self.read_file('sub/README'), 'submodule')
+        self.assertEqual(
+            [call_args[0][0] for call_args in mock_clone_from.call_args_list],
+            [self.origin_url, 'file://{}'.format(submodule_dir)],
+        )
+        self.assertTrue(os.path.isdir(repo.get_mirror_path('file://{}'.format(submodule_dir))))
+
+    def test_resolve_submodule_url(self):
+        """
+        Relative submodule URLs are resolved against the URL of their superproject
+        """
+        repo_url = 'https://github.com/open-craft/configuration.git'
+        self.assertEqual(
+            repo.resolve_submodule_url(repo_url, '../ansible-roles'),
+            'https://github.com/open-craft/ansible-roles',
+        )
+        self.assertEqual(repo.resolve_submodule_url(repo_url, './vendor'), repo_url + '/vendor')
+        self.assertEqual(repo.resolve_submodule_url(repo_url, 'git@example.com:sub.git'), 'git@example.com:sub.git')
+
+    @patch('git.repo.base.Repo.clone_from', wraps=git.repo.base.Repo.clone_from)
+    def test_open_repository_concurrent(self, mock_clone_from):
+        """
+        Concurrent checkouts of the same repository share the mirror and use separate worktrees
+        """
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            contents = list(executor.map(lambda _: self.read_file('VERSION'), range(8)))
+        self.assertEqual(contents, ['v1'] * 8)
+        self.assertEqual(mock_clone_from.call_count, 1)
+        self.assertEqual(os.listdir(os.path.join(self.cache_dir, 'worktrees')), [])
+
+    def test_collect_worktree_garbage(self):
+        """
+        Worktrees abandoned by killed processes are removed on the next checkout
+        """
+        self.read_file('VERSION')
+        mirror = git.Repo(repo.get_mirror_path(self.origin_url))
+        abandoned_path = os.path.join(self.cache_dir, 'worktrees', 'abandoned')
+        recent_path = os.path.join(self.cache_dir, 'worktrees', 'recent')
+        mirror.git.worktree('add', '--detach', abandoned_path, self.first_commit)
+        mirror.git.worktree('add', '--detach', recent_path, self.first_commit)
+        old_time = time.time() - 2 * 24 * 60 * 60
+        os.utime(abandoned_path, (old_time, old_time))
+
+        with override_settings(REPO_CACHE_WORKTREE_MAX_AGE=24 * 60 * 60):
+            self.read_file('VERSION')
+
+        self.assertFalse(os.path.exists(abandoned_path))
+        self.assertTrue(os.path.exists(recent_path))
+        self.assertNotIn(abandoned_path, mirror.git.worktree('list'))
@@ -29,7 +29,9 @@ from unittest.mock import PropertyMock, call, patch, Mock
 
 import ddt
 from django.conf import settings
+from django.db import connection, transaction
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 import freezegun
@@ -37,7 +39,13 @@ import freezegun
 from instance import tasks
 from instance.models.appserver import Status as AppServerStatus
 from instance.models.server import Status as ServerStatus
-from instance.models.log_entry import LogEntry
+from instance.models.log_entry import (
+    LogEntry,
+    create_log_entry_partitions,
+    delete_log_entries_before,
+    get_log_entry_partitions,
+    is_log_entry_table_partitioned,
+)
 from instance.models.openedx_deployment import OpenEdXDeployment
 from instance.tasks import make_appserver_active
 from instance.tests.base import TestCase
@@ -359,27 +367,18 @@ class CleanUpTestCase(TestCase):
         """
         return msg, kwargs
 
-    @patch(
-        'instance.tests.models.factories.openedx_instance.OpenEdXInstance._write_metadata_to_consul',
-        return_value=(1, True)
-    )
-    @patch('instance.logging.ModelLoggerAdapter.process')
-    @patch('instance.models.openedx_instance.OpenEdXInstance.terminate_obsolete_appservers')
-    def test_terminate_obsolete_appservers(self, mock_terminate_appservers, mock_logger, mock_consul):
+    @override_settings(TERMINATE_OBSOLETE_APPSERVERS_WORKERS=3)
+    @patch('instance.tasks.terminate_obsolete_appservers_of_all_instances', return_value=(4, 1))
+    def test_terminate_obsolete_appservers(self, mock_terminate_appservers):
         """
-        Test that `terminate_obsolete_appservers_all_instances`
-        calls `terminate_obsolete_appservers` on all existing instances.
+        Test that `terminate_obsolete_appservers_all_instances` terminates the obsolete appservers
+        of all instances at once, with the configured number of workers.
         """
-        mock_logger.side_effect = self.mock_logger_process
+        with self.assertLogs('instance.tasks') as logs:
+            tasks.terminate_obsolete_appservers_all_instances()
 
-        for _ in range(5):
-            OpenEdXInstanceFactory()
-
-        tasks.terminate_obsolete_appservers_all_instances()
-
-        self.assertEqual(mock_terminate_appservers.call_count, 5)
-        self.assertEqual(mock_logger.call_count, 10)
-        mock_logger.assert_called_with("Terminating obsolete appservers for instance %s", {})
+        mock_terminate_appservers.assert_called_once_with(max_workers=3)
+        self.assertIn('Terminated 4 obsolete appservers; 1 could not be terminated', logs.output[-1])
 
     @ddt.data(
         {'pr_state': 'closed', 'pr_days_since_closed': 4, 'instance_is_archived': False},
@@ -518,18 +517,62 @@ class DeleteOldLogsTestCase(TestCase):
             tasks.delete_old_logs()
 
         remaining_logs = LogEntry.objects.order_by('created')
-        # 1 extra log was generated to write the deletion query.
+        # The deletion is summarized in a new log entry.
+        self.assertTrue(remaining_logs.filter(
+            text="instance.tasks            "
+                 "| Deleted log entries created before 2018-07-03T07:20:12+00:00: "
+                 "dropped 0 partitions, deleted {} entries".format(total_logs_deleted)
+        ).exists())
         self.assertEqual(remaining_logs.count(), total_logs - total_logs_deleted + 1)
-        # The last created log is indeed the deletion query.
-        self.assertEqual(
-            remaining_logs.last().text,
-            "instance.tasks            "
-            "| DELETE FROM instance_logentry WHERE instance_logentry.created < '2018-07-03T07:20:12+00:00'::timestamptz"
-        )
-        # Only the new log remains.
         self.assertFalse(remaining_logs.filter(text__contains='old log').exists())
         self.assertTrue(remaining_logs.filter(text__contains='new log').exists())
 
+    def test_delete_old_logs_in_chunks(self):
+        """
+        Old log entries are deleted in chunks, until none is left.
+        """
+        with freezegun.freeze_time(self.before_cutoff):
+            LogEntry.objects.bulk_create(LogEntry(text='old log {}'.format(i)) for i in range(35))
+        with freezegun.freeze_time(self.now):
+            LogEntry.objects.create(text='new log')
+
+        cutoff = self.now - timezone.timedelta(days=1)
+        with patch('instance.models.log_entry.transaction.atomic', wraps=transaction.atomic) as mock_atomic:
+            dropped_partitions, deleted_count = delete_log_entries_before(cutoff, chunk_size=10)
+
+        self.assertEqual(dropped_partitions, [])
+        self.assertEqual(deleted_count, 35)
+        self.assertEqual(mock_atomic.call_count, 4)
+        self.assertEqual(list(LogEntry.objects.values_list('text', flat=True)), ['new log'])
+
+    def test_delete_old_logs_drops_expired_partitions(self):
+        """
+        Expired monthly partitions are dropped, whatever the number of log entries they hold.
+        """
+        if not is_log_entry_table_partitioned():
+            self.skipTest('The log entries table is only partitioned on PostgreSQL 11+')
+
+        start = timezone.datetime(2017, 1, 1, tzinfo=timezone.utc)
+        cutoff = timezone.datetime(2017, 3, 1, tzinfo=timezone.utc)
+        create_log_entry_partitions(start=start, months=2)
+        partition_names = [
+            name for name, lower_bound, _ in get_log_entry_partitions() if lower_bound and lower_bound >= start
+        ]
+        self.assertEqual(partition_names[:2], ['instance_logentry_p201701', 'instance_logentry_p201702'])
+
+        query_counts = []
+        for entry_count in (10, 1000):
+            create_log_entry_partitions(start=start, months=2)
+            with freezegun.freeze_time(start + timezone.timedelta(days=20)):
+                LogEntry.objects.bulk_create(LogEntry(text='old log {}'.format(i)) for i in range(entry_count))
+            with CaptureQueriesContext(connection) as queries:
+                dropped_partitions, deleted_count = delete_log_entries_before(cutoff, chunk_size=100)
+            self.assertEqual(dropped_partitions, partition_names[:2])
+            self.assertEqual(deleted_count, 0)
+            self.assertFalse(LogEntry.objects.filter(created__lt=cutoff).exists())
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+
 
 def gen_appserver_side_effect(deployment, instance, statuses):
     """
@@ -25,10 +25,12 @@ Utils module - Tests
 from datetime import datetime
 import itertools
 import subprocess
-from unittest.mock import patch
+import threading
+import time
+from unittest.mock import ANY, Mock, patch
 
 from instance.tests.base import TestCase
-from instance.utils import sufficient_time_passed, poll_streams, _line_timeout_generator, to_json
+from instance.utils import sufficient_time_passed, poll_streams, _line_timeout_generator, to_json, run_steps
 
 
 # Tests #######################################################################
@@ -129,3 +131,90 @@ class UtilsTestCase(TestCase):
         self.assertEqual(to_json(non_serializable), '{\n    "attr": 42\n}')
         serializable.attr = non_serializable  # pylint: disable=attribute-defined-outside-init
         self.assertEqual(to_json(serializable), '{\n    "attr": "%s"\n}' % (non_serializable,))
+
+
+class RunStepsTestCase(TestCase):
+    """
+    Test cases for run_steps()
+    """
+    def make_step(self, name, duration=0.2, dependencies=(), error=None):
+        """
+        Return a step which takes `duration` seconds, and records when it ran.
+        """
+        def func():
+            """ Simulate a provisioning step with some latency """
+            start = time.monotonic()
+            time.sleep(duration)
+            with self.lock:
+                self.runs[name] = (start, time.monotonic(), threading.current_thread())
+            if error:
+                raise error
+            return name.upper()
+        return func, dependencies
+
+    def setUp(self):
+        super().setUp()
+        self.lock = threading.Lock()
+        self.runs = {}
+        self.steps = {
+            'load balancer': self.make_step('load balancer'),
+            'dns': self.make_step('dns', dependencies=('load balancer',)),
+            'mysql': self.make_step('mysql', duration=0.4),
+            'mongo': self.make_step('mongo'),
+            'storage': self.make_step('storage', duration=0.4),
+        }
+
+    @patch('instance.utils.connections')
+    def test_concurrent(self, mock_connections):
+        """
+        Independent steps run concurrently, so the wall time is the one of the longest chain of steps.
+        """
+        start = time.monotonic()
+        results = run_steps(self.steps, max_workers=5)
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(results, {name: name.upper() for name in self.steps})
+        self.assertLess(elapsed, 1.0)  # Running the steps one after the other takes 1.4s
+        self.assertGreaterEqual(self.runs['dns'][0], self.runs['load balancer'][1])
+        self.assertNotIn(threading.current_thread(), [thread for unused, unused, thread in self.runs.values()])
+        self.assertEqual(mock_connections.close_all.call_count, 5)
+
+    def test_sequential(self):
+        """
+        With a single worker, the steps run one after the other in the calling thread.
+        """
+        start = time.monotonic()
+        results = run_steps(self.steps, max_workers=1)
+        self.assertGreaterEqual(time.monotonic() - start, 1.4)
+        self.assertEqual(results, {name: name.upper() for name in self.steps})
+        self.assertEqual({thread for unused, unused, thread in self.runs.values()}, {threading.current_thread()})
+        self.assertGreaterEqual(self.runs['dns'][0], self.runs['load balancer'][1])
+
+    @patch('instance.utils.connections')
+    def test_failure(self, mock_connections):
+        """
+        The error of a failed step is logged with the step name and raised, and its dependent steps don't run.
+        """
+        self.steps['load balancer'] = self.make_step('load balancer', error=ValueError('No load balancer'))
+        logger = Mock()
+        for max_workers in (1, 5):
+            self.runs.clear()
+            logger.reset_mock()
+            with self.assertRaisesRegex(ValueError, 'No load balancer'):
+                run_steps(self.steps, max_workers=max_workers, logger_=logger)
+            self.assertNotIn('dns', self.runs)
+            logger.error.assert_called_once_with('Step "%s" failed: %r', 'load balancer', ANY)
+
+    def test_invalid_dependencies(self):
+        """
+        Unknown dependencies and dependency cycles are rejected before running any step.
+        """
+        with self.assertRaisesRegex(ValueError, 'Step dns depends on unknown steps: gandi'):
+            run_steps({'dns': self.make_step('dns', dependencies=('gandi',))})
+        with self.assertRaisesRegex(ValueError, 'contain a cycle'):
+            run_steps({
+                'mysql': self.make_step('mysql'),
+                'a': self.make_step('a', dependencies=('b',)),
+                'b': self.make_step('b', dependencies=('a',)),
+            })
+        self.assertEqual(self.runs, {})
@@ -21,6 +21,7 @@ Test utils
 """
 
 # Imports #####################################################################
+from collections import defaultdict
 from contextlib import ExitStack
 import functools
 import unittest
@@ -29,6 +30,7 @@ from unittest.mock import Mock, patch
 import requests
 import responses
 import consul
+from instance.openstack_utils import ServerStatusPoller
 from instance.tests.fake_gandi_client import FakeGandiV5APIClient
 from instance.tests.models.factories.server import OSServerMockManager
 
@@ -106,12 +108,26 @@ def patch_services(func):
             mock_sleep = stack_patch('instance.models.server.time.sleep')
             mock_get_nova_client = stack_patch('instance.models.server.openstack_utils.get_nova_client')
             mock_get_nova_client.return_value.servers.get = os_server_manager.get_os_server
+            mock_get_nova_client.return_value.servers.list = os_server_manager.list_os_servers
+
+            # Don't share the server lists polled by this test with the other tests
+            status_pollers = defaultdict(ServerStatusPoller)
+            stack_patch(
+                'instance.models.server.openstack_utils.get_server_status_poller',
+                side_effect=status_pollers.__getitem__,
+            )
+            mock_wait_for_status_update = stack_patch('instance.openstack_utils.ServerStatusPoller.wait_for_update')
 
             def check_sleep_count(_delay):
                 """ Check that time.sleep() is not used in some sort of infinite loop """
                 self.assertLess(mock_sleep.call_count, 1000, "time.sleep() called too many times.")
             mock_sleep.side_effect = check_sleep_count
 
+            def check_wait_count(_timeout):
+                """ Check that sleep_until() doesn't wait in some sort of infinite loop """
+                self.assertLess(mock_wait_for_status_update.call_count, 1000, "Waited for status too many times.")
+            mock_wait_for_status_update.side_effect = check_wait_count
+
             mocks = Mock(
                 os_server_manager=os_server_manager,
                 mock_get_nova_client=mock_get_nova_client,
@@ -120,6 +136,7 @@ def patch_services(func):
                     'instance.models.server.openstack_utils.create_server', side_effect=new_servers,
                 ),
                 mock_sleep=mock_sleep,
+                mock_wait_for_status_update=mock_wait_for_status_update,
                 mock_run_ansible_playbooks=stack_patch(
                     'instance.models.mixins.ansible.AnsibleAppServerMixin.run_ansible_playbooks',
                     return_value=([], 0),
@@ -25,10 +25,12 @@ Instance app - Util functions
 import itertools
 import json
 import logging
+import random
 import selectors
 import shutil
 import socket
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from enum import Enum
 from contextlib import contextmanager
 from tempfile import mkdtemp
@@ -36,6 +38,7 @@ from unittest.mock import Mock
 
 import channels.layers
 from django.conf import settings
+from django.db import connections
 import requests
 from asgiref.sync import async_to_sync
 from dictdiffer import diff
@@ -46,6 +49,25 @@ from dictdiffer import diff
 logger = logging.getLogger(__name__)
 
 
+# Constants ###################################################################
+
+# Websocket group of the superusers, who receive the update events of all the instances
+WEBSOCKET_SUPERUSERS_GROUP = 'ws_superusers'
+
+# Types of the events which are sent to everyone allowed to see the object they are about,
+# so that the instance lists are kept up to date
+BROADCAST_EVENT_TYPES = ('instance_update', 'openedx_appserver_update', 'grove_deployment_update')
+
+# Keys of the event data identifying the object an event is about, from the most specific to the
+# least specific, with the kind of object used in the name of the websocket groups
+EVENT_OBJECT_KEYS = (
+    ('appserver_id', 'appserver'),
+    ('deployment_id', 'deployment'),
+    ('server_id', 'server'),
+    ('instance_id', 'instance'),
+)
+
+
 # Functions ###################################################################
 
 def is_port_open(ip, port):
@@ -79,7 +101,8 @@ def to_json(obj):
 
 def get_requests_retry(total=10, connect=10, read=10, redirect=10, backoff_factor=0,
                        status_forcelist=settings.OPENSTACK_RETRYABLE_STATUS_CODES,
-                       method_whitelist=settings.OPENSTACK_RETRYABLE_METHOD_WHITELIST):
+                       method_whitelist=settings.OPENSTACK_RETRYABLE_METHOD_WHITELIST,
+                       raise_on_status=True):
     """
     Returns a urllib3 `Retry` object, with the default requests retry policy
     """
@@ -91,9 +114,22 @@ def get_requests_retry(total=10, connect=10, read=10, redirect=10, backoff_facto
         backoff_factor=backoff_factor,
         status_forcelist=status_forcelist,
         method_whitelist=method_whitelist,
+        raise_on_status=raise_on_status,
     )
 
 
+def jittered_backoff(initial, maximum, factor=2, jitter=0.25):
+    """
+    Generate delays growing exponentially from `initial` up to `maximum`, each one randomly
+    varied by up to +/- `jitter` (as a fraction of the delay), so that concurrent pollers
+    don't end up polling in lockstep.
+    """
+    delay = initial
+    while True:
+        yield delay * random.uniform(1 - jitter, 1 + jitter)
+        delay = min(delay * factor, maximum)
+
+
 def _line_timeout_generator(line_timeout, global_timeout):
     """
     Helper function for poll_streams() to compute the timeout for a single line.
@@ -150,6 +186,100 @@ def poll_streams(*files, line_timeout=None, global_timeout=None):
                 selector.unregister(key.fileobj)
 
 
+def _sort_steps(steps):
+    """
+    Return the names of the given steps (see `run_steps`) so that each step comes after its dependencies.
+
+    Raises ValueError if a step depends on an unknown step, or if the dependencies contain a cycle.
+    """
+    for name, (unused, dependencies) in steps.items():
+        unknown_dependencies = set(dependencies) - set(steps)
+        if unknown_dependencies:
+            raise ValueError(
+                'Step {} depends on unknown steps: {}'.format(name, ', '.join(sorted(unknown_dependencies)))
+            )
+
+    sorted_names = []
+    remaining = {name: set(dependencies) for name, (unused, dependencies) in steps.items()}
+    while remaining:
+        ready = [name for name, dependencies in remaining.items() if not dependencies]
+        if not ready:
+            raise ValueError('The dependencies of steps {} contain a cycle'.format(', '.join(sorted(remaining))))
+        for name in ready:
+            del remaining[name]
+            sorted_names.append(name)
+        for dependencies in remaining.values():
+            dependencies.difference_update(ready)
+    return sorted_names
+
+
+def _run_step_in_thread(func):
+    """
+    Run `func` in a worker thread, closing the database connections the thread opened.
+    """
+    try:
+        return func()
+    finally:
+        connections.close_all()
+
+
+def run_steps(steps, max_workers=1, logger_=None):
+    """
+    Run steps which may depend on each other, running independent steps concurrently.
+
+    `steps` is a dictionary mapping step names to `(func, dependencies)` pairs, where `dependencies`
+    is an iterable of names of the steps which must succeed before `func` is called. At most
+    `max_workers` steps run at the same time; with `max_workers=1`, the steps run one after the
+    other in the calling thread.
+
+    Failures are logged with the name of the failed step. Once a step failed, no new step is started,
+    and after the running steps completed, the exception of the first failed step is raised.
+
+    Returns a dictionary mapping step names to the value returned by their function.
+    """
+    logger_ = logger_ or logger
+    sorted_names = _sort_steps(steps)
+    results = {}
+
+    if max_workers <= 1:
+        for name in sorted_names:
+            func, unused = steps[name]
+            try:
+                results[name] = func()
+            except Exception as exc:
+                logger_.error('Step "%s" failed: %r', name, exc)
+                raise
+        return results
+
+    remaining = {name: set(dependencies) for name, (unused, dependencies) in steps.items()}
+    running = {}
+    failures = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            if not failures:
+                # Start the steps whose dependencies all succeeded, in dependency order
+                for name in [name for name in sorted_names if name in remaining and not remaining[name]]:
+                    del remaining[name]
+                    running[executor.submit(_run_step_in_thread, steps[name][0])] = name
+            if not running:
+                break
+            done, unused = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as exc:  # pylint: disable=broad-except
+                    logger_.error('Step "%s" failed: %r', name, exc)
+                    failures.append(exc)
+                else:
+                    for dependencies in remaining.values():
+                        dependencies.discard(name)
+
+    if failures:
+        raise failures[0]
+    return results
+
+
 def sufficient_time_passed(earlier_date, later_date, expected_days_since):
     """
     Check if at least `expected_days_since` have passed between `earlier_date`
@@ -159,12 +289,41 @@ def sufficient_time_passed(earlier_date, later_date, expected_days_since):
     return days_passed >= expected_days_since
 
 
-def publish_data(data):
+def websocket_group_name(kind, pk):
     """
-    Publish the data to the 'ws' group.
+    Name of the websocket group of the clients subscribed to the object of the given `kind` and `pk`.
+    """
+    return 'ws_{}_{}'.format(kind, pk)
+
+
+def get_event_groups(data, organization_id=None):
+    """
+    Get the websocket groups the event `data` is sent to.
+
+    Update events are sent to the superusers and to the members of the organization owning the object.
+    Other events, like log lines, are only sent to the clients subscribed to the most specific object
+    the event is about.
+    """
+    if data['type'] in BROADCAST_EVENT_TYPES:
+        groups = [WEBSOCKET_SUPERUSERS_GROUP]
+        if organization_id is not None:
+            groups.append(websocket_group_name('organization', organization_id))
+        return groups
+    for key, kind in EVENT_OBJECT_KEYS:
+        if data.get(key) is not None:
+            return [websocket_group_name(kind, data[key])]
+    return []
+
+
+def publish_data(data, organization_id=None):
+    """
+    Publish the data to the websocket groups interested in it.
+
+    `organization_id` is the organization owning the object of an update event, if any.
     """
     channel_layer = channels.layers.get_channel_layer()
-    async_to_sync(channel_layer.group_send)('ws', {'type': 'notification', 'message': data})
+    for group in get_event_groups(data, organization_id):
+        async_to_sync(channel_layer.group_send)(group, {'type': 'notification', 'message': data})
 
 
 def build_instance_config_diff(instance_config, instance=None):
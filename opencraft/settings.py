@@ -322,6 +322,10 @@ OPENSTACK_TENANT = env('OPENSTACK_TENANT')
 OPENSTACK_AUTH_URL = env('OPENSTACK_AUTH_URL')
 OPENSTACK_REGION = env('OPENSTACK_REGION')
 
+# OpenStack clients are shared by all threads of a process, and their Keystone token is reused.
+# Tokens expiring within this number of seconds are renewed before the client is handed out.
+OPENSTACK_TOKEN_REFRESH_MARGIN = env.int('OPENSTACK_TOKEN_REFRESH_MARGIN', default=300)
+
 OPENSTACK_SANDBOX_FLAVOR = env.json('OPENSTACK_SANDBOX_FLAVOR', default={"ram": 4096, "disk": 40})
 OPENSTACK_SANDBOX_BASE_IMAGE = env.json('OPENSTACK_SANDBOX_BASE_IMAGE', default={"name": "focal-20.04-unmodified"})
 OPENSTACK_SANDBOX_SSH_KEYNAME = env('OPENSTACK_SANDBOX_SSH_KEYNAME', default='opencraft')
@@ -331,6 +335,12 @@ OPENSTACK_PRODUCTION_INSTANCE_FLAVOR = env.json(
     default={"ram": 8192, "disk": 80}
 )
 
+# While waiting for a server to reach a given status, its status is checked with an exponential
+# backoff between these two intervals (in seconds). The status of all the servers being waited for
+# in a region is fetched with a single request, at most once per SERVER_STATUS_POLL_MIN_INTERVAL.
+SERVER_STATUS_POLL_MIN_INTERVAL = env.float('SERVER_STATUS_POLL_MIN_INTERVAL', default=1.0)
+SERVER_STATUS_POLL_MAX_INTERVAL = env.float('SERVER_STATUS_POLL_MAX_INTERVAL', default=30.0)
+
 # Openstack fails to connect randomly, thus we retry on certain status codes.
 # for example Openstack throws 400, and it will work if we keep retrying,
 # more on https://github.com/open-craft/opencraft/pull/805
@@ -345,6 +355,14 @@ OPENSTACK_RETRYABLE_METHOD_WHITELIST = env.list(
     default=frozenset(["HEAD", "GET", "PUT", "DELETE", "OPTIONS", "TRACE"])
 )
 
+# Requests to third-party APIs (New Relic, RabbitMQ, GitHub, GitLab) share one keep-alive connection pool per host,
+# which runs at most this number of requests to the host at once
+HTTP_CLIENT_MAX_CONCURRENCY_PER_HOST = env.int('HTTP_CLIENT_MAX_CONCURRENCY_PER_HOST', default=10)
+
+# Number of times the failed requests to third-party APIs are retried, with an exponential backoff
+HTTP_CLIENT_RETRIES = env.int('HTTP_CLIENT_RETRIES', default=3)
+HTTP_CLIENT_RETRY_BACKOFF_FACTOR = env.float('HTTP_CLIENT_RETRY_BACKOFF_FACTOR', default=0.5)
+
 # Separate credentials for Swift.  These credentials are currently passed on to each instance
 # when Swift is enabled.
 
@@ -412,6 +430,9 @@ BILLING_RATE = env('BILLING_RATE', default=3)
 # Get it from https://github.com/settings/tokens
 GITHUB_ACCESS_TOKEN = env('GITHUB_ACCESS_TOKEN')
 
+# How long GitHub responses are kept to make conditional requests, in seconds
+GITHUB_RESPONSE_CACHE_TIMEOUT = env.int('GITHUB_RESPONSE_CACHE_TIMEOUT', default=7 * 24 * 3600)
+
 # Default github repository to pull code from
 DEFAULT_FORK = env('DEFAULT_FORK', default='openedx/edx-platform')
 DEFAULT_EDX_PLATFORM_REPO_URL = 'https://github.com/{}.git'.format(DEFAULT_FORK)
@@ -425,6 +446,14 @@ WATCH_PRS = env.bool('WATCH_PRS', default=True)
 # Time in seconds to wait before making a force termination for servers.
 SHUTDOWN_TIMEOUT = env.int('SHUTDOWN_TIMEOUT', default=600)  # 10 minutes
 
+# Maximum number of resources (databases, storage, DNS records...) provisioned concurrently for a
+# new app server. Set to 1 to provision them one after the other.
+SPAWN_APPSERVER_PROVISIONING_WORKERS = env.int('SPAWN_APPSERVER_PROVISIONING_WORKERS', default=4)
+
+# Maximum number of VMs shut down and deleted concurrently when terminating the obsolete app servers of all
+# instances. Set to 1 to terminate them one after the other.
+TERMINATE_OBSOLETE_APPSERVERS_WORKERS = env.int('TERMINATE_OBSOLETE_APPSERVERS_WORKERS', default=8)
+
 # Instances will be created as subdomains of this domain by default
 DEFAULT_INSTANCE_BASE_DOMAIN = env('DEFAULT_INSTANCE_BASE_DOMAIN')
 DEFAULT_STUDIO_DOMAIN_PREFIX = env('DEFAULT_STUDIO_DOMAIN_PREFIX', default='studio.')
@@ -610,6 +639,13 @@ ANSIBLE_LINE_TIMEOUT = env.int('ANSIBLE_LINE_TIMEOUT', default=7200)  # 2 hours
 # Timeout in seconds for an entire Ansible playbook.
 ANSIBLE_GLOBAL_TIMEOUT = env.int('ANSIBLE_GLOBAL_TIMEOUT', default=9000)  # 2.5 hours
 
+# Directory where the virtualenvs used to run Ansible are cached. A virtualenv is built once for
+# each combination of requirements file contents and Python version, and then shared by all runs.
+ANSIBLE_VENV_CACHE_DIR = env('ANSIBLE_VENV_CACHE_DIR', default=os.path.expanduser('~/.cache/opencraft/venvs'))
+
+# Max number of cached virtualenvs; the least recently used ones are removed first.
+ANSIBLE_VENV_CACHE_SIZE = env.int('ANSIBLE_VENV_CACHE_SIZE', default=10)
+
 # The repository to pull the default Ansible playbook from.
 ANSIBLE_APPSERVER_REPO = env('ANSIBLE_APPSERVER_REPO', default='https://github.com/open-craft/ansible-playbooks.git')
 
@@ -624,6 +660,14 @@ ANSIBLE_APPSERVER_REQUIREMENTS_PATH = env(
 # The version of the Ansible playbook repository to checkout.
 ANSIBLE_APPSERVER_VERSION = env('ANSIBLE_APPSERVER_VERSION', default='master')
 
+# Directory where the git repositories containing playbooks are mirrored. Each checkout only
+# fetches the new commits into the mirror, and uses a lightweight worktree of it.
+REPO_CACHE_DIR = env('REPO_CACHE_DIR', default=os.path.expanduser('~/.cache/opencraft/repos'))
+
+# Worktrees of the mirrored repositories which are older than this number of seconds are
+# considered abandoned (e.g. by a killed worker), and are garbage-collected.
+REPO_CACHE_WORKTREE_MAX_AGE = env.int('REPO_CACHE_WORKTREE_MAX_AGE', default=24 * 60 * 60)
+
 # Emails ######################################################################
 
 EMAIL_BACKEND = env('EMAIL_BACKEND',
@@ -661,6 +705,10 @@ HANDLERS = BASE_HANDLERS + ['db']
 LOGGING_EMAIL_THRESHOLD = env('LOGGING_EMAIL_THRESHOLD', default='CRITICAL')
 LOGGING_ROTATE_MAX_KBYTES = env.json('LOGGING_ROTATE_MAX_KBYTES', default=10 * 1024)
 LOGGING_ROTATE_MAX_FILES = env.json('LOGGING_ROTATE_MAX_FILES', default=60)
+# Log entries stored in the database are written in batches of up to this number of entries,
+# and at the latest after this number of seconds
+LOGGING_DB_BUFFER_CAPACITY = env.int('LOGGING_DB_BUFFER_CAPACITY', default=500)
+LOGGING_DB_FLUSH_INTERVAL = env.float('LOGGING_DB_FLUSH_INTERVAL', default=1.0)
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -685,7 +733,9 @@ LOGGING = {
         'db': {
             'level': 'INFO',
             'class': 'instance.logging.DBHandler',
-            'formatter': 'db'
+            'formatter': 'db',
+            'capacity': LOGGING_DB_BUFFER_CAPACITY,
+            'flush_interval': LOGGING_DB_FLUSH_INTERVAL,
         },
         'mail_admins': {
             'level': LOGGING_EMAIL_THRESHOLD,
@@ -708,6 +758,12 @@ LOGGING = {
             'propagate': False,
             'level': 'DEBUG',
         },
+        # The errors of the database log handler can't be written to the database
+        'instance.logging': {
+            'handlers': BASE_HANDLERS,
+            'propagate': False,
+            'level': 'INFO',
+        },
         'requests': {
             'handlers': HANDLERS,
             'propagate': False,
@@ -752,9 +808,18 @@ DEFAULT_INSTANCE_REDIS_URL = env('DEFAULT_INSTANCE_REDIS_URL', default=None)
 # Limit the number of log entries fetched for each instance, for performance
 LOG_LIMIT = env.int('LOG_LIMIT', default=10000)
 
+# Number of log entries fetched from the database at once when streaming logs through the API
+LOG_STREAM_CHUNK_SIZE = env.int('LOG_STREAM_CHUNK_SIZE', default=1000)
+
+# Maximum number of connections opened at once to each MySQL server, shared by all the threads of a process
+MYSQL_CONNECTION_POOL_SIZE = env.int('MYSQL_CONNECTION_POOL_SIZE', default=4)
+
 # How old a log entry needs to be before it's deleted.
 LOG_DELETION_DAYS = env.int('LOG_DELETION_DAYS', default=60)
 
+# Old log entries outside of expired partitions are deleted in chunks of this number of entries
+LOG_DELETION_CHUNK_SIZE = env.int('LOG_DELETION_CHUNK_SIZE', default=10000)
+
 # When configured, email sent from instances is relayed via external SMTP provider.
 INSTANCE_SMTP_RELAY_HOST = env('INSTANCE_SMTP_RELAY_HOST', default=None)
 INSTANCE_SMTP_RELAY_PORT = env.int('INSTANCE_SMTP_RELAY_PORT', default=587)
@@ -906,6 +971,13 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Max number of messages per second a websocket client can send, and how many messages it can send at once
+WEBSOCKET_RATE_LIMIT = env.float('WEBSOCKET_RATE_LIMIT', default=5.0)
+WEBSOCKET_RATE_LIMIT_BURST = env.int('WEBSOCKET_RATE_LIMIT_BURST', default=20)
+
+# Max number of objects a websocket client can subscribe to
+WEBSOCKET_MAX_SUBSCRIPTIONS = env.int('WEBSOCKET_MAX_SUBSCRIPTIONS', default=50)
+
 
 # Settings related to user self-service of launches
 
@@ -944,6 +1016,8 @@ TRIAL_INSTANCES_REPORT_SCHEDULE = env('TRIAL_INSTANCES_REPORT_SCHEDULE', default
 KILL_ZOMBIES_ENABLED = env("KILL_ZOMBIES_ENABLED", default=False)
 KILL_ZOMBIES_SCHEDULE = env("KILL_ZOMBIES_SCHEDULE", default="0 0 * * *")
 KILL_ZOMBIES_WARNING_THRESHOLD = env("KILL_ZOMBIES_WARNING_THRESHOLD", default=10)
+# Maximum number of zombie VMs deleted concurrently
+KILL_ZOMBIES_WORKERS = env.int("KILL_ZOMBIES_WORKERS", default=8)
 
 # User inactive and delete ####################################################
 
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# pylint: skip-file
+"""
+Benchmark the Nginx access log statistics of stats.py against the exact, single-process
+implementation it replaced, on generated logs.
+
+Usage: python benchmark_stats.py [--lines 10000000] [--unique-ips 250000] [--processes N] [--log-dir DIR]
+"""
+
+from __future__ import division, print_function
+from argparse import ArgumentParser
+import gzip
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stats import HLL_DEFAULT_PRECISION, NGINX_ACCESS_PATTERN, HyperLogLog, collect_hit_statistics  # noqa
+
+
+LINE_TEMPLATE = (
+    '- - {ip} - - [10/Oct/2020:13:55:36 +0000] "GET /courses/course-v1:Org+{n}+2020/courseware HTTP/1.1" '
+    '200 {size} "https://lms.example.com/dashboard" "Mozilla/5.0 (X11; Linux x86_64) Firefox/81.0"\n'
+)
+
+
+def generate_logs(log_dir, lines, unique_ips, files=4):
+    """
+    Write `lines` access log lines from `unique_ips` distinct addresses into rotated log files,
+    half of them compressed. A few lines don't match the access log format.
+    """
+    generator = random.Random(42)
+    ip_addresses = set()
+    while len(ip_addresses) < unique_ips:
+        ip_addresses.add('{}.{}.{}.{}'.format(*(generator.randint(1, 254) for _ in range(4))))
+    ip_addresses = sorted(ip_addresses)
+
+    lines_per_file = lines // files
+    for index in range(files):
+        file_name = 'access.log' if index == 0 else 'access.log.{}'.format(index)
+        if index >= files // 2:
+            handle = gzip.open(os.path.join(log_dir, file_name + '.gz'), 'wt')
+        else:
+            handle = open(os.path.join(log_dir, file_name), 'w')
+        with handle:
+            count = lines_per_file if index < files - 1 else lines - lines_per_file * (files - 1)
+            for line_number in range(count):
+                if line_number % 1000 == 999:
+                    handle.write('2020/10/10 13:55:36 [error] 1234#0: upstream timed out\n')
+                    continue
+                ip_address = ip_addresses[line_number % unique_ips if line_number < unique_ips
+                                          else generator.randrange(unique_ips)]
+                handle.write(LINE_TEMPLATE.format(ip=ip_address, n=line_number % 100, size=line_number % 9000))
+
+
+def collect_exact_hit_statistics(log_path):
+    """
+    The previous implementation: one process, a regex per line and a set of all the IP addresses.
+    """
+    unique_hits = set()
+    total_hits = 0
+    for file_name in sorted(os.listdir(log_path)):
+        file_path = os.path.join(log_path, file_name)
+        handle = gzip.open(file_path, 'rb') if file_name.endswith('.gz') else open(file_path, 'rb')
+        for line in handle:
+            match = NGINX_ACCESS_PATTERN.match(line)
+            if match:
+                total_hits += 1
+                unique_hits.add(match.group('ipaddress'))
+        handle.close()
+    return {'unique_hits': len(unique_hits), 'total_hits': total_hits}
+
+
+def run_measured(queue, function, args, kwargs):
+    """
+    Run the function, and report its result, duration and the peak memory of this process and its workers.
+    """
+    start = time.time()
+    result = function(*args, **kwargs)
+    duration = time.time() - start
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_worker_memory = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    queue.put((result, duration, peak_memory, peak_worker_memory))
+
+
+def measure(function, *args, **kwargs):
+    """
+    Run the function in a fresh process, so that the peak memory measurements are not shared.
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=run_measured, args=(queue, function, args, kwargs))
+    process.start()
+    measurement = queue.get()
+    process.join()
+    return measurement
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', type=int, default=10000000)
+    parser.add_argument('--unique-ips', type=int, default=250000)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--hll-precision', type=int, default=HLL_DEFAULT_PRECISION)
+    parser.add_argument('--log-dir', help='Reuse or keep the generated logs in this directory.')
+    args = parser.parse_args()
+
+    log_dir = args.log_dir or tempfile.mkdtemp(prefix='benchmark_stats_')
+    try:
+        if not os.listdir(log_dir):
+            print('Generating {} log lines in {}...'.format(args.lines, log_dir), file=sys.stderr)
+            generate_logs(log_dir, args.lines, args.unique_ips)
+
+        exact, exact_duration, exact_memory, _ = measure(collect_exact_hit_statistics, log_dir)
+        estimate, duration, memory, worker_memory = measure(
+            collect_hit_statistics, log_dir, processes=args.processes, precision=args.hll_precision,
+        )
+    finally:
+        if not args.log_dir:
+            shutil.rmtree(log_dir)
+
+    error = abs(estimate['unique_hits'] - exact['unique_hits']) / exact['unique_hits']
+    bound = 3 * HyperLogLog.relative_error(args.hll_precision)
+    print('exact:     {total_hits} hits, {unique_hits} unique'.format(**exact))
+    print('estimated: {total_hits} hits, {unique_hits} unique'.format(**estimate))
+    print('time:      {:.1f}s -> {:.1f}s ({:.1f}x)'.format(exact_duration, duration, exact_duration / duration))
+    print('peak RSS:  {} KiB -> {} KiB (+ {} KiB per worker)'.format(exact_memory, memory, worker_memory))
+    print('unique hits error: {:.2%} (bound: {:.2%})'.format(error, bound))
+    if estimate['total_hits'] != exact['total_hits'] or error > bound:
+        sys.exit(1)
@@ -1,24 +1,211 @@
 #!/edx/app/edxapp/venvs/edxapp/bin/python
 # pylint: skip-file
 
-from __future__ import print_function
-from argparse import ArgumentParser
+from __future__ import division, print_function
+from argparse import ArgumentParser, ArgumentTypeError
 from datetime import datetime, timedelta
 import gzip
+import hashlib
+import math
+import multiprocessing
 import os
 import re
+import struct
 import sys
 
-import django
-from django.utils import timezone
-
-from six.moves.configparser import ConfigParser
-
 
 # This regex pattern is used to extract the IPv4 address from the beginning of each line in the Nginx access logs.
-NGINX_ACCESS_PATTERN = re.compile(r'- - (?P<ipaddress>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})')
+NGINX_ACCESS_PATTERN = re.compile(br'- - (?P<ipaddress>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})')
+# The same pattern, to find the IPv4 addresses at the beginning of all the lines of a block of log lines at once.
+# The blocks are searched with a newline prepended: a literal prefix is much faster to search for than `^`.
+NGINX_ACCESS_LINES_PATTERN = re.compile(b'\n' + NGINX_ACCESS_PATTERN.pattern)
 LOG_PATH = '/edx/var/log/nginx'
 
+# The unique visitors are counted with HyperLogLog sketches of 2**precision one-byte registers.
+# The relative standard error of the count is 1.04 / sqrt(2**precision), i.e. 0.81% for a precision of 14:
+# the count is within 2.4% of the exact number of unique IP addresses 99.7% of the time.
+HLL_DEFAULT_PRECISION = 14
+
+# Uncompressed log files are split in chunks of about this size, which are parsed in parallel.
+# Compressed log files are parsed in one go.
+CHUNK_SIZE = 64 * 1024 * 1024
+# Size of the blocks of lines read from the log files
+BLOCK_SIZE = 1024 * 1024
+
+# Number of IP addresses each worker remembers to avoid hashing them again on every hit (about 30MB at most)
+SEEN_IP_ADDRESSES_CACHE_SIZE = 262144
+
+
+# The sketches use the first 64 bits of the SHA-1 hashes of the values
+HASH_STRUCT = struct.Struct('>Q')
+
+
+class HyperLogLog(object):
+    """
+    Mergeable sketch estimating the number of unique values added to it, in constant memory.
+    """
+    def __init__(self, precision=HLL_DEFAULT_PRECISION, registers=None):
+        self.precision = precision
+        self.num_registers = 1 << precision
+        if registers is None:
+            self.registers = bytearray(self.num_registers)
+        else:
+            self.registers = bytearray(registers)
+
+    @staticmethod
+    def relative_error(precision=HLL_DEFAULT_PRECISION):
+        """
+        Relative standard error of the estimates of sketches with the given precision
+        """
+        return 1.04 / math.sqrt(1 << precision)
+
+    def add(self, value):
+        """
+        Add a value (bytes) to the sketch
+        """
+        self.update((value,))
+
+    def update(self, values):
+        """
+        Add all the given values (bytes) to the sketch
+        """
+        registers = self.registers
+        remaining_bits = 64 - self.precision
+        mask = (1 << remaining_bits) - 1
+        # A stable hash is needed, to be able to merge the sketches built by different processes
+        sha1 = hashlib.sha1
+        unpack = HASH_STRUCT.unpack_from
+        for value in values:
+            hashed = unpack(sha1(value).digest())[0]
+            index = hashed >> remaining_bits
+            rank = remaining_bits - (hashed & mask).bit_length() + 1
+            if rank > registers[index]:
+                registers[index] = rank
+
+    def merge(self, other):
+        """
+        Add all the values of another sketch with the same precision to this sketch
+        """
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        """
+        Estimate the number of unique values added to the sketch
+        """
+        num_registers = self.num_registers
+        alpha = 0.7213 / (1 + 1.079 / num_registers)
+        estimate = alpha * num_registers * num_registers / sum(2.0 ** -rank for rank in self.registers)
+        num_zeros = self.registers.count(b'\x00')
+        if estimate <= 2.5 * num_registers and num_zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = num_registers * math.log(num_registers / num_zeros)
+        return int(round(estimate))
+
+
+def read_line_blocks(path, start, end):
+    """
+    Yield blocks of complete lines from the lines of a log file starting between the `start`
+    and `end` byte offsets, or from the whole file if `end` is None.
+    """
+    remaining = None
+    if end is None:
+        # Make sure we use gzip to decompress any compressed log files.
+        handle = gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+    else:
+        handle = open(path, 'rb')
+        if start:
+            # Skip the end of the line started in the previous chunk
+            handle.seek(start - 1)
+            start += len(handle.readline()) - 1
+        remaining = end - start
+
+    try:
+        leftover = b''
+        while remaining is None or remaining > 0:
+            block = handle.read(BLOCK_SIZE if remaining is None else min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            if remaining is not None:
+                remaining -= len(block)
+                if remaining <= 0 and not block.endswith(b'\n'):
+                    # Complete the last line of the chunk, which ends in the next chunk
+                    block += handle.readline()
+            block = leftover + block
+            end_of_lines = block.rfind(b'\n') + 1
+            leftover = block[end_of_lines:]
+            if end_of_lines:
+                yield block[:end_of_lines]
+        if leftover:
+            yield leftover
+    finally:
+        handle.close()
+
+
+def parse_log_chunk(work_unit):
+    """
+    Count the hits and the unique visitors of a chunk of a log file.
+
+    `work_unit` is a (path, start, end, precision) tuple, see `read_line_blocks()`.
+    Returns the number of hits, and the registers of the HyperLogLog sketch of the IP addresses.
+    """
+    path, start, end, precision = work_unit
+    sketch = HyperLogLog(precision)
+    total_hits = 0
+    seen_ip_addresses = set()
+
+    for block in read_line_blocks(path, start, end):
+        ip_addresses = NGINX_ACCESS_LINES_PATTERN.findall(b'\n' + block)
+        total_hits += len(ip_addresses)
+        new_ip_addresses = set(ip_addresses).difference(seen_ip_addresses)
+        if len(seen_ip_addresses) + len(new_ip_addresses) > SEEN_IP_ADDRESSES_CACHE_SIZE:
+            seen_ip_addresses.clear()
+        seen_ip_addresses.update(new_ip_addresses)
+        sketch.update(new_ip_addresses)
+
+    return total_hits, bytes(sketch.registers)
+
+
+def collect_hit_statistics(log_path, processes=None, precision=HLL_DEFAULT_PRECISION, chunk_size=CHUNK_SIZE):
+    """
+    Count the hits and the unique visitors in all the "access.log*" files of `log_path`.
+
+    The files are parsed by `processes` worker processes (one per CPU by default).
+    """
+    work_units = []
+    for file_name in sorted(os.listdir(log_path)):
+        file_path = os.path.join(log_path, file_name)
+        if not os.path.isfile(file_path) or not file_name.startswith('access.log'):
+            continue
+        print('Parsing log file: {file}'.format(file=file_name), file=sys.stderr)
+        if file_name.endswith('.gz'):
+            work_units.append((file_path, 0, None, precision))
+        else:
+            size = os.path.getsize(file_path)
+            for start in range(0, size, chunk_size):
+                work_units.append((file_path, start, min(start + chunk_size, size), precision))
+
+    sketch = HyperLogLog(precision)
+    total_hits = 0
+    pool = None
+    if processes == 1:
+        results = map(parse_log_chunk, work_units)
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(parse_log_chunk, work_units)
+    try:
+        for hits, registers in results:
+            total_hits += hits
+            sketch.merge(HyperLogLog(precision, registers))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return {
+        'unique_hits': sketch.count(),
+        'total_hits': total_hits,
+    }
+
 def valid_date(s):
     """
     Verify that the string passed in is a date
@@ -27,7 +214,7 @@ def valid_date(s):
         return datetime.strptime(s, "%Y-%m-%d").date()
     except ValueError:
         msg = "Not a valid date: '{0}'.".format(s)
-        raise argparse.ArgumentTypeError(msg)
+        raise ArgumentTypeError(msg)
 
 
 if __name__ == '__main__':
@@ -62,8 +249,24 @@ if __name__ == '__main__':
         type=valid_date,
         help='The last day on which statistics should be gathered.'
     )
+    parser.add_argument(
+        '--processes',
+        default=None,
+        type=int,
+        help='Number of processes parsing the Nginx logs. Defaults to the number of CPUs.'
+    )
+    parser.add_argument(
+        '--hll-precision',
+        default=HLL_DEFAULT_PRECISION,
+        type=int,
+        help='Precision of the unique hits count: its relative standard error is 1.04 / sqrt(2**precision).'
+    )
     args = parser.parse_args()
 
+    import django
+    from django.utils import timezone
+    from six.moves.configparser import ConfigParser
+
     # Set up the environment so that edX can be initialized as the LMS with the correct settings.
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lms.envs.openstack')
     os.environ.setdefault('SERVICE_VARIANT', 'lms')
@@ -96,35 +299,8 @@ if __name__ == '__main__':
     }
 
     if not args.skip_hit_statistics:
-        # Produce the paths to all of the "access.log*" files in the Nginx log directory to be parsed.
-        log_files = [
-            f for f in os.listdir(LOG_PATH)
-            if os.path.isfile(os.path.join(LOG_PATH, f)) and f.startswith('access.log')
-        ]
-
-        # Walk through all of the Nginx logs, storing the found remote host IP addresses in a set to enforce uniqueness.
-        unique_hits = set()
-        total_hits = 0
-        for file in log_files:
-            print('Parsing log file: {file}'.format(file=file), file=sys.stderr)
-
-            file_path = os.path.join(LOG_PATH, file)
-            # Make sure we use gzip to decompress any compressed log files.
-            if file.endswith('.gz'):
-                handle = gzip.open(file_path, 'rb')
-            else:
-                handle = open(file_path, 'r')
-
-            # Run each access log line through a regex to extract the IPv4 addresses of remote hosts.
-            for line in handle:
-                match = re.match(NGINX_ACCESS_PATTERN, line)
-                if match:
-                    total_hits += 1
-                    unique_hits.add(match.group('ipaddress'))
-            handle.close()
-
-        stats['unique_hits'] = len(unique_hits)
-        stats['total_hits'] = total_hits
+        # The unique remote host IP addresses are counted with a HyperLogLog sketch, rather than stored in a set.
+        stats.update(collect_hit_statistics(LOG_PATH, processes=args.processes, precision=args.hll_precision))
 
     # Build the ConfigParser data.
     config = ConfigParser()
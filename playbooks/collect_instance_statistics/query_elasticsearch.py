@@ -2,15 +2,22 @@
 # pylint: skip-file
 
 from __future__ import print_function
-from argparse import ArgumentParser
+from argparse import ArgumentParser, ArgumentTypeError
 from datetime import datetime, timedelta
-from elasticsearch import Elasticsearch
-from elasticsearch_dsl import Search
+import re
 import sys
 
 from six.moves.configparser import ConfigParser
 
 
+# The access logs are shipped by filebeat to one index per day
+INDEX_PATTERN = 'filebeat-*'
+# Maximum number of (host, IP address) buckets returned by each request
+DEFAULT_PAGE_SIZE = 10000
+# Splits the values of text fields into the tokens matched by `match_phrase` queries (standard analyzer)
+TOKEN_PATTERN = re.compile(r'[^\W_]+', re.UNICODE)
+
+
 def valid_date(s):
     """
     Verify that the string passed in is a date
@@ -19,7 +26,121 @@ def valid_date(s):
         return datetime.strptime(s, "%Y-%m-%d").date()
     except ValueError:
         msg = "Not a valid date: '{0}'.".format(s)
-        raise argparse.ArgumentTypeError(msg)
+        raise ArgumentTypeError(msg)
+
+
+def tokenize(value):
+    """
+    Return the lowercase tokens of a text field value
+    """
+    return [token.lower() for token in TOKEN_PATTERN.findall(value)]
+
+
+def host_matches_prefix(host, name_prefix):
+    """
+    Return True if the `match_phrase` query on the host for this name prefix matches the host.
+    """
+    host_tokens = tokenize(host)
+    prefix_tokens = tokenize(name_prefix)
+    if not prefix_tokens:
+        return False
+    return any(
+        host_tokens[index:index + len(prefix_tokens)] == prefix_tokens
+        for index in range(len(host_tokens) - len(prefix_tokens) + 1)
+    )
+
+
+def build_query(name_prefixes, start_date, end_date, page_size=DEFAULT_PAGE_SIZE, after_key=None):
+    """
+    Build the body of the search counting the access log hits of each (host, proxy IP address) pair.
+
+    The hosts of all the name prefixes and all the days of the report window are aggregated at once,
+    with a composite aggregation which is paged through by passing the `after_key` of the previous page.
+    """
+    composite = {
+        'size': page_size,
+        'sources': [
+            {'host': {'terms': {'field': 'host.keyword'}}},
+            {'ip': {'terms': {'field': 'proxy_ip.keyword'}}},
+        ],
+    }
+    if after_key is not None:
+        composite['after'] = after_key
+
+    return {
+        'size': 0,
+        'query': {
+            'bool': {
+                # Only query access log data of the given hosts, in the report window
+                'filter': [
+                    {'match_phrase': {'source': '/edx/var/log/nginx/access.log'}},
+                    {'range': {'@timestamp': {
+                        'gte': start_date.isoformat(),
+                        'lt': (end_date + timedelta(days=1)).isoformat(),
+                        'format': 'yyyy-MM-dd',
+                    }}},
+                    {'bool': {
+                        'should': [{'match_phrase': {'host': name_prefix}} for name_prefix in name_prefixes],
+                        'minimum_should_match': 1,
+                    }},
+                ],
+                # Ignore heartbeat or xqueue/get_queuelen requests
+                'must_not': [
+                    {'match_phrase': {'request': 'heartbeat'}},
+                    {'match_phrase': {'request': 'xqueue/get_queuelen'}},
+                ],
+            },
+        },
+        'aggs': {
+            'hits': {'composite': composite},
+        },
+    }
+
+
+def collect_hit_statistics(client, name_prefixes, start_date, end_date, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Return the unique and total hits of each name prefix between the two dates (included).
+    """
+    unique_ips = {name_prefix: set() for name_prefix in name_prefixes}
+    total_hits = {name_prefix: 0 for name_prefix in name_prefixes}
+    matching_prefixes = {}
+
+    after_key = None
+    while True:
+        response = client.search(
+            index=INDEX_PATTERN,
+            body=build_query(name_prefixes, start_date, end_date, page_size=page_size, after_key=after_key),
+            ignore_unavailable=True,
+        )
+        aggregation = response['aggregations']['hits']
+        for bucket in aggregation['buckets']:
+            host = bucket['key']['host']
+            ip = bucket['key']['ip']
+
+            # Ignore requests without a proxy_ip
+            if ip == '-':
+                continue
+
+            if host not in matching_prefixes:
+                matching_prefixes[host] = [
+                    name_prefix for name_prefix in name_prefixes if host_matches_prefix(host, name_prefix)
+                ]
+            for name_prefix in matching_prefixes[host]:
+                unique_ips[name_prefix].add(ip)
+                total_hits[name_prefix] += bucket['doc_count']
+
+        # `after_key` is only returned while there are more buckets to fetch
+        after_key = aggregation.get('after_key')
+        if not aggregation['buckets'] or after_key is None:
+            break
+
+    return {
+        name_prefix: {
+            'unique_hits': len(unique_ips[name_prefix]),
+            'total_hits': total_hits[name_prefix],
+        }
+        for name_prefix in name_prefixes
+    }
 
 
 if __name__ == '__main__':
@@ -28,7 +149,7 @@ if __name__ == '__main__':
     parser.add_argument(
         '--name-prefixes',
         default=None,
-        help='Comma-separated name prefixes to filter results by. Each will be run sequentially',
+        help='Comma-separated name prefixes to filter results by',
         required=True
     )
     parser.add_argument(
@@ -82,8 +203,16 @@ if __name__ == '__main__':
         default=None,
         help='Path to the output file of the new CSV. Leave blank to use stdout.'
     )
+    parser.add_argument(
+        '--page-size',
+        type=int,
+        default=DEFAULT_PAGE_SIZE,
+        help='Number of aggregation buckets fetched by each request'
+    )
     args = parser.parse_args()
 
+    from elasticsearch import Elasticsearch
+
     client = Elasticsearch(
         host=args.host,
         port=args.port,
@@ -94,53 +223,14 @@ if __name__ == '__main__':
     config = ConfigParser()
 
     name_prefixes = args.name_prefixes.split(',')
+    hit_statistics = collect_hit_statistics(
+        client, name_prefixes, args.start_date, args.end_date, page_size=args.page_size,
+    )
 
+    # Build the ConfigParser data
     for name_prefix in name_prefixes:
-
-        unique_ips = set()
-        total_hits = 0
-
-        # Start at start_date and go until end_date, incrementing by 1 day
-        # (at the end of the loop)
-        date = args.start_date
-        while date <= args.end_date:
-            es_index = 'filebeat-{date}'.format(date=date.strftime("%Y.%m.%d"))
-
-            # Query for the host matching the name_prefix
-            # Only query access log data, and ignore heartbeat or xqueue/get_queuelen requests
-            search = Search(using=client, index=es_index) \
-                .query("match_phrase", host=name_prefix) \
-                .query("match_phrase", source="/edx/var/log/nginx/access.log") \
-                .exclude("match_phrase", request="heartbeat") \
-                .exclude("match_phrase", request="xqueue/get_queuelen")
-
-            # Aggregate the unique hits by proxy_ip
-            search.aggs.bucket("unique_hits", "terms", size=10000, field="proxy_ip.keyword")
-
-            # Python slice syntax is used to set the `from` and `size`
-            # parameters for the search, which we want set to 0
-            response = search[0:0].execute()
-
-            for bucket in response["aggregations"]["unique_hits"]["buckets"]:
-                ip = bucket["key"]
-
-                # Ignore requests without a proxy_ip
-                if ip == "-":
-                    continue
-
-                unique_ips.add(ip)
-                total_hits += bucket["doc_count"]
-
-            date += timedelta(days=1)
-
-        stats = {
-            'unique_hits': len(unique_ips),
-            'total_hits': total_hits,
-        }
-
-        # Build the ConfigParser data
         config.add_section(name_prefix)
-        for key, value in stats.items():
+        for key, value in hit_statistics[name_prefix].items():
             config.set(name_prefix, key, str(value))
 
     # Output the data in ConfigParser format to stdout and to a file.
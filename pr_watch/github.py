@@ -22,17 +22,21 @@ GitHub Service API - Helper functions
 
 # Imports #####################################################################
 
+from collections import defaultdict
 from datetime import datetime
 import functools
+import hashlib
 import logging
 import operator
 import re
 
 from django.conf import settings
+from django.core.cache import cache
 from django.template.defaultfilters import truncatewords
-import requests
 import yaml
 
+from instance import http_client
+
 # Logging #####################################################################
 
 logger = logging.getLogger(__name__)
@@ -46,6 +50,11 @@ GH_HEADERS = {
     'Time-Zone': 'UTC',
 }
 
+GH_GRAPHQL_URL = 'https://api.github.com/graphql'
+
+# Fields of the PRs fetched with GraphQL, to create PR objects
+GH_GRAPHQL_PR_FIELDS = 'number title body author { login } baseRefName headRefName headRepository { nameWithOwner }'
+
 
 # Functions ###################################################################
 
@@ -54,17 +63,68 @@ def get_object_from_url(url):
     Send the request to the provided URL, attaching custom headers, and returns
     the deserialized object from the returned JSON.
 
+    The ETag and Last-Modified headers of the responses are stored, and sent back with the next
+    request to the same URL. When the object didn't change, GitHub then answers with a
+    304 Not Modified response, which doesn't count against the rate limit, and the stored
+    object is returned.
+
     Raises ObjectDoesNotExist if github returns a 404 response.
     """
     logger.info('GET URL %s', url)
-    r = requests.get(url, headers=GH_HEADERS)
+    cache_key = 'github_response_{}'.format(hashlib.sha1(url.encode()).hexdigest())
+    cached_response = cache.get(cache_key)
+    headers = dict(GH_HEADERS)
+    if cached_response:
+        if cached_response['etag']:
+            headers['If-None-Match'] = cached_response['etag']
+        if cached_response['last_modified']:
+            headers['If-Modified-Since'] = cached_response['last_modified']
+
+    r = http_client.request('GET', url, headers=headers)
+    if r.status_code == 304 and cached_response:
+        logger.debug('Not modified since the last request')
+        return cached_response['data']
     logger.debug('Response body: %s', r.text)
     if r.status_code == 404:
         raise ObjectDoesNotExist('404 response from {0}'.format(url))
     if r.status_code == 403 and r.headers.get('X-RateLimit-Remaining', '') == '0':
         raise RateLimitExceeded('Rate limit exceeded when requesting a resource at {}'.format(url))
     r.raise_for_status()
-    return r.json()
+    data = r.json()
+
+    etag, last_modified = r.headers.get('ETag'), r.headers.get('Last-Modified')
+    if etag or last_modified:
+        cache.set(
+            cache_key,
+            {'etag': etag, 'last_modified': last_modified, 'data': data},
+            settings.GITHUB_RESPONSE_CACHE_TIMEOUT,
+        )
+    return data
+
+
+def run_graphql_query(query, variables=None):
+    """
+    Run a query against the GitHub GraphQL API, and return its data.
+
+    Errors about some of the queried objects are logged, and their value in the data is None.
+    """
+    logger.info('POST GraphQL query to %s', GH_GRAPHQL_URL)
+    r = http_client.request(
+        'POST', GH_GRAPHQL_URL, json={'query': query, 'variables': variables or {}}, headers=GH_HEADERS,
+    )
+    logger.debug('Response body: %s', r.text)
+    if r.status_code == 403 and r.headers.get('X-RateLimit-Remaining', '') == '0':
+        raise RateLimitExceeded('Rate limit exceeded when running a GraphQL query')
+    r.raise_for_status()
+    result = r.json()
+    errors = result.get('errors') or []
+    if any(error.get('type') == 'RATE_LIMITED' for error in errors):
+        raise RateLimitExceeded('Rate limit exceeded when running a GraphQL query')
+    if result.get('data') is None:
+        raise GraphQLError('GraphQL query failed: {}'.format(errors))
+    for error in errors:
+        logger.warning('GraphQL query error: %s', error.get('message', error))
+    return result['data']
 
 
 def fork_name2tuple(fork_name):
@@ -129,6 +189,77 @@ def get_pr_by_number(pr_target_fork_name, pr_number):
     return pr
 
 
+def get_prs_by_number(pr_numbers_by_fork):
+    """
+    Return PR objects for the given PR numbers of several target forks, fetched with a single GraphQL request.
+
+    `pr_numbers_by_fork` maps target fork names to lists of PR numbers.
+    Returns a dict mapping (target fork name, PR number) tuples to PR objects.
+    PRs which don't exist, or whose source repository was deleted, are left out.
+    """
+    forks = [
+        (index, fork_name, pr_numbers)
+        for index, (fork_name, pr_numbers) in enumerate(sorted(pr_numbers_by_fork.items()))
+        if pr_numbers
+    ]
+    if not forks:
+        return {}
+
+    variables = {}
+    repository_queries = []
+    for index, fork_name, pr_numbers in forks:
+        variables['owner{}'.format(index)], variables['name{}'.format(index)] = fork_name2tuple(fork_name)
+        pr_queries = ' '.join(
+            'pr{number}: pullRequest(number: {number}) {{ {fields} }}'.format(
+                number=int(pr_number),
+                fields=GH_GRAPHQL_PR_FIELDS,
+            )
+            for pr_number in pr_numbers
+        )
+        repository_queries.append(
+            'fork{index}: repository(owner: $owner{index}, name: $name{index}) {{ {prs} }}'.format(
+                index=index,
+                prs=pr_queries,
+            )
+        )
+    query = 'query({variables}) {{ {repositories} }}'.format(
+        variables=', '.join('${}: String!'.format(name) for name in sorted(variables)),
+        repositories=' '.join(repository_queries),
+    )
+    data = run_graphql_query(query, variables)
+
+    prs = {}
+    for index, fork_name, pr_numbers in forks:
+        r_repository = data.get('fork{}'.format(index)) or {}
+        for pr_number in pr_numbers:
+            r_pr = r_repository.get('pr{}'.format(pr_number))
+            if not r_pr or not r_pr['headRepository']:
+                logger.warning('Could not get the details of PR #%s of %s', pr_number, fork_name)
+                continue
+            prs[(fork_name, pr_number)] = PR(
+                pr_number,
+                r_pr['headRepository']['nameWithOwner'],
+                fork_name,
+                r_pr['headRefName'],
+                r_pr['title'],
+                (r_pr['author'] or {}).get('login', 'ghost'),
+                body=r_pr['body'],
+                target_branch=r_pr['baseRefName'],
+            )
+    return prs
+
+
+def search_open_prs(user_names, fork_name):
+    """
+    Return the search results of the open PRs of the given users on `fork_name`.
+    """
+    if not user_names:
+        return []
+    authors = ' '.join('author:{author}'.format(author=author) for author in user_names)
+    q = 'is:open is:pr {authors} repo:{repo}'.format(authors=authors, repo=fork_name)
+    return get_object_from_url('https://api.github.com/search/issues?sort=created&q={}'.format(q))['items']
+
+
 def get_pr_list_from_username(user_name, fork_name):
     """
     Retrieve the current active PRs for a given user
@@ -140,18 +271,62 @@ def get_pr_list_from_usernames(user_names, fork_name):
     """
     Retrieve the current active PRs for a given set of users
     """
-    if not user_names:
-        return []
+    return get_pr_lists_from_usernames({fork_name: user_names})[fork_name]
 
-    authors = ' '.join('author:{author}'.format(author=author) for author in user_names)
-    q = 'is:open is:pr {authors} repo:{repo}'.format(authors=authors, repo=fork_name)
-    r_pr_list = get_object_from_url('https://api.github.com/search/issues?sort=created&q={}'.format(q))
 
-    pr_list = []
-    for pr_dict in r_pr_list['items']:
-        logger.debug('Received PR for user %s: %s', pr_dict['user']['login'], pr_dict)
-        pr_list.append(get_pr_by_number(fork_name, pr_dict['number']))
-    return pr_list
+def get_pr_lists_from_usernames(usernames_by_fork):
+    """
+    Retrieve the current active PRs for given sets of users, on several forks.
+
+    `usernames_by_fork` maps fork names to lists of users.
+    Returns a dict mapping the same fork names to lists of PR objects.
+
+    The PRs of each fork are found with a search, which doesn't count against the rate limit when
+    its results didn't change (see get_object_from_url()). The details of the PRs are stored until
+    the PRs are updated, and the details of the new and updated PRs of all the forks are fetched
+    with a single GraphQL request.
+    """
+    search_results = {}
+    prs = {}
+    pr_numbers_to_fetch = defaultdict(list)
+    for fork_name, user_names in usernames_by_fork.items():
+        search_results[fork_name] = search_open_prs(user_names, fork_name)
+        for pr_dict in search_results[fork_name]:
+            logger.debug('Received PR for user %s: %s', pr_dict['user']['login'], pr_dict)
+            cached_pr = cache.get(_get_pr_cache_key(fork_name, pr_dict['number']))
+            if cached_pr and cached_pr['updated_at'] == pr_dict['updated_at']:
+                prs[(fork_name, pr_dict['number'])] = cached_pr['pr']
+            else:
+                pr_numbers_to_fetch[fork_name].append(pr_dict['number'])
+
+    if pr_numbers_to_fetch:
+        fetched_prs = get_prs_by_number(pr_numbers_to_fetch)
+        prs.update(fetched_prs)
+        for fork_name, pr_dicts in search_results.items():
+            for pr_dict in pr_dicts:
+                pr = fetched_prs.get((fork_name, pr_dict['number']))
+                if pr is not None:
+                    cache.set(
+                        _get_pr_cache_key(fork_name, pr_dict['number']),
+                        {'updated_at': pr_dict['updated_at'], 'pr': pr},
+                        settings.GITHUB_RESPONSE_CACHE_TIMEOUT,
+                    )
+
+    return {
+        fork_name: [
+            prs[(fork_name, pr_dict['number'])]
+            for pr_dict in pr_dicts
+            if (fork_name, pr_dict['number']) in prs
+        ]
+        for fork_name, pr_dicts in search_results.items()
+    }
+
+
+def _get_pr_cache_key(fork_name, pr_number):
+    """
+    Cache key of the details of a PR
+    """
+    return 'github_pr_{}_{}'.format(fork_name, pr_number)
 
 
 def parse_date(date):
@@ -233,3 +408,9 @@ class RateLimitExceeded(Exception):
     """
     Exception raised when trying to access a GitHub object and a rate limit is hit
     """
+
+
+class GraphQLError(Exception):
+    """
+    Exception raised when a GraphQL query fails
+    """
@@ -23,6 +23,7 @@ Worker tasks for development of Open edX
 # Imports #####################################################################
 
 import logging
+from collections import defaultdict
 
 from django.conf import settings
 from huey.api import crontab
@@ -30,7 +31,7 @@ from huey.contrib.djhuey import db_periodic_task
 
 from instance.models.deployment import DeploymentType
 from instance.utils import create_new_deployment
-from pr_watch.github import (RateLimitExceeded, get_pr_list_from_usernames)
+from pr_watch.github import (RateLimitExceeded, get_pr_lists_from_usernames)
 from pr_watch.models import WatchedFork, WatchedPullRequest
 from userprofile.models import UserProfile
 
@@ -50,18 +51,29 @@ def watch_pr():
     if not settings.WATCH_PRS:
         return
     try:
+        usernames_by_watched_fork = {}
+        usernames_by_fork = defaultdict(set)
         for watched_fork in WatchedFork.objects.filter(enabled=True):
-            usernames = list(
-                UserProfile.objects.filter(
-                    organization=watched_fork.organization,
-                ).exclude(
-                    github_username__isnull=True,
-                ).values_list(
-                    'github_username',
-                    flat=True
-                )
+            usernames = UserProfile.objects.filter(
+                organization=watched_fork.organization,
+            ).exclude(
+                github_username__isnull=True,
+            ).values_list(
+                'github_username',
+                flat=True
             )
-            for pr in get_pr_list_from_usernames(usernames, watched_fork.fork):
+            usernames_by_watched_fork[watched_fork] = {username.lower() for username in usernames}
+            usernames_by_fork[watched_fork.fork].update(usernames)
+
+        # The PRs of all the watched forks are retrieved at once, to make as few GitHub API requests as possible.
+        # Several organizations can watch the same fork, so the PRs are then matched with the organizations.
+        pr_lists = get_pr_lists_from_usernames({
+            fork_name: sorted(usernames) for fork_name, usernames in usernames_by_fork.items()
+        })
+        for watched_fork, usernames in usernames_by_watched_fork.items():
+            for pr in pr_lists[watched_fork.fork]:
+                if pr.username.lower() not in usernames:
+                    continue
                 instance, created = WatchedPullRequest.objects.get_or_create_from_pr(pr, watched_fork)
                 if created:
                     logger.info('New PR found, creating sandbox: %s', pr)
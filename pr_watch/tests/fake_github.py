@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Fake GitHub API, to check the requests made by the PR watcher
+"""
+
+# Imports #####################################################################
+
+import hashlib
+import json
+import re
+from urllib.parse import parse_qs, urlsplit
+
+import responses
+
+
+# Classes #####################################################################
+
+class FakeGitHubServer:
+    """
+    In-process fake of the parts of the GitHub API used by the PR watcher, serving requests intercepted
+    by `responses`.
+
+    It supports conditional requests like GitHub, and records the requests made to it.
+    Use as follows:
+
+        with responses.RequestsMock(assert_all_requests_are_fired=False) as rsps:
+            server = FakeGitHubServer()
+            server.add_pr('source/repo', 12, author='user1')
+            server.register(rsps)
+    """
+    api_base = 'https://api.github.com'
+
+    def __init__(self):
+        # Open PRs of each target fork, indexed by number
+        self.prs = {}
+        self.requests = []
+        self._clock = 0
+
+    def register(self, rsps):
+        """
+        Register the fake API with the given `responses.RequestsMock`.
+        """
+        rsps.add_callback(responses.GET, re.compile(re.escape(self.api_base) + r'/search/issues'),
+                          callback=self.handle_search, content_type='application/json')
+        rsps.add_callback(responses.GET, re.compile(re.escape(self.api_base) + r'/repos/[^/]+/[^/]+/pulls/\d+'),
+                          callback=self.handle_get_pr, content_type='application/json')
+        rsps.add_callback(responses.POST, self.api_base + '/graphql',
+                          callback=self.handle_graphql, content_type='application/json')
+
+    def add_pr(self, fork_name, number, author, title='PR title', body='', head_fork='fork/repo', head_ref='branch'):
+        """
+        Open a PR on `fork_name`.
+        """
+        self.prs.setdefault(fork_name, {})[number] = {
+            'number': number,
+            'author': author,
+            'title': title,
+            'body': body,
+            'head_fork': head_fork,
+            'head_ref': head_ref,
+            'base_ref': 'master',
+            'updated_at': self._now(),
+        }
+
+    def update_pr(self, fork_name, number, **changes):
+        """
+        Change the attributes of a PR.
+        """
+        self.prs[fork_name][number].update(changes, updated_at=self._now())
+
+    def count_requests(self, method=None, path=None, status=None):
+        """
+        Number of the requests made, optionally only the ones with the given method, path and response status.
+        """
+        return len([
+            request for request in self.requests
+            if method in (None, request[0]) and path in (None, request[1]) and status in (None, request[2])
+        ])
+
+    def handle_search(self, request):
+        """
+        Search the open PRs with the given authors on the given repo.
+        """
+        query = parse_qs(urlsplit(request.url).query)['q'][0].split()
+        authors = {term[len('author:'):].lower() for term in query if term.startswith('author:')}
+        repos = [term[len('repo:'):] for term in query if term.startswith('repo:')]
+        items = [
+            {
+                'number': pr['number'],
+                'title': pr['title'],
+                'user': {'login': pr['author']},
+                'updated_at': pr['updated_at'],
+            }
+            for repo in repos
+            for number, pr in sorted(self.prs.get(repo, {}).items(), reverse=True)
+            if pr['author'].lower() in authors
+        ]
+        return self._conditional_response(request, {'total_count': len(items), 'items': items})
+
+    def handle_get_pr(self, request):
+        """
+        Get the details of a PR.
+        """
+        path = urlsplit(request.url).path
+        fork_name, number = re.match(r'/repos/([^/]+/[^/]+)/pulls/(\d+)', path).groups()
+        pr = self.prs.get(fork_name, {}).get(int(number))
+        if pr is None:
+            self.requests.append((request.method, path, 404))
+            return 404, {}, json.dumps({'message': 'Not Found'})
+        return self._conditional_response(request, {
+            'number': pr['number'],
+            'title': pr['title'],
+            'body': pr['body'],
+            'user': {'login': pr['author']},
+            'head': {'ref': pr['head_ref'], 'repo': {'full_name': pr['head_fork']}},
+            'base': {'ref': pr['base_ref']},
+        })
+
+    def handle_graphql(self, request):
+        """
+        Run a GraphQL query made of aliased `repository` fields containing aliased `pullRequest` fields.
+        """
+        self.requests.append((request.method, '/graphql', 200))
+        payload = json.loads(request.body)
+        variables = payload['variables']
+        data = {}
+        # Split the query on the repository fields
+        parts = re.split(r'(\w+): repository\(owner: \$(\w+), name: \$(\w+)\)', payload['query'])
+        for alias, owner_variable, name_variable, pr_queries in zip(parts[1::4], parts[2::4], parts[3::4], parts[4::4]):
+            fork_name = '{}/{}'.format(variables[owner_variable], variables[name_variable])
+            data[alias] = {}
+            for pr_alias, number in re.findall(r'(\w+): pullRequest\(number: (\d+)\)', pr_queries):
+                pr = self.prs.get(fork_name, {}).get(int(number))
+                data[alias][pr_alias] = pr and {
+                    'number': pr['number'],
+                    'title': pr['title'],
+                    'body': pr['body'],
+                    'author': {'login': pr['author']},
+                    'baseRefName': pr['base_ref'],
+                    'headRefName': pr['head_ref'],
+                    'headRepository': {'nameWithOwner': pr['head_fork']},
+                }
+        return 200, {}, json.dumps({'data': data})
+
+    def _conditional_response(self, request, data):
+        """
+        Return `data`, or a 304 Not Modified response if the client already has it.
+        """
+        body = json.dumps(data)
+        etag = '"{}"'.format(hashlib.sha1(body.encode()).hexdigest())
+        path = urlsplit(request.url).path
+        if request.headers.get('If-None-Match') == etag:
+            self.requests.append((request.method, path, 304))
+            return 304, {'ETag': etag}, ''
+        self.requests.append((request.method, path, 200))
+        return 200, {'ETag': etag}, body
+
+    def _now(self):
+        """
+        A new timestamp, later than the previous ones.
+        """
+        self._clock += 1
+        return '2020-01-01T00:00:{:02d}Z'.format(self._clock)
@@ -26,19 +26,26 @@ from datetime import datetime
 import json
 from unittest.mock import patch
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 import responses
 
 from instance.tests.base import get_raw_fixture
 from pr_watch import github
+from pr_watch.tests.fake_github import FakeGitHubServer
 
 
 # Tests #######################################################################
 
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
 class GitHubTestCase(TestCase):
     """
     Test cases for GitHub helper functions & API calls
     """
+    def setUp(self):
+        super().setUp()
+        # The responses and the PR details are cached
+        cache.clear()
 
     def test_fork_name2tuple(self):
         """
@@ -147,8 +154,8 @@ class GitHubTestCase(TestCase):
             github.get_pr_by_number('openedx/edx-platform', 1234567890)
 
     @responses.activate
-    @patch('pr_watch.github.get_pr_by_number')
-    def test_get_pr_list_from_username(self, mock_get_pr_by_number):
+    @patch('pr_watch.github.get_prs_by_number')
+    def test_get_pr_list_from_username(self, mock_get_prs_by_number):
         """
         Get list of open PR for user
         """
@@ -160,7 +167,11 @@ class GitHubTestCase(TestCase):
             content_type='application/json; charset=utf8',
             status=200)
 
-        mock_get_pr_by_number.side_effect = lambda fork_name, pr_number: [fork_name, pr_number]
+        mock_get_prs_by_number.side_effect = lambda pr_numbers_by_fork: {
+            (fork_name, pr_number): [fork_name, pr_number]
+            for fork_name, pr_numbers in pr_numbers_by_fork.items()
+            for pr_number in pr_numbers
+        }
 
         self.assertEqual(
             github.get_pr_list_from_username('itsjeyd', 'openedx/edx-platform'),
@@ -168,8 +179,8 @@ class GitHubTestCase(TestCase):
         )
 
     @responses.activate
-    @patch('pr_watch.github.get_pr_by_number')
-    def test_get_pr_list_from_usernames(self, mock_get_pr_by_number):
+    @patch('pr_watch.github.get_prs_by_number')
+    def test_get_pr_list_from_usernames(self, mock_get_prs_by_number):
         """
         Get list of open PR for a list of users
         """
@@ -184,7 +195,11 @@ class GitHubTestCase(TestCase):
             content_type='application/json; charset=utf8',
             status=200)
 
-        mock_get_pr_by_number.side_effect = lambda fork_name, pr_number: [fork_name, pr_number]
+        mock_get_prs_by_number.side_effect = lambda pr_numbers_by_fork: {
+            (fork_name, pr_number): [fork_name, pr_number]
+            for fork_name, pr_numbers in pr_numbers_by_fork.items()
+            for pr_number in pr_numbers
+        }
 
         self.assertEqual(
             github.get_pr_list_from_usernames(['itsjeyd', 'haikuginger'], 'openedx/edx-platform'),
@@ -203,3 +218,87 @@ class GitHubTestCase(TestCase):
         self.assertEqual(date.hour, 15)
         self.assertEqual(date.minute, 10)
         self.assertEqual(date.second, 30)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class GitHubPollingTestCase(TestCase):
+    """
+    Test cases for the requests made to poll the PRs of several forks, against a fake GitHub API.
+    """
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.server = FakeGitHubServer()
+        self.server.add_pr('source/repo1', 10, author='user1', title='First PR')
+        self.server.add_pr('source/repo1', 11, author='user2', title='Second PR')
+        self.server.add_pr('source/repo1', 12, author='outsider', title='Third PR')
+        self.server.add_pr('source/repo2', 20, author='user1', title='Other PR', head_ref='other-branch')
+        self.usernames_by_fork = {'source/repo1': ['user1', 'user2'], 'source/repo2': ['user1']}
+
+    def get_pr_titles(self):
+        """
+        Poll the PRs of the watched forks, and return their titles.
+        """
+        pr_lists = github.get_pr_lists_from_usernames(self.usernames_by_fork)
+        return {fork_name: [pr.title for pr in prs] for fork_name, prs in pr_lists.items()}
+
+    def test_unchanged_prs(self):
+        """
+        The details of all forks are fetched with one GraphQL request, then unchanged PRs cost no request
+        counting against the rate limit.
+        """
+        with responses.RequestsMock(assert_all_requests_are_fired=False) as rsps:
+            self.server.register(rsps)
+            pr_lists = github.get_pr_lists_from_usernames(self.usernames_by_fork)
+            self.assertEqual(self.server.count_requests('GET', '/search/issues', 200), 2)
+            self.assertEqual(self.server.count_requests('POST', '/graphql'), 1)
+
+            pr = pr_lists['source/repo2'][0]
+            self.assertEqual(
+                (pr.number, pr.fork_name, pr.repo_name, pr.branch_name, pr.username, pr.target_branch),
+                (20, 'fork/repo', 'source/repo2', 'other-branch', 'user1', 'master')
+            )
+            self.assertEqual(self.get_pr_titles(), {
+                'source/repo1': ['Second PR', 'First PR'],
+                'source/repo2': ['Other PR'],
+            })
+            self.assertEqual(self.server.count_requests('GET', '/search/issues', 304), 2)
+            self.assertEqual(self.server.count_requests('POST', '/graphql'), 1)
+
+    def test_updated_pr(self):
+        """
+        Only the details of the updated and new PRs are fetched again.
+        """
+        with responses.RequestsMock(assert_all_requests_are_fired=False) as rsps:
+            self.server.register(rsps)
+            self.get_pr_titles()
+            self.server.update_pr('source/repo1', 10, title='Renamed PR')
+            self.server.add_pr('source/repo2', 21, author='user1', title='New PR')
+            self.server.requests.clear()
+
+            self.assertEqual(self.get_pr_titles(), {
+                'source/repo1': ['Second PR', 'Renamed PR'],
+                'source/repo2': ['New PR', 'Other PR'],
+            })
+            self.assertEqual(self.server.count_requests('GET', '/search/issues', 200), 2)
+            self.assertEqual(self.server.count_requests('POST', '/graphql'), 1)
+            graphql_query = json.loads(rsps.calls[-1].request.body)['query']
+            self.assertIn('pullRequest(number: 10)', graphql_query)
+            self.assertIn('pullRequest(number: 21)', graphql_query)
+            self.assertNotIn('pullRequest(number: 11)', graphql_query)
+            self.assertNotIn('pullRequest(number: 20)', graphql_query)
+
+    def test_conditional_get(self):
+        """
+        Unchanged objects are returned from the cache when GitHub answers 304 Not Modified.
+        """
+        with responses.RequestsMock(assert_all_requests_are_fired=False) as rsps:
+            self.server.register(rsps)
+            pr = github.get_pr_by_number('source/repo1', 10)
+            self.assertEqual(github.get_pr_by_number('source/repo1', 10).title, pr.title)
+            self.server.update_pr('source/repo1', 10, title='Renamed PR')
+            self.assertEqual(github.get_pr_by_number('source/repo1', 10).title, 'Renamed PR')
+            self.assertEqual(
+                [status for dummy, dummy, status in self.server.requests],
+                [200, 304, 200]
+            )
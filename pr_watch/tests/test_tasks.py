@@ -36,6 +36,17 @@ from pr_watch.models import WatchedPullRequest
 from pr_watch.tests.factories import WatchedForkFactory, PRFactory
 
 
+# Functions ###################################################################
+
+def fake_pr_lists(get_pr_list):
+    """
+    Fake get_pr_lists_from_usernames(), using `get_pr_list(usernames, fork_name)` to get the PRs of each fork.
+    """
+    return lambda usernames_by_fork: {
+        fork_name: get_pr_list(usernames, fork_name) for fork_name, usernames in usernames_by_fork.items()
+    }
+
+
 # Tests #######################################################################
 
 
@@ -45,9 +56,9 @@ class TasksTestCase(TestCase):
     """
     @patch('pr_watch.github.get_commit_id_from_ref')
     @patch('pr_watch.tasks.create_new_deployment')
-    @patch('pr_watch.tasks.get_pr_list_from_usernames')
+    @patch('pr_watch.tasks.get_pr_lists_from_usernames')
     @override_settings(DEFAULT_INSTANCE_BASE_DOMAIN='awesome.hosting.org')
-    def test_watch_pr_new(self, mock_get_pr_list_from_usernames,
+    def test_watch_pr_new(self, mock_get_pr_lists_from_usernames,
                           mock_create_new_deployment, mock_get_commit_id_from_ref):
         """
         New PR created on the watched repo
@@ -72,7 +83,7 @@ class TasksTestCase(TestCase):
         )
         pr_url = 'https://github.com/source/repo/pull/234'
         self.assertEqual(pr.github_pr_url, pr_url)
-        mock_get_pr_list_from_usernames.return_value = [pr]
+        mock_get_pr_lists_from_usernames.side_effect = fake_pr_lists(lambda usernames, fork_name: [pr])
         mock_get_commit_id_from_ref.return_value = '7' * 40
 
         tasks.watch_pr()
@@ -107,11 +118,11 @@ class TasksTestCase(TestCase):
 
     @patch('pr_watch.github.get_commit_id_from_ref')
     @patch('pr_watch.tasks.create_new_deployment')
-    @patch('pr_watch.tasks.get_pr_list_from_usernames')
+    @patch('pr_watch.tasks.get_pr_lists_from_usernames')
     @override_settings(DEFAULT_INSTANCE_BASE_DOMAIN='awesome.hosting.org')
     def test_watch_pr_rate_limit_exceeded(
             self,
-            mock_get_pr_list_from_usernames,
+            mock_get_pr_lists_from_usernames,
             mock_create_new_deployment,
             mock_get_commit_id_from_ref
     ):
@@ -136,7 +147,7 @@ class TasksTestCase(TestCase):
         )
         pr_url = 'https://github.com/source/repo/pull/234'
         self.assertEqual(pr.github_pr_url, pr_url)
-        mock_get_pr_list_from_usernames.side_effect = RateLimitExceeded
+        mock_get_pr_lists_from_usernames.side_effect = RateLimitExceeded
         mock_get_commit_id_from_ref.return_value = '7' * 40
 
         tasks.watch_pr()
@@ -144,9 +155,9 @@ class TasksTestCase(TestCase):
 
     @patch('pr_watch.github.get_commit_id_from_ref')
     @patch('pr_watch.tasks.create_new_deployment')
-    @patch('pr_watch.tasks.get_pr_list_from_usernames')
+    @patch('pr_watch.tasks.get_pr_lists_from_usernames')
     @override_settings(DEFAULT_INSTANCE_BASE_DOMAIN='awesome.hosting.org')
-    def test_watch_several_forks(self, mock_get_pr_list_from_usernames,
+    def test_watch_several_forks(self, mock_get_pr_lists_from_usernames,
                                  mock_create_new_deployment, mock_get_commit_id_from_ref):
         """
         Create 2 watched forks with different settings, do a PR on each and check that both are seen and set up.
@@ -221,7 +232,7 @@ class TasksTestCase(TestCase):
                 raise NotImplementedError()
 
         # Substitute GitHub API calls by our results
-        mock_get_pr_list_from_usernames.side_effect = fake_pr_list_from_usernames
+        mock_get_pr_lists_from_usernames.side_effect = fake_pr_lists(fake_pr_list_from_usernames)
         # Commit ID is the same in both PRs
         mock_get_commit_id_from_ref.return_value = '7' * 40
 
@@ -276,9 +287,46 @@ class TasksTestCase(TestCase):
 
     @patch('pr_watch.github.get_commit_id_from_ref')
     @patch('pr_watch.tasks.create_new_deployment')
-    @patch('pr_watch.tasks.get_pr_list_from_usernames')
+    @patch('pr_watch.tasks.get_pr_lists_from_usernames')
+    @override_settings(DEFAULT_INSTANCE_BASE_DOMAIN='awesome.hosting.org')
+    def test_fork_watched_by_several_organizations(self, mock_get_pr_lists_from_usernames,
+                                                   mock_create_new_deployment, mock_get_commit_id_from_ref):
+        """
+        The PRs of a fork watched by several organizations are retrieved once, and each organization
+        only gets the PRs of its members.
+        """
+        _, organization1 = make_user_and_organization(
+            username='user1', org_name='Org 1', org_handle='org1', github_username='Author1',
+        )
+        _, organization2 = make_user_and_organization(
+            username='user2', org_name='Org 2', org_handle='org2', github_username='author2',
+        )
+        watched_fork1 = WatchedForkFactory(organization=organization1, fork='source/repo')
+        watched_fork2 = WatchedForkFactory(organization=organization2, fork='source/repo')
+        pr1 = PRFactory(number=1, target_fork_name='source/repo', branch_name='branch1', username='author1')
+        pr2 = PRFactory(number=2, target_fork_name='source/repo', branch_name='branch2', username='author2')
+        mock_get_pr_lists_from_usernames.return_value = {'source/repo': [pr1, pr2]}
+        mock_get_commit_id_from_ref.return_value = '7' * 40
+
+        tasks.watch_pr()
+        mock_get_pr_lists_from_usernames.assert_called_once()
+        usernames_by_fork = mock_get_pr_lists_from_usernames.call_args[0][0]
+        self.assertEqual(usernames_by_fork['source/repo'], ['Author1', 'author2'])
+        self.assertEqual(mock_create_new_deployment.call_count, 2)
+        self.assertEqual(
+            WatchedPullRequest.objects.get(github_pr_url=pr1.github_pr_url).watched_fork,
+            watched_fork1
+        )
+        self.assertEqual(
+            WatchedPullRequest.objects.get(github_pr_url=pr2.github_pr_url).watched_fork,
+            watched_fork2
+        )
+
+    @patch('pr_watch.github.get_commit_id_from_ref')
+    @patch('pr_watch.tasks.create_new_deployment')
+    @patch('pr_watch.tasks.get_pr_lists_from_usernames')
     @override_settings(DEFAULT_INSTANCE_BASE_DOMAIN='awesome.hosting.org')
-    def test_disabled_watchedfork(self, mock_get_pr_list_from_usernames,
+    def test_disabled_watchedfork(self, mock_get_pr_lists_from_usernames,
                                   mock_create_new_deployment, mock_get_commit_id_from_ref):
         """
         Creates WatchedFork with the 'enabled' field set to false and checks that its PRs are not watched.
@@ -308,7 +356,7 @@ class TasksTestCase(TestCase):
         )
 
         mock_get_commit_id_from_ref.return_value = '7' * 40
-        mock_get_pr_list_from_usernames.return_value = [pr]
+        mock_get_pr_lists_from_usernames.side_effect = fake_pr_lists(lambda usernames, fork_name: [pr])
 
         tasks.watch_pr()
         self.assertEqual(mock_create_new_deployment.call_count, 0)
@@ -316,15 +364,15 @@ class TasksTestCase(TestCase):
 
     @patch('pr_watch.github.get_commit_id_from_ref')
     @patch('pr_watch.tasks.create_new_deployment')
-    @patch('pr_watch.tasks.get_pr_list_from_usernames')
+    @patch('pr_watch.tasks.get_pr_lists_from_usernames')
     @override_settings(DEFAULT_INSTANCE_BASE_DOMAIN='awesome.hosting.org', WATCH_PRS=False)
     def test_watching_disabled(
-            self, mock_get_pr_list_from_usernames, mock_create_new_deployment, mock_get_commit_id_from_ref,
+            self, mock_get_pr_lists_from_usernames, mock_create_new_deployment, mock_get_commit_id_from_ref,
     ):
         """
         Verifies that watch_pr exits early if WATCH_PRS is disabled.
         """
         tasks.watch_pr()
-        mock_get_pr_list_from_usernames.assert_not_called()
+        mock_get_pr_lists_from_usernames.assert_not_called()
         mock_create_new_deployment.assert_not_called()
         mock_get_commit_id_from_ref.assert_not_called()
@@ -219,8 +219,6 @@ class NotificationsViewSet(GenericViewSet):
         deployments = self.get_queryset(application)
         instance = application.instance
 
-        undeployed_changes = build_instance_config_diff(application, instance)
-
         notifications = []
         for deployment in deployments:
             deployment_status = deployment.status()
@@ -25,9 +25,14 @@ from datetime import timedelta
 from collections import defaultdict
 
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Case, DateTimeField, F, IntegerField, Q, Sum, Value, When, Window
+from django.db.models.functions import ExtractDay
 from django.utils import timezone
 
 from instance.models.appserver import AppServer
+from instance.models.openedx_appserver import OpenEdXAppServer
+from instance.models.openedx_instance import OpenEdXInstance
 from pr_watch.models import WatchedPullRequest
 
 
@@ -176,6 +181,62 @@ def get_instance_charges(instance, invoice_start_date):
     return appservers_charges, appservers_total
 
 
+def get_billable_appservers(instance_ids, invoice_start_date):
+    """
+    Returns the billable AppServers of the given instances in the billing month, annotated with their
+    billing details, in one query. This computes the same values as `get_billing_period()`
+    and `generate_charge_details()`:
+
+    * `billing_start` and `billing_end`: the lifetime of the AppServer, clipped to the billing month
+      (and to today, during the current month).
+    * `days`: the number of billed days.
+    * `instance_id` and `instance_days`: the instance of the AppServer, and its total number of billed days.
+
+    :param instance_ids: The IDs of the OpenEdXInstances to bill.
+    :param invoice_start_date: The beginning of the month we want to issue usages for.
+    :return: A queryset of OpenEdXAppServers.
+    """
+    today = timezone.now()
+    billing_month_start = _normalize_date(invoice_start_date)
+    _, month_days = calendar.monthrange(billing_month_start.year, billing_month_start.month)
+    next_billing_month_start = billing_month_start + timedelta(days=month_days)
+    if _normalize_date(today) == billing_month_start:
+        end_of_month = today
+    else:
+        end_of_month = billing_month_start + timedelta(days=month_days - 1)
+
+    billing_start = Case(
+        When(created__lt=billing_month_start, then=Value(billing_month_start, output_field=DateTimeField())),
+        default=F('created'),
+        output_field=DateTimeField(),
+    )
+    billing_end = Case(
+        When(terminated__lt=next_billing_month_start, then=F('terminated')),
+        default=Value(end_of_month, output_field=DateTimeField()),
+        output_field=DateTimeField(),
+    )
+    # Adding one to the days to include the first day
+    days = ExtractDay(billing_end) - ExtractDay(billing_start) + Value(1, output_field=IntegerField())
+
+    return OpenEdXAppServer.objects.filter(
+        owner__instance_type=ContentType.objects.get_for_model(OpenEdXInstance),
+        owner__instance_id__in=instance_ids,
+        _status__in=(AppServer.Status.Running.state_id, AppServer.Status.Terminated.state_id),
+        created__lt=next_billing_month_start,
+    ).exclude(
+        terminated__lt=billing_month_start,
+    ).annotate(
+        instance_id=F('owner__instance_id'),
+        billing_start=billing_start,
+        billing_end=billing_end,
+        days=days,
+    ).exclude(
+        days=0,
+    ).annotate(
+        instance_days=Window(Sum('days'), partition_by=[F('owner_id')]),
+    ).order_by('-created', '-pk')
+
+
 def generate_watched_forks_instances(organization):
     """
     Extracts all of the watched forks for a specific organization over time
@@ -242,6 +303,26 @@ def generate_charges(forks_instances, invoice_start_date):
                 }
             }
     """
+    instances_charges = defaultdict(list)
+    instances_totals = defaultdict(int)
+
+    if invoice_start_date <= timezone.now():
+        instance_ids = {instance.id for instances in forks_instances.values() for instance in instances}
+        for appserver in get_billable_appservers(instance_ids, invoice_start_date).values(
+                'instance_id', 'name', 'billing_start', 'billing_end', 'days', 'instance_days'
+        ):
+            charge = settings.BILLING_RATE * appserver['days']
+            if charge == 0:
+                continue
+            instances_charges[appserver['instance_id']].append({
+                'name': appserver['name'],
+                'billing_start': appserver['billing_start'],
+                'billing_end': appserver['billing_end'],
+                'days': appserver['days'],
+                'charge': charge,
+            })
+            instances_totals[appserver['instance_id']] = settings.BILLING_RATE * appserver['instance_days']
+
     billing_data = {}
     total = 0
 
@@ -252,10 +333,8 @@ def generate_charges(forks_instances, invoice_start_date):
         }
 
         for instance in instances:
-            appservers_charges, appservers_total = get_instance_charges(instance, invoice_start_date)
-
-            billing_data[fork]['instances'][instance.name] = appservers_charges
-            billing_data[fork]['total'] += appservers_total
-            total += appservers_total
+            billing_data[fork]['instances'][instance.name] = list(instances_charges[instance.id])
+            billing_data[fork]['total'] += instances_totals[instance.id]
+            total += instances_totals[instance.id]
 
     return billing_data, total
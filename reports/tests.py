@@ -21,11 +21,13 @@
 # Imports #####################################################################
 from collections import defaultdict
 from datetime import timedelta, datetime
+from random import Random
 from unittest import mock
 from freezegun import freeze_time
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
 from django.core import mail
 from django.test import TestCase, override_settings
 from django.urls import reverse
@@ -34,7 +36,9 @@ from django.utils import timezone
 import ddt
 
 from instance.models.appserver import Status as AppServerStatus
+from instance.models.openedx_appserver import OpenEdXAppServer
 from instance.models.openedx_instance import OpenEdXInstance
+from instance.models.server import OpenStackServer
 from instance.tests.base import WithUserTestCase
 from instance.tests.models.factories.openedx_appserver import make_test_appserver
 from instance.tests.models.factories.openedx_instance import OpenEdXInstanceFactory
@@ -52,6 +56,18 @@ from registration.models import BetaTestApplication
 from userprofile.factories import OrganizationFactory
 from .tasks import send_trial_instances_report, send_all_instances_report
 
+# Functions #################################################################
+
+def _get_field_values(obj):
+    """
+    Returns the values of the fields of a model instance, except its primary key
+    """
+    return {
+        field.attname: getattr(obj, field.attname)
+        for field in obj._meta.concrete_fields if not field.primary_key
+    }
+
+
 # Tests #####################################################################
 
 
@@ -424,38 +440,119 @@ class ReportsHelpersTestCase(TestCase):
         'instance.tests.models.factories.openedx_instance.OpenEdXInstance._write_metadata_to_consul',
         return_value=(1, True)
     )
-    @mock.patch('reports.helpers.get_instance_charges')
-    def test_generate_charges(self, instance_charges_mock, mock_consul):
+    def test_generate_charges(self, mock_consul):
         """
         Make sure that we're able to generate charges for all of the appservers
         that belong to any fork under a given organization.
         The test here will pass if all forks with their AppServers are included
         in the billing data and each fork is associated with all charges that
         belong to its instances.
-        :param instance_charges_mock: A mock for get_instance_charges function.
         """
         invoice_month = self._generate_invoice_date(2017)
-        instance_charges = 22
-        charges_mock = {
-            'name': 'Mock AppServer',
-            'billing_start': invoice_month,
-            'billing_end': invoice_month,
-            'days': 10,
-            'charge': 31,
-        }
-        instance_charges_mock.return_value = ([charges_mock], instance_charges)
         watched_forks = {
             'fork1': [OpenEdXInstanceFactory() for _ in range(2)],
             'fork2': [OpenEdXInstanceFactory() for _ in range(1)],
         }
-
-        appservers_charges, appservers_total = generate_charges(watched_forks, invoice_month)
+        for instances in watched_forks.values():
+            for instance in instances:
+                self._create_appservers(instance, [
+                    # Billed for the whole month
+                    (AppServerStatus.Running, invoice_month - timedelta(days=40), None),
+                    # Billed from the 10th to the 20th
+                    (AppServerStatus.Terminated, invoice_month + timedelta(days=9), invoice_month + timedelta(days=19)),
+                    # Not billed
+                    (AppServerStatus.ConfigurationFailed, invoice_month - timedelta(days=40), None),
+                    (AppServerStatus.Terminated, invoice_month - timedelta(days=40), invoice_month - timedelta(days=1)),
+                    (AppServerStatus.Running, invoice_month + timedelta(days=31), None),
+                ])
+
+        ContentType.objects.get_for_model(OpenEdXInstance)
+        with self.assertNumQueries(1):
+            appservers_charges, appservers_total = generate_charges(watched_forks, invoice_month)
+
+        instance_charges = (31 + 11) * settings.BILLING_RATE
         self.assertEqual(appservers_total, 3 * instance_charges)
         self.assertEqual(len(appservers_charges), 2)
         self.assertEqual(len(appservers_charges['fork1']['instances']), 2)
         self.assertEqual(len(appservers_charges['fork2']['instances']), 1)
-        self.assertIn(str(charges_mock), str(appservers_charges['fork1']['instances']))
-        self.assertIn(str(charges_mock), str(appservers_charges['fork2']['instances']))
+        self.assertEqual(appservers_charges['fork1']['total'], 2 * instance_charges)
+        self.assertEqual(appservers_charges['fork2']['total'], instance_charges)
+        for fork, instances in watched_forks.items():
+            for instance in instances:
+                self.assertEqual(
+                    appservers_charges[fork]['instances'][instance.name],
+                    get_instance_charges(instance, invoice_month)[0],
+                )
+
+    @freeze_time('2018-06-15 13:30:00')
+    @mock.patch(
+        'instance.tests.models.factories.openedx_instance.OpenEdXInstance._write_metadata_to_consul',
+        return_value=(1, True)
+    )
+    def test_generate_charges_matches_instance_charges(self, mock_consul):
+        """
+        The charges computed by the database match the charges computed for each AppServer
+        by `get_instance_charges()`, for past, current and future months.
+        """
+        random = Random(42)
+        statuses = (
+            AppServerStatus.Running,
+            AppServerStatus.Terminated,
+            AppServerStatus.ConfigurationFailed,
+            AppServerStatus.Error,
+        )
+        period_start = self._generate_invoice_date(2017, 1)
+        period_seconds = int((timezone.now() - period_start).total_seconds())
+        instances = [OpenEdXInstanceFactory() for _ in range(10)]
+        for instance in instances:
+            lifetimes = []
+            for _ in range(300):
+                status = random.choice(statuses)
+                created = period_start + timedelta(seconds=random.randrange(period_seconds))
+                terminated = None
+                if status == AppServerStatus.Terminated:
+                    terminated = created + timedelta(seconds=random.randrange(60, 90 * 24 * 3600))
+                lifetimes.append((status, created, min(terminated, timezone.now()) if terminated else None))
+            self._create_appservers(instance, lifetimes)
+        watched_forks = {'fork1': instances[:6], 'fork2': instances[6:]}
+
+        for year, month in ((2017, 1), (2017, 2), (2017, 12), (2018, 2), (2018, 6), (2018, 7)):
+            invoice_month = self._generate_invoice_date(year, month)
+            billing_data, total = generate_charges(watched_forks, invoice_month)
+
+            expected_total = 0
+            for fork, fork_instances in watched_forks.items():
+                expected_fork_total = 0
+                for instance in fork_instances:
+                    expected_charges, expected_instance_total = get_instance_charges(instance, invoice_month)
+                    self.assertEqual(billing_data[fork]['instances'][instance.name], expected_charges)
+                    expected_fork_total += expected_instance_total
+                self.assertEqual(billing_data[fork]['total'], expected_fork_total)
+                expected_total += expected_fork_total
+            self.assertEqual(total, expected_total)
+            if (year, month) != (2018, 7):
+                self.assertGreater(total, 0)
+
+    @staticmethod
+    def _create_appservers(instance, lifetimes):
+        """
+        Creates AppServers for the given instance in bulk, given their (status, created, terminated) lifetimes.
+        """
+        template = make_test_appserver(instance)
+        servers = OpenStackServer.objects.bulk_create([
+            OpenStackServer(**_get_field_values(template.server)) for _ in lifetimes
+        ])
+        OpenEdXAppServer.objects.bulk_create([
+            OpenEdXAppServer(**dict(
+                _get_field_values(template),
+                name='AppServer {}'.format(index),
+                server_id=server.pk,
+                _status=status.state_id,
+                created=created,
+                terminated=terminated,
+            ))
+            for index, ((status, created, terminated), server) in enumerate(zip(lifetimes, servers))
+        ])
 
     def _setup_watched_forks(self):
         """